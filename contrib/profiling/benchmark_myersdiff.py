@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+#
+# Times MyersDiffer on generated files of various sizes, comparing the
+# current implementation against the one in another git revision.
+#
+# Usage: benchmark_myersdiff.py [--baseline=REVISION] [--runs=N]
+#                               [num_lines ...]
+
+from __future__ import print_function, unicode_literals
+
+import imp
+import os
+import random
+import subprocess
+import sys
+import time
+from optparse import OptionParser
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                        '..', '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from reviewboard.diffviewer.myersdiff import MyersDiffer
+
+
+DEFAULT_SIZES = [10000, 50000, 200000]
+
+# Roughly one in every CHANGE_RATE lines is modified, inserted or deleted.
+CHANGE_RATE = 50
+
+
+def load_baseline_differ(revision):
+    """Load the MyersDiffer class from the given git revision."""
+    source = subprocess.check_output(
+        ['git', 'show', '%s:reviewboard/diffviewer/myersdiff.py' % revision],
+        cwd=ROOT_DIR)
+
+    # The module is kept in sys.modules, so that its globals aren't
+    # cleared once this function returns.
+    module = imp.new_module(str('baseline_myersdiff'))
+    sys.modules[module.__name__] = module
+    exec(compile(source, 'myersdiff.py@%s' % revision, 'exec'),
+         module.__dict__)
+
+    return module.MyersDiffer
+
+
+def generate_files(num_lines, rand):
+    """Generate an original and modified file of the given length."""
+    a = [
+        '    value_%d = compute(%d, %d)\n' % (i, i % 97, rand.randint(0, 50))
+        for i in range(num_lines)
+    ]
+    b = list(a)
+
+    for i in range(num_lines // CHANGE_RATE):
+        pos = rand.randint(0, len(b) - 1)
+        op = rand.randint(0, 2)
+
+        if op == 0:
+            b[pos] = '    changed_%d = %f\n' % (i, rand.random())
+        elif op == 1:
+            b.insert(pos, '    inserted_%d = None\n' % i)
+        else:
+            del b[pos]
+
+    return a, b
+
+
+def time_differ(differ_cls, a, b, num_runs):
+    """Return the opcodes from the differ and the best time taken."""
+    best_elapsed = None
+
+    for i in range(num_runs):
+        start = time.time()
+        opcodes = list(differ_cls(a, b).get_opcodes())
+        elapsed = time.time() - start
+
+        if best_elapsed is None or elapsed < best_elapsed:
+            best_elapsed = elapsed
+
+    return opcodes, best_elapsed
+
+
+def run_benchmark(num_lines, rand, baseline_differ_cls, num_runs):
+    a, b = generate_files(num_lines, rand)
+
+    baseline_opcodes, baseline_elapsed = \
+        time_differ(baseline_differ_cls, a, b, num_runs)
+    opcodes, elapsed = time_differ(MyersDiffer, a, b, num_runs)
+
+    if opcodes != baseline_opcodes:
+        print('%8d lines: the opcodes differ from the baseline!'
+              % num_lines)
+
+    print('%8d lines: baseline %8.3fs, current %8.3fs (%+.1f%%, '
+          '%d opcodes)'
+          % (num_lines, baseline_elapsed, elapsed,
+             100.0 * (elapsed - baseline_elapsed) / baseline_elapsed,
+             len(opcodes)))
+
+
+def main():
+    parser = OptionParser(usage='%prog [options] [num_lines ...]')
+    parser.add_option('--baseline', dest='baseline', default='HEAD',
+                      help='The git revision of the MyersDiffer to '
+                           'compare against (defaults to HEAD)')
+    parser.add_option('--runs', dest='num_runs', type='int', default=3,
+                      help='The number of times to run each differ. The '
+                           'best time is reported (defaults to 3)')
+
+    options, args = parser.parse_args()
+    sizes = [int(arg) for arg in args] or DEFAULT_SIZES
+    baseline_differ_cls = load_baseline_differ(options.baseline)
+    rand = random.Random(0)
+
+    for num_lines in sizes:
+        run_benchmark(num_lines, rand, baseline_differ_cls,
+                      options.num_runs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""Cached access control information for users.
+
+Deciding whether a user can see a private repository or an invite-only
+review group requires knowing which repositories and groups the user has
+been given access to. Rather than querying for this on every check, the
+IDs are computed once per user and cached.
+
+The cached entries are versioned. Any change to group or repository
+membership replaces the version with a new random one, which causes the
+information to be recomputed the next time it's needed. Versions are
+never reused, so entries cached under an old version can't become valid
+again, even if the version is evicted from the cache.
+
+Membership changes bump the version as soon as they're made, which may be
+before the transaction containing them commits. A request handled in that
+window can recompute the information from the old membership and cache it
+under the new version. To limit how long such stale information can be
+used, cached entries expire after ``ACCESS_CACHE_EXPIRATION`` seconds.
+"""
+from __future__ import unicode_literals
+
+import uuid
+
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete
+from djblets.cache.backend import cache_memoize, make_cache_key
+
+
+_VERSION_KEY = 'user-access-version'
+
+#: The number of seconds before cached access information is recomputed.
+ACCESS_CACHE_EXPIRATION = 60
+
+
+class UserAccessInfo(object):
+    """Information on the private objects a user has access to.
+
+    ``group_ids`` contains the IDs of all review groups the user is a member
+    of. ``repository_ids`` contains the IDs of all repositories the user has
+    been given access to, either directly or through a review group.
+    """
+    def __init__(self, group_ids=(), repository_ids=()):
+        self.group_ids = frozenset(group_ids)
+        self.repository_ids = frozenset(repository_ids)
+
+
+def get_access_version():
+    """Returns the current version of the cached access information."""
+    key = make_cache_key(_VERSION_KEY)
+    version = cache.get(key)
+
+    if version is None:
+        version = _make_version()
+
+        if not cache.add(key, version):
+            # Another process set a version first, so use that one.
+            version = cache.get(key) or version
+
+    return version
+
+
+def invalidate_user_access(**kwargs):
+    """Invalidates the cached access information for all users.
+
+    This is called whenever group or repository membership changes.
+    """
+    cache.set(make_cache_key(_VERSION_KEY), _make_version())
+
+
+def _make_version():
+    return uuid.uuid4().hex
+
+
+def get_user_access(user):
+    """Returns the UserAccessInfo for a user.
+
+    The information is cached, and is also stored on the user for the rest
+    of the request, as long as the version doesn't change.
+    """
+    if not user.is_authenticated():
+        return UserAccessInfo()
+
+    version = get_access_version()
+    cached = getattr(user, '_access_info', None)
+
+    if cached and cached[0] == version:
+        return cached[1]
+
+    data = cache_memoize('user-access:%s:%s' % (user.pk, version),
+                         lambda: _build_access_data(user),
+                         expiration=ACCESS_CACHE_EXPIRATION)
+    info = UserAccessInfo(**data)
+    user._access_info = (version, info)
+
+    return info
+
+
+def _build_access_data(user):
+    """Looks up the groups and repositories a user has access to."""
+    from reviewboard.reviews.models import Group
+    from reviewboard.scmtools.models import Repository
+
+    group_ids = list(
+        Group.users.through.objects.filter(user=user.pk).values_list(
+            'group', flat=True))
+    repository_ids = set(
+        Repository.users.through.objects.filter(user=user.pk).values_list(
+            'repository', flat=True))
+
+    if group_ids:
+        repository_ids.update(
+            Repository.review_groups.through.objects.filter(
+                group__in=group_ids).values_list('repository', flat=True))
+
+    return {
+        'group_ids': group_ids,
+        'repository_ids': list(repository_ids),
+    }
+
+
+def _on_membership_changed(action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_user_access()
+
+
+def connect_signals():
+    """Connects the signals for invalidating cached access information."""
+    from reviewboard.reviews.models import Group
+    from reviewboard.scmtools.models import Repository
+
+    for through in (Group.users.through,
+                    Repository.users.through,
+                    Repository.review_groups.through):
+        m2m_changed.connect(_on_membership_changed, sender=through)
+
+    # Deleting a group or repository removes its memberships without
+    # sending m2m_changed.
+    post_delete.connect(invalidate_user_access, sender=Group)
+    post_delete.connect(invalidate_user_access, sender=Repository)
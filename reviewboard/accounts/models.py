@@ -9,7 +9,10 @@ from djblets.db.fields import CounterField, JSONField
 from djblets.db.managers import ConcurrencyManager
 from djblets.forms.fields import TIMEZONE_CHOICES
 
+from reviewboard.accounts.access import connect_signals
 from reviewboard.accounts.managers import ProfileManager
+from reviewboard.reviews.activity import \
+    invalidate_review_request_fingerprints
 from reviewboard.reviews.models import Group, ReviewRequest
 from reviewboard.site.models import LocalSite
 
@@ -120,6 +123,7 @@ class Profile(models.Model):
         immediately save to the database.
         """
         self.starred_review_requests.add(review_request)
+        invalidate_review_request_fingerprints([review_request.pk])
 
         if (review_request.public and
             (review_request.status == ReviewRequest.PENDING_REVIEW or
@@ -146,6 +150,7 @@ class Profile(models.Model):
 
         if q.count() > 0:
             self.starred_review_requests.remove(review_request)
+            invalidate_review_request_fingerprints([review_request.pk])
 
         if (review_request.public and
             (review_request.status == ReviewRequest.PENDING_REVIEW or
@@ -292,3 +297,7 @@ User.is_profile_visible = _is_user_profile_visible
 User.get_profile = _get_profile
 User.get_site_profile = _get_site_profile
 User._meta.ordering = ('username',)
+
+
+# Keep the cached access information up to date as memberships change.
+connect_signals()
@@ -1,8 +1,15 @@
 from __future__ import unicode_literals
 
-from django.contrib.auth.models import User
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from djblets.cache.backend import make_cache_key
 from djblets.testing.decorators import add_fixtures
+from kgb import SpyAgency
 
+from reviewboard.accounts import access
+from reviewboard.accounts.access import (get_access_version,
+                                         get_user_access,
+                                         invalidate_user_access)
 from reviewboard.accounts.models import LocalSiteProfile
 from reviewboard.testing import TestCase
 
@@ -55,3 +62,92 @@ class ProfileTests(TestCase):
         self.assertFalse(review_request in
                          profile1.starred_review_requests.all())
         self.assertEqual(site_profile.starred_public_request_count, 0)
+
+
+class UserAccessTests(SpyAgency, TestCase):
+    """Unit tests for the cached user access information."""
+    fixtures = ['test_users', 'test_scmtools']
+
+    def test_get_user_access(self):
+        """Testing get_user_access"""
+        user = User.objects.get(username='grumpy')
+        group = self.create_review_group(invite_only=True)
+        group.users.add(user)
+
+        repository1 = self.create_repository(name='repo1', path='/repo1',
+                                             public=False)
+        repository1.users.add(user)
+
+        repository2 = self.create_repository(name='repo2', path='/repo2',
+                                             public=False)
+        repository2.review_groups.add(group)
+
+        self.create_repository(name='repo3', path='/repo3', public=False)
+
+        access = get_user_access(user)
+        self.assertEqual(access.group_ids, set([group.pk]))
+        self.assertEqual(access.repository_ids,
+                         set([repository1.pk, repository2.pk]))
+
+        # Further lookups should come from the cache.
+        user = User.objects.get(username='grumpy')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_user_access(user).group_ids,
+                             set([group.pk]))
+
+    def test_get_user_access_expiration(self):
+        """Testing get_user_access caches with a short expiration"""
+        self.spy_on(access.cache_memoize)
+
+        get_user_access(User.objects.get(username='grumpy'))
+
+        calls = access.cache_memoize.spy.calls
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(calls[0].kwargs['expiration'],
+                         access.ACCESS_CACHE_EXPIRATION)
+
+    def test_get_user_access_after_membership_changes(self):
+        """Testing get_user_access after group and repository membership
+        changes
+        """
+        user = User.objects.get(username='grumpy')
+        group = self.create_review_group(invite_only=True)
+        repository = self.create_repository(public=False)
+
+        self.assertFalse(group.is_accessible_by(user))
+        self.assertFalse(repository.is_accessible_by(user))
+
+        group.users.add(user)
+        self.assertTrue(group.is_accessible_by(user))
+        self.assertFalse(repository.is_accessible_by(user))
+
+        repository.review_groups.add(group)
+        self.assertTrue(repository.is_accessible_by(user))
+
+        user.review_groups.remove(group)
+        self.assertFalse(group.is_accessible_by(user))
+        self.assertFalse(repository.is_accessible_by(user))
+
+    def test_get_access_version_not_reused(self):
+        """Testing get_access_version never reuses a version after
+        invalidation and eviction
+        """
+        versions = set([get_access_version()])
+
+        invalidate_user_access()
+        versions.add(get_access_version())
+
+        # Simulate the version being evicted from the cache.
+        cache.delete(make_cache_key('user-access-version'))
+        versions.add(get_access_version())
+
+        self.assertEqual(len(versions), 3)
+
+    def test_get_user_access_with_anonymous(self):
+        """Testing get_user_access with anonymous users"""
+        with self.assertNumQueries(0):
+            access = get_user_access(AnonymousUser())
+
+        self.assertEqual(access.group_ids, set())
+        self.assertEqual(access.repository_ids, set())
@@ -208,18 +208,11 @@ def reset_check_cache():
 
 
 def get_can_enable_search():
-    """Checks whether the search functionality can be enabled."""
-    try:
-        imp.find_module("lucene")
-        return (True, None)
-    except ImportError:
-        return (False, _(
-            'PyLucene (with JCC) is required to enable search. See the '
-            '<a href="%(url)s">documentation</a> for instructions.'
-        ) % {
-            'url': 'http://www.reviewboard.org/docs/manual/dev/admin/'
-                   'installation/linux/#installing-pylucene'
-        })
+    """Checks whether the search functionality can be enabled.
+
+    Search is built in, so this is always possible.
+    """
+    return (True, None)
 
 
 def get_can_enable_syntax_highlighting():
@@ -534,6 +534,20 @@ class DiffSettingsForm(SiteSettingsForm):
                     'to disable size restrictions.'),
         widget=forms.TextInput(attrs={'size': '15'}))
 
+    diffviewer_prewarm_chunks = forms.BooleanField(
+        label=_('Pre-generate diffs'),
+        help_text=_('Generate and cache new diffs and interdiffs in the '
+                    'background when they are uploaded, so they are ready '
+                    'before anyone views them.'),
+        required=False)
+
+    diffviewer_prewarm_max_jobs_per_repository = forms.IntegerField(
+        label=_('Max pre-generated files per repository'),
+        help_text=_('The maximum number of files that will be pre-generated '
+                    'at once for any given repository.'),
+        min_value=1,
+        widget=forms.TextInput(attrs={'size': '5'}))
+
     def load(self):
         # TODO: Move this check into a dependencies module so we can catch it
         #       when the user starts up Review Board.
@@ -578,7 +592,9 @@ class DiffSettingsForm(SiteSettingsForm):
                 'fields': ('diffviewer_max_diff_size',
                            'diffviewer_context_num_lines',
                            'diffviewer_paginate_by',
-                           'diffviewer_paginate_orphans')
+                           'diffviewer_paginate_orphans',
+                           'diffviewer_prewarm_chunks',
+                           'diffviewer_prewarm_max_jobs_per_repository')
             }
         )
 
@@ -23,6 +23,7 @@ from reviewboard import initialize
 from reviewboard.admin.checks import check_updates_required
 from reviewboard.admin.siteconfig import load_site_config
 from reviewboard.admin.views import manual_updates_required
+from reviewboard.notifications.outbox import start_outbox_worker
 
 
 class InitReviewBoardMiddleware(object):
@@ -36,6 +37,10 @@ class InitReviewBoardMiddleware(object):
             initialize()
             self._initialized = True
 
+            # Send any e-mails left in the outbox, and keep sending new ones
+            # in the background.
+            start_outbox_worker()
+
 
 class LoadSettingsMiddleware(object):
     """
@@ -125,6 +125,8 @@ defaults.update({
     'diffviewer_max_diff_size':            0,
     'diffviewer_paginate_by':              20,
     'diffviewer_paginate_orphans':         10,
+    'diffviewer_prewarm_chunks':           True,
+    'diffviewer_prewarm_max_jobs_per_repository': 2,
     'diffviewer_syntax_highlighting':      True,
     'diffviewer_syntax_highlighting_threshold': 0,
     'diffviewer_show_trailing_whitespace': True,
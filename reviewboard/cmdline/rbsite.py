@@ -398,7 +398,7 @@ class Site(object):
         """Determines whether there's likely duplicate diff data stored."""
         from reviewboard.diffviewer.models import FileDiff
 
-        return FileDiff.objects.unmigrated().count() > 0
+        return FileDiff.objects.unmigrated().exists()
 
     def get_settings_upgrade_needed(self):
         """Determines whether or not a settings upgrade is needed."""
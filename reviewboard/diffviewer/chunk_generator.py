@@ -1,20 +1,25 @@
 from __future__ import unicode_literals
 
+import bisect
 import fnmatch
+import os
 import re
+import time
 from difflib import SequenceMatcher
 
+from django.core.cache import cache
 from django.utils.html import escape
 from django.utils.safestring import mark_safe
-from django.utils.translation import ugettext as _, get_language
+from django.utils.translation import ugettext as _
 from djblets.log import log_timed
-from djblets.cache.backend import cache_memoize
+from djblets.cache.backend import cache_memoize, make_cache_key
 from djblets.siteconfig.models import SiteConfiguration
 from djblets.util.compat import six
 from djblets.util.compat.six.moves import range
 from pygments import highlight
-from pygments.lexers import get_lexer_for_filename
+from pygments.lexers import get_all_lexers, get_lexer_for_filename
 from pygments.formatters import HtmlFormatter
+from pygments.util import ClassNotFound
 
 from reviewboard.diffviewer.differ import get_differ
 from reviewboard.diffviewer.diffutils import (get_original_file,
@@ -22,6 +27,54 @@ from reviewboard.diffviewer.diffutils import (get_original_file,
 from reviewboard.diffviewer.opcode_generator import get_diff_opcode_generator
 
 
+# Matches lexer filename patterns that only look at the file extension.
+EXTENSION_LEXER_PATTERN_RE = re.compile(r'^\*\.[^.*?\[]+$')
+
+_lexer_classes = {}
+_name_lexer_patterns = None
+
+
+def get_lexer_class_for_filename(filename):
+    """Returns the Pygments lexer class used to highlight a file.
+
+    Finding a lexer for a filename means matching against the filename
+    patterns of every lexer, so the result is cached by the file's
+    extension. Files matching a lexer pattern that looks at more than the
+    extension (such as "Makefile" or "*.html.erb") are cached by their
+    name instead.
+
+    If there's no lexer for the file, this returns None.
+    """
+    global _name_lexer_patterns
+
+    if _name_lexer_patterns is None:
+        _name_lexer_patterns = [
+            pattern
+            for lexer_info in get_all_lexers()
+            for pattern in lexer_info[2]
+            if not EXTENSION_LEXER_PATTERN_RE.match(pattern)
+        ]
+
+    basename = os.path.basename(filename)
+    key = os.path.splitext(basename)[1]
+
+    if not key or any(fnmatch.fnmatch(basename, pattern)
+                      for pattern in _name_lexer_patterns):
+        key = basename
+
+    try:
+        return _lexer_classes[key]
+    except KeyError:
+        try:
+            lexer_cls = type(get_lexer_for_filename(basename))
+        except ClassNotFound:
+            lexer_cls = None
+
+        _lexer_classes[key] = lexer_cls
+
+        return lexer_cls
+
+
 class NoWrapperHtmlFormatter(HtmlFormatter):
     """An HTML Formatter for Pygments that doesn't wrap items in a div."""
     def __init__(self, *args, **kwargs):
@@ -77,6 +130,16 @@ class DiffChunkGenerator(object):
          in this case, so we have to indicate that we are indeed in
          interdiff mode so that we can special-case this and not
          grab a patched file for the interdiff version.
+
+    Files with more than CHUNK_WINDOW_NUM_LINES lines don't have their chunks
+    stored as one big list. Instead, the chunks are stored in the cache in
+    windows of roughly that many lines as they're generated, and get_chunks
+    returns a DiffChunkWindows that loads one window at a time. Chunks larger
+    than the window size are split up.
+
+    Chunks must not contain any localized text. They're cached once for all
+    languages, and translation is left up to the DiffRenderer and the
+    templates it renders.
     """
     NEWLINES_RE = re.compile(r'\r?\n')
 
@@ -84,6 +147,27 @@ class DiffChunkGenerator(object):
     STYLED_MAX_LINE_LEN = 1000
     STYLED_MAX_LIMIT_BYTES = 200000  # 200KB
 
+    # The approximate number of lines stored in each window of chunks for
+    # large files. This is also the maximum size of any chunk.
+    CHUNK_WINDOW_NUM_LINES = 5000
+
+    # Whether to highlight only the changed regions of the modified file,
+    # reusing the highlighted lines of the original file for the rest.
+    INCREMENTAL_HIGHLIGHTING = True
+
+    # The number of matching non-blank lines needed around a changed region
+    # before the highlighting is considered to be back in sync with the
+    # original file.
+    HIGHLIGHT_SYNC_NUM_LINES = 5
+
+    # The maximum number of seconds to wait for another process that's
+    # generating the same chunks, before generating them here instead.
+    GENERATION_LOCK_TIMEOUT = 60
+
+    # The number of seconds between checks for chunks being generated by
+    # another process.
+    GENERATION_LOCK_POLL_INTERVAL = 0.2
+
     def __init__(self, request, filediff, interfilediff=None,
                  force_interdiff=False, enable_syntax_highlighting=True):
         assert filediff
@@ -98,14 +182,23 @@ class DiffChunkGenerator(object):
 
         self.filename = filediff.source_file
 
-        # Chunk processing state.
+        self._reset_state()
+
+    def _reset_state(self):
+        """Resets the chunk processing state."""
         self._last_header = [None, None]
         self._last_header_index = [0, 0]
         self._cur_meta = {}
         self._chunk_index = 0
 
     def make_cache_key(self):
-        """Creates a cache key for any generated chunks."""
+        """Creates a cache key for any generated chunks.
+
+        The generated chunks don't contain any translated text, so the key
+        doesn't depend on the active language. All languages share the same
+        cached chunks, and any text shown alongside them is localized when
+        the diff is rendered.
+        """
         key = 'diff-sidebyside-'
 
         if self.enable_syntax_highlighting:
@@ -119,8 +212,6 @@ class DiffChunkGenerator(object):
         else:
             key += 'interdiff-%s-none' % self.filediff.pk
 
-        key += '-%s' % get_language()
-
         return key
 
     def get_chunks(self):
@@ -132,15 +223,136 @@ class DiffChunkGenerator(object):
         If there are chunks already computed in the cache, they will be
         returned. Otherwise, new chunks will be generated, stored in cache,
         and returned.
+
+        For large files, this returns a DiffChunkWindows, which acts like a
+        list but only loads chunks from the cache one window at a time.
+
+        Only one process generates the chunks for a file at a time. If
+        another process is already generating them, this will wait for
+        those chunks rather than generating them again.
         """
         if (self.filediff.binary or
                 self.filediff.deleted or
                 self.filediff.source_revision == ''):
             return []
 
-        return cache_memoize(self.make_cache_key(),
-                             lambda: list(self._get_chunks_uncached()),
-                             large_data=True)
+        key = self.make_cache_key()
+        lock_key = make_cache_key('%s-lock' % key)
+        locked = False
+
+        if make_cache_key(key) not in cache:
+            locked = cache.add(lock_key, True, self.GENERATION_LOCK_TIMEOUT)
+
+            if not locked:
+                self._wait_for_generation(key, lock_key)
+
+        try:
+            result = cache_memoize(key,
+                                   lambda: self._store_chunk_windows()[0],
+                                   large_data=True)
+        finally:
+            if locked:
+                cache.delete(lock_key)
+
+        if isinstance(result, dict):
+            return DiffChunkWindows(self, result)
+
+        return result
+
+    def _wait_for_generation(self, key, lock_key):
+        """Waits for another process to finish generating chunks.
+
+        This returns once the chunks are in the cache, the other process
+        has released its lock, or GENERATION_LOCK_TIMEOUT has passed.
+        """
+        timeout = time.time() + self.GENERATION_LOCK_TIMEOUT
+
+        while time.time() < timeout:
+            time.sleep(self.GENERATION_LOCK_POLL_INTERVAL)
+
+            if make_cache_key(key) in cache or lock_key not in cache:
+                break
+
+    def make_window_cache_key(self, window_index):
+        """Creates a cache key for a window of generated chunks."""
+        return '%s-window-%d' % (self.make_cache_key(), window_index)
+
+    def get_chunk_window(self, window_index):
+        """Returns the list of chunks in a window.
+
+        The window will be loaded from the cache. If it's no longer in the
+        cache, all of the windows will be regenerated and stored again.
+        """
+        return cache_memoize(
+            self.make_window_cache_key(window_index),
+            lambda: self._store_chunk_windows(window_index)[1],
+            large_data=True)
+
+    def _store_chunk_windows(self, wanted_window_index=None):
+        """Generates chunks, storing large files in windows in the cache.
+
+        This returns a tuple of the value to store under the main cache key
+        and the chunks for ``wanted_window_index``, if requested.
+
+        If the file's chunks don't fill up a full window, the value for the
+        main cache key is the list of chunks. Otherwise, each window is
+        stored in the cache as soon as it fills up, and the value is a
+        dictionary describing the windows and containing a summary of each
+        chunk. In this case, only one window of chunks is held in memory
+        at a time.
+        """
+        self._reset_state()
+
+        window = []
+        window_num_lines = 0
+        window_offsets = []
+        summaries = []
+        wanted_window = None
+
+        def store_window():
+            window_index = len(window_offsets)
+            window_offsets.append(len(summaries) - len(window))
+            cache_memoize(self.make_window_cache_key(window_index),
+                          lambda: window,
+                          force_overwrite=True,
+                          large_data=True)
+
+            return window_index
+
+        for chunk in self._get_chunks_uncached():
+            window.append(chunk)
+            window_num_lines += chunk['numlines']
+            summaries.append({
+                'index': chunk['index'],
+                'change': chunk['change'],
+                'numlines': chunk['numlines'],
+                'collapsable': chunk['collapsable'],
+                'meta': {
+                    'whitespace_chunk':
+                        chunk['meta'].get('whitespace_chunk', False),
+                },
+            })
+
+            if window_num_lines >= self.CHUNK_WINDOW_NUM_LINES:
+                if store_window() == wanted_window_index:
+                    wanted_window = window
+
+                window = []
+                window_num_lines = 0
+
+        if not window_offsets:
+            # This file was small enough to store in one go.
+            return window, window
+
+        if window:
+            if store_window() == wanted_window_index:
+                wanted_window = window
+
+        return {
+            'num_chunks': len(summaries),
+            'window_offsets': window_offsets,
+            'summaries': summaries,
+        }, wanted_window
 
     def _get_chunks_uncached(self):
         """Returns the list of chunks, bypassing the cache."""
@@ -180,30 +392,6 @@ class DiffChunkGenerator(object):
         a_num_lines = len(a)
         b_num_lines = len(b)
 
-        markup_a = markup_b = None
-
-        if self._get_enable_syntax_highlighting(old, new, a, b):
-            repository = self.filediff.diffset.repository
-            tool = repository.get_scmtool()
-            source_file = \
-                tool.normalize_path_for_display(self.filediff.source_file)
-            dest_file = \
-                tool.normalize_path_for_display(self.filediff.dest_file)
-
-            try:
-                # TODO: Try to figure out the right lexer for these files
-                #       once instead of twice.
-                markup_a = self._apply_pygments(old or '', source_file)
-                markup_b = self._apply_pygments(new or '', dest_file)
-            except:
-                pass
-
-        if not markup_a:
-            markup_a = self.NEWLINES_RE.split(escape(old))
-
-        if not markup_b:
-            markup_b = self.NEWLINES_RE.split(escape(new))
-
         siteconfig = SiteConfiguration.objects.get_current()
         ignore_space = True
 
@@ -232,11 +420,12 @@ class DiffChunkGenerator(object):
                 request=self.request)
 
         line_num = 1
-        opcodes_generator = get_diff_opcode_generator(self.differ,
-                                                      self.filediff,
-                                                      self.interfilediff)
+        opcodes = list(get_diff_opcode_generator(self.differ,
+                                                 self.filediff,
+                                                 self.interfilediff))
+        markup_a, markup_b = self._get_markup(old, new, a, b, opcodes)
 
-        for tag, i1, i2, j1, j2, meta in opcodes_generator:
+        for tag, i1, i2, j1, j2, meta in opcodes:
             old_lines = markup_a[i1:i2]
             new_lines = markup_b[j1:j2]
             num_lines = max(len(old_lines), len(new_lines))
@@ -252,21 +441,24 @@ class DiffChunkGenerator(object):
                 last_range_start = num_lines - context_num_lines
 
                 if line_num == 1:
-                    yield self._new_chunk(lines, 0, last_range_start, True)
-                    yield self._new_chunk(lines, last_range_start, num_lines)
+                    ranges = [(0, last_range_start, True),
+                              (last_range_start, num_lines, False)]
+                elif i2 == a_num_lines and j2 == b_num_lines:
+                    ranges = [(0, context_num_lines, False),
+                              (context_num_lines, num_lines, True)]
                 else:
-                    yield self._new_chunk(lines, 0, context_num_lines)
-
-                    if i2 == a_num_lines and j2 == b_num_lines:
-                        yield self._new_chunk(lines, context_num_lines,
-                                              num_lines, True)
-                    else:
-                        yield self._new_chunk(lines, context_num_lines,
-                                              last_range_start, True)
-                        yield self._new_chunk(lines, last_range_start,
-                                              num_lines)
+                    ranges = [(0, context_num_lines, False),
+                              (context_num_lines, last_range_start, True),
+                              (last_range_start, num_lines, False)]
+
+                for start, end, collapsable in ranges:
+                    for chunk in self._new_chunks(lines, start, end,
+                                                  collapsable):
+                        yield chunk
             else:
-                yield self._new_chunk(lines, 0, num_lines, False, tag, meta)
+                for chunk in self._new_chunks(lines, 0, num_lines, False,
+                                              tag, meta):
+                    yield chunk
 
             line_num += num_lines
 
@@ -348,6 +540,27 @@ class DiffChunkGenerator(object):
 
         return result
 
+    def _new_chunks(self, all_lines, start, end, collapsable=False,
+                    tag='equal', meta=None):
+        """Creates one or more chunks for a range of lines.
+
+        Ranges larger than CHUNK_WINDOW_NUM_LINES are split into multiple
+        chunks, so that no single chunk has to hold an unbounded number of
+        lines.
+        """
+        max_lines = self.CHUNK_WINDOW_NUM_LINES
+
+        if end - start <= max_lines:
+            yield self._new_chunk(all_lines, start, end, collapsable, tag,
+                                  meta)
+        else:
+            for piece_start in range(start, end, max_lines):
+                # Each chunk needs its own meta dictionary, since headers are
+                # stored in it.
+                yield self._new_chunk(all_lines, piece_start,
+                                      min(piece_start + max_lines, end),
+                                      collapsable, tag, dict(meta or {}))
+
     def _new_chunk(self, all_lines, start, end, collapsable=False,
                    tag='equal', meta=None):
         """Creates a chunk.
@@ -430,18 +643,230 @@ class DiffChunkGenerator(object):
         else:
             self._last_header_index[0] = last_index
 
-    def _apply_pygments(self, data, filename):
-        """Applies Pygments syntax-highlighting to a file's contents.
+    def _get_markup(self, old, new, a, b, opcodes):
+        """Returns the HTML markup for the lines of both files.
 
-        The resulting HTML will be returned as a list of lines.
+        If syntax highlighting is enabled, the lexer is looked up once and
+        shared by both files when they're of the same type. The modified
+        file is then highlighted incrementally, based on the original file,
+        if possible.
+
+        If the files can't be highlighted, the lines are simply escaped.
         """
-        lexer = get_lexer_for_filename(filename,
-                                       stripnl=False,
-                                       encoding='utf-8')
+        markup_a = markup_b = None
+
+        if self._get_enable_syntax_highlighting(old, new, a, b):
+            repository = self.filediff.diffset.repository
+            tool = repository.get_scmtool()
+            source_file = \
+                tool.normalize_path_for_display(self.filediff.source_file)
+            dest_file = \
+                tool.normalize_path_for_display(self.filediff.dest_file)
+
+            try:
+                source_lexer_cls = get_lexer_class_for_filename(source_file)
+                dest_lexer_cls = get_lexer_class_for_filename(dest_file)
+                source_lexer = dest_lexer = None
+
+                if source_lexer_cls:
+                    source_lexer = self._create_lexer(source_lexer_cls)
+                    markup_a = self._apply_pygments(old or '', source_lexer)
+
+                if dest_lexer_cls is source_lexer_cls:
+                    dest_lexer = source_lexer
+                elif dest_lexer_cls:
+                    dest_lexer = self._create_lexer(dest_lexer_cls)
+
+                if dest_lexer:
+                    if (markup_a and dest_lexer is source_lexer and
+                        self.INCREMENTAL_HIGHLIGHTING):
+                        markup_b = self._apply_pygments_incremental(
+                            a, b, markup_a, opcodes, dest_lexer)
+
+                    if markup_b is None:
+                        markup_b = self._apply_pygments(new or '',
+                                                        dest_lexer)
+            except:
+                pass
+
+        if not markup_a:
+            markup_a = self.NEWLINES_RE.split(escape(old))
+
+        if not markup_b:
+            markup_b = self.NEWLINES_RE.split(escape(new))
+
+        return markup_a, markup_b
+
+    def _create_lexer(self, lexer_cls):
+        """Creates a Pygments lexer for highlighting files."""
+        lexer = lexer_cls(stripnl=False, encoding='utf-8')
         lexer.add_filter('codetagify')
 
+        return lexer
+
+    def _apply_pygments(self, data, lexer):
+        """Applies Pygments syntax-highlighting to a file's contents.
+
+        The resulting HTML will be returned as a list of lines.
+        """
         return highlight(data, lexer, NoWrapperHtmlFormatter()).splitlines()
 
+    def _apply_pygments_incremental(self, a, b, markup_a, opcodes, lexer):
+        """Applies Pygments syntax-highlighting to a modified file.
+
+        Rather than highlighting the whole modified file, this reuses the
+        highlighted lines from the original file for unchanged lines, and
+        only highlights the regions around the changes.
+
+        Each region is highlighted starting a few lines before the change,
+        and must match the original file's highlighting for at least
+        HIGHLIGHT_SYNC_NUM_LINES non-blank lines right before the change.
+        This ensures the lexer starts out in the same state it was in for
+        the original file. If they don't match, highlighting starts further
+        back.
+
+        Highlighting then continues past the change until the lines match
+        the original file's highlighting again for that many non-blank
+        lines, at which point the lexer is considered to be back in sync
+        (for instance, after a change that opens a multi-line comment).
+        Only a window of lines around the change is lexed at a time. If
+        the lines aren't back in sync within the window, the window is
+        doubled and the region is lexed again.
+
+        The resulting HTML will be returned as a list of lines, or None if
+        this would take more work than highlighting the whole file.
+        """
+        num_lines = len(b)
+        sync_num_lines = self.HIGHLIGHT_SYNC_NUM_LINES
+        formatter = NoWrapperHtmlFormatter()
+
+        if len(markup_a) != len(a):
+            return None
+
+        # Map each unchanged line in the modified file to the same line in
+        # the original file. "equal" opcodes may still contain whitespace
+        # changes, so the lines must be compared.
+        orig_linenums = [None] * num_lines
+
+        for tag, i1, i2, j1, j2, meta in opcodes:
+            if tag == 'equal':
+                for i, j in zip(range(i1, i2), range(j1, j2)):
+                    if a[i] == b[j]:
+                        orig_linenums[j] = i
+
+        # Lines following deleted lines must be highlighted again as well,
+        # since the deleted lines may have changed the lexer's state.
+        prev_i = -1
+
+        for j, i in enumerate(list(orig_linenums)):
+            if i is not None and prev_i is not None and i != prev_i + 1:
+                orig_linenums[j] = None
+
+            prev_i = i
+
+        markup_b = [
+            markup_a[i] if i is not None else None
+            for i in orig_linenums
+        ]
+        num_highlighted = 0
+        j = 0
+
+        while j < num_lines:
+            if orig_linenums[j] is not None:
+                j += 1
+                continue
+
+            # This is the start of a changed region. Find where it ends.
+            end = j + 1
+
+            while end < num_lines and orig_linenums[end] is None:
+                end += 1
+
+            # Only a window of lines around the change is lexed. If that
+            # isn't enough to get back in sync, the window is grown, rather
+            # than lexing the rest of the file.
+            num_before = 2 * sync_num_lines
+            num_after = 4 * sync_num_lines
+
+            while True:
+                start = max(j - num_before, 0)
+                window_end = min(end + num_after, num_lines)
+                num_highlighted += window_end - start
+
+                if num_highlighted > num_lines:
+                    # This is more work than highlighting the whole file.
+                    return None
+
+                lines = []
+                num_synced = 0
+
+                # There's no earlier lexer state to match at the start of
+                # the file.
+                synced = (start == 0)
+                resynced = False
+
+                # Tokens near the end of the window may be lexed differently
+                # than they would be in the whole file, so the lines must be
+                # back in sync a few lines before the end of the window.
+                if window_end == num_lines:
+                    resync_end = num_lines
+                else:
+                    resync_end = window_end - sync_num_lines
+
+                tokens = lexer.get_tokens(
+                    '\n'.join(b[start:window_end]) + '\n')
+
+                for linenum, (is_line, line) in enumerate(
+                        formatter._format_lines(tokens), start):
+                    if linenum >= window_end:
+                        # Pygments split the lines differently than we did
+                        # (for instance, on a lone "\r").
+                        return None
+
+                    line = line.rstrip('\n')
+                    lines.append(line)
+                    orig_linenum = orig_linenums[linenum]
+
+                    if (orig_linenum is None or
+                        line != markup_a[orig_linenum]):
+                        num_synced = 0
+                    elif b[linenum].strip():
+                        num_synced += 1
+
+                    if linenum == j - 1:
+                        # We've reached the change. If the lines leading up
+                        # to it don't match, start again further back.
+                        synced = (start == 0 or
+                                  num_synced >= sync_num_lines)
+
+                        if not synced:
+                            break
+                    elif (linenum >= end and
+                          linenum < resync_end and
+                          num_synced >= sync_num_lines):
+                        resynced = True
+                        break
+
+                if not synced:
+                    num_before *= 2
+                elif resynced:
+                    break
+                elif window_end == num_lines:
+                    if len(lines) != window_end - start:
+                        return None
+
+                    break
+                else:
+                    num_after *= 2
+
+            # Only the lines from the change onward are used. The lines
+            # before it were only highlighted to check the lexer's state.
+            stop = start + len(lines)
+            markup_b[j:stop] = lines[j - start:]
+            j = stop
+
+        return markup_b
+
     def _convert_to_utf8(self, s, enc):
         """Returns the passed string as a unicode string.
 
@@ -522,6 +947,46 @@ class DiffChunkGenerator(object):
         return oldchanges, newchanges
 
 
+class DiffChunkWindows(object):
+    """A list of chunks for a large file, stored in windows in the cache.
+
+    This acts like a read-only list of chunks. Iterating over it loads one
+    window of chunks from the cache at a time, so the full list of chunks
+    for the file never has to be in memory. Indexing loads only the window
+    containing the chunk.
+
+    ``summaries`` contains a small dictionary for each chunk, with the
+    chunk's index, change type, number of lines, collapsable state, and
+    whether it's a whitespace-only chunk. This can be used in place of the
+    chunks when the lines aren't needed.
+    """
+    def __init__(self, generator, manifest):
+        self.generator = generator
+        self.num_chunks = manifest['num_chunks']
+        self.window_offsets = manifest['window_offsets']
+        self.summaries = manifest['summaries']
+
+    def __len__(self):
+        return self.num_chunks
+
+    def __iter__(self):
+        for window_index in range(len(self.window_offsets)):
+            for chunk in self.generator.get_chunk_window(window_index):
+                yield chunk
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.num_chunks
+
+        if index < 0 or index >= self.num_chunks:
+            raise IndexError('Chunk index out of range')
+
+        window_index = bisect.bisect_right(self.window_offsets, index) - 1
+        window = self.generator.get_chunk_window(window_index)
+
+        return window[index - self.window_offsets[window_index]]
+
+
 def compute_chunk_last_header(lines, numlines, meta, last_header=None):
     """Computes information for the displayed function/class headers.
 
@@ -1,19 +1,26 @@
 from __future__ import unicode_literals
 
+import hashlib
+import logging
 import os
 import re
 import subprocess
 import tempfile
 
+from django.core.cache import cache
 from django.utils import six
 from django.utils.translation import ugettext as _
+from djblets.cache.backend import cache_memoize, make_cache_key
 from djblets.log import log_timed
 from djblets.siteconfig.models import SiteConfiguration
+from djblets.util.compat.six.moves.urllib.parse import quote as urlquote
 from djblets.util.contextmanagers import controlled_subprocess
 
 from reviewboard.accounts.models import Profile
 from reviewboard.admin.checks import get_can_enable_syntax_highlighting
-from reviewboard.scmtools.core import PRE_CREATION, HEAD
+from reviewboard.diffviewer.errors import PatchError
+from reviewboard.diffviewer.patcher import apply_patch
+from reviewboard.scmtools.core import PRE_CREATION, HEAD, SCMTool
 
 
 NEWLINE_CONVERSION_RE = re.compile(r'\r(\r?\n)?')
@@ -45,9 +52,12 @@ def convert_line_endings(data):
 
 
 def patch(diff, file, filename, request=None):
-    """Apply a diff to a file.  Delegates out to `patch` because noone
-       except Larry Wall knows how to patch."""
+    """Apply a diff to a file.
 
+    The diff is first applied in-process, which avoids writing temporary
+    files and forking. If that fails, this delegates out to `patch`,
+    because noone except Larry Wall knows how to patch.
+    """
     log_timer = log_timed("Patching file %s" % filename,
                           request=request)
 
@@ -55,6 +65,16 @@ def patch(diff, file, filename, request=None):
         # Someone uploaded an unchanged file. Return the one we're patching.
         return file
 
+    try:
+        data = apply_patch(convert_line_endings(diff),
+                           convert_line_endings(file))
+        log_timer.done()
+
+        return data
+    except PatchError as e:
+        logging.debug('Unable to patch %s in-process, falling back to '
+                      'patch: %s', filename, e)
+
     # Prepare the temporary directory if none is available
     tempdir = tempfile.mkdtemp(prefix='reviewboard.')
 
@@ -140,18 +160,96 @@ def get_original_file(filediff, request=None):
         data = convert_line_endings(data)
 
     # If there's a parent diff set, apply it to the buffer.
-    if filediff.parent_diff:
+    if filediff.parent_diff_hash_id:
+        data = _get_cached_patched_file(
+            data, filediff.parent_diff_hash_id,
+            lambda: patch(filediff.parent_diff, data, filediff.source_file,
+                          request))
+    elif filediff.parent_diff:
         data = patch(filediff.parent_diff, data, filediff.source_file,
                      request)
 
     return data
 
 
+def prefetch_original_files(filediffs, request=None):
+    """Fetches the original versions of several files in one go.
+
+    The files are fetched using Repository.get_files, which stores them in
+    the cache, so that later calls to get_original_file for these
+    filediffs don't have to go back to the repository one file at a time.
+
+    Errors are logged and otherwise ignored. They'll be raised again when
+    get_original_file is called for the file.
+    """
+    files_by_repository = {}
+
+    for filediff in filediffs:
+        if (filediff.binary or
+            filediff.deleted or
+            filediff.source_revision in (PRE_CREATION, '')):
+            continue
+
+        diffset = filediff.diffset
+        files = files_by_repository.setdefault(diffset.repository, [])
+        f = (filediff.source_file, filediff.source_revision,
+             diffset.base_commit_id)
+
+        if f not in files:
+            files.append(f)
+
+    for repository, files in six.iteritems(files_by_repository):
+        try:
+            repository.get_files(files, request=request)
+        except Exception as e:
+            logging.warning('Unable to prefetch %d files from %s: %s',
+                            len(files), repository, e)
+
+
 def get_patched_file(buffer, filediff, request=None):
-    tool = filediff.diffset.repository.get_scmtool()
-    diff = tool.normalize_patch(filediff.diff, filediff.source_file,
-                                filediff.source_revision)
-    return patch(diff, buffer, filediff.dest_file, request)
+    def _patch():
+        tool = filediff.diffset.repository.get_scmtool()
+        diff = tool.normalize_patch(filediff.diff, filediff.source_file,
+                                    filediff.source_revision)
+        return patch(diff, buffer, filediff.dest_file, request)
+
+    if not filediff.diff_hash_id:
+        # This is an older FileDiff that hasn't been migrated to
+        # FileDiffData yet, so there's no hash to key off of.
+        return _patch()
+
+    tool_class = filediff.diffset.repository.tool.get_scmtool_class()
+
+    if tool_class.normalize_patch == SCMTool.normalize_patch:
+        extra_key = ''
+    else:
+        # The SCMTool may change the diff based on the file being patched
+        # (such as collapsing Subversion keywords), so the result is only
+        # valid for this particular file and revision.
+        extra_key = '%s:%s:%s' % (filediff.diffset.repository_id,
+                                  urlquote(filediff.source_file),
+                                  urlquote(filediff.source_revision))
+
+    return _get_cached_patched_file(buffer, filediff.diff_hash_id, _patch,
+                                    extra_key)
+
+
+def _get_cached_patched_file(data, diff_hash, patch_func, extra_key=''):
+    """Returns the result of patching a file, caching it.
+
+    The result is cached based on the SHA1 of the file being patched and
+    the hash of the diff (the ``FileDiffData`` key), so any review requests
+    patching the same file contents with the same diff will share the
+    result, as will interdiffs and chunks rendered for other languages.
+    The cached data is compressed.
+    """
+    key = 'patched-file:%s:%s' % (hashlib.sha1(data).hexdigest(), diff_hash)
+
+    if extra_key:
+        key += ':%s' % extra_key
+
+    # See Repository.get_file for why the result is wrapped in a list.
+    return cache_memoize(key, lambda: [patch_func()], large_data=True)[0]
 
 
 def get_revision_str(revision):
@@ -337,12 +435,35 @@ def populate_diff_chunks(files, enable_syntax_highlighting=True,
     """
     from reviewboard.diffviewer.chunk_generator import get_diff_chunk_generator
 
-    for diff_file in files:
-        generator = get_diff_chunk_generator(request,
-                                             diff_file['filediff'],
-                                             diff_file['interfilediff'],
-                                             diff_file['force_interdiff'],
-                                             enable_syntax_highlighting)
+    generators = [
+        get_diff_chunk_generator(request,
+                                 diff_file['filediff'],
+                                 diff_file['interfilediff'],
+                                 diff_file['force_interdiff'],
+                                 enable_syntax_highlighting)
+        for diff_file in files
+    ]
+
+    # Any files that will need their chunks generated will need their
+    # original versions. Fetch those all at once up-front, instead of one
+    # at a time as each file is processed.
+    cached_keys = cache.get_many([
+        make_cache_key(generator.make_cache_key())
+        for generator in generators
+    ])
+    prefetch_filediffs = []
+
+    for generator in generators:
+        if make_cache_key(generator.make_cache_key()) not in cached_keys:
+            prefetch_filediffs.append(generator.filediff)
+
+            if generator.interfilediff:
+                prefetch_filediffs.append(generator.interfilediff)
+
+    if prefetch_filediffs:
+        prefetch_original_files(prefetch_filediffs, request)
+
+    for diff_file, generator in zip(files, generators):
         chunks = generator.get_chunks()
 
         diff_file.update({
@@ -352,7 +473,11 @@ def populate_diff_chunks(files, enable_syntax_highlighting=True,
             'whitespace_only': True,
         })
 
-        for j, chunk in enumerate(chunks):
+        # Large files have their chunks loaded from the cache in windows.
+        # We only need the summary of each chunk here.
+        chunk_summaries = getattr(chunks, 'summaries', chunks)
+
+        for j, chunk in enumerate(chunk_summaries):
             chunk['index'] = j
 
             if chunk['change'] != 'equal':
@@ -406,17 +531,27 @@ def get_file_chunks_in_range(context, filediff, interfilediff,
       7        True if line consists of only whitespace changes
       ======== =============================================================
     """
-    def find_header(headers):
-        for header in reversed(headers):
-            if header[0] < first_line:
-                return {
-                    'line': header[0],
-                    'text': header[1],
-                }
+    chunks = get_file_chunks_in_ranges(context, filediff, interfilediff,
+                                       [(first_line, num_lines)])[0]
+
+    for chunk in chunks:
+        yield chunk
 
-    interdiffset = None
 
-    key = "_diff_files_%s_%s" % (filediff.diffset.id, filediff.id)
+def get_file_chunks_in_ranges(context, filediff, interfilediff, ranges):
+    """Returns the chunks within several ranges of lines in a file.
+
+    ``ranges`` is a list of ``(first_line, num_lines)`` tuples. This returns
+    a list with the chunks for each range, in the same order, using the same
+    format as get_file_chunks_in_range.
+
+    The file's chunks are only loaded and walked through once, no matter
+    how many ranges are requested. This should be used instead of calling
+    get_file_chunks_in_range repeatedly when there are many comments on
+    the same file.
+    """
+    key = "_diff_files_%s_%s" % (filediff.diffset_id, filediff.id)
+    interdiffset = None
 
     if interfilediff:
         key += "_%s" % (interfilediff.id)
@@ -434,55 +569,85 @@ def get_file_chunks_in_range(context, filediff, interfilediff,
                              request=request)
         context[key] = files
 
+    range_chunks = [[] for i in range(len(ranges))]
+
     if not files:
-        raise StopIteration
+        return range_chunks
 
     assert len(files) == 1
     last_header = [None, None]
 
+    # The ranges that still have lines left to find, mapping each range's
+    # index to the next line and number of lines remaining.
+    remaining = dict(enumerate(ranges))
+
     for chunk in files[0]['chunks']:
+        if not remaining:
+            break
+
         if ('headers' in chunk['meta'] and
                 (chunk['meta']['headers'][0] or chunk['meta']['headers'][1])):
             last_header = chunk['meta']['headers']
 
         lines = chunk['lines']
 
-        if lines[-1][0] >= first_line >= lines[0][0]:
-            start_index = first_line - lines[0][0]
+        for i, (first_line, num_lines) in list(six.iteritems(remaining)):
+            if lines[-1][0] >= first_line >= lines[0][0]:
+                new_chunk = _get_chunk_range(chunk, first_line, num_lines,
+                                             last_header)
+                range_chunks[i].append(new_chunk)
 
-            if first_line + num_lines <= lines[-1][0]:
-                last_index = start_index + num_lines
-            else:
-                last_index = len(lines)
-
-            new_chunk = {
-                'lines': chunk['lines'][start_index:last_index],
-                'numlines': last_index - start_index,
-                'change': chunk['change'],
-                'meta': chunk.get('meta', {}),
-            }
-
-            if 'left_headers' in chunk['meta']:
-                left_header = find_header(chunk['meta']['left_headers'])
-                right_header = find_header(chunk['meta']['right_headers'])
-                del new_chunk['meta']['left_headers']
-                del new_chunk['meta']['right_headers']
-
-                if left_header or right_header:
-                    header = (left_header, right_header)
+                num_lines -= new_chunk['numlines']
+                assert num_lines >= 0
+
+                if num_lines == 0:
+                    del remaining[i]
                 else:
-                    header = last_header
+                    remaining[i] = (first_line + new_chunk['numlines'],
+                                    num_lines)
+
+    return range_chunks
+
+
+def _get_chunk_range(chunk, first_line, num_lines, last_header):
+    """Returns a new chunk containing a range of lines from a chunk."""
+    def find_header(headers):
+        for header in reversed(headers):
+            if header[0] < first_line:
+                return {
+                    'line': header[0],
+                    'text': header[1],
+                }
+
+    lines = chunk['lines']
+    start_index = first_line - lines[0][0]
 
-                new_chunk['meta']['headers'] = header
+    if first_line + num_lines <= lines[-1][0]:
+        last_index = start_index + num_lines
+    else:
+        last_index = len(lines)
+
+    # The chunk may be shared with other ranges, so its metadata must not
+    # be modified.
+    meta = dict(chunk.get('meta', {}))
 
-            yield new_chunk
+    if 'left_headers' in meta:
+        left_header = find_header(meta.pop('left_headers'))
+        right_header = find_header(meta.pop('right_headers'))
+
+        if left_header or right_header:
+            header = (left_header, right_header)
+        else:
+            header = last_header
 
-            first_line += new_chunk['numlines']
-            num_lines -= new_chunk['numlines']
+        meta['headers'] = header
 
-            assert num_lines >= 0
-            if num_lines == 0:
-                break
+    return {
+        'lines': lines[start_index:last_index],
+        'numlines': last_index - start_index,
+        'change': chunk['change'],
+        'meta': meta,
+    }
 
 
 def get_enable_highlighting(user):
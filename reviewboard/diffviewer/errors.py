@@ -25,3 +25,12 @@ class DiffParserError(Exception):
     def __init__(self, msg, linenum):
         Exception.__init__(self, msg)
         self.linenum = linenum
+
+
+class PatchError(Exception):
+    """An error applying a diff to a file in-process.
+
+    This is raised when a hunk doesn't apply, or when the diff contains
+    content that the in-process patcher doesn't understand.
+    """
+    pass
@@ -0,0 +1,74 @@
+from __future__ import unicode_literals
+
+import optparse
+import time
+
+from django.core.management.base import CommandError, NoArgsCommand
+
+from reviewboard.diffviewer.models import FileDiffData
+
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        optparse.make_option('--batch-size', type='int', dest='batch_size',
+                             default=FileDiffData.objects.COMPRESS_BATCH_SIZE,
+                             help='The number of diffs to compress in each '
+                                  'batch'),
+    )
+    help = ('Compresses the diffs stored in the database, reducing space '
+            'requirements')
+
+    # The minimum number of seconds between progress updates.
+    PROGRESS_INTERVAL = 5
+
+    def handle_noargs(self, **options):
+        batch_size = options.get('batch_size')
+
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        self.stdout.write(
+            'Compressing stored diffs...\n'
+            '\n'
+            'This may take a while. It is safe to continue using '
+            'Review Board while this is\n'
+            'processing, but it may temporarily run slower.\n'
+            '\n')
+
+        self._start_time = time.time()
+        self._last_report_time = self._start_time
+
+        info = FileDiffData.objects.compress_all(batch_size=batch_size,
+                                                 callback=self._on_progress)
+
+        old_size = info['old_size']
+        new_size = info['new_size']
+
+        if old_size:
+            savings = (old_size - new_size) * 100.0 / old_size
+        else:
+            savings = 0
+
+        self.stdout.write(
+            '\n'
+            'Compressed %d of %d stored diffs. Diffs now take %s bytes, '
+            'down from %s bytes (%d%% savings).\n'
+            % (info['entries_compressed'], info['entries_processed'],
+               new_size, old_size, savings))
+
+    def _on_progress(self, info):
+        """Reports progress after each batch."""
+        now = time.time()
+
+        if now - self._last_report_time < self.PROGRESS_INTERVAL:
+            return
+
+        self._last_report_time = now
+        elapsed = now - self._start_time
+
+        self.stdout.write(
+            '  %d diffs processed (%.1f diffs/sec), %d compressed\n'
+            % (info['entries_processed'],
+               info['entries_processed'] / elapsed,
+               info['entries_compressed']))
+        self.stdout.flush()
@@ -1,39 +1,132 @@
 from __future__ import unicode_literals
 
-from django.core.management.base import NoArgsCommand
+import optparse
+import os
+import time
+
+from django.core.management.base import CommandError, NoArgsCommand
 
 from reviewboard.diffviewer.models import FileDiff
 
 
 class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        optparse.make_option('--batch-size', type='int', dest='batch_size',
+                             default=FileDiff.objects.MIGRATION_BATCH_SIZE,
+                             help='The number of FileDiff IDs to process '
+                                  'in each batch'),
+        optparse.make_option('--processes', type='int', dest='processes',
+                             default=1,
+                             help='The number of processes to use'),
+        optparse.make_option('--checkpoint', dest='checkpoint',
+                             default=None, metavar='FILE',
+                             help='A file for storing progress, so that an '
+                                  'interrupted run can be resumed'),
+    )
     help = ('Condenses the diffs stored in the database, reducing space '
             'requirements')
 
+    # The minimum number of seconds between progress updates.
+    PROGRESS_INTERVAL = 5
+
     def handle_noargs(self, **options):
-        count = FileDiff.objects.unmigrated().count()
+        batch_size = options.get('batch_size')
+        processes = options.get('processes')
+        checkpoint_file = options.get('checkpoint')
+
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
 
-        if count == 0:
+        if processes < 1:
+            raise CommandError('--processes must be at least 1')
+
+        if not FileDiff.objects.unmigrated().exists():
             self.stdout.write('All diffs have already been migrated.\n')
+
+            if checkpoint_file and os.path.exists(checkpoint_file):
+                os.unlink(checkpoint_file)
+
             return
 
+        start_id = None
+
+        if checkpoint_file and os.path.exists(checkpoint_file):
+            try:
+                with open(checkpoint_file, 'r') as f:
+                    start_id = int(f.read().strip()) + 1
+            except (IOError, ValueError) as e:
+                raise CommandError('Unable to read the checkpoint file %s: %s'
+                                   % (checkpoint_file, e))
+
+            self.stdout.write('Resuming from FileDiff ID %d.\n' % start_id)
+
         self.stdout.write(
-            'Processing %(count)d diffs for duplicates...\n'
+            'Processing diffs for duplicates...\n'
             '\n'
             'This may take a while. It is safe to continue using '
             'Review Board while this is\n'
             'processing, but it may temporarily run slower.\n'
-            % {
-                'count': count,
-            });
+            '\n')
+
+        self._start_time = time.time()
+        self._last_report_time = self._start_time
+        self._checkpoint_file = checkpoint_file
+
+        info = FileDiff.objects.migrate_all(batch_size=batch_size,
+                                            processes=processes,
+                                            start_id=start_id,
+                                            callback=self._on_progress)
 
-        info = FileDiff.objects.migrate_all()
+        if checkpoint_file and os.path.exists(checkpoint_file):
+            os.unlink(checkpoint_file)
 
         old_diff_size = info['old_diff_size']
         new_diff_size = info['new_diff_size']
 
+        if old_diff_size:
+            savings = info['bytes_saved'] * 100.0 / old_diff_size
+        else:
+            savings = 0
+
         self.stdout.write(
             '\n'
-            'Condensed stored diffs from %s bytes to %s bytes '
-            '(%d%% savings)\n'
-            % (old_diff_size, new_diff_size,
-               float(new_diff_size) / float(old_diff_size) * 100.0))
+            'Condensed %d stored diffs from %s bytes to %s bytes '
+            '(%d%% savings) in %s\n'
+            % (info['diffs_migrated'], old_diff_size, new_diff_size,
+               savings, self._format_elapsed(time.time() - self._start_time)))
+
+    def _on_progress(self, info):
+        """Records and reports progress after each batch."""
+        if self._checkpoint_file:
+            with open(self._checkpoint_file, 'w') as f:
+                f.write('%d' % info['last_id'])
+
+        now = time.time()
+
+        if (now - self._last_report_time < self.PROGRESS_INTERVAL and
+            info['last_id'] < info['max_id']):
+            return
+
+        self._last_report_time = now
+        elapsed = now - self._start_time
+        id_range = info['max_id'] - info['min_id'] + 1
+        pct = (info['last_id'] - info['min_id'] + 1) * 100.0 / id_range
+
+        if elapsed > 0:
+            rate = info['diffs_migrated'] / elapsed
+        else:
+            rate = 0
+
+        self.stdout.write(
+            '  [%d%%] %d diffs processed (%.1f diffs/sec), '
+            '%s bytes saved, %s elapsed\n'
+            % (pct, info['diffs_migrated'], rate, info['bytes_saved'],
+               self._format_elapsed(elapsed)))
+        self.stdout.flush()
+
+    def _format_elapsed(self, elapsed):
+        """Formats a number of seconds as H:MM:SS."""
+        minutes, seconds = divmod(int(elapsed), 60)
+        hours, minutes = divmod(minutes, 60)
+
+        return '%d:%02d:%02d' % (hours, minutes, seconds)
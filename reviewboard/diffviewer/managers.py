@@ -1,16 +1,22 @@
 from __future__ import unicode_literals
 
+import hashlib
+import multiprocessing
 import os
 
-from django.db import models
+from django.db import (IntegrityError, connections, models, router,
+                       transaction)
 from django.db.models import Q
 from django.utils.encoding import smart_unicode
 from django.utils.translation import ugettext as _
 from djblets.db.fields import Base64DecodedValue
 from djblets.siteconfig.models import SiteConfiguration
+from djblets.util.compat import six
+from djblets.util.compat.six.moves import range
 
 from reviewboard.diffviewer.differ import DEFAULT_DIFF_COMPAT_VERSION
 from reviewboard.diffviewer.errors import DiffTooBigError, EmptyDiffError
+from reviewboard.diffviewer.parser import DiffParser
 from reviewboard.scmtools.core import PRE_CREATION, UNKNOWN, FileNotFoundError
 
 
@@ -26,40 +32,167 @@ class FileDiffManager(models.Manager):
             Q(diff_hash__isnull=False) &
             (Q(parent_diff_hash__isnull=False) | Q(parent_diff64='')))
 
-    def migrate_all(self):
+    # The default number of FileDiff IDs covered by each batch when
+    # migrating.
+    MIGRATION_BATCH_SIZE = 1000
+
+    def migrate_all(self, batch_size=None, processes=1, start_id=None,
+                    callback=None):
         """Migrates diff content in FileDiffs to use FileDiffData for storage.
 
         This will run through all unmigrated FileDiffs and migrate them,
         condensing their storage needs and removing the content from
         FileDiffs.
 
+        FileDiffs are migrated in batches covering ``batch_size`` IDs each.
+        If ``processes`` is more than 1, the batches are split up between
+        that many worker processes.
+
+        FileDiffs with IDs lower than ``start_id`` are skipped. This can be
+        used to resume an earlier migration from the ``last_id`` it
+        reported.
+
+        ``callback``, if provided, is called after each batch with a
+        dictionary of the progress so far. This contains the same keys as
+        the result.
+
+        This will return a dictionary with the result of the process.
+        ``last_id`` in the result is the highest ID for which all lower IDs
+        have been processed, and ``max_id`` is the highest FileDiff ID.
+        """
+        batch_size = batch_size or self.MIGRATION_BATCH_SIZE
+        id_range = self.aggregate(min_id=models.Min('pk'),
+                                  max_id=models.Max('pk'))
+        min_id = id_range['min_id']
+        max_id = id_range['max_id']
+
+        if start_id is not None and min_id is not None:
+            min_id = max(min_id, start_id)
+
+        progress = {
+            'diffs_migrated': 0,
+            'old_diff_size': 0,
+            'new_diff_size': 0,
+            'bytes_saved': 0,
+            'min_id': min_id,
+            'last_id': max_id,
+            'max_id': max_id,
+        }
+
+        if min_id is None or min_id > max_id:
+            return progress
+
+        batch_starts = range(min_id, max_id + 1, batch_size)
+        batches = [
+            (batch_start, min(batch_start + batch_size, max_id + 1))
+            for batch_start in batch_starts
+        ]
+
+        # Batches may finish out of order when using several processes.
+        # Track which have finished, so that last_id is only advanced past
+        # batches once everything before them is done.
+        finished_batches = set()
+        next_batch_start = min_id
+        pool = None
+
+        if processes > 1:
+            # The worker processes can't share this process's database
+            # connections. Closing them before forking means each worker
+            # opens its own connections when it first needs them. Closing
+            # them in the workers instead would end this process's
+            # sessions on the database server.
+            for connection in connections.all():
+                connection.close()
+
+            pool = multiprocessing.Pool(processes)
+            results = pool.imap_unordered(_migrate_filediff_range, batches)
+        else:
+            results = (
+                _migrate_filediff_range(batch)
+                for batch in batches
+            )
+
+        try:
+            for batch_start, info in results:
+                for key in ('diffs_migrated', 'old_diff_size',
+                            'new_diff_size', 'bytes_saved'):
+                    progress[key] += info[key]
+
+                finished_batches.add(batch_start)
+
+                while next_batch_start in finished_batches:
+                    finished_batches.remove(next_batch_start)
+                    next_batch_start += batch_size
+
+                progress['last_id'] = min(next_batch_start - 1, max_id)
+
+                if callback:
+                    callback(dict(progress))
+        finally:
+            if pool:
+                pool.terminate()
+                pool.join()
+
+        return progress
+
+    def migrate_range(self, min_id, max_id):
+        """Migrates diff content for FileDiffs with IDs in a range.
+
+        This covers IDs from ``min_id`` up to, but not including,
+        ``max_id``. The diff content for all the FileDiffs is stored at
+        once, so identical content within the range is only stored once.
+
         This will return a dictionary with the result of the process.
         """
-        filediffs = self.unmigrated()
+        from reviewboard.diffviewer.models import FileDiffData
 
-        total_diffs_migrated = 0
-        total_diff_size = 0
-        total_bytes_saved = 0
+        filediffs = list(self.unmigrated().filter(pk__gte=min_id,
+                                                  pk__lt=max_id))
+        diffs = []
 
         for filediff in filediffs:
-            total_diffs_migrated += 1
+            if not filediff.diff_hash_id:
+                diffs.append((filediff.diff64, None, None))
 
-            diff_size = len(filediff.diff64)
-            parent_diff_size = len(filediff.parent_diff64)
+            if filediff.parent_diff64 and not filediff.parent_diff_hash_id:
+                diffs.append((filediff.parent_diff64, None, None))
 
-            total_diff_size += diff_size + parent_diff_size
+        db = router.db_for_write(self.model)
 
-            diff_hash_is_new, parent_diff_hash_is_new = \
-                filediff._migrate_diff_data(recalculate_counts=False)
+        with transaction.commit_on_success(using=db):
+            hashes, new_hashes = FileDiffData.objects._store_diffs(diffs)
+            hashes = iter(hashes)
+            total_diff_size = 0
+            total_bytes_saved = 0
 
-            if diff_size > 0 and not diff_hash_is_new:
-                total_bytes_saved += diff_size
+            for filediff in filediffs:
+                updates = {}
 
-            if parent_diff_size > 0 and not parent_diff_hash_is_new:
-                total_bytes_saved += parent_diff_size
+                if not filediff.diff_hash_id:
+                    updates['diff_hash'] = next(hashes)
+                    updates['diff64'] = ''
+
+                if filediff.parent_diff64 and not filediff.parent_diff_hash_id:
+                    updates['parent_diff_hash'] = next(hashes)
+                    updates['parent_diff64'] = ''
+
+                for key, hash_key in (('diff64', 'diff_hash'),
+                                      ('parent_diff64', 'parent_diff_hash')):
+                    if hash_key in updates:
+                        size = len(getattr(filediff, key))
+                        total_diff_size += size
+
+                        if updates[hash_key] in new_hashes:
+                            # This is the first copy of the content, so
+                            # it's the one that's kept.
+                            new_hashes.remove(updates[hash_key])
+                        else:
+                            total_bytes_saved += size
+
+                self.filter(pk=filediff.pk).update(**updates)
 
         return {
-            'diffs_migrated': total_diffs_migrated,
+            'diffs_migrated': len(filediffs),
             'old_diff_size': total_diff_size,
             'new_diff_size': total_diff_size - total_bytes_saved,
             'bytes_saved': total_bytes_saved,
@@ -70,19 +203,194 @@ class FileDiffDataManager(models.Manager):
     """
     A custom manager for FileDiffData
 
-    Sets the binary data to a Base64DecodedValue, so that Base64Field is
-    forced to encode the data. This is a workaround to Base64Field checking
-    if the object has been saved into the database using the pk.
+    Compresses the binary data when creating entries, and sets it to a
+    Base64DecodedValue, so that Base64Field is forced to encode the data.
+    This is a workaround to Base64Field checking if the object has been
+    saved into the database using the pk.
     """
+    # The number of entries processed at once when compressing existing
+    # entries.
+    COMPRESS_BATCH_SIZE = 100
+
     def get_or_create(self, *args, **kwargs):
         defaults = kwargs.get('defaults', {})
 
         if defaults and defaults['binary']:
-            defaults['binary'] = \
-                Base64DecodedValue(kwargs['defaults']['binary'])
+            data, compression = \
+                self.model.compress_content(defaults['binary'])
+            defaults['binary'] = Base64DecodedValue(data)
+
+            if compression:
+                extra_data = dict(defaults.get('extra_data') or {})
+                extra_data['compression'] = compression
+                defaults['extra_data'] = extra_data
 
         return super(FileDiffDataManager, self).get_or_create(*args, **kwargs)
 
+    def compress_all(self, batch_size=None, callback=None):
+        """Compresses the content of all uncompressed entries.
+
+        Entries are loaded and saved in batches of ``batch_size``, each in
+        its own transaction, so this can run while the server is in use.
+        Entries whose content doesn't get any smaller are left as-is.
+
+        ``callback``, if provided, is called after each batch with a
+        dictionary of the progress so far. This contains the same keys as
+        the result.
+
+        This will return a dictionary with the result of the process.
+        """
+        batch_size = batch_size or self.COMPRESS_BATCH_SIZE
+        db = router.db_for_write(self.model)
+        progress = {
+            'entries_processed': 0,
+            'entries_compressed': 0,
+            'old_size': 0,
+            'new_size': 0,
+        }
+        last_pk = None
+
+        while True:
+            # Entries are paged through by their hash. Entries that are
+            # skipped or compressed won't be returned again, and new
+            # entries are compressed when they're created.
+            queryset = self.order_by('pk')
+
+            if last_pk is not None:
+                queryset = queryset.filter(pk__gt=last_pk)
+
+            batch = list(queryset[:batch_size])
+
+            if not batch:
+                break
+
+            with transaction.commit_on_success(using=db):
+                for data in batch:
+                    content = data.content
+                    progress['entries_processed'] += 1
+                    progress['old_size'] += len(content)
+
+                    if data.compression:
+                        progress['new_size'] += len(data.binary)
+                        continue
+
+                    data.content = content
+
+                    if data.compression:
+                        progress['entries_compressed'] += 1
+                        self.filter(pk=data.pk).update(
+                            binary=data.binary,
+                            extra_data=data.extra_data)
+
+                    progress['new_size'] += len(data.binary)
+
+            last_pk = batch[-1].pk
+
+            if callback:
+                callback(dict(progress))
+
+        return progress
+
+    # The maximum number of hashes looked up in a single query.
+    LOOKUP_BATCH_SIZE = 500
+
+    def store_diffs(self, diffs):
+        """Stores the content for many diffs at once.
+
+        ``diffs`` is a list of (diff, insert_count, delete_count) tuples.
+        The line counts may be None if they aren't known.
+
+        Existing entries are looked up in batches, and any missing ones are
+        created using bulk inserts, instead of making several queries for
+        each diff.
+
+        This returns a list of the hashes of the diffs, in the same order as
+        ``diffs``, for use as FileDiffData primary keys.
+        """
+        return self._store_diffs(diffs)[0]
+
+    def _store_diffs(self, diffs):
+        """Stores the content for many diffs at once.
+
+        This returns a tuple of the list of hashes for the diffs, and a set
+        of the hashes for the entries that were newly created.
+        """
+        hashes = []
+        new_diffs = {}
+        new_hashes = []
+
+        for diff, insert_count, delete_count in diffs:
+            hashkey = hashlib.sha1(diff).hexdigest()
+            hashes.append(hashkey)
+
+            if hashkey not in new_diffs:
+                new_diffs[hashkey] = (diff, insert_count, delete_count)
+                new_hashes.append(hashkey)
+
+        for i in range(0, len(new_hashes), self.LOOKUP_BATCH_SIZE):
+            existing_hashes = self.filter(
+                pk__in=new_hashes[i:i + self.LOOKUP_BATCH_SIZE]
+            ).values_list('pk', flat=True)
+
+            for hashkey in existing_hashes:
+                del new_diffs[hashkey]
+
+        new_data = []
+
+        for hashkey in new_hashes:
+            if hashkey in new_diffs:
+                diff, insert_count, delete_count = new_diffs[hashkey]
+                data = self.model(binary_hash=hashkey)
+                data.content = diff
+
+                if insert_count is not None:
+                    data.insert_count = insert_count
+                    data.delete_count = delete_count
+
+                new_data.append(data)
+
+        if new_data:
+            self._bulk_create_data(new_data)
+
+        return hashes, set(new_diffs)
+
+    def _bulk_create_data(self, new_data):
+        """Saves a list of new FileDiffData in bulk.
+
+        If any of them were saved by another process since they were looked
+        up, they're instead saved one at a time, skipping those that exist.
+        """
+        db = router.db_for_write(self.model)
+        sid = transaction.savepoint(using=db)
+
+        try:
+            self.bulk_create(new_data)
+            transaction.savepoint_commit(sid, using=db)
+        except IntegrityError:
+            transaction.savepoint_rollback(sid, using=db)
+
+            for data in new_data:
+                sid = transaction.savepoint(using=db)
+
+                try:
+                    data.save(force_insert=True, using=db)
+                    transaction.savepoint_commit(sid, using=db)
+                except IntegrityError:
+                    transaction.savepoint_rollback(sid, using=db)
+
+
+def _migrate_filediff_range(batch):
+    """Migrates the FileDiffs in a range of IDs.
+
+    This returns the start of the range, along with the result of the
+    migration.
+    """
+    from reviewboard.diffviewer.models import FileDiff
+
+    min_id, max_id = batch
+
+    return min_id, FileDiff.objects.migrate_range(min_id, max_id)
+
 
 class DiffSetManager(models.Manager):
     """A custom manager for DiffSet objects.
@@ -145,7 +453,7 @@ class DiffSetManager(models.Manager):
         The diff_file_contents and parent_diff_file_contents parameters are
         strings with the actual diff contents.
         """
-        from reviewboard.diffviewer.models import FileDiff
+        from reviewboard.diffviewer.models import FileDiff, FileDiffData
 
         tool = repository.get_scmtool()
 
@@ -201,6 +509,10 @@ class DiffSetManager(models.Manager):
         if save:
             diffset.save()
 
+        filediffs = []
+        diffs = []
+        parent_diffs = []
+
         for f in files:
             if f.origFile in parent_files:
                 parent_file = parent_files[f.origFile]
@@ -223,27 +535,72 @@ class DiffSetManager(models.Manager):
             else:
                 status = FileDiff.MODIFIED
 
-            filediff = FileDiff(diffset=diffset,
-                                source_file=f.origFile,
-                                dest_file=dest_file,
-                                source_revision=smart_unicode(source_rev),
-                                dest_detail=f.newInfo,
-                                diff=f.data,
-                                parent_diff=parent_content,
-                                binary=f.binary,
-                                status=status)
-            filediff.set_line_counts(f.insert_count, f.delete_count)
+            filediffs.append(FileDiff(
+                diffset=diffset,
+                source_file=f.origFile,
+                dest_file=dest_file,
+                source_revision=smart_unicode(source_rev),
+                dest_detail=f.newInfo,
+                binary=f.binary,
+                status=status))
+            diffs.append((f.data, f.insert_count, f.delete_count))
+            parent_diffs.append(parent_content)
+
+        if save:
+            # The diff content for all files is stored at once, and then all
+            # the FileDiffs are created at once, so that large diffs don't
+            # require several queries per file.
+            stored_diffs = diffs + [
+                (parent_diff, None, None)
+                for parent_diff in parent_diffs
+                if parent_diff
+            ]
+            hashes = iter(FileDiffData.objects.store_diffs(stored_diffs))
+
+            for filediff in filediffs:
+                filediff.diff_hash_id = next(hashes)
 
-            if save:
-                filediff.save()
+            for filediff, parent_diff in zip(filediffs, parent_diffs):
+                if parent_diff:
+                    filediff.parent_diff_hash_id = next(hashes)
+
+            FileDiff.objects.bulk_create(filediffs)
+
+            self._prewarm_diff_chunks(diffset, diffset_history)
 
         return diffset
 
+    def _prewarm_diff_chunks(self, diffset, diffset_history):
+        """Queues generation of the chunks for a newly created diffset.
+
+        This covers the diff itself and, if there's a previous revision in
+        the history, the interdiff against it.
+        """
+        from reviewboard.diffviewer.prewarm import prewarm_diff_chunks
+
+        prewarm_diff_chunks(diffset)
+
+        if diffset_history:
+            try:
+                prev_diffset = diffset_history.diffsets.exclude(
+                    pk=diffset.pk).latest()
+                prewarm_diff_chunks(prev_diffset, interdiffset=diffset)
+            except self.model.DoesNotExist:
+                pass
+
     def _process_files(self, parser, basedir, repository, base_commit_id,
                        request, check_existence=False, limit_to=None):
+        """Returns the parsed files in a diff, with normalized filenames.
+
+        If check_existence is True, the original files are checked in the
+        repository all at once, and a FileNotFoundError is raised for the
+        first one that doesn't exist.
+        """
         tool = repository.get_scmtool()
+        files = []
+        files_to_check = []
 
-        for f in parser.parse():
+        for f in self._iter_parsed_files(parser):
             f2, revision = tool.parse_diff_revision(f.origFile, f.origInfo,
                                                     f.moved)
 
@@ -258,21 +615,43 @@ class DiffSetManager(models.Manager):
                 continue
 
             # FIXME: this would be a good place to find permissions errors
-            if (revision != PRE_CREATION and
+            if (check_existence and
+                revision != PRE_CREATION and
                 revision != UNKNOWN and
                 not f.binary and
                 not f.deleted and
-                not f.moved and
-                (check_existence and
-                 not repository.get_file_exists(filename, revision,
-                                                base_commit_id=base_commit_id,
-                                                request=request))):
-                raise FileNotFoundError(filename, revision, base_commit_id)
+                not f.moved):
+                files_to_check.append((filename, revision, base_commit_id))
 
             f.origFile = filename
             f.origInfo = revision
 
-            yield f
+            files.append(f)
+
+        if files_to_check:
+            exists = repository.get_files_exist(files_to_check,
+                                                request=request)
+
+            for file_info, file_exists in zip(files_to_check, exists):
+                if not file_exists:
+                    raise FileNotFoundError(*file_info)
+
+        return files
+
+    def _iter_parsed_files(self, parser):
+        """Returns the files parsed from a diff.
+
+        Parsers written before DiffParser.iter_files existed customize
+        parsing by overriding parse(). For those, parse() is used, so
+        that their changes aren't skipped. Otherwise, the files are
+        iterated over as they're parsed.
+        """
+        parse_func = six.get_unbound_function(type(parser).parse)
+
+        if parse_func is not six.get_unbound_function(DiffParser.parse):
+            return parser.parse()
+
+        return parser.iter_files()
 
     def _compare_files(self, filename1, filename2):
         """
@@ -2,12 +2,13 @@ from __future__ import unicode_literals
 
 import hashlib
 import logging
+import zlib
 
 from django.db import models
 from django.utils import timezone
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
-from djblets.db.fields import Base64Field, JSONField
+from djblets.db.fields import Base64DecodedValue, Base64Field, JSONField
 
 from reviewboard.diffviewer.managers import (FileDiffDataManager,
                                              FileDiffManager,
@@ -21,13 +22,60 @@ class FileDiffData(models.Model):
     Contains hash and base64 pairs.
 
     These pairs are used to reduce diff database storage.
+
+    The diff content may be compressed before it's stored in ``binary``.
+    The compression used is recorded in ``extra_data``, and ``content``
+    always provides the uncompressed diff.
     """
+    COMPRESSION_ZLIB = 'zlib'
+
     binary_hash = models.CharField(_("hash"), max_length=40, primary_key=True)
     binary = Base64Field(_("base64"))
     objects = FileDiffDataManager()
 
     extra_data = JSONField(null=True)
 
+    @property
+    def compression(self):
+        """The compression used for the stored content, if any."""
+        return self.extra_data.get('compression')
+
+    @property
+    def content(self):
+        """The uncompressed diff content."""
+        data = self.binary
+
+        if data and self.compression == self.COMPRESSION_ZLIB:
+            data = zlib.decompress(data)
+
+        return data
+
+    @content.setter
+    def content(self, content):
+        data, compression = self.compress_content(content)
+        self.binary = Base64DecodedValue(data)
+
+        if compression:
+            self.extra_data['compression'] = compression
+        else:
+            self.extra_data.pop('compression', None)
+
+    @classmethod
+    def compress_content(cls, content):
+        """Compresses diff content for storage.
+
+        This returns a tuple of the data to store and the compression used.
+        If compressing the content doesn't make it any smaller, it's stored
+        as-is, and the compression will be None.
+        """
+        if content:
+            compressed = zlib.compress(content)
+
+            if len(compressed) < len(content):
+                return compressed, cls.COMPRESSION_ZLIB
+
+        return content, None
+
     @property
     def insert_count(self):
         return self.extra_data.get('insert_count')
@@ -53,7 +101,7 @@ class FileDiffData(models.Model):
         logging.debug('Recalculating insert/delete line counts on '
                       'FileDiffData %s' % self.pk)
 
-        files = tool.get_parser(self.binary).parse()
+        files = tool.get_parser(self.content).parse()
 
         if len(files) != 1:
             logging.error('Failed to correctly parse stored diff data in '
@@ -133,7 +181,7 @@ class FileDiff(models.Model):
         if not self.diff_hash:
             self._migrate_diff_data()
 
-        return self.diff_hash.binary
+        return self.diff_hash.content
 
     def _set_diff(self, diff):
         hashkey = self._hash_hexdigest(diff)
@@ -152,7 +200,7 @@ class FileDiff(models.Model):
             self._migrate_diff_data()
 
         if self.parent_diff_hash:
-            return self.parent_diff_hash.binary
+            return self.parent_diff_hash.content
         else:
             return None
 
@@ -59,18 +59,23 @@ class MyersDiffer(Differ):
         """
         self._gen_diff_data()
 
+        a_length = self.a_data.length
+        b_length = self.b_data.length
+        a_modified = self.a_data.modified
+        b_modified = self.b_data.modified
+
         a_line = b_line = 0
         last_group = None
 
         # Go through the entire set of lines on both the old and new files
-        while a_line < self.a_data.length or b_line < self.b_data.length:
+        while a_line < a_length or b_line < b_length:
             a_start = a_line
             b_start = b_line
 
-            if a_line < self.a_data.length and \
-               not self.a_data.modified.get(a_line, False) and \
-               b_line < self.b_data.length and \
-               not self.b_data.modified.get(b_line, False):
+            if (a_line < a_length and
+                    not a_modified.get(a_line, False) and
+                    b_line < b_length and
+                    not b_modified.get(b_line, False)):
                 # Equal
                 a_changed = b_changed = 1
                 tag = "equal"
@@ -82,17 +87,17 @@ class MyersDiffer(Differ):
                 # Count every old line that's been modified, and the
                 # remainder of old lines if we've reached the end of the new
                 # file.
-                while (a_line < self.a_data.length and
-                       (b_line >= self.b_data.length or
-                        self.a_data.modified.get(a_line, False))):
+                while (a_line < a_length and
+                       (b_line >= b_length or
+                        a_modified.get(a_line, False))):
                     a_line += 1
 
                 # Count every new line that's been modified, and the
                 # remainder of new lines if we've reached the end of the old
                 # file.
-                while (b_line < self.b_data.length and
-                       (a_line >= self.a_data.length or
-                        self.b_data.modified.get(b_line, False))):
+                while (b_line < b_length and
+                       (a_line >= a_length or
+                        b_modified.get(b_line, False))):
                     b_line += 1
 
                 a_changed = a_line - a_start
@@ -128,8 +133,7 @@ class MyersDiffer(Differ):
                               b_start, b_start + b_changed)
 
         if not last_group:
-            last_group = ("equal", 0, self.a_data.length,
-                          0, self.b_data.length)
+            last_group = ("equal", 0, a_length, 0, b_length)
 
         yield last_group
 
@@ -167,6 +171,10 @@ class MyersDiffer(Differ):
         lists of numbers is faster than comparing lists of strings.
         """
         codes = []
+        code_table = self.code_table
+        interesting_line_table = self.interesting_line_table
+        interesting_line_regexes = self.interesting_line_regexes
+        ignore_space = self.ignore_space
 
         linenum = 0
 
@@ -182,7 +190,7 @@ class MyersDiffer(Differ):
             raw_line = line
             stripped_line = line.lstrip()
 
-            if self.ignore_space:
+            if ignore_space:
                 # We still want to show lines that contain only whitespace.
                 if len(stripped_line) > 0:
                     line = stripped_line
@@ -190,22 +198,22 @@ class MyersDiffer(Differ):
             interesting_line_name = None
 
             try:
-                code = self.code_table[line]
+                code = code_table[line]
                 interesting_line_name = \
-                    self.interesting_line_table.get(code, None)
+                    interesting_line_table.get(code, None)
             except KeyError:
                 # This is a new, unrecorded line, so mark it and store it.
                 self.last_code += 1
                 code = self.last_code
-                self.code_table[line] = code
+                code_table[line] = code
 
                 # Check to see if this is an interesting line that the caller
                 # wants recorded.
                 if stripped_line:
-                    for name, regex in self.interesting_line_regexes:
+                    for name, regex in interesting_line_regexes:
                         if regex.match(raw_line):
                             interesting_line_name = name
-                            self.interesting_line_table[code] = name
+                            interesting_line_table[code] = name
                             break
 
             if interesting_line_name:
@@ -222,15 +230,24 @@ class MyersDiffer(Differ):
         """
         Finds the Shortest Middle Snake.
         """
+        # This is the hottest code in the differ, so everything used in the
+        # loops below is pulled into local variables up-front, saving
+        # attribute lookups on every step along a diagonal.
         down_vector = self.fdiag  # The vector for the (0, 0) to (x, y) search
         up_vector = self.bdiag    # The vector for the (u, v) to (N, M) search
+        downoff = self.downoff
+        upoff = self.upoff
+        a_undiscarded = self.a_data.undiscarded
+        b_undiscarded = self.b_data.undiscarded
+        snake_limit = self.SNAKE_LIMIT
+        max_lines = self.max_lines
 
         down_k = a_lower - b_lower  # The k-line to start the forward search
         up_k = a_upper - b_upper    # The k-line to start the reverse search
         odd_delta = (down_k - up_k) % 2 != 0
 
-        down_vector[self.downoff + down_k] = a_lower
-        up_vector[self.upoff + up_k] = a_upper
+        down_vector[downoff + down_k] = a_lower
+        up_vector[upoff + up_k] = a_upper
 
         dmin = a_lower - b_upper
         dmax = a_upper - b_lower
@@ -239,7 +256,7 @@ class MyersDiffer(Differ):
         up_min = up_max = up_k
 
         cost = 0
-        max_cost = max(256, self._very_approx_sqrt(self.max_lines * 4))
+        max_cost = max(256, self._very_approx_sqrt(max_lines * 4))
 
         while True:
             cost += 1
@@ -247,20 +264,20 @@ class MyersDiffer(Differ):
 
             if down_min > dmin:
                 down_min -= 1
-                down_vector[self.downoff + down_min - 1] = -1
+                down_vector[downoff + down_min - 1] = -1
             else:
                 down_min += 1
 
             if down_max < dmax:
                 down_max += 1
-                down_vector[self.downoff + down_max + 1] = -1
+                down_vector[downoff + down_max + 1] = -1
             else:
                 down_max -= 1
 
             # Extend the forward path
             for k in range(down_max, down_min - 1, -2):
-                tlo = down_vector[self.downoff + k - 1]
-                thi = down_vector[self.downoff + k + 1]
+                tlo = down_vector[downoff + k - 1]
+                thi = down_vector[downoff + k + 1]
 
                 if tlo >= thi:
                     x = tlo + 1
@@ -273,36 +290,35 @@ class MyersDiffer(Differ):
                 # Find the end of the furthest reaching forward D-path in
                 # diagonal k
                 while (x < a_upper and y < b_upper and
-                       (self.a_data.undiscarded[x] ==
-                        self.b_data.undiscarded[y])):
+                       a_undiscarded[x] == b_undiscarded[y]):
                     x += 1
                     y += 1
 
-                if odd_delta and up_min <= k <= up_max and \
-                   up_vector[self.upoff + k] <= x:
+                if (odd_delta and up_min <= k <= up_max and
+                        up_vector[upoff + k] <= x):
                     return x, y, True, True
 
-                if x - old_x > self.SNAKE_LIMIT:
+                if x - old_x > snake_limit:
                     big_snake = True
 
-                down_vector[self.downoff + k] = x
+                down_vector[downoff + k] = x
 
             # Extend the reverse path
             if up_min > dmin:
                 up_min -= 1
-                up_vector[self.upoff + up_min - 1] = self.max_lines
+                up_vector[upoff + up_min - 1] = max_lines
             else:
                 up_min += 1
 
             if up_max < dmax:
                 up_max += 1
-                up_vector[self.upoff + up_max + 1] = self.max_lines
+                up_vector[upoff + up_max + 1] = max_lines
             else:
                 up_max -= 1
 
             for k in range(up_max, up_min - 1, -2):
-                tlo = up_vector[self.upoff + k - 1]
-                thi = up_vector[self.upoff + k + 1]
+                tlo = up_vector[upoff + k - 1]
+                thi = up_vector[upoff + k + 1]
 
                 if tlo < thi:
                     x = tlo
@@ -313,19 +329,18 @@ class MyersDiffer(Differ):
                 old_x = x
 
                 while (x > a_lower and y > b_lower and
-                       (self.a_data.undiscarded[x - 1] ==
-                        self.b_data.undiscarded[y - 1])):
+                       a_undiscarded[x - 1] == b_undiscarded[y - 1]):
                     x -= 1
                     y -= 1
 
                 if (not odd_delta and down_min <= k <= down_max and
-                        x <= down_vector[self.downoff + k]):
+                        x <= down_vector[downoff + k]):
                     return x, y, True, True
 
-                if old_x - x > self.SNAKE_LIMIT:
+                if old_x - x > snake_limit:
                     big_snake = True
 
-                up_vector[self.upoff + k] = x
+                up_vector[upoff + k] = x
 
             if find_minimal:
                 continue
@@ -439,29 +454,34 @@ class MyersDiffer(Differ):
         The divide-and-conquer implementation of the Longest Common
         Subsequence (LCS) algorithm.
         """
+        a_undiscarded = self.a_data.undiscarded
+        b_undiscarded = self.b_data.undiscarded
+
         # Fast walkthrough equal lines at the start
         while (a_lower < a_upper and b_lower < b_upper and
-               (self.a_data.undiscarded[a_lower] ==
-                self.b_data.undiscarded[b_lower])):
+               a_undiscarded[a_lower] == b_undiscarded[b_lower]):
             a_lower += 1
             b_lower += 1
 
         while (a_upper > a_lower and b_upper > b_lower and
-               (self.a_data.undiscarded[a_upper - 1] ==
-                self.b_data.undiscarded[b_upper - 1])):
+               a_undiscarded[a_upper - 1] == b_undiscarded[b_upper - 1]):
             a_upper -= 1
             b_upper -= 1
 
         if a_lower == a_upper:
             # Inserted lines.
-            while b_lower < b_upper:
-                self.b_data.modified[self.b_data.real_indexes[b_lower]] = True
-                b_lower += 1
+            modified = self.b_data.modified
+            real_indexes = self.b_data.real_indexes
+
+            for i in range(b_lower, b_upper):
+                modified[real_indexes[i]] = True
         elif b_lower == b_upper:
             # Deleted lines
-            while a_lower < a_upper:
-                self.a_data.modified[self.a_data.real_indexes[a_lower]] = True
-                a_lower += 1
+            modified = self.a_data.modified
+            real_indexes = self.a_data.real_indexes
+
+            for i in range(a_lower, a_upper):
+                modified[real_indexes[i]] = True
         else:
             # Find the middle snake and length of an optimal path for A and B
             x, y, low_minimal, high_minimal = \
@@ -484,15 +504,19 @@ class MyersDiffer(Differ):
         the two lines are identical, we can shift the chunk so that the line
         appears both before and after the line, rather than only after.
         """
+        modified = data.modified
+        other_modified = other_data.modified
+        lines = data.data
+
         i = j = 0
         i_end = data.length
 
         while True:
             # Scan forward in order to find the start of a run of changes.
-            while i < i_end and not data.modified.get(i, False):
+            while i < i_end and not modified.get(i, False):
                 i += 1
 
-                while other_data.modified.get(j, False):
+                while other_modified.get(j, False):
                     j += 1
 
             if i == i_end:
@@ -502,10 +526,10 @@ class MyersDiffer(Differ):
 
             # Find the end of these changes
             i += 1
-            while data.modified.get(i, False):
+            while modified.get(i, False):
                 i += 1
 
-            while other_data.modified.get(j, False):
+            while other_modified.get(j, False):
                 j += 1
 
             while True:
@@ -514,43 +538,43 @@ class MyersDiffer(Differ):
                 # Move the changed chunks back as long as the previous
                 # unchanged line matches the last changed line.
                 # This merges with the previous changed chunks.
-                while start != 0 and data.data[start - 1] == data.data[i - 1]:
+                while start != 0 and lines[start - 1] == lines[i - 1]:
                     start -= 1
                     i -= 1
 
-                    data.modified[start] = True
-                    data.modified[i] = False
+                    modified[start] = True
+                    modified[i] = False
 
-                    while data.modified.get(start - 1, False):
+                    while modified.get(start - 1, False):
                         start -= 1
 
                     j -= 1
-                    while other_data.modified.get(j, False):
+                    while other_modified.get(j, False):
                         j -= 1
 
                 # The end of the changed run at the last point where it
                 # corresponds to the changed run in the other data set.
                 # If it's equal to i_end, then we didn't find a corresponding
                 # point.
-                if other_data.modified.get(j - 1, False):
+                if other_modified.get(j - 1, False):
                     corresponding = i
                 else:
                     corresponding = i_end
 
                 # Move the changed region forward as long as the first
                 # changed line is the same as the following unchanged line.
-                while i != i_end and data.data[start] == data.data[i]:
-                    data.modified[start] = False
-                    data.modified[i] = True
+                while i != i_end and lines[start] == lines[i]:
+                    modified[start] = False
+                    modified[i] = True
 
                     start += 1
                     i += 1
 
-                    while data.modified.get(i, False):
+                    while modified.get(i, False):
                         i += 1
 
                     j += 1
-                    while other_data.modified.get(j, False):
+                    while other_modified.get(j, False):
                         j += 1
                         corresponding = i
 
@@ -563,16 +587,16 @@ class MyersDiffer(Differ):
                 start -= 1
                 i -= 1
 
-                data.modified[start] = True
-                data.modified[i] = False
+                modified[start] = True
+                modified[i] = False
 
                 j -= 1
-                while other_data.modified.get(j, False):
+                while other_modified.get(j, False):
                     j -= 1
 
     def _discard_confusing_lines(self):
         def build_discard_list(data, discards, counts):
-            many = 5 * self._very_approx_sqrt(data.length / 64)
+            many = 5 * self._very_approx_sqrt(data.length // 64)
 
             for i, item in enumerate(data.data):
                 if item != 0:
@@ -642,7 +666,7 @@ class MyersDiffer(Differ):
                             if discards[j] == self.DISCARD_CANCEL:
                                 discards[j] = self.DISCARD_NONE
                     else:
-                        minimum = 1 + self._very_approx_sqrt(length / 4)
+                        minimum = 1 + self._very_approx_sqrt(length // 4)
                         j = 0
                         consec = 0
                         while j < length:
@@ -664,14 +688,19 @@ class MyersDiffer(Differ):
                 i += 1
 
         def discard_lines(data, discards):
+            minimal_diff = self.minimal_diff
+            undiscarded = data.undiscarded
+            real_indexes = data.real_indexes
+            modified = data.modified
             j = 0
+
             for i, item in enumerate(data.data):
-                if self.minimal_diff or discards[i] == self.DISCARD_NONE:
-                    data.undiscarded[j] = item
-                    data.real_indexes[j] = i
+                if minimal_diff or discards[i] == self.DISCARD_NONE:
+                    undiscarded[j] = item
+                    real_indexes[j] = i
                     j += 1
                 else:
-                    data.modified[i] = True
+                    modified[i] = True
 
             data.undiscarded_lines = j
 
@@ -701,9 +730,9 @@ class MyersDiffer(Differ):
 
     def _very_approx_sqrt(self, i):
         result = 1
-        i /= 4
+        i //= 4
         while i > 0:
-            i /= 4
+            i //= 4
             result *= 2
 
         return result
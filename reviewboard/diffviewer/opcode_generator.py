@@ -1,8 +1,9 @@
 from __future__ import unicode_literals
 
+import logging
 import re
+import time
 
-from djblets.util.compat import six
 from djblets.util.compat.six.moves import range
 
 from reviewboard.diffviewer.processors import (filter_interdiff_opcodes,
@@ -13,9 +14,20 @@ class DiffOpcodeGenerator(object):
     ALPHANUM_RE = re.compile(r'\w')
     WHITESPACE_RE = re.compile(r'\s')
 
+    # The minimum number of lines in a move, unless a single line is at
+    # least MOVE_MIN_LINE_LENGTH characters long. This is also the size of
+    # the windows of deleted lines that are indexed for finding moves.
     MOVE_PREFERRED_MIN_LINES = 2
     MOVE_MIN_LINE_LENGTH = 20
 
+    # The maximum number of deleted blocks that may match the start of an
+    # inserted block before the lines are considered too common to be
+    # shown as a move.
+    MOVE_MAX_CANDIDATES = 32
+
+    # The maximum number of seconds to spend on move detection for a file.
+    MOVE_TIME_BUDGET = 2.0
+
     def __init__(self, differ, filediff=None, interfilediff=None):
         self.differ = differ
         self.filediff = filediff
@@ -34,6 +46,8 @@ class DiffOpcodeGenerator(object):
         self.groups = []
         self.removes = {}
         self.inserts = []
+        self._line_codes = {}
+        self._removed_codes = {}
 
         self._precompute_opcodes()
         self._compute_moves()
@@ -87,19 +101,15 @@ class DiffOpcodeGenerator(object):
             group = (tag, i1, i2, j1, j2, meta)
             self.groups.append(group)
 
-            # Store delete/insert ranges for later lookup. We will be building
-            # keys that in most cases will be unique for the particular block
-            # of text being inserted/deleted. There is a chance of collision,
-            # so we store a list of matching groups under that key.
+            # Store delete/insert ranges for later lookup. Deleted lines are
+            # indexed by the window of lines starting at them. There is a
+            # chance of collision, so we store a list of matching positions
+            # and groups under that key.
             #
-            # Later, we will loop through the keys and attempt to find insert
-            # keys/groups that match remove keys/groups.
+            # Later, we will loop through the inserted groups and attempt to
+            # find deleted blocks that match them.
             if tag in ('delete', 'replace'):
-                for i in range(i1, i2):
-                    line = self.differ.a[i].strip()
-
-                    if line:
-                        self.removes.setdefault(line, []).append((i, group))
+                self._index_removed_lines(group)
 
             if tag in ('insert', 'replace'):
                 self.inserts.append(group)
@@ -107,206 +117,182 @@ class DiffOpcodeGenerator(object):
     def _compute_moves(self):
         # We now need to figure out all the moved locations.
         #
-        # At this point, we know all the inserted groups, and all the
-        # individually deleted lines. We'll be going through and finding
-        # consecutive groups of matching inserts/deletes that represent a
-        # move block.
+        # At this point, we know all the inserted groups and have an index
+        # of the deleted lines. We'll go through each inserted group, line
+        # by line, and look up deleted blocks that begin with the same
+        # lines. Each candidate is extended for as long as the lines keep
+        # matching, and the longest one wins.
         #
-        # The algorithm will be documented as we go in the code.
+        # Lookups are done on windows of MOVE_PREFERRED_MIN_LINES lines
+        # (or a single line, if it's long enough to be a move on its own),
+        # so common lines like braces, "pass", or blank lines don't by
+        # themselves produce candidates. Windows that appear too many times
+        # in the deleted lines are considered too common to be meaningful
+        # moves and are ignored. This keeps the work close to linear in the
+        # number of changed lines.
         #
-        # We start by looping through all the inserted groups.
-        for insert in self.inserts:
-            self._compute_move_for_insert(*insert)
+        # Move detection is only a nicety, so if it takes longer than
+        # MOVE_TIME_BUDGET seconds, we stop and keep what we have so far.
+        # The time is checked for each line of each inserted group, so a
+        # single large group can't run over the budget either.
+        if not self.inserts or not self.removes:
+            return
+
+        self._move_deadline = time.time() + self.MOVE_TIME_BUDGET
+
+        for i, insert in enumerate(self.inserts):
+            if not self._compute_move_for_insert(*insert):
+                logging.debug('Move detection exceeded its time budget of '
+                              '%s seconds; skipping the remaining %d '
+                              'inserted ranges.',
+                              self.MOVE_TIME_BUDGET,
+                              len(self.inserts) - i)
+                break
+
+    def _get_line_code(self, line):
+        """Returns an integer code representing a stripped line.
+
+        Identical lines (ignoring leading and trailing whitespace) share the
+        same code, which makes comparing windows of lines cheap.
+        """
+        line = line.strip()
+
+        try:
+            return self._line_codes[line]
+        except KeyError:
+            code = len(self._line_codes)
+            self._line_codes[line] = code
+
+            return code
+
+    def _index_removed_lines(self, group):
+        """Adds the deleted lines from a group to the move index.
+
+        Each non-blank deleted line is indexed by the codes of the window
+        of lines starting at it. Long lines are also indexed on their own,
+        since they can be considered a move by themselves.
+        """
+        tag, i1, i2, j1, j2, meta = group
+        a = self.differ.a
+        window_size = self.MOVE_PREFERRED_MIN_LINES
+        codes = [self._get_line_code(a[i]) for i in range(i1, i2)]
+        blank_code = self._line_codes.get('')
+
+        for i, code in enumerate(codes):
+            if code == blank_code:
+                continue
+
+            if i + window_size <= len(codes):
+                key = tuple(codes[i:i + window_size])
+                self.removes.setdefault(key, []).append((i1 + i, group))
+
+            if len(a[i1 + i].strip()) >= self.MOVE_MIN_LINE_LENGTH:
+                self.removes.setdefault(code, []).append((i1 + i, group))
+
+        self._removed_codes.update(zip(range(i1, i2), codes))
+
+    def _find_move_candidates(self, codes, i, end):
+        """Returns the deleted lines that may start a move at a position.
+
+        ``codes`` are the line codes for the inserted group, and ``i`` is
+        the index into it. Windows or lines that appear more than
+        MOVE_MAX_CANDIDATES times are considered too common, and are
+        skipped.
+        """
+        candidates = []
+        window_size = self.MOVE_PREFERRED_MIN_LINES
+
+        if i + window_size <= end:
+            candidates += self.removes.get(tuple(codes[i:i + window_size]),
+                                           [])
+
+        candidates += self.removes.get(codes[i], [])
+
+        if len(candidates) > self.MOVE_MAX_CANDIDATES:
+            return []
+
+        return candidates
 
     def _compute_move_for_insert(self, itag, ii1, ii2, ij1, ij2, imeta):
-        # Store some state on the range we'll be working with inside this
-        # insert group.
-        #
-        # i_move_cur is the current location inside the insert group
-        # (from ij1 through ij2).
-        #
-        # i_move_range is the current range of consecutive lines that
-        # we'll use for a move. Each line in this range has a
-        # corresponding consecutive delete line.
-        #
-        # r_move_ranges represents deleted move ranges. The key is a
-        # string in the form of "{i1}-{i2}-{j1}-{j2}", with those
-        # positions taken from the remove group for the line. The value
-        # is a tuple of (r_start, r_end, r_group). These values are used to
-        # quickly locate deleted lines we've found that match the inserted
-        # lines, so we can assemble ranges later.
-        i_move_cur = ij1
-        i_move_range = (i_move_cur, i_move_cur)
-        r_move_ranges = {}  # key -> (start, end, group)
-        prev_key = None
-
-        # Loop through every location from ij1 through ij2 until we've
-        # reached the end.
-        while i_move_cur <= ij2:
-            try:
-                iline = self.differ.b[i_move_cur].strip()
-            except IndexError:
-                iline = None
-
-            updated_range = False
-
-            if iline and iline in self.removes:
-                # The inserted line at this location has a corresponding
-                # removed line.
-                #
-                # If there's already some information on removed line ranges
-                # for this particular move block we're processing then we'll
-                # update the range.
-                #
-                # The way we do that is to find each removed line that matches
-                # this inserted line, and for each of those find out if there's
-                # an existing move range that the found removed line
-                # immediately follows. If there is, we update the existing
-                # range.
-                #
-                # If there isn't any move information for this line, we'll
-                # simply add it to the move ranges.
-                for ri, rgroup in self.removes.get(iline, []):
-                    key = '%s-%s-%s-%s' % rgroup[1:5]
-                    prev_key = key
-
-                    r_move_range = r_move_ranges.get(key)
-
-                    if r_move_range:
-                        # If the remove information for the line is next in
-                        # the sequence for this calculated move range...
-                        if ri == r_move_range[1] + 1:
-                            # This is part of the current range, so update
-                            # the end of the range to include it.
-                            r_move_ranges[key] = (r_move_range[0], ri, rgroup)
-                            updated_range = True
-                    else:
-                        # We don't have any move ranges yet, or we're done
-                        # with the existing range, so it's time to build one
-                        # based on any removed lines we find that match the
-                        # inserted line.
-                        r_move_ranges[key] = (ri, ri, rgroup)
-                        updated_range = True
-
-                if not updated_range and r_move_ranges:
-                    # We didn't find a move range that this line is a part
-                    # of, but we do have some existing move ranges stored.
-                    #
-                    # Given that updated_range is set, we'll be processing
-                    # the known move ranges below. We'll actually want to
-                    # re-check this line afterward, so that we can start a
-                    # new move range after we've finished processing the
-                    # current ones.
-                    #
-                    # To do that, just i_move_cur back by one. That negates
-                    # the increment below.
-                    i_move_cur -= 1
-            elif iline == '' and prev_key:
-                # This is a blank or whitespace-only line, which would not
-                # be in the list of removed lines above. We also have been
-                # working on a move range.
-                #
-                # At this point, the plan is to just attach this blank
-                # line onto the end of the last range being operated on.
-                #
-                # This blank line will help tie together adjacent move
-                # ranges. If it turns out to be a trailing line, it'll be
-                # stripped later in _determine_move_range.
-                r_move_range = r_move_ranges.get(prev_key, None)
-
-                if r_move_range:
-                    new_end_i = r_move_range[1] + 1
-
-                    if (new_end_i < len(self.differ.a) and
-                        self.differ.a[new_end_i].strip() == ''):
-                        # There was a matching blank line on the other end
-                        # of the range, so we should feel more confident about
-                        # adding the blank line here.
-                        r_move_ranges[prev_key] = \
-                            (r_move_range[0], new_end_i, r_move_range[2])
-                        updated_range = True
-
-            i_move_cur += 1
-
-            if not updated_range:
-                # We've reached the very end of the insert group. See if
-                # we have anything that looks like a move.
-                if r_move_ranges:
-                    r_move_range = \
-                        self._find_longest_move_range(r_move_ranges)
-
-                    # If we have a move range, see if it's one we want to
-                    # include or filter out. Some moves are not impressive
-                    # enough to display. For example, a small portion of a
-                    # comment, or whitespace-only changes.
-                    r_move_range = self._determine_move_range(r_move_range)
-
-                    if r_move_range:
-                        # Rebuild the insert and remove ranges based on where
-                        # we are now and which range we won.
-                        #
-                        # The new ranges will be actual lists of positions,
-                        # rather than a beginning and end. These will be
-                        # provided to the renderer.
-                        #
-                        # The ranges expected by the renderers are 1-based,
-                        # whereas our calculations for this algorithm are
-                        # 0-based, so we add 1 to the numbers.
-                        #
-                        # The upper boundaries passed to the range() function
-                        # must actually be one higher than the value we want.
-                        # So, for r_move_range, we actually increment by 2.  We
-                        # only increment i_move_cur by one, because i_move_cur
-                        # already factored in the + 1 by being at the end of
-                        # the while loop.
-                        i_range = range(i_move_range[0] + 1,
-                                        i_move_cur + 1)
-                        r_range = range(r_move_range[0] + 1,
-                                        r_move_range[1] + 2)
-
-                        rmeta = r_move_range[2][-1]
-                        rmeta.setdefault('moved-to', {}).update(
-                            dict(zip(r_range, i_range)))
-                        imeta.setdefault('moved-from', {}).update(
-                            dict(zip(i_range, r_range)))
-
-                # Reset the state for the next range.
-                prev_key = None
-                i_move_range = (i_move_cur, i_move_cur)
-                r_move_ranges = {}
-
-    def _find_longest_move_range(self, r_move_ranges):
-        # Go through every range of lines we've found and find the longest.
-        #
-        # The longest move range wins. If we find two ranges that are equal,
-        # though, we'll ignore both. The idea is that if we have two identical
-        # moves, then it's probably common enough code that we don't want to
-        # show the move. An example might be some standard part of a comment
-        # block, with no real changes in content.
-        #
-        # Note that with the current approach, finding duplicate moves doesn't
-        # cause us to reset the winning range to the second-highest identical
-        # match. We may want to do that down the road, but it means additional
-        # state, and this is hopefully uncommon enough to not be a real
-        # problem.
-        r_move_range = None
-
-        for iter_move_range in six.itervalues(r_move_ranges):
-            if not r_move_range:
-                r_move_range = iter_move_range
-            else:
-                len1 = r_move_range[1] - r_move_range[0]
-                len2 = iter_move_range[1] - iter_move_range[0]
-
-                if len1 < len2:
-                    r_move_range = iter_move_range
-                elif len1 == len2:
-                    # If there are two that are the same, it may be common
-                    # code that we don't want to see moves for. Comments,
-                    # for example.
+        """Finds the moved lines in an inserted group.
+
+        This returns False if move detection ran out of time before the
+        whole group was checked.
+        """
+        # Compute the codes for every line in this insert group. These are
+        # compared against the codes of the deleted lines.
+        codes = [self._get_line_code(line)
+                 for line in self.differ.b[ij1:ij2]]
+        removed_codes = self._removed_codes
+        num_lines = len(codes)
+        blank_code = self._line_codes.get('')
+        i = 0
+
+        while i < num_lines:
+            if time.time() > self._move_deadline:
+                return False
+
+            if codes[i] == blank_code:
+                i += 1
+                continue
+
+            # Extend each candidate deleted block for as long as the lines
+            # keep matching. The longest block wins. If there are two
+            # blocks that are equally long, it may be common code (such as
+            # standard parts of comments) that we don't want to show moves
+            # for.
+            r_move_range = None
+            longest = 0
+            seen = set()
+
+            for ri, rgroup in self._find_move_candidates(codes, i, num_lines):
+                if ri in seen:
+                    continue
+
+                if time.time() > self._move_deadline:
+                    return False
+
+                seen.add(ri)
+                ri_end = rgroup[2]
+                length = 1
+
+                while (i + length < num_lines and
+                       ri + length < ri_end and
+                       removed_codes[ri + length] == codes[i + length]):
+                    length += 1
+
+                if length > longest:
+                    longest = length
+                    r_move_range = (ri, ri + length - 1, rgroup)
+                elif length == longest:
                     r_move_range = None
 
-        return r_move_range
+            if longest == 0:
+                i += 1
+                continue
+
+            # If we have a move range, see if it's one we want to include
+            # or filter out. Some moves are not impressive enough to
+            # display. For example, a small portion of a comment, or
+            # whitespace-only changes.
+            r_move_range = self._determine_move_range(r_move_range)
+
+            if r_move_range:
+                # The ranges expected by the renderers are 1-based,
+                # whereas our calculations for this algorithm are 0-based,
+                # so we add 1 to the numbers.
+                i_range = range(ij1 + i + 1, ij1 + i + longest + 1)
+                r_range = range(r_move_range[0] + 1, r_move_range[1] + 2)
+
+                rmeta = r_move_range[2][-1]
+                rmeta.setdefault('moved-to', {}).update(
+                    dict(zip(r_range, i_range)))
+                imeta.setdefault('moved-from', {}).update(
+                    dict(zip(i_range, r_range)))
+
+            i += longest
+
+        return True
 
     def _determine_move_range(self, r_move_range):
         """Determines if a move range is valid and should be included.
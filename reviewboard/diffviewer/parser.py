@@ -3,7 +3,7 @@ from __future__ import unicode_literals
 import logging
 import re
 
-from djblets.util.compat.six.moves import range
+from djblets.util.compat import six
 
 from reviewboard.diffviewer.errors import DiffParserError
 
@@ -15,12 +15,49 @@ class File(object):
         self.origInfo = None
         self.newInfo = None
         self.origChangesetId = None
-        self.data = None
         self.binary = False
         self.deleted = False
         self.moved = False
         self.insert_count = 0
         self.delete_count = 0
+        self._data_chunks = None
+
+    def _get_data(self):
+        chunks = self._data_chunks
+
+        if chunks is None:
+            return None
+
+        if len(chunks) > 1:
+            chunks = [chunks[0][:0].join(chunks)]
+            self._data_chunks = chunks
+
+        return chunks[0]
+
+    def _set_data(self, data):
+        if data is None:
+            self._data_chunks = None
+        else:
+            self._data_chunks = [data]
+
+    # The diff content for the file. While a diff is being parsed, this is
+    # built up in pieces using append_data(), and only joined together once
+    # it's accessed.
+    data = property(_get_data, _set_data)
+
+    def append_data(self, data):
+        """Appends content to the end of the file's diff data."""
+        if self._data_chunks is None:
+            self._data_chunks = [data]
+        else:
+            self._data_chunks.append(data)
+
+    def prepend_data(self, data):
+        """Inserts content at the start of the file's diff data."""
+        if self._data_chunks is None:
+            self._data_chunks = [data]
+        else:
+            self._data_chunks.insert(0, data)
 
 
 class DiffParser(object):
@@ -35,16 +72,38 @@ class DiffParser(object):
         self.data = data
         self.lines = data.splitlines()
 
+        # Lines are stored in the parsed files with the same type as the
+        # diff, so that byte strings never get decoded along the way.
+        if isinstance(data, six.binary_type):
+            self.newline = b'\n'
+        else:
+            self.newline = '\n'
+
     def parse(self):
         """
         Parses the diff, returning a list of File objects representing each
         file in the diff.
         """
+        self.files = list(self.iter_files())
+
+        return self.files
+
+    def iter_files(self):
+        """Parses the diff, yielding File objects as they're found.
+
+        Each File is yielded once all of its content has been parsed. This
+        allows callers to process and discard files one at a time when
+        working with very large diffs.
+
+        Parsers that need to change how the diff as a whole is parsed
+        should override this, rather than parse(). Parsers that override
+        parse() still work when diffs are uploaded, but their files are
+        all parsed before any of them are processed.
+        """
         logging.debug("DiffParser.parse: Beginning parse of diff, size = %s",
                       len(self.data))
 
-        preamble = ''
-        self.files = []
+        preamble = []
         file = None
         i = 0
 
@@ -53,22 +112,29 @@ class DiffParser(object):
             next_linenum, new_file = self.parse_change_header(i)
 
             if new_file:
-                # This line is the start of a new file diff.
+                # This line is the start of a new file diff, so the previous
+                # file is complete.
+                if file:
+                    yield file
+
                 file = new_file
-                file.data = preamble + file.data
-                preamble = ''
-                self.files.append(file)
+
+                if preamble:
+                    file.prepend_data(self.join_data(preamble))
+                    preamble = []
+
                 i = next_linenum
             else:
                 if file:
                     i = self.parse_diff_line(i, file)
                 else:
-                    preamble += self.lines[i] + '\n'
+                    preamble += [self.lines[i], self.newline]
                     i += 1
 
-        logging.debug("DiffParser.parse: Finished parsing diff.")
+        if file:
+            yield file
 
-        return self.files
+        logging.debug("DiffParser.parse: Finished parsing diff.")
 
     def parse_diff_line(self, linenum, info):
         line = self.lines[linenum]
@@ -79,10 +145,19 @@ class DiffParser(object):
             elif line.startswith('+'):
                 info.insert_count += 1
 
-        info.data += line + '\n'
+        info.append_data(line + self.newline)
 
         return linenum + 1
 
+    def append_lines(self, info, linenum, count=1):
+        """Appends lines from the diff to a file's diff data."""
+        for line in self.lines[linenum:linenum + count]:
+            info.append_data(line + self.newline)
+
+    def join_data(self, chunks):
+        """Joins a list of pieces of diff data together."""
+        return self.data[:0].join(chunks)
+
     def parse_change_header(self, linenum):
         """
         Parses part of the diff beginning at the specified line number, trying
@@ -119,9 +194,7 @@ class DiffParser(object):
 
             # The header is part of the diff, so make sure it gets in the
             # diff content.
-            file.data = ''.join([
-                self.lines[i] + '\n' for i in range(start, linenum)
-            ])
+            self.append_lines(file, start, linenum - start)
 
         return linenum, file
 
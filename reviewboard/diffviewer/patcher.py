@@ -0,0 +1,301 @@
+from __future__ import unicode_literals
+
+import re
+
+from djblets.util.compat.six.moves import range
+
+from reviewboard.diffviewer.errors import PatchError
+
+
+HUNK_HEADER_RE = re.compile(
+    br'^@@ -(?P<orig_start>\d+)(?:,(?P<orig_len>\d+))? '
+    br'\+(?P<new_start>\d+)(?:,(?P<new_len>\d+))? @@')
+
+NO_NEWLINE_MARKER = b'\\'
+
+
+class Hunk(object):
+    """A single hunk from a unified diff.
+
+    ``orig_lines`` contains the context and removed lines, as they're
+    expected to appear in the original file. ``new_lines`` contains the
+    context and inserted lines, as they'll appear in the patched file.
+
+    ``leading_context`` and ``trailing_context`` hold the number of
+    unchanged lines at the start and end of the hunk, which can be ignored
+    when applying the hunk with fuzz.
+    """
+    def __init__(self, orig_start, orig_len, new_start, new_len):
+        self.orig_start = orig_start
+        self.orig_len = orig_len
+        self.new_start = new_start
+        self.new_len = new_len
+        self.orig_lines = []
+        self.new_lines = []
+        self.leading_context = 0
+        self.trailing_context = 0
+
+
+def split_lines(data):
+    """Splits data into a list of lines, keeping the trailing newlines.
+
+    Unlike ``str.splitlines``, this only splits on ``\\n``.
+    """
+    lines = [line + b'\n' for line in data.split(b'\n')]
+
+    # The last entry is whatever came after the final newline. If that's
+    # empty, the file ended with a newline and there's nothing left.
+    last_line = lines.pop()[:-1]
+
+    if last_line:
+        lines.append(last_line)
+
+    return lines
+
+
+def parse_hunks(diff):
+    """Parses the hunks out of a unified diff for a single file.
+
+    Any headers before the first hunk are skipped. This raises PatchError
+    if the diff isn't a unified diff for one file.
+    """
+    hunks = []
+    lines = split_lines(diff)
+    num_lines = len(lines)
+    i = 0
+
+    while i < num_lines:
+        line = lines[i]
+        m = HUNK_HEADER_RE.match(line)
+
+        if not m:
+            if (hunks and line.startswith(b'--- ') and i + 1 < num_lines and
+                    lines[i + 1].startswith(b'+++ ')):
+                raise PatchError('The diff contains more than one file')
+            elif (line.startswith(b'GIT binary patch') or
+                  line.startswith(b'***************')):
+                raise PatchError('Unsupported diff format')
+
+            i += 1
+            continue
+
+        hunk = Hunk(int(m.group('orig_start')),
+                    int(m.group('orig_len') or 1),
+                    int(m.group('new_start')),
+                    int(m.group('new_len') or 1))
+        orig_remaining = hunk.orig_len
+        new_remaining = hunk.new_len
+        in_leading_context = True
+        i += 1
+
+        while i < num_lines and (orig_remaining > 0 or new_remaining > 0):
+            line = lines[i]
+            prefix = line[:1]
+
+            if prefix == b' ' or line == b'\n':
+                content = line[1:] or b'\n'
+                hunk.orig_lines.append(content)
+                hunk.new_lines.append(content)
+                orig_remaining -= 1
+                new_remaining -= 1
+
+                if in_leading_context:
+                    hunk.leading_context += 1
+
+                hunk.trailing_context += 1
+            elif prefix == b'-':
+                hunk.orig_lines.append(line[1:])
+                orig_remaining -= 1
+                in_leading_context = False
+                hunk.trailing_context = 0
+            elif prefix == b'+':
+                hunk.new_lines.append(line[1:])
+                new_remaining -= 1
+                in_leading_context = False
+                hunk.trailing_context = 0
+            elif prefix == NO_NEWLINE_MARKER:
+                _strip_last_newline(lines[i - 1], hunk)
+            else:
+                raise PatchError('Unexpected line %d in hunk: %r'
+                                 % (i + 1, line))
+
+            i += 1
+
+        if orig_remaining != 0 or new_remaining != 0:
+            raise PatchError('Truncated hunk ending on line %d' % i)
+
+        # A "\ No newline at end of file" marker may follow the last line
+        # of the hunk.
+        if i < num_lines and lines[i].startswith(NO_NEWLINE_MARKER):
+            _strip_last_newline(lines[i - 1], hunk)
+            i += 1
+
+        if hunk.leading_context == len(hunk.orig_lines):
+            # The hunk is all context, so there's nothing leading up to
+            # a change.
+            hunk.trailing_context = 0
+
+        hunks.append(hunk)
+
+    return hunks
+
+
+def apply_patch(diff, data, strict=False, max_fuzz=2):
+    """Applies a unified diff for a single file to the file's contents.
+
+    This works entirely in memory, without calling out to :command:`patch`.
+
+    Hunks that don't apply at the line numbers listed in the diff are
+    searched for nearby (the offset is carried over to the following
+    hunks). If they still don't match, up to ``max_fuzz`` lines of leading
+    and trailing context are ignored, in a similar way to GNU patch's fuzz
+    factor. At least one line of context is always kept, so that a hunk
+    can't match wherever its removed lines happen to appear, and the
+    ignored context must still fit within the file.
+
+    This doesn't reproduce every rule GNU patch uses for offsets and fuzz,
+    so it may place or reject a few badly-matching hunks differently.
+
+    If ``strict`` is True, each hunk must apply exactly at its listed
+    position, with no offset or fuzz.
+
+    Both ``diff`` and ``data`` are expected to use ``\\n`` line endings.
+    PatchError is raised if any hunk fails to apply.
+    """
+    hunks = parse_hunks(diff)
+
+    if not hunks:
+        raise PatchError('The diff does not contain any hunks')
+
+    orig_lines = split_lines(data)
+    result = []
+    cursor = 0
+    offset = 0
+
+    if strict:
+        max_fuzz = 0
+
+    for hunk_num, hunk in enumerate(hunks):
+        # When there are no original lines, the hunk's start is the line
+        # after which the new content is inserted.
+        if hunk.orig_len == 0:
+            expected = hunk.orig_start
+        else:
+            expected = hunk.orig_start - 1
+
+        match = None
+        context = max(hunk.leading_context, hunk.trailing_context)
+        hunk_max_fuzz = min(max_fuzz, max(context - 1, 0))
+
+        for fuzz in range(hunk_max_fuzz + 1):
+            match = _find_hunk(orig_lines, hunk, expected + offset, cursor,
+                               fuzz, strict)
+
+            if match is not None:
+                break
+
+        if match is None:
+            raise PatchError('Hunk #%d (line %d) failed to apply'
+                             % (hunk_num + 1, hunk.orig_start))
+
+        pos, skip_start, skip_end = match
+        offset = pos - skip_start - expected
+
+        _extend_lines(result, orig_lines[cursor:pos])
+        _extend_lines(result, hunk.new_lines[skip_start:
+                                             len(hunk.new_lines) - skip_end])
+        cursor = pos + len(hunk.orig_lines) - skip_start - skip_end
+
+    _extend_lines(result, orig_lines[cursor:])
+
+    return b''.join(result)
+
+
+def _extend_lines(result, lines):
+    """Adds lines to the result, making sure the previous line ends cleanly.
+
+    If the last line so far was missing a trailing newline and more lines
+    are being added after it, the newline is added back, as GNU patch does.
+    """
+    if lines and result and not result[-1].endswith(b'\n'):
+        result[-1] += b'\n'
+
+    result.extend(lines)
+
+
+def _strip_last_newline(prev_line, hunk):
+    """Handles a "\\ No newline at end of file" marker.
+
+    This strips the newline from the last line added to the hunk for the
+    side that the preceding diff line belonged to.
+    """
+    prefix = prev_line[:1]
+
+    if prefix == b'\n':
+        # An empty context line, with its leading space stripped.
+        prefix = b' '
+
+    if prefix in (b' ', b'-') and hunk.orig_lines:
+        hunk.orig_lines[-1] = hunk.orig_lines[-1].rstrip(b'\n')
+
+    if prefix in (b' ', b'+') and hunk.new_lines:
+        hunk.new_lines[-1] = hunk.new_lines[-1].rstrip(b'\n')
+
+
+def _find_hunk(orig_lines, hunk, expected, min_pos, fuzz, strict):
+    """Finds where a hunk applies in the original file.
+
+    This returns a tuple of (position, leading lines skipped, trailing lines
+    skipped), or None if the hunk doesn't match anywhere at or after
+    ``min_pos``.
+    """
+    # Fuzz first evens out the leading and trailing context before ignoring
+    # any context on both sides, as GNU patch does. A hunk with less leading
+    # context than trailing context must be at the start of the file, and
+    # one with less trailing context must be at the end of the file.
+    context = max(hunk.leading_context, hunk.trailing_context)
+    prefix_fuzz = fuzz + hunk.leading_context - context
+    suffix_fuzz = fuzz + hunk.trailing_context - context
+    skip_start = min(max(prefix_fuzz, 0), hunk.leading_context)
+    skip_end = min(max(suffix_fuzz, 0), hunk.trailing_context)
+
+    wanted = hunk.orig_lines[skip_start:len(hunk.orig_lines) - skip_end]
+    num_wanted = len(wanted)
+    max_pos = len(orig_lines) - num_wanted
+    start = expected + skip_start
+
+    def matches(pos):
+        # The context lines being ignored still have to fit within the
+        # file, before and after the lines being matched.
+        return (min_pos <= pos <= max_pos and
+                pos - skip_start >= 0 and
+                pos + num_wanted + skip_end <= len(orig_lines) and
+                orig_lines[pos:pos + num_wanted] == wanted)
+
+    if strict:
+        anchored_pos = start
+    elif suffix_fuzz < 0:
+        anchored_pos = max_pos
+    elif prefix_fuzz < 0:
+        anchored_pos = 0
+    else:
+        anchored_pos = None
+
+    if anchored_pos is not None:
+        if matches(anchored_pos):
+            return anchored_pos, skip_start, skip_end
+
+        return None
+
+    # Search outward from the expected position, preferring the closest
+    # match.
+    max_distance = max(start - min_pos, max_pos - start)
+
+    for distance in range(max_distance + 1):
+        if matches(start + distance):
+            return start + distance, skip_start, skip_end
+
+        if distance and matches(start - distance):
+            return start - distance, skip_start, skip_end
+
+    return None
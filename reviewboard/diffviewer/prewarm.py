@@ -0,0 +1,167 @@
+from __future__ import unicode_literals
+
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection
+from djblets.siteconfig.models import SiteConfiguration
+
+from reviewboard.diffviewer.chunk_generator import get_diff_chunk_generator
+from reviewboard.diffviewer.diffutils import (get_diff_files,
+                                               prefetch_original_files)
+from reviewboard.diffviewer.models import DiffSet
+
+
+class ChunkPrewarmPool(object):
+    """A pool of worker threads that generate diff chunks ahead of time.
+
+    Jobs are queued along with the ID of the repository they'll access.
+    Up to num_workers jobs run at once, but no more than
+    max_jobs_per_repository for any one repository, so that a single large
+    diff can't tie up every worker or flood its repository with requests.
+
+    The worker threads are started when the first job is queued.
+    """
+    def __init__(self, num_workers=4, max_jobs_per_repository=2):
+        self.num_workers = num_workers
+        self.max_jobs_per_repository = max_jobs_per_repository
+        self._jobs = []
+        self._active_jobs = {}
+        self._workers = []
+        self._cond = threading.Condition()
+
+    def add(self, repository_id, func, *args):
+        """Queues a function to be called by one of the worker threads."""
+        with self._cond:
+            self._jobs.append((repository_id, func, args))
+            self._start_workers()
+            self._cond.notify_all()
+
+    def _get_next_job(self):
+        """Removes and returns the next job that can be run.
+
+        Jobs for repositories that already have max_jobs_per_repository jobs
+        running are skipped. If no job can be run, this returns None.
+
+        This must be called with the lock held.
+        """
+        for i, job in enumerate(self._jobs):
+            if (self._active_jobs.get(job[0], 0) <
+                self.max_jobs_per_repository):
+                return self._jobs.pop(i)
+
+        return None
+
+    def _start_workers(self):
+        """Starts any worker threads that aren't yet running."""
+        while len(self._workers) < self.num_workers:
+            thread = threading.Thread(target=self._worker,
+                                      name='diff-chunk-prewarm')
+            thread.daemon = True
+            thread.start()
+            self._workers.append(thread)
+
+    def _worker(self):
+        """Runs jobs from the queue as they can be run."""
+        while True:
+            with self._cond:
+                job = self._get_next_job()
+
+                while job is None:
+                    self._cond.wait()
+                    job = self._get_next_job()
+
+                repository_id = job[0]
+                self._active_jobs[repository_id] = \
+                    self._active_jobs.get(repository_id, 0) + 1
+
+            try:
+                self._run_job(job)
+            finally:
+                with self._cond:
+                    self._active_jobs[repository_id] -= 1
+
+                    if not self._active_jobs[repository_id]:
+                        del self._active_jobs[repository_id]
+
+                    self._cond.notify_all()
+
+    def _run_job(self, job):
+        """Runs a job, logging any errors."""
+        repository_id, func, args = job
+
+        try:
+            func(*args)
+        except Exception as e:
+            logging.error('Error pre-generating diff chunks in repository '
+                          '%s: %s',
+                          repository_id, e, exc_info=1)
+        finally:
+            # This isn't running as part of a request, so nothing else will
+            # close the thread's database connection.
+            connection.close()
+
+
+prewarm_pool = ChunkPrewarmPool()
+
+
+def prewarm_diff_chunks(diffset, interdiffset=None):
+    """Queues generation of the diff chunks for a diff or interdiff.
+
+    The chunks for every file in the diff (or the interdiff between
+    diffset and interdiffset) are generated in the background by
+    prewarm_pool and stored in the cache, so that they're ready by the
+    time someone views the diff.
+
+    This does nothing if the diffviewer_prewarm_chunks setting is off.
+    """
+    siteconfig = SiteConfiguration.objects.get_current()
+
+    if (getattr(settings, 'RUNNING_TEST', False) or
+        not siteconfig.get('diffviewer_prewarm_chunks')):
+        return
+
+    prewarm_pool.max_jobs_per_repository = \
+        siteconfig.get('diffviewer_prewarm_max_jobs_per_repository')
+    prewarm_pool.add(diffset.repository_id, _queue_diff_files,
+                     diffset.pk, interdiffset and interdiffset.pk)
+
+
+def _queue_diff_files(diffset_id, interdiffset_id):
+    """Queues generation of the chunks for each file in a diff."""
+    siteconfig = SiteConfiguration.objects.get_current()
+    enable_syntax_highlighting = \
+        siteconfig.get('diffviewer_syntax_highlighting')
+
+    diffset = DiffSet.objects.get(pk=diffset_id)
+
+    if interdiffset_id:
+        interdiffset = DiffSet.objects.get(pk=interdiffset_id)
+    else:
+        interdiffset = None
+
+    diff_files = get_diff_files(diffset, interdiffset=interdiffset)
+
+    # Fetch all the original files in one go, rather than having each job
+    # fetch its own.
+    prefetch_original_files(
+        [diff_file['filediff'] for diff_file in diff_files] +
+        [diff_file['interfilediff'] for diff_file in diff_files
+         if diff_file['interfilediff']])
+
+    for diff_file in diff_files:
+        prewarm_pool.add(diffset.repository_id, _generate_chunks,
+                         diff_file['filediff'],
+                         diff_file['interfilediff'],
+                         diff_file['force_interdiff'],
+                         enable_syntax_highlighting)
+
+
+def _generate_chunks(filediff, interfilediff, force_interdiff,
+                     enable_syntax_highlighting):
+    """Generates and caches the chunks for a file in a diff."""
+    generator = get_diff_chunk_generator(None, filediff, interfilediff,
+                                         force_interdiff,
+                                         enable_syntax_highlighting)
+    generator.get_chunks()
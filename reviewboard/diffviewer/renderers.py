@@ -216,8 +216,11 @@ class DiffRenderer(object):
                         self.diff_file['chunks'].remove(chunk)
 
         equal_lines = 0
+        chunks = self.diff_file['chunks']
 
-        for chunk in self.diff_file['chunks']:
+        # Large files have their chunks loaded from the cache in windows,
+        # so use the summaries to avoid loading every window here.
+        for chunk in getattr(chunks, 'summaries', chunks):
             if chunk['change'] == 'equal':
                 equal_lines += chunk['numlines']
 
@@ -1,24 +1,36 @@
 from __future__ import unicode_literals
 
+import hashlib
 import os
+import threading
 import unittest
 
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.http import HttpResponse
-from djblets.cache.backend import cache_memoize
+from django.utils import translation
+from djblets.cache.backend import cache_memoize, make_cache_key
+from djblets.db.fields import Base64DecodedValue
 from djblets.siteconfig.models import SiteConfiguration
 from djblets.util.compat.six.moves import zip_longest
 from kgb import SpyAgency
 import nose
+from pygments.lexers import CMakeLexer, MakefileLexer, PythonLexer, TextLexer
 
 import reviewboard.diffviewer.diffutils as diffutils
 import reviewboard.diffviewer.parser as diffparser
-from reviewboard.diffviewer.chunk_generator import DiffChunkGenerator
-from reviewboard.diffviewer.errors import UserVisibleError
+from reviewboard.diffviewer.chunk_generator import (
+    DiffChunkGenerator, DiffChunkWindows, get_lexer_class_for_filename)
+from reviewboard.diffviewer.errors import PatchError, UserVisibleError
 from reviewboard.diffviewer.forms import UploadDiffForm
-from reviewboard.diffviewer.models import DiffSet, FileDiff
+from reviewboard.diffviewer.models import (DiffSet, DiffSetHistory, FileDiff,
+                                           FileDiffData)
 from reviewboard.diffviewer.myersdiff import MyersDiffer
-from reviewboard.diffviewer.opcode_generator import get_diff_opcode_generator
+from reviewboard.diffviewer.opcode_generator import (DiffOpcodeGenerator,
+                                                     get_diff_opcode_generator)
+from reviewboard.diffviewer.patcher import apply_patch
+from reviewboard.diffviewer.prewarm import (ChunkPrewarmPool,
+                                            prewarm_diff_chunks)
 from reviewboard.diffviewer.renderers import DiffRenderer
 from reviewboard.diffviewer.processors import (filter_interdiff_opcodes,
                                                merge_adjacent_chunks)
@@ -219,6 +231,29 @@ class DiffParserTest(TestCase):
         files = diffparser.DiffParser(data).parse()
         self.compareDiffs(files, "context")
 
+    def test_parse_with_preamble(self):
+        """Testing parse on a diff with a preamble"""
+        data = b'This is a preamble.\n\n' + self.diff('-u')
+        files = diffparser.DiffParser(data).parse()
+        self.compareDiffs(files, "unified")
+
+        self.assertTrue(files[0].data.startswith(b'This is a preamble.\n\n'))
+        self.assertTrue(files[1].data.startswith(b'--- '))
+
+    def test_iter_files(self):
+        """Testing iter_files on a unified diff"""
+        data = self.diff('-u')
+        files = list(diffparser.DiffParser(data).iter_files())
+        self.compareDiffs(files, "unified")
+
+        expected_files = diffparser.DiffParser(data).parse()
+
+        for file, expected_file in zip(files, expected_files):
+            self.assertEqual(file.origFile, expected_file.origFile)
+            self.assertEqual(file.data, expected_file.data)
+            self.assertEqual(file.insert_count, expected_file.insert_count)
+            self.assertEqual(file.delete_count, expected_file.delete_count)
+
     def testPatch(self):
         """Testing patching"""
 
@@ -430,6 +465,78 @@ class DiffParserTest(TestCase):
             ]
         )
 
+    def test_move_detection_with_common_lines(self):
+        """Testing diff viewer move detection with many common lines"""
+        block = [
+            '    if (value) {',
+            '        do_something();',
+            '    }',
+            '',
+        ]
+
+        self._test_move_detection(
+            ['void f() {', '    call_function_one();',
+             '    call_function_two();', '}'] + block * 50,
+            block * 50 + ['void f() {', '    call_function_one();',
+                          '    call_function_two();', '}'],
+            [
+                {
+                    201: 1,
+                    202: 2,
+                    203: 3,
+                }
+            ],
+            [
+                {
+                    1: 201,
+                    2: 202,
+                    3: 203,
+                }
+            ])
+
+    def test_move_detection_time_budget(self):
+        """Testing diff viewer move detection stops after exceeding the
+        time budget
+        """
+        class NoTimeOpcodeGenerator(DiffOpcodeGenerator):
+            MOVE_TIME_BUDGET = -1
+
+        differ = MyersDiffer(
+            ['this is line 1, and it is sufficiently long', '---',
+             'this is line 2, and it is sufficiently long'],
+            ['this is line 2, and it is sufficiently long', '---',
+             'this is line 1, and it is sufficiently long'])
+
+        for opcodes in NoTimeOpcodeGenerator(differ):
+            self.assertNotIn('moved-to', opcodes[-1])
+            self.assertNotIn('moved-from', opcodes[-1])
+
+    def test_move_detection_time_budget_within_group(self):
+        """Testing diff viewer move detection stops partway through an
+        inserted group after exceeding the time budget
+        """
+        class SlowOpcodeGenerator(DiffOpcodeGenerator):
+            num_lookups = 0
+
+            def _find_move_candidates(self, *args, **kwargs):
+                # Simulate the time budget running out during the first
+                # lookup.
+                self.num_lookups += 1
+                self._move_deadline = 0
+
+                return super(SlowOpcodeGenerator,
+                             self)._find_move_candidates(*args, **kwargs)
+
+        differ = MyersDiffer(
+            ['this is old line %d, and it is sufficiently long' % i
+             for i in range(5)],
+            ['this is new line %d, and it is sufficiently long' % i
+             for i in range(5)])
+        generator = SlowOpcodeGenerator(differ)
+        list(generator)
+
+        self.assertEqual(generator.num_lookups, 1)
+
     def test_line_counts(self):
         """Testing DiffParser with insert/delete line counts"""
         diff = (
@@ -479,6 +586,224 @@ class DiffParserTest(TestCase):
         self.assertEqual(r_moves, expected_r_moves)
 
 
+class PatcherTests(TestCase):
+    """Unit tests for the in-process patcher."""
+    diff = (
+        b'--- README\n'
+        b'+++ README\n'
+        b'@@ -2,3 +2,3 @@\n'
+        b' line 2\n'
+        b'-line 3\n'
+        b'+line three\n'
+        b' line 4\n'
+    )
+
+    def test_apply_patch(self):
+        """Testing apply_patch"""
+        self.assertEqual(
+            apply_patch(self.diff, b'line 1\nline 2\nline 3\nline 4\n'),
+            b'line 1\nline 2\nline three\nline 4\n')
+
+    def test_apply_patch_with_offset(self):
+        """Testing apply_patch with hunks at an offset"""
+        self.assertEqual(
+            apply_patch(self.diff,
+                        b'new\nline 1\nline 2\nline 3\nline 4\n'),
+            b'new\nline 1\nline 2\nline three\nline 4\n')
+
+    def test_apply_patch_with_fuzz(self):
+        """Testing apply_patch with fuzz"""
+        diff = (
+            b'--- README\n'
+            b'+++ README\n'
+            b'@@ -1,5 +1,5 @@\n'
+            b' line 1\n'
+            b' line 2\n'
+            b'-line 3\n'
+            b'+line three\n'
+            b' line 4\n'
+            b' line 5\n'
+        )
+
+        self.assertEqual(
+            apply_patch(diff, b'line 1\nline 2\nline 3\nline 4\nline 6\n'),
+            b'line 1\nline 2\nline three\nline 4\nline 6\n')
+
+    def test_apply_patch_with_fuzz_keeps_context(self):
+        """Testing apply_patch with fuzz doesn't ignore all the context"""
+        diff = (
+            b'--- README\n'
+            b'+++ README\n'
+            b'@@ -1,3 +1,2 @@\n'
+            b' a\n'
+            b'-a\n'
+            b' z\n'
+        )
+
+        # Without any context, "-a" would match the first line.
+        self.assertRaises(PatchError,
+                          lambda: apply_patch(diff, b'a\nw\nz\n'))
+        self.assertRaises(
+            PatchError,
+            lambda: apply_patch(self.diff,
+                                b'line 1\nline 2\nline 3\nline 5\n'))
+
+    def test_apply_patch_with_fuzz_at_file_bounds(self):
+        """Testing apply_patch with fuzz near the start and end of a file"""
+        diff = (
+            b'--- README\n'
+            b'+++ README\n'
+            b'@@ -4,7 +4,7 @@\n'
+            b' c1\n'
+            b' c2\n'
+            b' c3\n'
+            b'-old\n'
+            b'+new\n'
+            b' c4\n'
+            b' c5\n'
+            b' c6\n'
+        )
+
+        # The ignored context lines fit within the file.
+        self.assertEqual(
+            apply_patch(diff, b'c1\nc2\nc3\nold\nc4\nc5\nc7\n'),
+            b'c1\nc2\nc3\nnew\nc4\nc5\nc7\n')
+
+        # The ignored leading context would be before the start of the file.
+        self.assertRaises(
+            PatchError,
+            lambda: apply_patch(diff, b'c2\nc3\nold\nc4\nc5\nc6\nend\n'))
+
+        # The ignored trailing context would be past the end of the file.
+        self.assertRaises(
+            PatchError,
+            lambda: apply_patch(diff, b'x\nc2\nc3\nold\nc4\nc5\n'))
+
+    def test_apply_patch_strict(self):
+        """Testing apply_patch in strict mode"""
+        self.assertRaises(
+            PatchError,
+            lambda: apply_patch(self.diff,
+                                b'new\nline 1\nline 2\nline 3\nline 4\n',
+                                strict=True))
+        self.assertRaises(
+            PatchError,
+            lambda: apply_patch(self.diff,
+                                b'line 1\nline 2\nline 3\nline 5\n',
+                                strict=True))
+
+    def test_apply_patch_with_no_newline(self):
+        """Testing apply_patch with "No newline at end of file" markers"""
+        diff = (
+            b'--- README\n'
+            b'+++ README\n'
+            b'@@ -1,2 +1,2 @@\n'
+            b' line 1\n'
+            b'-line 2\n'
+            b'\\ No newline at end of file\n'
+            b'+line two\n'
+        )
+
+        self.assertEqual(apply_patch(diff, b'line 1\nline 2'),
+                         b'line 1\nline two\n')
+
+    def test_apply_patch_with_mismatch(self):
+        """Testing apply_patch with hunks that don't apply"""
+        self.assertRaises(
+            PatchError,
+            lambda: apply_patch(self.diff, b'foo\nbar\nbaz\n'))
+
+
+class PatchedFileCacheTests(SpyAgency, TestCase):
+    """Unit tests for caching patched files."""
+    fixtures = ['test_scmtools']
+
+    def test_get_patched_file_cached(self):
+        """Testing get_patched_file caches by file and diff hashes"""
+        diff = (
+            b'--- README\n'
+            b'+++ README\n'
+            b'@@ -1 +1 @@\n'
+            b'-Hello\n'
+            b'+Hello there\n'
+        )
+
+        repository = self.create_repository(tool_name='Test')
+        diffset = self.create_diffset(repository=repository)
+        filediff1 = self.create_filediff(diffset, diff=diff)
+        filediff2 = self.create_filediff(diffset, source_file='/other-file',
+                                         diff=diff)
+
+        self.assertEqual(diffutils.get_patched_file(b'Hello\n', filediff1),
+                         b'Hello there\n')
+
+        self.spy_on(diffutils.patch)
+
+        self.assertEqual(diffutils.get_patched_file(b'Hello\n', filediff2),
+                         b'Hello there\n')
+        self.assertFalse(diffutils.patch.spy.called)
+
+
+class FileChunksInRangesTests(TestCase):
+    """Unit tests for diffutils.get_file_chunks_in_ranges."""
+    def test_get_file_chunks_in_ranges(self):
+        """Testing get_file_chunks_in_ranges"""
+        chunks = [
+            {
+                'change': 'equal',
+                'lines': [[1], [2], [3], [4]],
+                'meta': {
+                    'left_headers': [(1, 'class Foo')],
+                    'right_headers': [],
+                },
+            },
+            {
+                'change': 'insert',
+                'lines': [[5], [6], [7], [8]],
+                'meta': {
+                    'left_headers': [],
+                    'right_headers': [],
+                },
+            },
+        ]
+
+        filediff = FileDiff(pk=2, diffset=DiffSet(pk=1))
+        context = {
+            '_diff_files_1_2': [{'chunks': chunks}],
+        }
+
+        result = diffutils.get_file_chunks_in_ranges(
+            context, filediff, None, [(2, 2), (3, 4), (2, 2), (20, 1)])
+        self.assertEqual(len(result), 4)
+
+        self.assertEqual(result[0], [{
+            'change': 'equal',
+            'lines': [[2], [3]],
+            'numlines': 2,
+            'meta': {
+                'headers': ({'line': 1, 'text': 'class Foo'}, None),
+            },
+        }])
+
+        self.assertEqual(len(result[1]), 2)
+        self.assertEqual(result[1][0]['lines'], [[3], [4]])
+        self.assertEqual(result[1][1]['lines'], [[5], [6]])
+        self.assertEqual(result[1][1]['change'], 'insert')
+
+        # The same range should get the same result, and the original
+        # chunks shouldn't have been modified.
+        self.assertEqual(result[2], result[0])
+        self.assertEqual(result[3], [])
+        self.assertTrue('left_headers' in chunks[0]['meta'])
+        self.assertFalse('headers' in chunks[0]['meta'])
+
+        # A single range should match what get_file_chunks_in_range returns.
+        self.assertEqual(
+            list(diffutils.get_file_chunks_in_range(context, filediff, None,
+                                                    3, 4)),
+            result[1])
+
+
 class FileDiffMigrationTests(TestCase):
     fixtures = ['test_scmtools']
 
@@ -525,7 +850,7 @@ class FileDiffMigrationTests(TestCase):
 
         self.assertEqual(diff, self.diff)
         self.assertEqual(self.filediff.diff64, '')
-        self.assertEqual(self.filediff.diff_hash.binary, self.diff)
+        self.assertEqual(self.filediff.diff_hash.content, self.diff)
         self.assertEqual(self.filediff.diff, diff)
         self.assertEqual(self.filediff.parent_diff, None)
         self.assertEqual(self.filediff.parent_diff_hash, None)
@@ -544,7 +869,7 @@ class FileDiffMigrationTests(TestCase):
 
         self.assertEqual(parent_diff, self.parent_diff)
         self.assertEqual(self.filediff.parent_diff64, '')
-        self.assertEqual(self.filediff.parent_diff_hash.binary,
+        self.assertEqual(self.filediff.parent_diff_hash.content,
                          self.parent_diff)
         self.assertEqual(self.filediff.parent_diff, self.parent_diff)
 
@@ -589,6 +914,65 @@ class FileDiffMigrationTests(TestCase):
         self.assertEqual(self.filediff.diff_hash.insert_count, 10)
         self.assertEqual(self.filediff.diff_hash.delete_count, 20)
 
+    def test_migrate_all(self):
+        """Testing FileDiffManager.migrate_all"""
+        self.filediff.diff64 = self.diff
+        self.filediff.parent_diff64 = self.parent_diff
+        self.filediff.save()
+
+        filediffs = [self.filediff]
+
+        for i in range(4):
+            filediffs.append(FileDiff.objects.create(
+                source_file='README',
+                dest_file='README',
+                diffset=self.filediff.diffset,
+                diff64=self.diff,
+                parent_diff64=''))
+
+        progress = []
+        info = FileDiff.objects.migrate_all(batch_size=2,
+                                            callback=progress.append)
+
+        self.assertEqual(info['diffs_migrated'], 5)
+        self.assertEqual(info['old_diff_size'],
+                         5 * len(self.diff) + len(self.parent_diff))
+        self.assertEqual(info['new_diff_size'],
+                         len(self.diff) + len(self.parent_diff))
+        self.assertEqual(info['bytes_saved'], 4 * len(self.diff))
+        self.assertEqual(info['last_id'], filediffs[-1].pk)
+        self.assertEqual(len(progress), 3)
+        self.assertEqual(progress[0]['last_id'], filediffs[0].pk + 1)
+        self.assertEqual(FileDiffData.objects.count(), 2)
+        self.assertFalse(FileDiff.objects.unmigrated().exists())
+
+        for filediff in filediffs:
+            filediff = FileDiff.objects.get(pk=filediff.pk)
+            self.assertEqual(filediff.diff64, '')
+            self.assertEqual(filediff.diff, self.diff)
+
+        filediff = FileDiff.objects.get(pk=self.filediff.pk)
+        self.assertEqual(filediff.parent_diff64, '')
+        self.assertEqual(filediff.parent_diff, self.parent_diff)
+
+    def test_migrate_all_with_start_id(self):
+        """Testing FileDiffManager.migrate_all with start_id"""
+        self.filediff.diff64 = self.diff
+        self.filediff.save()
+
+        filediff = FileDiff.objects.create(source_file='README',
+                                           dest_file='README',
+                                           diffset=self.filediff.diffset,
+                                           diff64=self.parent_diff,
+                                           parent_diff64='')
+
+        info = FileDiff.objects.migrate_all(start_id=filediff.pk)
+
+        self.assertEqual(info['diffs_migrated'], 1)
+        self.assertEqual(info['bytes_saved'], 0)
+        self.assertEqual(list(FileDiff.objects.unmigrated()),
+                         [self.filediff])
+
 
 class HighlightRegionTest(TestCase):
     def setUp(self):
@@ -697,6 +1081,89 @@ class DbTests(TestCase):
         self.assertEquals(filediff1.diff_hash, filediff2.diff_hash)
 
 
+class FileDiffDataManagerTests(TestCase):
+    """Unit tests for FileDiffDataManager."""
+    def test_store_diffs(self):
+        """Testing FileDiffDataManager.store_diffs"""
+        diff1 = b'diff1\n'
+        diff2 = b'diff2\n'
+        hash1 = hashlib.sha1(diff1).hexdigest()
+        hash2 = hashlib.sha1(diff2).hexdigest()
+
+        FileDiffData.objects.get_or_create(binary_hash=hash1,
+                                           defaults={'binary': diff1})
+
+        hashes = FileDiffData.objects.store_diffs([
+            (diff1, 1, 1),
+            (diff2, 2, 3),
+            (diff2, 2, 3),
+        ])
+
+        self.assertEqual(hashes, [hash1, hash2, hash2])
+        self.assertEqual(FileDiffData.objects.count(), 2)
+
+        data = FileDiffData.objects.get(pk=hash2)
+        self.assertEqual(data.content, diff2)
+        self.assertEqual(data.insert_count, 2)
+        self.assertEqual(data.delete_count, 3)
+
+    def test_store_diffs_compresses(self):
+        """Testing FileDiffDataManager.store_diffs compresses content"""
+        diff = b'+ this is a line\n' * 100
+
+        hashes = FileDiffData.objects.store_diffs([(diff, 100, 0)])
+
+        data = FileDiffData.objects.get(pk=hashes[0])
+        self.assertEqual(data.compression, FileDiffData.COMPRESSION_ZLIB)
+        self.assertTrue(len(data.binary) < len(diff))
+        self.assertEqual(data.content, diff)
+        self.assertEqual(data.insert_count, 100)
+
+    def test_get_or_create_compresses(self):
+        """Testing FileDiffDataManager.get_or_create compresses content"""
+        diff = b'+ this is a line\n' * 100
+
+        data, is_new = FileDiffData.objects.get_or_create(
+            binary_hash=hashlib.sha1(diff).hexdigest(),
+            defaults={'binary': diff})
+
+        self.assertTrue(is_new)
+
+        data = FileDiffData.objects.get(pk=data.pk)
+        self.assertEqual(data.compression, FileDiffData.COMPRESSION_ZLIB)
+        self.assertEqual(data.content, diff)
+
+    def test_compress_all(self):
+        """Testing FileDiffDataManager.compress_all"""
+        diff1 = b'+ this is a line\n' * 100
+        diff2 = b'x\n'
+
+        for diff in (diff1, diff2):
+            # Store the content uncompressed, as older versions did.
+            FileDiffData.objects.create(
+                binary_hash=hashlib.sha1(diff).hexdigest(),
+                binary=Base64DecodedValue(diff))
+
+        progress = []
+        info = FileDiffData.objects.compress_all(batch_size=1,
+                                                 callback=progress.append)
+
+        self.assertEqual(info['entries_processed'], 2)
+        self.assertEqual(info['entries_compressed'], 1)
+        self.assertEqual(info['old_size'], len(diff1) + len(diff2))
+        self.assertTrue(info['new_size'] < info['old_size'])
+        self.assertEqual(len(progress), 2)
+
+        data = FileDiffData.objects.get(pk=hashlib.sha1(diff1).hexdigest())
+        self.assertEqual(data.compression, FileDiffData.COMPRESSION_ZLIB)
+        self.assertEqual(data.content, diff1)
+
+        # Compressing wouldn't make this any smaller, so it's left alone.
+        data = FileDiffData.objects.get(pk=hashlib.sha1(diff2).hexdigest())
+        self.assertEqual(data.compression, None)
+        self.assertEqual(data.content, diff2)
+
+
 class DiffSetManagerTests(SpyAgency, TestCase):
     """Unit tests for DiffSetManager."""
     fixtures = ['test_scmtools']
@@ -715,14 +1182,186 @@ class DiffSetManagerTests(SpyAgency, TestCase):
 
         repository = self.create_repository(tool_name='Test')
 
-        self.spy_on(repository.get_file_exists,
-                    call_fake=lambda *args, **kwargs: True)
+        self.spy_on(repository.get_files_exist,
+                    call_fake=lambda repository, files, *args, **kwargs:
+                        [True] * len(files))
 
         diffset = DiffSet.objects.create_from_data(
             repository, 'diff', diff, None, None, None, '/', None)
 
         self.assertEqual(diffset.files.count(), 1)
 
+    def test_creating_with_parent_diff_data(self):
+        """Test creating a DiffSet from diff file data with a parent diff"""
+        readme_diff = (
+            b'diff --git a/README b/README\n'
+            b'index d6613f5..5b50866 100644\n'
+            b'--- README\n'
+            b'+++ README\n'
+            b'@ -1,1 +1,1 @@\n'
+            b'-blah blah\n'
+            b'+blah!\n'
+        )
+        foo_diff = (
+            b'diff --git a/foo.c b/foo.c\n'
+            b'index 0bc5c26..9bc3fb0 100644\n'
+            b'--- foo.c\n'
+            b'+++ foo.c\n'
+            b'@ -1,1 +1,2 @@\n'
+            b' blah\n'
+            b'+blah!\n'
+        )
+        parent_diff = (
+            b'diff --git a/README b/README\n'
+            b'index 94bdd3e..d6613f5 100644\n'
+            b'--- README\n'
+            b'+++ README\n'
+            b'@ -1,1 +1,1 @@\n'
+            b'-blah..\n'
+            b'+blah blah\n'
+        )
+
+        repository = self.create_repository(tool_name='Test')
+
+        self.spy_on(repository.get_files_exist,
+                    call_fake=lambda repository, files, *args, **kwargs:
+                        [True] * len(files))
+
+        diffset = DiffSet.objects.create_from_data(
+            repository, 'diff', readme_diff + foo_diff, 'parent_diff',
+            parent_diff, None, '/', None)
+
+        filediffs = list(diffset.files.order_by('pk'))
+        self.assertEqual(len(filediffs), 2)
+
+        self.assertEqual(filediffs[0].source_file, '/README')
+        self.assertEqual(filediffs[0].source_revision, '94bdd3e')
+        self.assertEqual(filediffs[0].diff, readme_diff)
+        self.assertEqual(filediffs[0].parent_diff, parent_diff)
+        self.assertEqual(filediffs[0].diff_hash.insert_count, 1)
+        self.assertEqual(filediffs[0].diff_hash.delete_count, 1)
+
+        self.assertEqual(filediffs[1].source_file, '/foo.c')
+        self.assertEqual(filediffs[1].source_revision, '0bc5c26')
+        self.assertEqual(filediffs[1].diff, foo_diff)
+        self.assertEqual(filediffs[1].parent_diff, None)
+        self.assertEqual(filediffs[1].diff_hash.insert_count, 1)
+        self.assertEqual(filediffs[1].diff_hash.delete_count, 0)
+
+    def test_creating_with_parser_overriding_parse(self):
+        """Testing DiffSetManager.create_from_data with a DiffParser that
+        overrides parse()
+        """
+        class LegacyDiffParser(diffparser.DiffParser):
+            def parse(self):
+                files = super(LegacyDiffParser, self).parse()
+
+                for f in files:
+                    f.newInfo = 'Parsed by LegacyDiffParser'
+
+                return files
+
+        diff = (
+            b'diff --git a/README b/README\n'
+            b'index d6613f5..5b50866 100644\n'
+            b'--- README\n'
+            b'+++ README\n'
+            b'@ -1,1 +1,1 @@\n'
+            b'-blah..\n'
+            b'+blah blah\n'
+        )
+
+        repository = self.create_repository(tool_name='Test')
+        tool_cls = type(repository.get_scmtool())
+        old_get_parser = tool_cls.get_parser
+        tool_cls.get_parser = lambda self, data: LegacyDiffParser(data)
+
+        self.spy_on(repository.get_files_exist,
+                    call_fake=lambda repository, files, *args, **kwargs:
+                        [True] * len(files))
+
+        try:
+            diffset = DiffSet.objects.create_from_data(
+                repository, 'diff', diff, None, None, None, '/', None)
+        finally:
+            tool_cls.get_parser = old_get_parser
+
+        self.assertEqual(diffset.files.get().dest_detail,
+                         'Parsed by LegacyDiffParser')
+
+    def test_creating_prewarms_chunks(self):
+        """Testing DiffSetManager.create_from_data queues pre-generating
+        chunks for the diff and interdiff
+        """
+        diff = (
+            b'diff --git a/README b/README\n'
+            b'index d6613f5..5b50866 100644\n'
+            b'--- README\n'
+            b'+++ README\n'
+            b'@ -1,1 +1,1 @@\n'
+            b'-blah..\n'
+            b'+blah blah\n'
+        )
+
+        repository = self.create_repository(tool_name='Test')
+        history = DiffSetHistory.objects.create(name='test')
+
+        self.spy_on(repository.get_files_exist,
+                    call_fake=lambda repository, files, *args, **kwargs:
+                        [True] * len(files))
+        self.spy_on(prewarm_diff_chunks,
+                    call_fake=lambda *args, **kwargs: None)
+
+        diffset1 = DiffSet.objects.create_from_data(
+            repository, 'diff', diff, None, None, history, '/', None)
+        diffset2 = DiffSet.objects.create_from_data(
+            repository, 'diff', diff, None, None, history, '/', None)
+
+        calls = prewarm_diff_chunks.spy.calls
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(calls[0].args, (diffset1,))
+        self.assertEqual(calls[1].args, (diffset2,))
+        self.assertEqual(calls[2].args, (diffset1,))
+        self.assertEqual(calls[2].kwargs, {'interdiffset': diffset2})
+
+
+class ChunkPrewarmPoolTests(SpyAgency, TestCase):
+    """Unit tests for ChunkPrewarmPool."""
+    def test_runs_jobs(self):
+        """Testing ChunkPrewarmPool runs queued jobs in worker threads"""
+        results = []
+        done = threading.Event()
+
+        def _fail():
+            raise Exception('Oh no')
+
+        def _add_result(value):
+            results.append(value)
+            done.set()
+
+        pool = ChunkPrewarmPool(num_workers=1)
+        pool.add(1, _fail)
+        pool.add(1, _add_result, 'a')
+        done.wait(10)
+
+        self.assertEqual(results, ['a'])
+
+    def test_max_jobs_per_repository(self):
+        """Testing ChunkPrewarmPool limits the running jobs per repository"""
+        pool = ChunkPrewarmPool(max_jobs_per_repository=1)
+        self.spy_on(pool._start_workers, call_fake=lambda self: None)
+
+        pool.add(1, len, 'a')
+        pool.add(1, len, 'b')
+        pool.add(2, len, 'c')
+
+        pool._active_jobs[1] = 1
+        self.assertEqual(pool._get_next_job(), (2, len, ('c',)))
+        self.assertEqual(pool._get_next_job(), None)
+
+        del pool._active_jobs[1]
+        self.assertEqual(pool._get_next_job(), (1, len, ('a',)))
+
 
 class UploadDiffFormTests(SpyAgency, TestCase):
     """Unit tests for UploadDiffForm."""
@@ -745,8 +1384,9 @@ class UploadDiffFormTests(SpyAgency, TestCase):
 
         repository = self.create_repository(tool_name='Test')
 
-        self.spy_on(repository.get_file_exists,
-                    call_fake=lambda *args, **kwargs: True)
+        self.spy_on(repository.get_files_exist,
+                    call_fake=lambda repository, files, *args, **kwargs:
+                        [True] * len(files))
 
         form = UploadDiffForm(
             repository=repository,
@@ -768,9 +1408,11 @@ class UploadDiffFormTests(SpyAgency, TestCase):
         """Testing UploadDiffForm and filtering parent diff files"""
         saw_file_exists = {}
 
-        def get_file_exists(repository, filename, revision, *args, **kwargs):
-            saw_file_exists[(filename, revision)] = True
-            return True
+        def get_files_exist(repository, files, *args, **kwargs):
+            for filename, revision, base_commit_id in files:
+                saw_file_exists[(filename, revision)] = True
+
+            return [True] * len(files)
 
         diff = (
             b'diff --git a/README b/README\n'
@@ -807,7 +1449,7 @@ class UploadDiffFormTests(SpyAgency, TestCase):
                                               content_type='text/x-patch')
 
         repository = self.create_repository(tool_name='Test')
-        self.spy_on(repository.get_file_exists, call_fake=get_file_exists)
+        self.spy_on(repository.get_files_exist, call_fake=get_files_exist)
 
         form = UploadDiffForm(
             repository=repository,
@@ -1024,7 +1666,7 @@ class ProcessorsTests(TestCase):
         ])
 
 
-class DiffChunkGeneratorTests(TestCase):
+class DiffChunkGeneratorTests(SpyAgency, TestCase):
     """Unit tests for DiffChunkGenerator."""
     def test_get_line_changed_regions(self):
         """Testing DiffChunkGenerator._get_line_changed_regions"""
@@ -1059,6 +1701,200 @@ class DiffChunkGeneratorTests(TestCase):
         regions = generator._get_line_changed_regions(old, new)
         deep_equal(regions, (None, None))
 
+    def test_make_cache_key_language_independent(self):
+        """Testing DiffChunkGenerator.make_cache_key doesn't depend on the
+        active language
+        """
+        filediff = FileDiff(pk=1, source_file='foo', diffset=DiffSet())
+        generator = DiffChunkGenerator(None, filediff)
+
+        with translation.override('en'):
+            key = generator.make_cache_key()
+
+        with translation.override('fr'):
+            self.assertEqual(generator.make_cache_key(), key)
+
+    def test_get_chunks_with_windows(self):
+        """Testing DiffChunkGenerator.get_chunks with large files stored in
+        windows
+        """
+        chunks = [
+            {
+                'index': i,
+                'change': 'insert',
+                'numlines': 2,
+                'collapsable': False,
+                'lines': [[i * 2 + 1], [i * 2 + 2]],
+                'meta': {},
+            }
+            for i in range(5)
+        ]
+
+        filediff = FileDiff(pk=1, source_file='foo', source_revision='123',
+                            diffset=DiffSet())
+        generator = DiffChunkGenerator(None, filediff)
+        generator.CHUNK_WINDOW_NUM_LINES = 4
+        self.spy_on(generator._get_chunks_uncached,
+                    call_fake=lambda self: iter(chunks))
+
+        cache.clear()
+        result = generator.get_chunks()
+
+        self.assertTrue(isinstance(result, DiffChunkWindows))
+        self.assertEqual(len(result), 5)
+        self.assertEqual(result.window_offsets, [0, 2, 4])
+        self.assertEqual(len(result.summaries), 5)
+        self.assertFalse('lines' in result.summaries[0])
+        self.assertEqual(list(result), chunks)
+        self.assertEqual(result[3], chunks[3])
+        self.assertEqual(result[-1], chunks[4])
+        self.assertRaises(IndexError, lambda: result[5])
+
+        # The chunks should now come from the cache.
+        generator = DiffChunkGenerator(None, filediff)
+        self.spy_on(generator._get_chunks_uncached)
+
+        self.assertEqual(list(generator.get_chunks()), chunks)
+        self.assertFalse(generator._get_chunks_uncached.called)
+
+    def test_get_chunks_releases_lock(self):
+        """Testing DiffChunkGenerator.get_chunks releases the generation
+        lock
+        """
+        chunks = [{'index': 0, 'change': 'equal', 'numlines': 1,
+                   'collapsable': False, 'lines': [[1]], 'meta': {}}]
+
+        filediff = FileDiff(pk=1, source_file='foo', source_revision='123',
+                            diffset=DiffSet())
+        generator = DiffChunkGenerator(None, filediff)
+        self.spy_on(generator._get_chunks_uncached,
+                    call_fake=lambda self: iter(chunks))
+
+        cache.clear()
+        self.assertEqual(generator.get_chunks(), chunks)
+
+        lock_key = make_cache_key('%s-lock' % generator.make_cache_key())
+        self.assertFalse(lock_key in cache)
+
+    def test_get_chunks_waits_for_lock(self):
+        """Testing DiffChunkGenerator.get_chunks waits for another process
+        generating the same chunks
+        """
+        chunks = [{'index': 0, 'change': 'equal', 'numlines': 1,
+                   'collapsable': False, 'lines': [[1]], 'meta': {}}]
+
+        filediff = FileDiff(pk=1, source_file='foo', source_revision='123',
+                            diffset=DiffSet())
+        generator = DiffChunkGenerator(None, filediff)
+        generator.GENERATION_LOCK_TIMEOUT = 1
+        generator.GENERATION_LOCK_POLL_INTERVAL = 0.01
+        key = generator.make_cache_key()
+        lock_key = make_cache_key('%s-lock' % key)
+
+        cache.clear()
+        cache.add(lock_key, True)
+
+        def _wait_for_generation(self, *args):
+            # Simulate the other process storing the chunks while we wait.
+            cache_memoize(key, lambda: chunks, large_data=True)
+
+        self.spy_on(generator._wait_for_generation,
+                    call_fake=_wait_for_generation)
+        self.spy_on(generator._get_chunks_uncached)
+
+        self.assertEqual(generator.get_chunks(), chunks)
+        self.assertTrue(generator._wait_for_generation.called)
+        self.assertFalse(generator._get_chunks_uncached.called)
+
+        # The lock belongs to the other process, so it must be left alone.
+        self.assertTrue(lock_key in cache)
+
+    def test_get_lexer_class_for_filename(self):
+        """Testing get_lexer_class_for_filename"""
+        self.assertEqual(get_lexer_class_for_filename('foo/bar.py'),
+                         PythonLexer)
+        self.assertEqual(get_lexer_class_for_filename('Makefile'),
+                         MakefileLexer)
+        self.assertEqual(get_lexer_class_for_filename('CMakeLists.txt'),
+                         CMakeLexer)
+        self.assertEqual(get_lexer_class_for_filename('README.txt'),
+                         TextLexer)
+        self.assertEqual(get_lexer_class_for_filename('README'), None)
+
+    def test_apply_pygments_incremental(self):
+        """Testing DiffChunkGenerator._apply_pygments_incremental matches
+        highlighting the whole file
+        """
+        a = ['import os', '']
+
+        for i in range(30):
+            a += [
+                'def func%d(path):' % i,
+                '    """Returns whether path %d exists."""' % i,
+                '    return os.path.exists(path)',
+                '',
+            ]
+
+        b = list(a)
+        b[10] = '    return os.path.exists(path) and False'
+        b.insert(40, 'x = """')
+        b.insert(60, '"""')
+        del b[90]
+
+        filediff = FileDiff(source_file='foo.py', diffset=DiffSet())
+        generator = DiffChunkGenerator(None, filediff)
+        lexer = generator._create_lexer(PythonLexer)
+        markup_a = generator._apply_pygments('\n'.join(a) + '\n', lexer)
+        opcodes = get_diff_opcode_generator(MyersDiffer(a, b))
+
+        self.assertEqual(
+            generator._apply_pygments_incremental(a, b, markup_a,
+                                                  list(opcodes), lexer),
+            generator._apply_pygments('\n'.join(b) + '\n', lexer))
+
+    def test_apply_pygments_incremental_near_top(self):
+        """Testing DiffChunkGenerator._apply_pygments_incremental with a
+        change near the top of a large file
+        """
+        a = ['import os', '']
+
+        for i in range(2000):
+            a += [
+                'def func%d(path):' % i,
+                '    return os.path.exists(path)',
+                '',
+            ]
+
+        b = list(a)
+        b[2] = 'def changed(path):'
+
+        filediff = FileDiff(source_file='foo.py', diffset=DiffSet())
+        generator = DiffChunkGenerator(None, filediff)
+        lexer = generator._create_lexer(PythonLexer)
+        markup_a = generator._apply_pygments('\n'.join(a) + '\n', lexer)
+        opcodes = get_diff_opcode_generator(MyersDiffer(a, b))
+
+        # Keep track of how much of the file is lexed.
+        lexed = []
+        get_tokens = lexer.get_tokens
+
+        def _get_tokens(text, *args, **kwargs):
+            lexed.append(text)
+            return get_tokens(text, *args, **kwargs)
+
+        lexer.get_tokens = _get_tokens
+        markup_b = generator._apply_pygments_incremental(
+            a, b, markup_a, list(opcodes), lexer)
+        del lexer.get_tokens
+
+        self.assertEqual(
+            markup_b,
+            generator._apply_pygments('\n'.join(b) + '\n', lexer))
+
+        # Only a small window around the change should have been lexed.
+        self.assertEqual(len(lexed), 1)
+        self.assertTrue(lexed[0].count('\n') < 50)
+
 
 class DiffRendererTests(SpyAgency, TestCase):
     """Unit tests for DiffRenderer."""
@@ -112,9 +112,15 @@ class Beanstalk(HostingService):
         """Determines if a file exists.
 
         This will perform an API request to fetch the metadata for a file.
+        The metadata can only be looked up with a base commit ID. Without
+        one, the file's contents will be fetched and cached instead.
 
         If using Git, this will expect a base commit ID to be provided.
         """
+        if not base_commit_id:
+            return self._get_file_exists_from_contents(repository, path,
+                                                       revision)
+
         try:
             self._api_get_node(repository, path, revision, base_commit_id)
 
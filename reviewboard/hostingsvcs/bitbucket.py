@@ -155,15 +155,28 @@ class Bitbucket(HostingService):
                         *args, **kwargs):
         """Determines if a file exists.
 
-        This will perform an API request to fetch the metadata for a file.
+        This will perform a HEAD request for the file, so that the
+        contents don't need to be downloaded. If the HEAD request isn't
+        supported, the file's contents will be fetched and cached instead.
 
         If using Git, this will expect a base commit ID to be provided.
         """
         try:
-            self._api_get_src(repository, path, revision, base_commit_id)
+            url = self._build_src_url(repository, path, revision,
+                                      base_commit_id)
+            self._http_head(
+                url,
+                username=self.account.username,
+                password=decrypt_password(self.account.data['password']))
 
             return True
-        except (URLError, HTTPError, FileNotFoundError):
+        except HTTPError as e:
+            if e.code in (405, 501):
+                return self._get_file_exists_from_contents(
+                    repository, path, revision, base_commit_id)
+
+            return False
+        except (URLError, FileNotFoundError):
             return False
 
     def _api_get_repository(self, username, repo_name):
@@ -173,6 +186,11 @@ class Bitbucket(HostingService):
         return self._api_get(url)
 
     def _api_get_src(self, repository, path, revision, base_commit_id):
+        return self._api_get(
+            self._build_src_url(repository, path, revision, base_commit_id),
+            raw_content=True)
+
+    def _build_src_url(self, repository, path, revision, base_commit_id):
         # If a base commit ID is provided, use it. It may not be provided,
         # though, and in this case, we need to use the provided revision,
         # which will work for Mercurial but not for Git.
@@ -190,15 +208,13 @@ class Bitbucket(HostingService):
                        'this file was not provided. Use RBTools 0.5.2 or '
                        'newer.')
 
-        url = self._build_api_url(
+        return self._build_api_url(
             'repositories/%s/%s/raw/%s/%s'
             % (quote(self._get_repository_owner(repository)),
                quote(self._get_repository_name(repository)),
                quote(revision),
                quote(path)))
 
-        return self._api_get(url, raw_content=True)
-
     def _build_api_url(self, url):
         return 'https://bitbucket.org/api/1.0/%s' % url
 
@@ -314,14 +314,64 @@ class GitHub(HostingService):
                                   'git/blobs/%s' % revision)
 
         try:
-            self._http_get(url, headers={
-                'Accept': self.RAW_MIMETYPE,
-            })
+            # Only the status matters, so don't download the blob.
+            self._http_head(url)
 
             return True
         except (URLError, HTTPError):
             return False
 
+    def get_files_exist(self, repository, files):
+        """Returns whether several files exist in the repository.
+
+        Files with the same base commit ID are checked against a single
+        recursive listing of that commit's tree. Any files that can't be
+        matched in a listing, including those without a base commit ID,
+        are left for get_file_exists to check.
+        """
+        results = {}
+        files_by_commit = {}
+
+        for f in files:
+            if f[2]:
+                files_by_commit.setdefault(f[2], []).append(f)
+
+        for base_commit_id, commit_files in six.iteritems(files_by_commit):
+            if len(commit_files) == 1:
+                # A single HEAD request is cheaper than listing the tree.
+                continue
+
+            url = '%s&recursive=1' % self._build_api_url(
+                self._get_repo_api_url(repository),
+                'git/trees/%s' % base_commit_id)
+
+            try:
+                rsp = self._api_get(url)
+            except Exception as e:
+                logging.warning('Unable to fetch the tree for commit %s on '
+                                'GitHub: %s',
+                                base_commit_id, e)
+                continue
+
+            if rsp.get('truncated'):
+                # The tree is too large to list in one go.
+                continue
+
+            blob_shas = dict(
+                (entry['path'], entry['sha'])
+                for entry in rsp['tree']
+                if entry['type'] == 'blob'
+            )
+
+            for f in commit_files:
+                path, revision = f[:2]
+                sha = blob_shas.get(path.lstrip('/'))
+
+                if sha and revision and sha.startswith(revision):
+                    results[f] = True
+
+        return results
+
     def get_branches(self, repository):
         results = []
 
@@ -488,6 +538,11 @@ class GitHub(HostingService):
         self._check_rate_limits(headers)
         return data, headers
 
+    def _http_head(self, url, *args, **kwargs):
+        data, headers = super(GitHub, self)._http_head(url, *args, **kwargs)
+        self._check_rate_limits(headers)
+        return data, headers
+
     def _http_post(self, url, *args, **kwargs):
         data, headers = super(GitHub, self)._http_post(url, *args, **kwargs)
         self._check_rate_limits(headers)
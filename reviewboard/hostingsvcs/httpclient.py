@@ -0,0 +1,281 @@
+"""HTTP communication with hosting services.
+
+Hosting services make a lot of API requests to the same few servers. Rather
+than opening a new connection, and doing a new TLS handshake, for every
+request, connections are kept alive and shared between requests from all
+hosting services and threads in the process.
+
+GET responses that have an ETag or Last-Modified header are cached, and
+later requests for the same URL are sent as conditional requests. If the
+server reports that nothing has changed, the cached response is used. Some
+services, like GitHub, don't count these against the API rate limit.
+
+The number of requests in progress for any one hosting service account is
+also limited, so that a burst of work for one account can't tie up all the
+connections to a server.
+"""
+from __future__ import unicode_literals
+
+import hashlib
+import io
+import logging
+import socket
+import threading
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from djblets.cache.backend import make_cache_key
+from djblets.util.compat import six
+from djblets.util.compat.six.moves import http_client
+from djblets.util.compat.six.moves.urllib.error import HTTPError, URLError
+from djblets.util.compat.six.moves.urllib.parse import urljoin, urlparse
+from djblets.util.compat.six.moves.urllib.request import getproxies, urlopen
+
+from reviewboard import get_package_version
+
+
+# The maximum number of redirects to follow for a request.
+MAX_REDIRECTS = 5
+
+# The largest response body that will be cached for conditional requests.
+MAX_CACHED_RESPONSE_SIZE = 256 * 1024
+
+IDEMPOTENT_METHODS = ('GET', 'HEAD')
+REDIRECT_STATUSES = (301, 302, 303, 307)
+
+
+class HTTPConnectionPool(object):
+    """A thread-safe pool of keep-alive HTTP connections.
+
+    Idle connections are kept for each scheme and host, up to
+    MAX_IDLE_CONNECTIONS per host. A connection is only ever used by one
+    request at a time.
+    """
+    MAX_IDLE_CONNECTIONS = 4
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle_connections = {}
+
+    def get_connection(self, scheme, netloc, allow_reuse=True):
+        """Returns a connection to a host.
+
+        This returns a tuple of the connection and whether it's an idle
+        connection being reused. Idle connections may have been closed by
+        the server since they were last used.
+        """
+        if allow_reuse:
+            with self._lock:
+                idle = self._idle_connections.get((scheme, netloc))
+
+                if idle:
+                    return idle.pop(), True
+
+        return self._create_connection(scheme, netloc), False
+
+    def release_connection(self, scheme, netloc, conn):
+        """Returns a connection to the pool once a response has been read.
+
+        The connection is closed if there are already enough idle
+        connections to the host.
+        """
+        with self._lock:
+            idle = self._idle_connections.setdefault((scheme, netloc), [])
+
+            if len(idle) < self.MAX_IDLE_CONNECTIONS:
+                idle.append(conn)
+                return
+
+        conn.close()
+
+    def _create_connection(self, scheme, netloc):
+        if scheme == 'https':
+            return http_client.HTTPSConnection(netloc)
+        else:
+            return http_client.HTTPConnection(netloc)
+
+    def clear(self):
+        """Closes all idle connections."""
+        with self._lock:
+            idle_connections = self._idle_connections
+            self._idle_connections = {}
+
+        for conns in six.itervalues(idle_connections):
+            for conn in conns:
+                conn.close()
+
+
+_pool = HTTPConnectionPool()
+_account_semaphores = {}
+_account_semaphores_lock = threading.Lock()
+
+
+def get_connection_pool():
+    """Returns the connection pool shared by all hosting services."""
+    return _pool
+
+
+@contextmanager
+def limit_concurrent_requests(key, max_requests):
+    """Limits the number of requests in progress for a key.
+
+    This is used as a context manager around a request. If ``max_requests``
+    requests for the key are already in progress, this will block until one
+    of them finishes.
+    """
+    with _account_semaphores_lock:
+        semaphore = _account_semaphores.get(key)
+
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(max_requests)
+            _account_semaphores[key] = semaphore
+
+    with semaphore:
+        yield
+
+
+def send_request(request):
+    """Sends a urllib Request, returning the response data and headers.
+
+    This behaves like urlopen. Redirects are followed, an HTTPError is
+    raised for error responses, and a URLError is raised if the server
+    can't be reached. Requests that go through a proxy are handed off to
+    urlopen.
+
+    If the response is a 304 Not Modified for a cached response, the
+    cached data is returned along with the headers from the 304.
+    """
+    url = request.get_full_url()
+    method = request.get_method()
+    body = request.data
+    headers = dict(request.header_items())
+    parsed_url = urlparse(url)
+
+    if (parsed_url.scheme not in ('http', 'https') or
+        parsed_url.scheme in getproxies() or
+        '@' in parsed_url.netloc):
+        u = urlopen(request)
+
+        return u.read(), u.headers
+
+    if not any(name.lower() == 'user-agent' for name in headers):
+        headers['User-Agent'] = 'ReviewBoard/%s' % get_package_version()
+
+    cache_key = None
+    cached_response = None
+
+    if method == 'GET':
+        cache_key = _make_response_cache_key(url, headers)
+        cached_response = cache.get(cache_key)
+
+        if cached_response:
+            if cached_response['etag']:
+                headers['If-None-Match'] = cached_response['etag']
+
+            if cached_response['last_modified']:
+                headers['If-Modified-Since'] = \
+                    cached_response['last_modified']
+
+    for i in range(MAX_REDIRECTS + 1):
+        status, reason, response_headers, data = \
+            _send_pooled_request(method, url, body, headers)
+        location = response_headers.get('Location')
+
+        if (status not in REDIRECT_STATUSES or
+            not location or
+            (method not in IDEMPOTENT_METHODS and status == 307)):
+            break
+
+        # Follow the redirect the same way urllib does. POSTs are turned
+        # into GETs. Conditional headers are dropped, since they were for
+        # the original URL.
+        url = urljoin(url, location)
+        cache_key = None
+        cached_response = None
+
+        for name in list(six.iterkeys(headers)):
+            if (name.lower() in ('if-none-match', 'if-modified-since') or
+                (method == 'POST' and
+                 name.lower() in ('content-type', 'content-length'))):
+                del headers[name]
+
+        if method == 'POST':
+            method = 'GET'
+            body = None
+
+    if status == 304 and cached_response:
+        return cached_response['data'], response_headers
+
+    if not (200 <= status < 300):
+        raise HTTPError(url, status, reason, response_headers,
+                        io.BytesIO(data))
+
+    if cache_key and len(data) <= MAX_CACHED_RESPONSE_SIZE:
+        etag = response_headers.get('ETag')
+        last_modified = response_headers.get('Last-Modified')
+
+        if etag or last_modified:
+            cache.set(cache_key, {
+                'etag': etag,
+                'last_modified': last_modified,
+                'data': data,
+            })
+
+    return data, response_headers
+
+
+def _make_response_cache_key(url, headers):
+    """Returns the cache key for a response to a GET request.
+
+    The key covers the request headers, as well as the URL, so that
+    responses for one set of credentials are never used for another.
+    """
+    key = hashlib.sha1(url.encode('utf-8'))
+
+    for name, value in sorted(six.iteritems(headers)):
+        key.update(('\n%s: %s' % (name.lower(), value)).encode('utf-8'))
+
+    return make_cache_key('hostingsvc-http:%s' % key.hexdigest())
+
+
+def _send_pooled_request(method, url, body, headers):
+    """Sends a single request over a pooled connection.
+
+    This returns a tuple of the status, reason, response headers and
+    response data. Idempotent requests on an idle connection that the
+    server has since closed are retried on a new connection.
+    """
+    parsed_url = urlparse(url)
+    scheme = parsed_url.scheme
+    netloc = parsed_url.netloc
+    path = parsed_url.path or '/'
+
+    if parsed_url.query:
+        path += '?' + parsed_url.query
+
+    allow_reuse = method in IDEMPOTENT_METHODS
+
+    while True:
+        conn, reused = _pool.get_connection(scheme, netloc, allow_reuse)
+
+        try:
+            conn.request(method, path, body, headers)
+            response = conn.getresponse()
+            data = response.read()
+            break
+        except (socket.error, http_client.HTTPException) as e:
+            conn.close()
+
+            if not reused:
+                raise URLError(e)
+
+            logging.debug('Idle connection to %s was closed; retrying '
+                          'with a new connection: %s',
+                          netloc, e)
+
+    if response.will_close:
+        conn.close()
+    else:
+        _pool.release_connection(scheme, netloc, conn)
+
+    return response.status, response.reason, response.msg, data
@@ -7,13 +7,17 @@ import mimetools
 
 from django.utils.translation import ugettext_lazy as _
 from djblets.util.compat import six
+from djblets.util.compat.six.moves.urllib.error import HTTPError, URLError
 from djblets.util.compat.six.moves.urllib.parse import urlparse
 from djblets.util.compat.six.moves.urllib.request import (
     Request as URLRequest,
-    HTTPBasicAuthHandler,
-    urlopen)
+    HTTPBasicAuthHandler)
 from pkg_resources import iter_entry_points
 
+from reviewboard.hostingsvcs.httpclient import (limit_concurrent_requests,
+                                                send_request)
+from reviewboard.scmtools.errors import FileNotFoundError
+
 
 class HostingService(object):
     """An interface to a hosting service for repositories and bug trackers.
@@ -48,6 +52,10 @@ class HostingService(object):
     repository_fields = {}
     bug_tracker_field = None
 
+    # The maximum number of HTTP requests that can be in progress at once
+    # for a single hosting service account.
+    max_concurrent_requests = 4
+
     def __init__(self, account):
         assert account
         self.account = account
@@ -119,11 +127,35 @@ class HostingService(object):
         return repository.get_scmtool().get_file(path, revision)
 
     def get_file_exists(self, repository, path, revision, *args, **kwargs):
+        """Returns whether a file exists in the repository.
+
+        This is called for every file in every uploaded diff, so subclasses
+        should check without downloading the file where they can, using a
+        HEAD request or a metadata API. If the service has no way to do
+        that, _get_file_exists_from_contents can be used instead.
+        """
         if not self.supports_repositories:
             raise NotImplementedError
 
         return repository.get_scmtool().file_exists(path, revision)
 
+    def get_files_exist(self, repository, files):
+        """Returns whether several files exist in the repository.
+
+        ``files`` is a list of (path, revision, base_commit_id) tuples. This
+        returns a dictionary mapping each tuple that could be checked to
+        whether the file exists. Files that are left out will be checked
+        with get_file_exists instead.
+
+        By default, this just calls get_file_exists for each file. Services
+        that can check several files in one request should override this.
+        """
+        return dict(
+            (f, self.get_file_exists(repository, f[0], f[1],
+                                     base_commit_id=f[2]))
+            for f in files
+        )
+
     def get_branches(self, repository):
         """Get a list of all branches in the repositories.
 
@@ -242,6 +274,21 @@ class HostingService(object):
     # HTTP utility methods
     #
 
+    def _get_file_exists_from_contents(self, repository, path, revision,
+                                       base_commit_id=None):
+        """Determines if a file exists by fetching its contents.
+
+        This is for services that can't check for a file any other way. The
+        file is fetched through the repository, rather than get_file, so
+        that its contents are cached for when the diff is viewed.
+        """
+        try:
+            repository.get_file(path, revision, base_commit_id)
+
+            return True
+        except (HTTPError, URLError, FileNotFoundError):
+            return False
+
     def _json_get(self, *args, **kwargs):
         data, headers = self._http_get(*args, **kwargs)
         return json.loads(data), headers
@@ -253,6 +300,9 @@ class HostingService(object):
     def _http_get(self, url, *args, **kwargs):
         return self._http_request(url, **kwargs)
 
+    def _http_head(self, url, *args, **kwargs):
+        return self._http_request(url, method='HEAD', **kwargs)
+
     def _http_post(self, url, body=None, fields={}, files={},
                    content_type=None, headers={}, *args, **kwargs):
         headers = headers.copy()
@@ -271,9 +321,12 @@ class HostingService(object):
         return self._http_request(url, body, headers, **kwargs)
 
     def _build_request(self, url, body=None, headers={}, username=None,
-                       password=None):
+                       password=None, method=None):
         r = URLRequest(url, body, headers)
 
+        if method:
+            r.get_method = lambda: method
+
         if username is not None and password is not None:
             auth_key = username + ':' + password
             r.add_header(HTTPBasicAuthHandler.auth_header,
@@ -284,9 +337,13 @@ class HostingService(object):
 
     def _http_request(self, url, body=None, headers={}, **kwargs):
         r = self._build_request(url, body, headers, **kwargs)
-        u = urlopen(r)
+        account = self.account
+        limit_key = '%s:%s:%s' % (account.service_name, account.hosting_url,
+                                  account.username)
 
-        return u.read(), u.headers
+        with limit_concurrent_requests(limit_key,
+                                       self.max_concurrent_requests):
+            return send_request(r)
 
     def _build_form_data(self, fields, files):
         """Encodes data for use in an HTTP POST."""
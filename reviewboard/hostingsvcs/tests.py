@@ -9,8 +9,11 @@ from djblets.util.compat import six
 from djblets.util.compat.six.moves import cStringIO as StringIO
 from djblets.util.compat.six.moves.urllib.error import HTTPError
 from djblets.util.compat.six.moves.urllib.parse import urlparse
+from djblets.util.compat.six.moves.urllib.request import (
+    Request as URLRequest)
 from kgb import SpyAgency
 
+from reviewboard.hostingsvcs import httpclient
 from reviewboard.hostingsvcs.errors import RepositoryError
 from reviewboard.hostingsvcs.models import HostingServiceAccount
 from reviewboard.hostingsvcs.service import get_hosting_service
@@ -31,6 +34,8 @@ class ServiceTests(SpyAgency, TestCase):
         self.service_class = get_hosting_service(self.service_name)
 
     def setUp(self):
+        super(ServiceTests, self).setUp()
+
         self.assertNotEqual(self.service_class, None)
         self._old_http_post = self.service_class._http_post
         self._old_http_get = self.service_class._http_get
@@ -226,6 +231,30 @@ class BeanstalkTests(ServiceTests):
             expected_revision='123',
             expected_found=True)
 
+    def test_get_file_exists_caches_contents(self):
+        """Testing Beanstalk get_file_exists caches the file's contents
+        when fetched without a base commit ID
+        """
+        def _http_get(service, url, *args, **kwargs):
+            return b'My data', {}
+
+        account = self._get_hosting_account()
+        service = account.service
+        repository = Repository(hosting_account=account,
+                                tool=Tool.objects.get(name='Subversion'))
+        repository.extra_data = {
+            'beanstalk_account_domain': 'mydomain',
+            'beanstalk_repo_name': 'myrepo',
+        }
+
+        service.authorize('myuser', 'abc123', None)
+
+        self.spy_on(service._http_get, call_fake=_http_get)
+
+        self.assertTrue(service.get_file_exists(repository, '/path', '123'))
+        self.assertEqual(repository.get_file('/path', '123'), b'My data')
+        self.assertEqual(len(service._http_get.calls), 1)
+
     def _test_get_file(self, tool_name, revision, base_commit_id,
                        expected_revision):
         def _http_get(service, url, *args, **kwargs):
@@ -533,10 +562,46 @@ class BitbucketTests(ServiceTests):
         self.assertTrue(service._http_get.called)
         self.assertEqual(result, 'My data')
 
+    def test_get_file_exists_without_head_support(self):
+        """Testing Bitbucket get_file_exists falls back on fetching and
+        caching the file if HEAD isn't supported
+        """
+        def _http_head(service, url, *args, **kwargs):
+            raise HTTPError(url, 405, 'Method Not Allowed', {}, None)
+
+        def _http_get(service, url, *args, **kwargs):
+            self.assertEqual(
+                url,
+                'https://bitbucket.org/api/1.0/repositories/'
+                'myuser/myrepo/raw/456/path')
+            return b'My data', {}
+
+        account = self._get_hosting_account()
+        service = account.service
+        repository = Repository(hosting_account=account,
+                                tool=Tool.objects.get(name='Git'))
+        repository.extra_data = {
+            'bitbucket_repo_name': 'myrepo',
+        }
+
+        service.authorize('myuser', 'abc123', None)
+
+        self.spy_on(service._http_head, call_fake=_http_head)
+        self.spy_on(service._http_get, call_fake=_http_get)
+
+        self.assertTrue(service.get_file_exists(repository, 'path', '123',
+                                                '456'))
+        self.assertTrue(service._http_get.called)
+
+        # The file's contents should now come from the cache.
+        self.assertEqual(repository.get_file('path', '123', '456'),
+                         b'My data')
+        self.assertEqual(len(service._http_get.calls), 1)
+
     def _test_get_file_exists(self, tool_name, revision, base_commit_id,
                               expected_revision, expected_found,
                               expected_http_called=True):
-        def _http_get(service, url, *args, **kwargs):
+        def _http_head(service, url, *args, **kwargs):
             self.assertEqual(
                 url,
                 'https://bitbucket.org/api/1.0/repositories/'
@@ -544,9 +609,9 @@ class BitbucketTests(ServiceTests):
                 % expected_revision)
 
             if expected_found:
-                return b'{}', {}
+                return b'', {}
             else:
-                raise HTTPError()
+                raise HTTPError(url, 404, 'Not Found', {}, None)
 
         account = self._get_hosting_account()
         service = account.service
@@ -558,11 +623,13 @@ class BitbucketTests(ServiceTests):
 
         service.authorize('myuser', 'abc123', None)
 
-        self.spy_on(service._http_get, call_fake=_http_get)
+        self.spy_on(service._http_head, call_fake=_http_head)
+        self.spy_on(service._http_get)
 
         result = service.get_file_exists(repository, 'path', revision,
                                          base_commit_id)
-        self.assertEqual(service._http_get.called, expected_http_called)
+        self.assertEqual(service._http_head.called, expected_http_called)
+        self.assertFalse(service._http_get.called)
         self.assertEqual(result, expected_found)
 
 
@@ -974,6 +1041,101 @@ class GitHubTests(ServiceTests):
         self.assertEqual(body['client_id'], client_id)
         self.assertEqual(body['client_secret'], client_secret)
 
+    def test_get_file_exists(self):
+        """Testing GitHub get_file_exists uses a HEAD request"""
+        self._test_get_file_exists(expected_found=True)
+
+    def test_get_file_exists_not_found(self):
+        """Testing GitHub get_file_exists with a missing file"""
+        self._test_get_file_exists(expected_found=False)
+
+    def test_get_files_exist(self):
+        """Testing GitHub get_files_exist uses one tree listing per
+        base commit
+        """
+        def _http_get(service, url, *args, **kwargs):
+            self.assertEqual(
+                url,
+                'https://api.github.com/repos/myuser/myrepo/git/trees/'
+                'base123?access_token=def456&recursive=1')
+
+            return json.dumps({
+                'sha': 'tree123',
+                'truncated': False,
+                'tree': [
+                    {
+                        'path': 'README',
+                        'type': 'blob',
+                        'sha': 'd6613f5d6ba5a00d1a2ad2a10e6b4fb2f0ef3a1c',
+                    },
+                    {
+                        'path': 'src',
+                        'type': 'tree',
+                        'sha': '0bc5c26a6ba5a00d1a2ad2a10e6b4fb2f0ef3a1c',
+                    },
+                    {
+                        'path': 'src/foo.c',
+                        'type': 'blob',
+                        'sha': '94bdd3e6ba5a00d1a2ad2a10e6b4fb2f0ef3a1ca',
+                    },
+                ],
+            }), {}
+
+        account = self._get_hosting_account()
+        account.data['authorization'] = {'token': 'def456'}
+
+        repository = Repository(hosting_account=account)
+        repository.extra_data = {
+            'repository_plan': 'public',
+            'github_public_repo_name': 'myrepo',
+        }
+
+        service = account.service
+        self.spy_on(service._http_get, call_fake=_http_get)
+
+        files = [
+            ('/README', 'd6613f5', 'base123'),
+            ('src/foo.c', '94bdd3e', 'base123'),
+            ('src/bar.c', '1234567', 'base123'),
+            ('other.c', '1234567', None),
+        ]
+
+        self.assertEqual(service.get_files_exist(repository, files), {
+            ('/README', 'd6613f5', 'base123'): True,
+            ('src/foo.c', '94bdd3e', 'base123'): True,
+        })
+        self.assertEqual(len(service._http_get.calls), 1)
+
+    def _test_get_file_exists(self, expected_found):
+        def _http_head(service, url, *args, **kwargs):
+            self.assertEqual(
+                url,
+                'https://api.github.com/repos/myuser/myrepo/git/blobs/'
+                'abc123?access_token=def456')
+
+            if expected_found:
+                return b'', {}
+            else:
+                raise HTTPError(url, 404, 'Not Found', {}, None)
+
+        account = self._get_hosting_account()
+        account.data['authorization'] = {'token': 'def456'}
+
+        repository = Repository(hosting_account=account)
+        repository.extra_data = {
+            'repository_plan': 'public',
+            'github_public_repo_name': 'myrepo',
+        }
+
+        service = account.service
+        self.spy_on(service._http_head, call_fake=_http_head)
+        self.spy_on(service._http_get)
+
+        result = service.get_file_exists(repository, 'path', 'abc123')
+        self.assertTrue(service._http_head.called)
+        self.assertFalse(service._http_get.called)
+        self.assertEqual(result, expected_found)
+
     def test_get_branches(self):
         """Testing GitHub get_branches implementation"""
         branches_api_response = json.dumps([
@@ -1734,3 +1896,187 @@ class VersionOneTests(ServiceTests):
                 'versionone_url': 'http://versionone.example.com',
             }),
             'http://versionone.example.com/assetdetail.v1?Number=%s')
+
+
+class FakeHTTPResponse(object):
+    def __init__(self, status, data=b'', headers={}, will_close=False):
+        self.status = status
+        self.reason = 'Reason'
+        self.msg = headers
+        self.will_close = will_close
+        self._data = data
+
+    def read(self):
+        return self._data
+
+
+class FakeHTTPConnection(object):
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+        self.closed = False
+
+    def request(self, method, path, body, headers):
+        self.requests.append((method, path, body, dict(headers)))
+
+    def getresponse(self):
+        return self.responses.pop(0)
+
+    def close(self):
+        self.closed = True
+
+
+class HTTPClientTests(SpyAgency, TestCase):
+    """Unit tests for the hosting service HTTP client."""
+
+    def setUp(self):
+        super(HTTPClientTests, self).setUp()
+
+        self.pool = httpclient.get_connection_pool()
+        self.pool.clear()
+        self.responses = []
+        self.connections = []
+
+        def _create_connection(pool, scheme, netloc):
+            conn = FakeHTTPConnection(self.responses)
+            self.connections.append(conn)
+
+            return conn
+
+        self.spy_on(self.pool._create_connection,
+                    call_fake=_create_connection)
+        self.spy_on(httpclient.getproxies, call_fake=lambda: {})
+
+    def tearDown(self):
+        self.pool.clear()
+
+        super(HTTPClientTests, self).tearDown()
+
+    def test_send_request_reuses_connection(self):
+        """Testing hosting service HTTP requests reuse connections"""
+        self.responses.extend([
+            FakeHTTPResponse(200, b'first'),
+            FakeHTTPResponse(200, b'second'),
+        ])
+
+        data, headers = httpclient.send_request(
+            URLRequest('https://example.com/api/first'))
+        self.assertEqual(data, b'first')
+
+        data, headers = httpclient.send_request(
+            URLRequest('https://example.com/api/second?page=2'))
+        self.assertEqual(data, b'second')
+
+        self.assertEqual(len(self.connections), 1)
+
+        requests = self.connections[0].requests
+        self.assertEqual(len(requests), 2)
+        self.assertEqual(requests[0][:2], ('GET', '/api/first'))
+        self.assertEqual(requests[1][:2], ('GET', '/api/second?page=2'))
+        self.assertTrue(requests[0][3]['User-Agent'].startswith(
+            'ReviewBoard/'))
+
+    def test_send_request_with_closed_connection(self):
+        """Testing hosting service HTTP requests don't reuse connections
+        the server will close
+        """
+        self.responses.extend([
+            FakeHTTPResponse(200, b'first', will_close=True),
+            FakeHTTPResponse(200, b'second'),
+        ])
+
+        httpclient.send_request(URLRequest('https://example.com/first'))
+        httpclient.send_request(URLRequest('https://example.com/second'))
+
+        self.assertEqual(len(self.connections), 2)
+        self.assertTrue(self.connections[0].closed)
+        self.assertFalse(self.connections[1].closed)
+
+    def test_send_request_not_modified(self):
+        """Testing hosting service HTTP requests use cached responses
+        for 304 Not Modified
+        """
+        self.responses.extend([
+            FakeHTTPResponse(200, b'data', {'ETag': '"abc123"'}),
+            FakeHTTPResponse(304, headers={
+                'ETag': '"abc123"',
+                'X-RateLimit-Remaining': '10',
+            }),
+        ])
+
+        data, headers = httpclient.send_request(
+            URLRequest('https://example.com/api/'))
+        self.assertEqual(data, b'data')
+
+        data, headers = httpclient.send_request(
+            URLRequest('https://example.com/api/'))
+        self.assertEqual(data, b'data')
+        self.assertEqual(headers['X-RateLimit-Remaining'], '10')
+
+        requests = self.connections[0].requests
+        self.assertFalse('If-None-Match' in requests[0][3])
+        self.assertEqual(requests[1][3]['If-None-Match'], '"abc123"')
+
+    def test_send_request_not_modified_different_credentials(self):
+        """Testing hosting service HTTP requests don't share cached
+        responses between credentials
+        """
+        self.responses.extend([
+            FakeHTTPResponse(200, b'data', {'ETag': '"abc123"'}),
+            FakeHTTPResponse(200, b'other'),
+        ])
+
+        httpclient.send_request(URLRequest('https://example.com/api/', None,
+                                           {'Authorization': 'Basic abc'}))
+        data, headers = httpclient.send_request(
+            URLRequest('https://example.com/api/', None,
+                       {'Authorization': 'Basic def'}))
+        self.assertEqual(data, b'other')
+
+        requests = self.connections[0].requests
+        self.assertFalse('If-None-Match' in requests[1][3])
+
+    def test_send_request_error(self):
+        """Testing hosting service HTTP requests raise HTTPError for
+        error responses
+        """
+        self.responses.append(FakeHTTPResponse(404, b'Not found'))
+
+        try:
+            httpclient.send_request(URLRequest('https://example.com/api/'))
+            self.fail('HTTPError was not raised')
+        except HTTPError as e:
+            self.assertEqual(e.code, 404)
+            self.assertEqual(e.read(), b'Not found')
+
+    def test_send_request_redirect(self):
+        """Testing hosting service HTTP requests follow redirects"""
+        self.responses.extend([
+            FakeHTTPResponse(301, headers={
+                'Location': 'https://example.com/new/',
+            }),
+            FakeHTTPResponse(200, b'data'),
+        ])
+
+        data, headers = httpclient.send_request(
+            URLRequest('https://example.com/old/', b'body', {
+                'Content-Type': 'text/plain',
+            }))
+        self.assertEqual(data, b'data')
+
+        requests = self.connections[0].requests
+        self.assertEqual(requests[0][:3], ('POST', '/old/', b'body'))
+        self.assertEqual(requests[1][:3], ('GET', '/new/', None))
+        self.assertFalse('Content-type' in requests[1][3])
+
+    def test_limit_concurrent_requests(self):
+        """Testing hosting service HTTP requests are limited per account"""
+        semaphore_key = 'github::myuser'
+
+        with httpclient.limit_concurrent_requests(semaphore_key, 2):
+            with httpclient.limit_concurrent_requests(semaphore_key, 2):
+                semaphore = httpclient._account_semaphores[semaphore_key]
+                self.assertFalse(semaphore.acquire(False))
+
+        self.assertTrue(semaphore.acquire(False))
+        semaphore.release()
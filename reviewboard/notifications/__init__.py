@@ -9,9 +9,10 @@ def connect_signals(**kwargs):
     connect their signals. This is done so as to guarantee that django
     is loaded first.
     """
-    from reviewboard.notifications import email
+    from reviewboard.notifications import email, recipients
 
     email.connect_signals()
+    recipients.connect_signals()
 
 
 initializing.connect(connect_signals)
@@ -11,6 +11,14 @@ from django.utils import timezone
 from djblets.siteconfig.models import SiteConfiguration
 
 from reviewboard.accounts.signals import user_registered
+from reviewboard.notifications.outbox import queue_email
+from reviewboard.notifications.recipients import (
+    build_email_address,
+    get_email_address_for_user,
+    get_email_addresses_for_group,
+    get_review_mail_recipients,
+    get_review_participants,
+    get_review_request_participants)
 from reviewboard.reviews.models import ReviewRequest, Review
 from reviewboard.reviews.signals import (review_request_published,
                                          review_published, reply_published,
@@ -18,6 +26,22 @@ from reviewboard.reviews.signals import (review_request_published,
 from reviewboard.reviews.views import build_diff_comment_fragments
 
 
+# The address helpers live in reviewboard.notifications.recipients, but
+# are still provided here for existing callers.
+__all__ = [
+    'SpiffyEmailMessage',
+    'build_email_address',
+    'connect_signals',
+    'get_email_address_for_user',
+    'get_email_addresses_for_group',
+    'mail_new_user',
+    'mail_reply',
+    'mail_review',
+    'mail_review_request',
+    'send_review_mail',
+]
+
+
 def review_request_closed_cb(sender, user, review_request, **kwargs):
     """Sends e-mail when a review request is closed.
 
@@ -85,33 +109,6 @@ def connect_signals():
     user_registered.connect(user_registered_cb)
 
 
-def build_email_address(fullname, email):
-    if not fullname:
-        return email
-    else:
-        return '"%s" <%s>' % (fullname, email)
-
-
-def get_email_address_for_user(u):
-    return build_email_address(u.get_full_name(), u.email)
-
-
-def get_email_addresses_for_group(g):
-    if g.mailing_list:
-        if g.mailing_list.find(",") == -1:
-            # The mailing list field has only one e-mail address in it,
-            # so we can just use that and the group's display name.
-            return ['"%s" <%s>' % (g.display_name, g.mailing_list)]
-        else:
-            # The mailing list field has multiple e-mail addresses in it.
-            # We don't know which one should have the group's display name
-            # attached to it, so just return their custom list as-is.
-            return g.mailing_list.split(',')
-    else:
-        return [get_email_address_for_user(u)
-                for u in g.users.filter(is_active=True)]
-
-
 class SpiffyEmailMessage(EmailMultiAlternatives):
     """An EmailMessage subclass with improved header and message ID support.
 
@@ -119,7 +116,8 @@ class SpiffyEmailMessage(EmailMultiAlternatives):
     including Sender/X-Sender, In-Reply-To/References, and Reply-To.
 
     The generated Message-ID header from the e-mail can be accessed
-    through the :py:attr:`message_id` attribute after the e-mail is sent.
+    through the :py:attr:`message_id` attribute after the e-mail is sent
+    or queued.
     """
     def __init__(self, subject, text_body, html_body, from_email, sender,
                  to, cc, in_reply_to, headers={}):
@@ -170,31 +168,8 @@ def send_review_mail(user, review_request, subject, in_reply_to,
 
     from_email = get_email_address_for_user(user)
 
-    recipients = set()
-    to_field = set()
-
-    if from_email:
-        recipients.add(from_email)
-
-    if review_request.submitter.is_active:
-        recipients.add(get_email_address_for_user(review_request.submitter))
-
-    for u in review_request.target_people.filter(is_active=True):
-        recipients.add(get_email_address_for_user(u))
-        to_field.add(get_email_address_for_user(u))
-
-    for group in review_request.target_groups.all():
-        for address in get_email_addresses_for_group(group):
-            recipients.add(address)
-
-    for profile in review_request.starred_by.all():
-        if profile.user.is_active:
-            recipients.add(get_email_address_for_user(profile.user))
-
-    if extra_recipients:
-        for recipient in extra_recipients:
-            if recipient.is_active:
-                recipients.add(get_email_address_for_user(recipient))
+    to_field, cc_field, groups = get_review_mail_recipients(
+        user, review_request, extra_recipients)
 
     siteconfig = current_site.config.get()
     domain_method = siteconfig.get("site_domain_method")
@@ -210,22 +185,12 @@ def send_review_mail(user, review_request, subject, in_reply_to,
     text_body = render_to_string(text_template_name, context)
     html_body = render_to_string(html_template_name, context)
 
-    # Set the cc field only when the to field (i.e People) are mentioned,
-    # so that to field consists of Reviewers and cc consists of all the
-    # other members of the group
-    if to_field:
-        cc_field = recipients.symmetric_difference(to_field)
-    else:
-        to_field = recipients
-        cc_field = set()
-
     base_url = '%s://%s' % (domain_method, current_site.domain)
 
     headers = {
         'X-ReviewBoard-URL': base_url,
         'X-ReviewRequest-URL': base_url + review_request.get_absolute_url(),
-        'X-ReviewGroup': ', '.join(group.name for group in
-                                   review_request.target_groups.all()),
+        'X-ReviewGroup': ', '.join(group.name for group in groups),
     }
 
     if review_request.repository:
@@ -246,9 +211,9 @@ def send_review_mail(user, review_request, subject, in_reply_to,
                                  from_email, sender, list(to_field),
                                  list(cc_field), in_reply_to, headers)
     try:
-        message.send()
+        message.message_id = queue_email(message)
     except Exception as e:
-        logging.error("Error sending e-mail notification with subject '%s' on "
+        logging.error("Error queuing e-mail notification with subject '%s' on "
                       "behalf of '%s' to '%s': %s",
                       subject.strip(),
                       from_email,
@@ -288,7 +253,7 @@ def mail_review_request(review_request, changedesc=None, on_close=False):
         # Fancy quoted "replies"
         subject = "Re: " + subject
         reply_message_id = review_request.email_message_id
-        extra_recipients = review_request.participants
+        extra_recipients = get_review_request_participants(review_request)
     else:
         extra_recipients = None
 
@@ -375,7 +340,7 @@ def mail_reply(reply):
                              review_request.display_id,
                              review_request.summary),
                          review.email_message_id,
-                         review.participants,
+                         get_review_participants(review),
                          'notifications/reply_email.txt',
                          'notifications/reply_email.html',
                          extra_context)
@@ -409,8 +374,8 @@ def mail_new_user(user):
                                   for a in settings.ADMINS], None, None)
 
     try:
-        message.send()
+        queue_email(message)
     except Exception as e:
-        logging.error("Error sending e-mail notification with subject '%s' on "
+        logging.error("Error queuing e-mail notification with subject '%s' on "
                       "behalf of '%s' to admin: %s",
                       subject.strip(), from_email, e, exc_info=1)
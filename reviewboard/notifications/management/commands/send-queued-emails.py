@@ -0,0 +1,33 @@
+from __future__ import unicode_literals
+
+import optparse
+
+from django.core.management.base import NoArgsCommand
+from django.utils import timezone
+
+from reviewboard.notifications.models import QueuedEmail
+from reviewboard.notifications.outbox import send_queued_emails
+
+
+class Command(NoArgsCommand):
+    option_list = NoArgsCommand.option_list + (
+        optparse.make_option('--retry-failed', action='store_true',
+                             dest='retry_failed', default=False,
+                             help='Also retry e-mails that failed too many '
+                                  'times to be retried automatically'),
+    )
+    help = ('Sends any e-mails waiting in the outbox. This can be run '
+            'periodically to send e-mails left over by processes that '
+            'exited before sending them.')
+
+    def handle_noargs(self, **options):
+        if options.get('retry_failed'):
+            QueuedEmail.objects.filter(next_attempt__isnull=True).update(
+                next_attempt=timezone.now(),
+                attempts=0)
+
+        num_sent = send_queued_emails()
+        num_waiting = QueuedEmail.objects.count()
+
+        self.stdout.write('Sent %d e-mail(s). %d e-mail(s) are still in the '
+                          'outbox.\n' % (num_sent, num_waiting))
@@ -0,0 +1,69 @@
+from __future__ import unicode_literals
+
+from django.core.mail import EmailMultiAlternatives
+from django.db import models
+from django.utils import timezone
+from django.utils.encoding import python_2_unicode_compatible
+from django.utils.translation import ugettext_lazy as _
+from djblets.db.fields import JSONField
+
+
+@python_2_unicode_compatible
+class QueuedEmail(models.Model):
+    """An e-mail waiting in the outbox to be sent.
+
+    The message itself is stored in ``message_data``, in the form produced
+    by :py:meth:`set_message`. E-mails are removed from the outbox once
+    they've been sent. If sending fails, ``next_attempt`` is pushed back
+    and the e-mail is tried again later. After too many failures,
+    ``next_attempt`` is cleared and the e-mail is left in the outbox, along
+    with the last error, so that it can be looked into.
+    """
+    message_id = models.CharField(_('message ID'), max_length=255)
+    message_data = JSONField(_('message data'))
+    timestamp = models.DateTimeField(_('timestamp'), default=timezone.now)
+    next_attempt = models.DateTimeField(_('next attempt'), null=True,
+                                        default=timezone.now, db_index=True)
+    attempts = models.PositiveIntegerField(_('attempts'), default=0)
+    last_error = models.TextField(_('last error'), blank=True)
+
+    def set_message(self, message):
+        """Stores an EmailMessage or EmailMultiAlternatives."""
+        self.message_data = {
+            'subject': message.subject,
+            'body': message.body,
+            'from_email': message.from_email,
+            'to': list(message.to),
+            'cc': list(message.cc),
+            'bcc': list(message.bcc),
+            'headers': dict(message.extra_headers),
+            'alternatives': [
+                list(alternative)
+                for alternative in getattr(message, 'alternatives', [])
+            ],
+        }
+
+    def get_message(self):
+        """Returns the stored message as an EmailMultiAlternatives."""
+        data = self.message_data
+
+        return EmailMultiAlternatives(
+            subject=data['subject'],
+            body=data['body'],
+            from_email=data['from_email'],
+            to=data['to'],
+            cc=data['cc'],
+            bcc=data['bcc'],
+            headers=data['headers'],
+            alternatives=[
+                tuple(alternative)
+                for alternative in data['alternatives']
+            ])
+
+    def __str__(self):
+        return self.message_data.get('subject', self.message_id)
+
+    class Meta:
+        ordering = ['timestamp']
+        verbose_name = _('queued e-mail')
+        verbose_name_plural = _('queued e-mails')
@@ -0,0 +1,234 @@
+from __future__ import unicode_literals
+
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.mail.message import make_msgid
+from django.db import connection
+from django.utils import timezone
+
+from reviewboard.notifications.models import QueuedEmail
+
+
+# The number of e-mails to send over one connection before reconnecting.
+BATCH_SIZE = 50
+
+# The number of times an e-mail is tried before giving up on it.
+MAX_ATTEMPTS = 6
+
+# The delay before the first retry of an e-mail, in seconds. This doubles
+# with each failed attempt.
+RETRY_DELAY = 30
+
+# How long an outbox worker has to send an e-mail it's claimed before
+# another worker may take it over, in seconds.
+CLAIM_TIMEOUT = 300
+
+
+def queue_email(message):
+    """Queues an e-mail message to be sent in the background.
+
+    The message is stored in the outbox in the database, and will be sent
+    by an outbox worker. This returns the message's Message-ID, which is
+    assigned up-front so that later e-mails can refer to this one.
+    """
+    message_id = message.extra_headers.get('Message-ID')
+
+    if not message_id:
+        message_id = make_msgid()
+        message.extra_headers['Message-ID'] = message_id
+
+    queued_email = QueuedEmail(message_id=message_id)
+    queued_email.set_message(message)
+    queued_email.save()
+
+    if getattr(settings, 'RUNNING_TEST', False):
+        # Tests expect the e-mail to be sent by the time this returns.
+        send_queued_emails()
+    else:
+        outbox_worker.wake()
+
+    return message_id
+
+
+def start_outbox_worker():
+    """Starts the outbox worker for this process.
+
+    Any e-mails that are due, including ones left in the outbox by
+    processes that have since exited, are sent right away. E-mails that
+    are waiting to be retried are sent once they're due.
+    """
+    if not getattr(settings, 'RUNNING_TEST', False):
+        outbox_worker.wake()
+
+
+def send_queued_emails():
+    """Sends all the e-mails in the outbox that are due to be sent.
+
+    The e-mails are sent in batches, with one SMTP connection shared by
+    all the e-mails in a batch. Each e-mail is claimed before it's sent, so
+    that several workers can safely drain the same outbox.
+
+    This returns the number of e-mails that were sent.
+    """
+    num_sent = 0
+
+    while True:
+        queued_emails = list(
+            QueuedEmail.objects
+            .filter(next_attempt__lte=timezone.now())
+            .order_by('next_attempt')[:BATCH_SIZE])
+
+        if not queued_emails:
+            break
+
+        num_sent += _send_batch(queued_emails)
+
+        if len(queued_emails) < BATCH_SIZE:
+            break
+
+    return num_sent
+
+
+def _send_batch(queued_emails):
+    """Sends a batch of queued e-mails over a single connection."""
+    num_sent = 0
+    mail_connection = None
+
+    try:
+        for queued_email in queued_emails:
+            if not _claim(queued_email):
+                # Another worker got to it first.
+                continue
+
+            try:
+                if mail_connection is None:
+                    mail_connection = get_connection()
+                    mail_connection.open()
+
+                mail_connection.send_messages([queued_email.get_message()])
+            except Exception as e:
+                _retry_later(queued_email, e)
+
+                # The connection may be in a bad state, so start over with
+                # a new one for the next e-mail.
+                _close_connection(mail_connection)
+                mail_connection = None
+            else:
+                queued_email.delete()
+                num_sent += 1
+    finally:
+        _close_connection(mail_connection)
+
+    return num_sent
+
+
+def _claim(queued_email):
+    """Claims a queued e-mail for sending.
+
+    This pushes back the e-mail's next attempt, so that no other worker
+    will pick it up in the meantime. If another worker has already changed
+    the e-mail, this returns False.
+    """
+    claimed_until = timezone.now() + timedelta(seconds=CLAIM_TIMEOUT)
+    claimed = QueuedEmail.objects.filter(
+        pk=queued_email.pk,
+        attempts=queued_email.attempts,
+        next_attempt=queued_email.next_attempt).update(
+            next_attempt=claimed_until)
+
+    if claimed:
+        queued_email.next_attempt = claimed_until
+
+    return claimed == 1
+
+
+def _retry_later(queued_email, error):
+    """Records a failed attempt to send an e-mail, and schedules a retry."""
+    message_data = queued_email.message_data
+    queued_email.attempts += 1
+    queued_email.last_error = '%s' % error
+
+    if queued_email.attempts < MAX_ATTEMPTS:
+        delay = RETRY_DELAY * 2 ** (queued_email.attempts - 1)
+        queued_email.next_attempt = \
+            timezone.now() + timedelta(seconds=delay)
+
+        logging.warning("Error sending e-mail notification with subject "
+                        "'%s' to '%s' (attempt %d). Trying again in %d "
+                        "seconds: %s",
+                        message_data['subject'],
+                        ','.join(message_data['to'] + message_data['cc']),
+                        queued_email.attempts, delay, error)
+    else:
+        queued_email.next_attempt = None
+
+        logging.error("Error sending e-mail notification with subject '%s' "
+                      "to '%s'. Giving up after %d attempts: %s",
+                      message_data['subject'],
+                      ','.join(message_data['to'] + message_data['cc']),
+                      queued_email.attempts, error)
+
+    queued_email.save()
+
+
+def _close_connection(mail_connection):
+    if mail_connection is not None:
+        try:
+            mail_connection.close()
+        except Exception as e:
+            logging.warning('Error closing the e-mail connection: %s', e)
+
+
+class EmailOutboxWorker(object):
+    """A worker thread that sends the e-mails in the outbox.
+
+    The thread is started the first time it's woken up, either when an
+    e-mail is queued or when the web server starts handling requests. It
+    sends any e-mails that are due whenever it's woken up, and also checks
+    the outbox every poll_interval seconds, in order to retry failed
+    e-mails and pick up any left over from other processes.
+
+    Short-lived processes may exit before their worker has sent everything.
+    The send-queued-emails management command can be run periodically to
+    send anything left over.
+    """
+    def __init__(self, poll_interval=30):
+        self.poll_interval = poll_interval
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def wake(self):
+        """Wakes up the worker, starting it if needed."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name='email-outbox')
+                self._thread.daemon = True
+                self._thread.start()
+
+        self._event.set()
+
+    def _run(self):
+        """Sends e-mails until the process exits."""
+        while True:
+            self._event.wait(self.poll_interval)
+            self._event.clear()
+
+            try:
+                send_queued_emails()
+            except Exception as e:
+                logging.error('Error sending e-mails from the outbox: %s',
+                              e, exc_info=1)
+            finally:
+                # This isn't running as part of a request, so nothing else
+                # will close the thread's database connection. Closing it
+                # also ensures the next check sees newly queued e-mails.
+                connection.close()
+
+
+outbox_worker = EmailOutboxWorker()
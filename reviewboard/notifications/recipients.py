@@ -0,0 +1,258 @@
+"""Recipient resolution for review e-mails.
+
+Working out who should receive an e-mail for a review request involves the
+submitter, the target people and groups, everyone who starred the review
+request, and often everyone who took part in the discussion. Rather than
+looking each of these up one object at a time, the recipients are fetched
+in a fixed number of queries, no matter how many people or groups are
+involved.
+
+Expanding a review group without a mailing list into the addresses of its
+members is the most expensive part, so the expanded addresses are cached
+per group. The cached addresses for a group are thrown away whenever its
+members, or the members' names or addresses, change.
+
+Changes to users are noticed through the post_save signal. Bulk updates
+through QuerySet.update() (such as deactivating many users at once) don't
+send it, so the cached addresses for those users' groups will be out of
+date until the groups' memberships change or the cache entries expire.
+Code making such updates should call invalidate_group_email_addresses()
+for the affected groups.
+"""
+from __future__ import unicode_literals
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from djblets.cache.backend import make_cache_key
+from djblets.util.compat import six
+
+
+# The fields on User that make up an e-mail address or affect whether a
+# user receives e-mail.
+_ADDRESS_FIELDS = set(['first_name', 'last_name', 'email', 'is_active'])
+
+
+def build_email_address(fullname, email):
+    if not fullname:
+        return email
+    else:
+        return '"%s" <%s>' % (fullname, email)
+
+
+def get_email_address_for_user(u):
+    return build_email_address(u.get_full_name(), u.email)
+
+
+def get_email_addresses_for_groups(groups):
+    """Returns the e-mail addresses for each of a list of review groups.
+
+    This returns a dictionary mapping each group's ID to a list of
+    addresses. Groups with a mailing list use that. Otherwise, the group's
+    active members are used, with the addresses for all groups that aren't
+    already cached fetched in one query.
+    """
+    addresses = {}
+    member_groups = []
+
+    for group in groups:
+        if group.mailing_list:
+            if group.mailing_list.find(",") == -1:
+                # The mailing list field has only one e-mail address in it,
+                # so we can just use that and the group's display name.
+                addresses[group.pk] = [
+                    '"%s" <%s>' % (group.display_name, group.mailing_list),
+                ]
+            else:
+                # The mailing list field has multiple e-mail addresses in
+                # it. We don't know which one should have the group's
+                # display name attached to it, so just return their custom
+                # list as-is.
+                addresses[group.pk] = group.mailing_list.split(',')
+        else:
+            member_groups.append(group)
+
+    if member_groups:
+        cache_keys = dict(
+            (_make_group_cache_key(group.pk), group.pk)
+            for group in member_groups
+        )
+        cached = cache.get_many(list(six.iterkeys(cache_keys)))
+
+        for key, addresses_for_group in six.iteritems(cached):
+            addresses[cache_keys[key]] = addresses_for_group
+
+        missing_ids = [
+            group.pk
+            for group in member_groups
+            if group.pk not in addresses
+        ]
+
+        if missing_ids:
+            from reviewboard.reviews.models import Group
+
+            new_addresses = dict(
+                (group_id, [])
+                for group_id in missing_ids
+            )
+            memberships = (
+                Group.users.through.objects
+                .filter(group__in=missing_ids, user__is_active=True)
+                .select_related('user')
+                .order_by('user__username'))
+
+            for membership in memberships:
+                new_addresses[membership.group_id].append(
+                    get_email_address_for_user(membership.user))
+
+            cache.set_many(dict(
+                (_make_group_cache_key(group_id), addresses_for_group)
+                for group_id, addresses_for_group in
+                six.iteritems(new_addresses)
+            ))
+            addresses.update(new_addresses)
+
+    return addresses
+
+
+def get_email_addresses_for_group(group):
+    """Returns the e-mail addresses for a review group."""
+    return get_email_addresses_for_groups([group])[group.pk]
+
+
+def get_review_request_participants(review_request):
+    """Returns the active users who have reviewed or replied on a request."""
+    return User.objects.filter(reviews__review_request=review_request,
+                               is_active=True).distinct()
+
+
+def get_review_participants(review):
+    """Returns the active users who have written or replied to a review."""
+    return User.objects.filter(
+        Q(reviews=review.pk) | Q(reviews__base_reply_to=review.pk),
+        is_active=True).distinct()
+
+
+def get_review_mail_recipients(user, review_request, extra_recipients=None):
+    """Returns the recipients for an e-mail about a review request.
+
+    This returns a tuple of the addresses for the To field, the addresses
+    for the CC field, and the review request's target groups.
+
+    The people the review request is assigned to go in the To field, and
+    everyone else is CC'd. If nobody is assigned, everyone goes in the To
+    field.
+
+    ``extra_recipients`` is an optional list or queryset of additional
+    users to send the e-mail to.
+    """
+    recipients = set()
+    to_field = set()
+
+    from_email = get_email_address_for_user(user)
+
+    if from_email:
+        recipients.add(from_email)
+
+    submitter = review_request.submitter
+
+    if submitter.is_active:
+        recipients.add(get_email_address_for_user(submitter))
+
+    for u in review_request.target_people.filter(is_active=True):
+        recipients.add(get_email_address_for_user(u))
+        to_field.add(get_email_address_for_user(u))
+
+    groups = list(review_request.target_groups.all())
+
+    for addresses in six.itervalues(get_email_addresses_for_groups(groups)):
+        recipients.update(addresses)
+
+    starred_by = (review_request.starred_by
+                  .filter(user__is_active=True)
+                  .select_related('user'))
+
+    for profile in starred_by:
+        recipients.add(get_email_address_for_user(profile.user))
+
+    if extra_recipients:
+        for recipient in extra_recipients:
+            if recipient.is_active:
+                recipients.add(get_email_address_for_user(recipient))
+
+    # Set the cc field only when the to field (i.e People) are mentioned,
+    # so that to field consists of Reviewers and cc consists of all the
+    # other members of the group
+    if to_field:
+        cc_field = recipients.symmetric_difference(to_field)
+    else:
+        to_field = recipients
+        cc_field = set()
+
+    return to_field, cc_field, groups
+
+
+def invalidate_group_email_addresses(group_ids):
+    """Throws away the cached member addresses for review groups."""
+    if group_ids:
+        cache.delete_many([
+            _make_group_cache_key(group_id)
+            for group_id in group_ids
+        ])
+
+
+def _make_group_cache_key(group_id):
+    return make_cache_key('group-email-addresses:%s' % group_id)
+
+
+def _get_group_ids_for_user(user):
+    from reviewboard.reviews.models import Group
+
+    return list(Group.users.through.objects.filter(user=user.pk).values_list(
+        'group', flat=True))
+
+
+def _on_membership_changed(instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # The memberships were changed through user.review_groups, so the
+        # instance is a User and pk_set contains group IDs.
+        if action == 'pre_clear':
+            invalidate_group_email_addresses(
+                _get_group_ids_for_user(instance))
+        elif action in ('post_add', 'post_remove'):
+            invalidate_group_email_addresses(pk_set)
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_group_email_addresses([instance.pk])
+
+
+def _on_membership_deleted(instance, **kwargs):
+    invalidate_group_email_addresses([instance.group_id])
+
+
+def _on_group_changed(instance, **kwargs):
+    invalidate_group_email_addresses([instance.pk])
+
+
+def _on_user_saved(instance, created, update_fields=None, **kwargs):
+    # Logging in only updates last_login, which doesn't affect addresses.
+    # Bulk updates through QuerySet.update() never get here. See the module
+    # docstring.
+    if (not created and
+        (update_fields is None or
+         _ADDRESS_FIELDS.intersection(update_fields))):
+        invalidate_group_email_addresses(_get_group_ids_for_user(instance))
+
+
+def connect_signals():
+    """Connects the signals for invalidating cached group addresses."""
+    from reviewboard.reviews.models import Group
+
+    m2m_changed.connect(_on_membership_changed, sender=Group.users.through)
+
+    # Deleting a user or group removes its memberships without sending
+    # m2m_changed.
+    post_delete.connect(_on_membership_deleted, sender=Group.users.through)
+    post_save.connect(_on_group_changed, sender=Group)
+    post_delete.connect(_on_group_changed, sender=Group)
+    post_save.connect(_on_user_saved, sender=User)
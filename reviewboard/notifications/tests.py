@@ -1,15 +1,29 @@
 from __future__ import unicode_literals
 
+from datetime import timedelta
+from smtplib import SMTPException
+
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core import mail
+from django.core.mail import EmailMultiAlternatives
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.utils import timezone
 from djblets.siteconfig.models import SiteConfiguration
+from djblets.util.compat.six.moves import cStringIO as StringIO
+from kgb import SpyAgency
 
 from reviewboard import initialize
 from reviewboard.admin.siteconfig import load_site_config
+from reviewboard.notifications import outbox
 from reviewboard.notifications.email import (build_email_address,
                                              get_email_address_for_user,
                                              get_email_addresses_for_group)
+from reviewboard.notifications.models import QueuedEmail
+from reviewboard.notifications.recipients import (
+    get_email_addresses_for_groups,
+    get_review_mail_recipients)
 from reviewboard.reviews.models import Group, ReviewRequest
 from reviewboard.testing import TestCase
 
@@ -244,3 +258,256 @@ class ReviewRequestEmailTests(TestCase, EmailTestHelper):
 
     def _get_sender(self, user):
         return build_email_address(user.get_full_name(), self.sender)
+
+
+class RecipientsTests(TestCase):
+    """Unit tests for resolving e-mail recipients."""
+    fixtures = ['test_users']
+
+    def setUp(self):
+        super(RecipientsTests, self).setUp()
+
+        initialize()
+
+        self.grumpy = User.objects.get(username='grumpy')
+        self.dopey = User.objects.get(username='dopey')
+
+    def test_get_email_addresses_for_groups_cached(self):
+        """Testing get_email_addresses_for_groups caches member addresses"""
+        group = self.create_review_group()
+        group.users.add(self.grumpy)
+
+        self.assertEqual(get_email_addresses_for_groups([group]),
+                         {group.pk: [get_email_address_for_user(self.grumpy)]})
+
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                get_email_addresses_for_groups([group]),
+                {group.pk: [get_email_address_for_user(self.grumpy)]})
+
+    def test_get_email_addresses_for_groups_membership_changes(self):
+        """Testing get_email_addresses_for_groups after membership changes"""
+        group = self.create_review_group()
+        group.users.add(self.grumpy)
+        get_email_addresses_for_groups([group])
+
+        self.dopey.review_groups.add(group)
+        self.assertEqual(
+            set(get_email_addresses_for_groups([group])[group.pk]),
+            set([get_email_address_for_user(self.grumpy),
+                 get_email_address_for_user(self.dopey)]))
+
+        group.users.remove(self.grumpy)
+        self.assertEqual(get_email_addresses_for_groups([group]),
+                         {group.pk: [get_email_address_for_user(self.dopey)]})
+
+        self.dopey.review_groups.clear()
+        self.assertEqual(get_email_addresses_for_groups([group]),
+                         {group.pk: []})
+
+    def test_get_email_addresses_for_groups_user_changes(self):
+        """Testing get_email_addresses_for_groups after a member's address
+        changes
+        """
+        group = self.create_review_group()
+        group.users.add(self.grumpy)
+        get_email_addresses_for_groups([group])
+
+        self.grumpy.email = 'grumpy2@example.com'
+        self.grumpy.save()
+
+        self.assertEqual(get_email_addresses_for_groups([group]),
+                         {group.pk: [get_email_address_for_user(self.grumpy)]})
+
+        self.grumpy.is_active = False
+        self.grumpy.save()
+
+        self.assertEqual(get_email_addresses_for_groups([group]),
+                         {group.pk: []})
+
+    def test_get_review_mail_recipients_num_queries(self):
+        """Testing get_review_mail_recipients uses a fixed number of queries
+        """
+        review_request = self.create_review_request()
+        review_request.target_people.add(self.grumpy)
+
+        for i in range(3):
+            group = self.create_review_group(name='group%d' % i)
+            group.users.add(self.dopey)
+            review_request.target_groups.add(group)
+
+        admin = User.objects.get(username='admin')
+        admin.get_profile().star_review_request(review_request)
+
+        # Looking up target people, target groups, group members and
+        # starred users.
+        with self.assertNumQueries(4):
+            to_field, cc_field, groups = get_review_mail_recipients(
+                review_request.submitter, review_request)
+
+        self.assertEqual(to_field,
+                         set([get_email_address_for_user(self.grumpy)]))
+        self.assertEqual(
+            cc_field,
+            set([get_email_address_for_user(review_request.submitter),
+                 get_email_address_for_user(self.dopey),
+                 get_email_address_for_user(admin)]))
+        self.assertEqual(len(groups), 3)
+
+        # The group members are now cached.
+        with self.assertNumQueries(3):
+            get_review_mail_recipients(review_request.submitter,
+                                       review_request)
+
+
+class FakeEmailBackend(EmailBackend):
+    """An in-memory e-mail backend that counts connections and failures."""
+    def __init__(self, *args, **kwargs):
+        super(FakeEmailBackend, self).__init__(*args, **kwargs)
+        self.num_opened = 0
+        self.fail_subjects = set()
+
+    def open(self):
+        self.num_opened += 1
+
+    def send_messages(self, messages):
+        for message in messages:
+            if message.subject in self.fail_subjects:
+                raise SMTPException('Server unavailable')
+
+        return super(FakeEmailBackend, self).send_messages(messages)
+
+
+class OutboxTests(SpyAgency, TestCase):
+    """Unit tests for the e-mail outbox."""
+    def setUp(self):
+        super(OutboxTests, self).setUp()
+
+        mail.outbox = []
+        self.backend = FakeEmailBackend()
+        self.spy_on(outbox.get_connection,
+                    call_fake=lambda *args, **kwargs: self.backend)
+
+    def test_queue_email(self):
+        """Testing queue_email sends the e-mail and empties the outbox"""
+        message = self._create_message('Test')
+        message_id = outbox.queue_email(message)
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(QueuedEmail.objects.count(), 0)
+        self.assertEqual(mail.outbox[0].subject, 'Test')
+        self.assertEqual(mail.outbox[0].to, ['grumpy@example.com'])
+        self.assertEqual(mail.outbox[0].cc, ['doc@example.com'])
+        self.assertEqual(mail.outbox[0].extra_headers['X-Test'], 'yes')
+        self.assertEqual(mail.outbox[0].alternatives,
+                         [('<p>Body</p>', 'text/html')])
+        self.assertEqual(mail.outbox[0].message()['Message-ID'], message_id)
+
+    def test_send_queued_emails_one_connection(self):
+        """Testing send_queued_emails sends a batch over one connection"""
+        for i in range(3):
+            self._create_queued_email('Test %d' % i)
+
+        self.assertEqual(outbox.send_queued_emails(), 3)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(self.backend.num_opened, 1)
+        self.assertEqual(QueuedEmail.objects.count(), 0)
+
+    def test_send_queued_emails_retry(self):
+        """Testing send_queued_emails retries failed e-mails later"""
+        self.backend.fail_subjects.add('Bad')
+        self._create_queued_email('Bad')
+        self._create_queued_email('Good')
+
+        self.assertEqual(outbox.send_queued_emails(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, 'Good')
+
+        queued_email = QueuedEmail.objects.get()
+        self.assertEqual(queued_email.attempts, 1)
+        self.assertEqual(queued_email.last_error, 'Server unavailable')
+        self.assertTrue(queued_email.next_attempt > timezone.now())
+
+        # The e-mail isn't due yet, so nothing should be sent.
+        self.assertEqual(outbox.send_queued_emails(), 0)
+
+        # Once it's due, it should be sent.
+        self.backend.fail_subjects.clear()
+        queued_email.next_attempt = timezone.now() - timedelta(seconds=1)
+        queued_email.save()
+
+        self.assertEqual(outbox.send_queued_emails(), 1)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(QueuedEmail.objects.count(), 0)
+
+    def test_send_queued_emails_give_up(self):
+        """Testing send_queued_emails gives up after too many failures"""
+        self.backend.fail_subjects.add('Bad')
+        queued_email = self._create_queued_email('Bad')
+        queued_email.attempts = outbox.MAX_ATTEMPTS - 1
+        queued_email.save()
+
+        self.assertEqual(outbox.send_queued_emails(), 0)
+
+        queued_email = QueuedEmail.objects.get()
+        self.assertEqual(queued_email.attempts, outbox.MAX_ATTEMPTS)
+        self.assertEqual(queued_email.next_attempt, None)
+
+    def test_send_queued_emails_claimed(self):
+        """Testing send_queued_emails skips e-mails claimed elsewhere"""
+        queued_email = self._create_queued_email('Test')
+
+        # Simulate another worker claiming the e-mail first.
+        QueuedEmail.objects.filter(pk=queued_email.pk).update(
+            attempts=1)
+
+        self.assertEqual(outbox._send_batch([queued_email]), 0)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(QueuedEmail.objects.count(), 1)
+
+    def test_send_queued_emails_command(self):
+        """Testing the send-queued-emails management command sends e-mails
+        left in the outbox
+        """
+        self._create_queued_email('Test 1')
+        self._create_queued_email('Test 2')
+
+        call_command('send-queued-emails', stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(QueuedEmail.objects.count(), 0)
+
+    def test_send_queued_emails_command_retry_failed(self):
+        """Testing the send-queued-emails management command with
+        --retry-failed
+        """
+        queued_email = self._create_queued_email('Test')
+        queued_email.attempts = outbox.MAX_ATTEMPTS
+        queued_email.next_attempt = None
+        queued_email.save()
+
+        call_command('send-queued-emails', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 0)
+
+        call_command('send-queued-emails', retry_failed=True,
+                     stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(QueuedEmail.objects.count(), 0)
+
+    def _create_message(self, subject):
+        message = EmailMultiAlternatives(subject, 'Body',
+                                         'noreply@example.com',
+                                         ['grumpy@example.com'],
+                                         cc=['doc@example.com'],
+                                         headers={'X-Test': 'yes'})
+        message.attach_alternative('<p>Body</p>', 'text/html')
+
+        return message
+
+    def _create_queued_email(self, subject):
+        queued_email = QueuedEmail(message_id='<%s@example.com>' % subject)
+        queued_email.set_message(self._create_message(subject))
+        queued_email.next_attempt = timezone.now() - timedelta(seconds=1)
+        queued_email.save()
+
+        return queued_email
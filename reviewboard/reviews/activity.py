@@ -0,0 +1,177 @@
+"""Activity fingerprints for review requests.
+
+A review request's fingerprint is an opaque token that changes whenever
+anything shown on its page changes. That includes publishing, drafts,
+reviews, replies, comments, dependencies and stars. Views can use it to
+build an ETag and answer conditional requests without loading the rest of
+the review request's data.
+
+Reviews have fingerprints of their own, which only change when the review,
+its comments or its replies change. These are used to cache the rendered
+reviews on the review request page.
+
+Fingerprints are only stored in the cache. Any change to the review
+request deletes its fingerprint, and a new random one is generated the
+next time it's needed. A fingerprint that's been evicted is handled the
+same way, so it costs one full page load rather than risking a stale page.
+"""
+from __future__ import unicode_literals
+
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from djblets.cache.backend import make_cache_key
+from djblets.util.compat import six
+
+
+def _make_fingerprint_key(name, object_id):
+    return make_cache_key('%s-activity:%s' % (name, object_id))
+
+
+def _get_fingerprints(name, object_ids):
+    keys = dict(
+        (_make_fingerprint_key(name, object_id), object_id)
+        for object_id in object_ids
+    )
+    cached_fingerprints = cache.get_many(list(keys.keys()))
+    fingerprints = {}
+
+    for key, object_id in six.iteritems(keys):
+        fingerprint = cached_fingerprints.get(key)
+
+        if fingerprint is None:
+            fingerprint = uuid.uuid4().hex
+
+            if not cache.add(key, fingerprint,
+                             settings.CACHE_EXPIRATION_TIME):
+                # Another request set the fingerprint first.
+                fingerprint = cache.get(key) or fingerprint
+
+        fingerprints[object_id] = fingerprint
+
+    return fingerprints
+
+
+def _invalidate_fingerprints(name, object_ids):
+    cache.delete_many([
+        _make_fingerprint_key(name, object_id)
+        for object_id in object_ids
+    ])
+
+
+def get_review_request_fingerprint(review_request_id):
+    """Returns the activity fingerprint for a review request.
+
+    This should be fetched before loading any data for the review request,
+    so that changes made while the data is being loaded will result in a
+    new fingerprint.
+    """
+    return _get_fingerprints('review-request',
+                             [review_request_id])[review_request_id]
+
+
+def invalidate_review_request_fingerprints(review_request_ids):
+    """Invalidates the activity fingerprints for review requests."""
+    _invalidate_fingerprints('review-request', review_request_ids)
+
+
+def get_review_fingerprints(review_ids):
+    """Returns the activity fingerprints for a list of reviews.
+
+    A review's fingerprint changes when the review or any of its comments
+    change, or when a reply to it is created, changed or deleted. The
+    result is a dictionary mapping review IDs to fingerprints.
+    """
+    return _get_fingerprints('review', review_ids)
+
+
+def invalidate_review_fingerprint(review):
+    """Invalidates the activity fingerprint for a review.
+
+    If the review is a reply, the fingerprint for the review being replied
+    to will be invalidated as well.
+    """
+    review_ids = [review.pk]
+
+    if review.base_reply_to_id is not None:
+        review_ids.append(review.base_reply_to_id)
+
+    _invalidate_fingerprints('review', review_ids)
+
+
+def _on_review_request_changed(instance, **kwargs):
+    invalidate_review_request_fingerprints([instance.pk])
+
+
+def _on_review_request_related_changed(instance, **kwargs):
+    invalidate_review_request_fingerprints([instance.review_request_id])
+
+
+def _on_review_changed(instance, **kwargs):
+    invalidate_review_request_fingerprints([instance.review_request_id])
+    invalidate_review_fingerprint(instance)
+
+
+def _on_comment_deleting(instance, **kwargs):
+    # A comment is tied to its review through the review's many-to-many
+    # table, which is cleared before post_delete is sent. Look up the review
+    # while it can still be found.
+    try:
+        instance._review = instance.get_review()
+    except ObjectDoesNotExist:
+        pass
+
+
+def _on_comment_deleted(instance, **kwargs):
+    review = getattr(instance, '_review', None)
+
+    if review is not None:
+        invalidate_review_request_fingerprints([review.review_request_id])
+        invalidate_review_fingerprint(review)
+
+
+def _on_dependencies_changed(instance, action, pk_set, **kwargs):
+    # Both sides of the dependency show it, so both need to be invalidated.
+    if action in ('pre_clear', 'post_add', 'post_remove'):
+        if action == 'pre_clear':
+            # The IDs aren't provided when clearing, so look them up before
+            # they're gone.
+            if kwargs['reverse']:
+                related = instance.blocks
+            else:
+                related = instance.depends_on
+
+            pk_set = related.values_list('pk', flat=True)
+
+        invalidate_review_request_fingerprints([instance.pk] + list(pk_set))
+
+
+def connect_signals():
+    """Connects the signals for invalidating fingerprints."""
+    from reviewboard.reviews.models import (Comment, FileAttachmentComment,
+                                            Review, ReviewRequest,
+                                            ReviewRequestDraft,
+                                            ScreenshotComment)
+
+    post_save.connect(_on_review_request_changed, sender=ReviewRequest)
+    post_delete.connect(_on_review_request_changed, sender=ReviewRequest)
+
+    post_save.connect(_on_review_request_related_changed,
+                      sender=ReviewRequestDraft)
+    post_delete.connect(_on_review_request_related_changed,
+                        sender=ReviewRequestDraft)
+
+    post_save.connect(_on_review_changed, sender=Review)
+    post_delete.connect(_on_review_changed, sender=Review)
+
+    # Saving a comment invalidates its review in BaseComment.save().
+    for comment_cls in (Comment, FileAttachmentComment, ScreenshotComment):
+        pre_delete.connect(_on_comment_deleting, sender=comment_cls)
+        post_delete.connect(_on_comment_deleted, sender=comment_cls)
+
+    m2m_changed.connect(_on_dependencies_changed,
+                        sender=ReviewRequest.depends_on.through)
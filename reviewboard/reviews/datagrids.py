@@ -4,6 +4,7 @@ import pytz
 import logging
 
 from django.contrib.auth.models import User
+from django.db.models import Max
 from django.http import Http404
 from django.template.defaultfilters import date
 from django.utils.datastructures import SortedDict
@@ -14,8 +15,9 @@ from djblets.datagrid.grids import (CheckboxColumn, Column, DateTimeColumn,
 from djblets.util.compat import six
 from djblets.util.templatetags.djblets_utils import ageid
 
-from reviewboard.accounts.models import Profile, LocalSiteProfile
-from reviewboard.reviews.models import Group, ReviewRequest
+from reviewboard.accounts.models import (LocalSiteProfile, Profile,
+                                         ReviewRequestVisit)
+from reviewboard.reviews.models import Group, Review, ReviewRequest
 from reviewboard.reviews.templatetags.reviewtags import render_star
 from reviewboard.site.urlresolvers import local_site_reverse
 
@@ -140,6 +142,7 @@ class MyCommentsColumn(Column):
         self.image_alt = _("My Comments")
         self.detailed_label = _("My Comments")
         self.shrink = True
+        self.my_reviews = {}
 
         # XXX It'd be nice to be able to sort on this, but datagrids currently
         # can only sort based on stored (in the DB) values, not computed
@@ -151,40 +154,35 @@ class MyCommentsColumn(Column):
         if user.is_anonymous():
             return queryset
 
-        query_dict = {
-            'user_id': six.text_type(user.id),
-        }
+        # Look up the user's reviews for all review requests on the page at
+        # once, rather than querying for each row.
+        reviews = Review.objects.filter(
+            user=user,
+            review_request__in=self.datagrid.id_list).values_list(
+                'review_request', 'public', 'ship_it')
 
-        return queryset.extra(select={
-            'mycomments_my_reviews': """
-                SELECT COUNT(1)
-                  FROM reviews_review
-                  WHERE reviews_review.user_id = %(user_id)s
-                    AND reviews_review.review_request_id =
-                        reviews_reviewrequest.id
-            """ % query_dict,
-            'mycomments_private_reviews': """
-                SELECT COUNT(1)
-                  FROM reviews_review
-                  WHERE reviews_review.user_id = %(user_id)s
-                    AND reviews_review.review_request_id =
-                        reviews_reviewrequest.id
-                    AND NOT reviews_review.public
-            """ % query_dict,
-            'mycomments_shipit_reviews': """
-                SELECT COUNT(1)
-                  FROM reviews_review
-                  WHERE reviews_review.user_id = %(user_id)s
-                    AND reviews_review.review_request_id =
-                        reviews_reviewrequest.id
-                    AND reviews_review.ship_it
-            """ % query_dict,
-        })
+        self.my_reviews = {}
+
+        for review_request_id, public, ship_it in reviews:
+            info = self.my_reviews.setdefault(review_request_id, {
+                'private': False,
+                'ship_it': False,
+            })
+
+            info['private'] = info['private'] or not public
+            info['ship_it'] = info['ship_it'] or ship_it
+
+        return queryset
 
     def render_data(self, review_request):
         user = self.datagrid.request.user
 
-        if user.is_anonymous() or review_request.mycomments_my_reviews == 0:
+        if user.is_anonymous():
+            return ""
+
+        info = self.my_reviews.get(review_request.pk)
+
+        if not info:
             return ""
 
         # Priority is ranked in the following order:
@@ -192,11 +190,11 @@ class MyCommentsColumn(Column):
         # 1) Non-public (draft) reviews
         # 2) Public reviews marked "Ship It"
         # 3) Public reviews not marked "Ship It"
-        if review_request.mycomments_private_reviews > 0:
+        if info['private']:
             icon_class = 'rb-icon-datagrid-comment-draft'
             image_alt = _("Comments drafted")
         else:
-            if review_request.mycomments_shipit_reviews > 0:
+            if info['ship_it']:
                 icon_class = 'rb-icon-datagrid-comment-shipit'
                 image_alt = _("Comments published. Ship it!")
             else:
@@ -219,11 +217,24 @@ class ToMeColumn(Column):
         self.label = "\u00BB"  # this is &raquo;
         self.detailed_label = "\u00BB To Me"
         self.shrink = True
+        self.all_to_me = set()
 
-    def render_data(self, review_request):
+    def augment_queryset(self, queryset):
         user = self.datagrid.request.user
-        if (user.is_authenticated() and
-            review_request.target_people.filter(pk=user.pk).exists()):
+
+        if user.is_anonymous():
+            return queryset
+
+        self.all_to_me = set(
+            ReviewRequest.target_people.through.objects.filter(
+                user=user,
+                reviewrequest__in=self.datagrid.id_list).values_list(
+                    'reviewrequest', flat=True))
+
+        return queryset
+
+    def render_data(self, review_request):
+        if review_request.pk in self.all_to_me:
             return ('<div title="%s"><b>&raquo;</b></div>'
                     % (self.detailed_label))
 
@@ -243,9 +254,38 @@ class NewUpdatesColumn(Column):
         self.image_alt = "New Updates"
         self.detailed_label = "New Updates"
         self.shrink = True
+        self.all_updated = set()
+
+    def augment_queryset(self, queryset):
+        user = self.datagrid.request.user
+
+        if user.is_anonymous():
+            return queryset
+
+        visits = dict(
+            ReviewRequestVisit.objects.filter(
+                user=user,
+                review_request__in=self.datagrid.id_list).values_list(
+                    'review_request', 'timestamp'))
+
+        # Find the newest review from anyone else on each of the visited
+        # review requests, in a single query.
+        latest_reviews = Review.objects.filter(
+            public=True,
+            review_request__in=list(visits.keys())).exclude(
+                user=user).values('review_request').annotate(
+                    latest_timestamp=Max('timestamp')).order_by()
+
+        self.all_updated = set(
+            info['review_request']
+            for info in latest_reviews
+            if info['latest_timestamp'] > visits[info['review_request']]
+        )
+
+        return queryset
 
     def render_data(self, review_request):
-        if review_request.new_review_count > 0:
+        if review_request.pk in self.all_updated:
             return '<div class="%s" title="%s" />' % \
                    (self.image_class, self.image_alt)
 
@@ -359,6 +399,9 @@ class PeopleColumn(Column):
         self.sortable = False
         self.shrink = False
 
+    def augment_queryset(self, queryset):
+        return queryset.prefetch_related('target_people')
+
     def render_data(self, review_request):
         people = review_request.target_people.all()
         return reduce(lambda a, d: a + d.username + ' ', people, '')
@@ -374,6 +417,9 @@ class GroupsColumn(Column):
         self.sortable = False
         self.shrink = False
 
+    def augment_queryset(self, queryset):
+        return queryset.prefetch_related('target_groups')
+
     def render_data(self, review_request):
         groups = review_request.target_groups.all()
         return reduce(lambda a, d: a + d.name + ' ', groups, '')
@@ -408,21 +454,11 @@ class ReviewCountColumn(Column):
         self.shrink = True
         self.link = True
         self.link_func = self.link_to_object
+        self.db_field = 'public_review_count'
+        self.sortable = True
 
     def render_data(self, review_request):
-        return six.text_type(review_request.publicreviewcount_count)
-
-    def augment_queryset(self, queryset):
-        return queryset.extra(select={
-            'publicreviewcount_count': """
-                SELECT COUNT(*)
-                  FROM reviews_review
-                  WHERE reviews_review.public
-                    AND reviews_review.base_reply_to_id is NULL
-                    AND reviews_review.review_request_id =
-                        reviews_reviewrequest.id
-            """
-        })
+        return six.text_type(review_request.public_review_count)
 
     def link_to_object(self, review_request, value):
         return "%s#last-review" % review_request.get_absolute_url()
@@ -618,10 +654,6 @@ class ReviewRequestDataGrid(DataGrid):
 
         return False
 
-    def post_process_queryset(self, queryset):
-        q = queryset.with_counts(self.request.user)
-        return super(ReviewRequestDataGrid, self).post_process_queryset(q)
-
     def link_to_object(self, obj, value):
         if value and isinstance(value, User):
             return local_site_reverse("user", request=self.request,
@@ -0,0 +1,20 @@
+from __future__ import unicode_literals
+
+from django_evolution.mutations import AddField, SQLMutation
+from djblets.db.fields import CounterField
+
+
+MUTATIONS = [
+    AddField('ReviewRequest', 'public_review_count', CounterField, null=True,
+             initial=0),
+    SQLMutation('populate_public_review_count', ["""
+        UPDATE reviews_reviewrequest
+           SET public_review_count = (
+               SELECT COUNT(*)
+                 FROM reviews_review
+                WHERE reviews_review.review_request_id =
+                      reviews_reviewrequest.id
+                  AND reviews_review.public
+                  AND reviews_review.base_reply_to_id is NULL)
+"""])
+]
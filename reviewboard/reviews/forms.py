@@ -9,6 +9,7 @@ from django.utils.translation import ugettext_lazy as _
 
 from reviewboard.diffviewer import forms as diffviewer_forms
 from reviewboard.diffviewer.models import DiffSet
+from reviewboard.diffviewer.prewarm import prewarm_diff_chunks
 from reviewboard.reviews.models import (DefaultReviewer, Group,
                                         ReviewRequestDraft, Screenshot)
 from reviewboard.scmtools.models import Repository
@@ -127,10 +128,16 @@ class UploadDiffForm(diffviewer_forms.UploadDiffForm):
                 latest_diffset = public_diffsets.latest()
                 diffset.revision = latest_diffset.revision + 1
             except DiffSet.DoesNotExist:
+                latest_diffset = None
                 diffset.revision = 1
 
             diffset.save()
 
+            if latest_diffset:
+                # The diff itself is already being pre-generated. Do the same
+                # for the interdiff against the latest public revision.
+                prewarm_diff_chunks(latest_diffset, interdiffset=diffset)
+
         return diffset
 
 
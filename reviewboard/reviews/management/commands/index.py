@@ -9,24 +9,12 @@ from django.conf import settings
 from django.core.management.base import CommandError, NoArgsCommand
 from django.db.models import Q
 from django.utils import timezone
-from djblets.util.compat import six
 from djblets.siteconfig.models import SiteConfiguration
 
-from reviewboard.reviews.models import ReviewRequest
-
-try:
-    import lucene
-    lucene.initVM(lucene.CLASSPATH)
-    have_lucene = True
-
-    lv = [int(x) for x in lucene.VERSION.split('.')]
-    lucene_is_2x = lv[0] == 2 and lv[1] < 9
-    lucene_is_3x = lv[0] == 3 or (lv[0] == 2 and lv[1] == 9)
-except ImportError:
-    # This is here just in case someone is misconfigured but manages to
-    # skip the dependency checks inside manage.py (perhaps they have
-    # DEBUG = False)
-    have_lucene = False
+from reviewboard.search.indexing import (build_document,
+                                         get_indexable_review_requests,
+                                         get_search_index,
+                                         update_review_requests)
 
 
 class Command(NoArgsCommand):
@@ -34,10 +22,17 @@ class Command(NoArgsCommand):
         optparse.make_option('--full', action='store_false',
                              dest='incremental', default=True,
                              help='Do a full (level-0) index of the database'),
+        optparse.make_option('--optimize', action='store_true',
+                             dest='optimize', default=False,
+                             help='Merge the index into a single segment'),
     )
     help = "Creates a search index of review requests"
     requires_model_validation = True
 
+    # The number of review requests updated in the index at once during an
+    # incremental update.
+    BATCH_SIZE = 500
+
     def handle_noargs(self, **options):
         siteconfig = SiteConfiguration.objects.get_current()
 
@@ -47,10 +42,6 @@ class Command(NoArgsCommand):
                                'enabled in the Review Board administration '
                                'settings to run this command.\n')
 
-        if not have_lucene:
-            raise CommandError('PyLucene is required to build the search '
-                               'index.\n')
-
         incremental = options.get('incremental', True)
 
         store_dir = siteconfig.get("search_index_file")
@@ -74,136 +65,67 @@ class Command(NoArgsCommand):
         with open(timestamp_file, 'w') as f:
             f.write('%d' % time.time())
 
-        if lucene_is_2x:
-            store = lucene.FSDirectory.getDirectory(store_dir, False)
-            writer = lucene.IndexWriter(store, False,
-                                        lucene.StandardAnalyzer(),
-                                        not incremental)
-        elif lucene_is_3x:
-            store = lucene.FSDirectory.open(lucene.File(store_dir))
-            writer = lucene.IndexWriter(
-                store,
-                lucene.StandardAnalyzer(lucene.Version.LUCENE_CURRENT),
-                not incremental,
-                lucene.IndexWriter.MaxFieldLength.LIMITED)
-        else:
-            assert False
+        index = get_search_index()
 
-        status = Q(status='P') | Q(status='S')
-        objects = ReviewRequest.objects.filter(status)
         if incremental:
-            query = Q(last_updated__gt=timestamp)
-            # FIXME: re-index based on reviews once reviews are indexed.  I
-            # tried ORing this in, but it doesn't seem to work.
-            #        Q(review__timestamp__gt=timestamp)
-            objects = objects.filter(query)
+            # The index is normally kept up to date as review requests
+            # change. This catches anything that was missed, such as
+            # review requests that were changed while search was disabled.
+            objects = get_indexable_review_requests().filter(
+                Q(last_updated__gt=timestamp) |
+                Q(last_review_activity_timestamp__gt=timestamp))
+        else:
+            objects = get_indexable_review_requests()
+
+        objects = objects.select_related('submitter')
 
         if self.stdout.isatty():
             self.stdout.write('Creating Review Request Index')
+
         totalobjs = objects.count()
-        i = 0
-        prev_pct = -1
 
-        for request in objects:
-            try:
-                # Remove the old documents from the index
-                if incremental:
-                    writer.deleteDocuments(
-                        lucene.Term('id', six.text_type(request.id)))
+        if incremental:
+            batch = []
 
-                self.index_review_request(writer, request)
+            for request in self._iter_progress(objects, totalobjs):
+                batch.append(request)
 
-                if self.stdout.isatty():
-                    i += 1
-                    pct = (i * 100 / totalobjs)
-                    if pct != prev_pct:
-                        self.stdout.write("  [%s%%]\r" % pct)
-                        self.stdout.flush()
-                        prev_pct = pct
+                if len(batch) == self.BATCH_SIZE:
+                    update_review_requests(batch)
+                    batch = []
 
-            except Exception as e:
-                self.stderr.write('Error indexing ReviewRequest #%d: %s\n'
-                                 % (request.id, e))
+            if batch:
+                update_review_requests(batch)
 
-        if self.stdout.isatty():
-            self.stdout.write('Optimizing Index')
-        writer.optimize()
+            index.merge(optimize=options.get('optimize', False))
+        else:
+            index.rebuild(self._iter_documents(objects, totalobjs))
 
         if self.stdout.isatty():
             self.stdout.write('Indexed %d documents' % totalobjs)
             self.stdout.write('Done')
 
-        writer.close()
+    def _iter_documents(self, objects, totalobjs):
+        """Yields the search index documents for review requests."""
+        for request in self._iter_progress(objects, totalobjs):
+            try:
+                yield build_document(request)
+            except Exception as e:
+                self.stderr.write('Error indexing ReviewRequest #%d: %s\n'
+                                  % (request.id, e))
+
+    def _iter_progress(self, objects, totalobjs):
+        """Yields review requests, showing the progress on a terminal."""
+        i = 0
+        prev_pct = -1
+
+        for request in objects.iterator():
+            yield request
 
-    def index_review_request(self, writer, request):
-        if lucene_is_2x:
-            lucene_tokenized = lucene.Field.Index.TOKENIZED
-            lucene_un_tokenized = lucene.Field.Index.UN_TOKENIZED
-        elif lucene_is_3x:
-            lucene_tokenized = lucene.Field.Index.ANALYZED
-            lucene_un_tokenized = lucene.Field.Index.NOT_ANALYZED
-        else:
-            assert False
-
-        # There are several fields we want to make available to users.
-        # We index them individually, but also create a big hunk of text
-        # to use for the default field, so people can just type in a
-        # string and get results.
-        doc = lucene.Document()
-        doc.add(lucene.Field('id', six.text_type(request.id),
-                             lucene.Field.Store.YES,
-                             lucene.Field.Index.NO))
-        doc.add(lucene.Field('summary', request.summary,
-                             lucene.Field.Store.NO,
-                             lucene_tokenized))
-        if request.changenum:
-            doc.add(lucene.Field('changenum',
-                                 six.text_type(request.changenum),
-                                 lucene.Field.Store.NO,
-                                 lucene_tokenized))
-        # Remove commas, since lucene won't tokenize it right with them
-        bugs = ' '.join(request.bugs_closed.split(','))
-        doc.add(lucene.Field('bug', bugs,
-                             lucene.Field.Store.NO,
-                             lucene_tokenized))
-
-        name = ' '.join([request.submitter.username,
-                         request.submitter.get_full_name()])
-        doc.add(lucene.Field('author', name,
-                             lucene.Field.Store.NO,
-                             lucene_tokenized))
-        doc.add(lucene.Field('username', request.submitter.username,
-                             lucene.Field.Store.NO,
-                             lucene_un_tokenized))
-
-        # FIXME: index reviews
-        # FIXME: index dates
-
-        files = []
-        if request.diffset_history:
-            for diffset in request.diffset_history.diffsets.all():
-                for filediff in diffset.files.all():
-                    if filediff.source_file:
-                        files.append(filediff.source_file)
-                    if filediff.dest_file:
-                        files.append(filediff.dest_file)
-        aggregate_files = '\n'.join(set(files))
-        # FIXME: this tokenization doesn't let people search for files
-        # in a really natural way.  It'll split on '/' which handles the
-        # majority case, but it'd be nice to be able to drill down
-        # (main.cc, vmuiLinux/main.cc, and player/linux/main.cc)
-        doc.add(lucene.Field('file', aggregate_files,
-                             lucene.Field.Store.NO,
-                             lucene_tokenized))
-
-        text = '\n'.join([request.summary,
-                          request.description,
-                          six.text_type(request.changenum),
-                          request.testing_done,
-                          bugs,
-                          name,
-                          aggregate_files])
-        doc.add(lucene.Field('text', text,
-                             lucene.Field.Store.NO,
-                             lucene_tokenized))
-        writer.addDocument(doc)
+            if self.stdout.isatty():
+                i += 1
+                pct = (i * 100 / totalobjs)
+                if pct != prev_pct:
+                    self.stdout.write("  [%s%%]\r" % pct)
+                    self.stdout.flush()
+                    prev_pct = pct
@@ -10,6 +10,7 @@ from django.db.models.query import QuerySet
 from djblets.db.managers import ConcurrencyManager
 from djblets.util.compat import six
 
+from reviewboard.accounts.access import get_user_access
 from reviewboard.diffviewer.models import DiffSetHistory
 from reviewboard.scmtools.errors import ChangeNumberInUseError
 
@@ -46,9 +47,9 @@ class ReviewGroupManager(Manager):
                 q = q & Q(visible=True)
 
             if user.is_authenticated():
-                q = q | Q(users__pk=user.pk)
+                q = q | Q(pk__in=get_user_access(user).group_ids)
 
-            qs = self.filter(q).distinct()
+            qs = self.filter(q)
 
         return qs.filter(local_site=local_site)
 
@@ -60,6 +61,13 @@ class ReviewGroupManager(Manager):
 
 class ReviewRequestQuerySet(QuerySet):
     def with_counts(self, user):
+        """Adds the number of new reviews for the user to each result.
+
+        Each review request gets a ``new_review_count`` attribute, computed
+        by a subquery for every row. Nothing in Review Board uses this any
+        longer, as the datagrids look up new updates for a whole page at
+        once, but it's kept for compatibility with existing callers.
+        """
         queryset = self
 
         if user and user.is_authenticated():
@@ -292,10 +300,13 @@ class ReviewRequestManager(ConcurrencyManager):
                            Q(target_groups__invite_only=False))
 
             if is_authenticated:
-                repo_query = repo_query | (
-                    Q(repository__users=user) |
-                    Q(repository__review_groups__users=user))
-                group_query = group_query | Q(target_groups__users=user)
+                # Use the user's cached memberships, rather than joining
+                # against the membership tables.
+                access = get_user_access(user)
+                repo_query = (repo_query |
+                              Q(repository__in=access.repository_ids))
+                group_query = (group_query |
+                               Q(target_groups__in=access.group_ids))
 
                 query = query & (Q(submitter=user) |
                                  (repo_query &
@@ -17,9 +17,14 @@ from djblets.db.managers import ConcurrencyManager
 from djblets.db.query import get_object_or_none
 from djblets.util.templatetags.djblets_images import crop_image, thumbnail
 
+from reviewboard.accounts.access import get_user_access
 from reviewboard.changedescs.models import ChangeDescription
 from reviewboard.diffviewer.models import DiffSet, DiffSetHistory, FileDiff
 from reviewboard.attachments.models import FileAttachment
+from reviewboard.reviews.activity import (
+    connect_signals as connect_activity_signals,
+    invalidate_review_fingerprint,
+    invalidate_review_request_fingerprints)
 from reviewboard.reviews.errors import PermissionError
 from reviewboard.reviews.managers import (DefaultReviewerManager,
                                           ReviewGroupManager,
@@ -78,7 +83,7 @@ class Group(models.Model):
         return (not self.invite_only or
                 user.is_superuser or
                 (user.is_authenticated() and
-                 self.users.filter(pk=user.pk).count() > 0))
+                 self.pk in get_user_access(user).group_ids))
 
     def is_mutable_by(self, user):
         """
@@ -617,6 +622,7 @@ class ReviewRequest(BaseReviewRequestDetails):
         default=None,
         blank=True)
     shipit_count = CounterField(_("ship-it count"), default=0)
+    public_review_count = CounterField(_("public review count"), default=0)
 
     local_site = models.ForeignKey(LocalSite, blank=True, null=True)
     local_id = models.IntegerField('site-local ID', blank=True, null=True)
@@ -667,22 +673,21 @@ class ReviewRequest(BaseReviewRequestDetails):
         """
         Returns any new reviews since the user last viewed the review request.
         """
-        if user.is_authenticated():
-            # If this ReviewRequest was queried using with_counts=True,
-            # then we should know the new review count and can use this to
-            # decide whether we have anything at all to show.
-            if hasattr(self, "new_review_count") and self.new_review_count > 0:
-                query = self.visits.filter(user=user)
+        # If this ReviewRequest was queried using with_counts=True, then we
+        # already know whether there's anything at all to show.
+        if (user.is_authenticated() and
+            getattr(self, 'new_review_count', 1) > 0):
+            query = self.visits.filter(user=user)
 
-                try:
-                    visit = query[0]
+            try:
+                visit = query[0]
 
-                    return self.reviews.filter(
-                        public=True,
-                        timestamp__gt=visit.timestamp).exclude(user=user)
-                except IndexError:
-                    # This visit doesn't exist, so bail.
-                    pass
+                return self.reviews.filter(
+                    public=True,
+                    timestamp__gt=visit.timestamp).exclude(user=user)
+            except IndexError:
+                # This visit doesn't exist, so bail.
+                pass
 
         return self.reviews.get_empty_query_set()
 
@@ -732,7 +737,7 @@ class ReviewRequest(BaseReviewRequestDetails):
             return False
 
         if (user.is_authenticated() and
-            self.target_people.filter(pk=user.pk).count() > 0):
+            self.target_people.filter(pk=user.pk).exists()):
             return True
 
         groups = list(self.target_groups.all())
@@ -1635,6 +1640,9 @@ class BaseComment(models.Model):
 
             ReviewRequest.objects.filter(pk=review.review_request_id).update(
                 last_review_activity_timestamp=self.timestamp)
+            invalidate_review_request_fingerprints(
+                [review.review_request_id])
+            invalidate_review_fingerprint(review)
         except Review.DoesNotExist:
             pass
 
@@ -1967,6 +1975,9 @@ class Review(models.Model):
         if self.ship_it:
             self.review_request.increment_shipit_count()
 
+        if not self.is_reply():
+            self.review_request.increment_public_review_count()
+
         if self.is_reply():
             reply_published.send(sender=self.__class__,
                                  user=user, reply=self)
@@ -2004,3 +2015,7 @@ class Review(models.Model):
     class Meta:
         ordering = ['timestamp']
         get_latest_by = 'timestamp'
+
+
+# Keep the activity fingerprints for review requests up to date.
+connect_activity_signals()
@@ -14,8 +14,11 @@ from djblets.siteconfig.models import SiteConfiguration
 from djblets.testing.decorators import add_fixtures
 from kgb import SpyAgency
 
-from reviewboard.accounts.models import Profile, LocalSiteProfile
+from reviewboard.accounts.models import (LocalSiteProfile, Profile,
+                                        ReviewRequestVisit)
 from reviewboard.attachments.models import FileAttachment
+from reviewboard.reviews import views
+from reviewboard.reviews.activity import get_review_request_fingerprint
 from reviewboard.reviews.forms import DefaultReviewerForm, GroupForm
 from reviewboard.reviews.markdown_utils import (markdown_escape,
                                                 markdown_unescape)
@@ -545,6 +548,41 @@ class ReviewRequestTests(TestCase):
         review_request.close(ReviewRequest.SUBMITTED)
         self.assertTrue(review_request.public)
 
+    def test_public_review_count(self):
+        """Testing ReviewRequest.public_review_count when publishing reviews"""
+        review_request = self.create_review_request(publish=True)
+        review = self.create_review(review_request)
+
+        review_request = ReviewRequest.objects.get(pk=review_request.pk)
+        self.assertEqual(review_request.public_review_count, 0)
+
+        review.publish()
+        self.create_reply(review, publish=True)
+
+        review_request = ReviewRequest.objects.get(pk=review_request.pk)
+        self.assertEqual(review_request.public_review_count, 1)
+
+    def test_get_new_reviews(self):
+        """Testing ReviewRequest.get_new_reviews without with_counts"""
+        user = User.objects.get(username='grumpy')
+        review_request = self.create_review_request(publish=True)
+        old_review = self.create_review(review_request, publish=True)
+        ReviewRequestVisit.objects.create(user=user,
+                                          review_request=review_request)
+
+        review = self.create_review(review_request, publish=True)
+        self.create_review(review_request, user=user, publish=True)
+
+        # Review.save() always updates the timestamp, so set them directly.
+        Review.objects.filter(pk=old_review.pk).update(
+            timestamp=old_review.timestamp - timedelta(days=1))
+        Review.objects.filter(pk=review.pk).update(
+            timestamp=review.timestamp + timedelta(days=1))
+
+        review_request = ReviewRequest.objects.get(pk=review_request.pk)
+        self.assertEqual(list(review_request.get_new_reviews(user)),
+                         [review])
+
 
 class ViewTests(TestCase):
     """Tests for views in reviewboard.reviews.views"""
@@ -860,6 +898,44 @@ class ViewTests(TestCase):
         self.assertEqual(datagrid.rows[1]['object'].summary, 'Test 2')
         self.assertEqual(datagrid.rows[2]['object'].summary, 'Test 1')
 
+    def test_review_list_with_review_columns(self):
+        """Testing all_review_requests view with the review-related columns"""
+        user = User.objects.get(username='grumpy')
+
+        review_request = self.create_review_request(summary='Test 1',
+                                                    publish=True)
+        review_request.target_people.add(user)
+        self.create_review(review_request, publish=True)
+        self.create_review(review_request, user=user)
+
+        self.create_review_request(summary='Test 2', publish=True)
+
+        self.client.login(username='grumpy', password='grumpy')
+
+        response = self.client.get(
+            '/r/', {
+                'columns': 'summary,my_comments,to_me,review_count,'
+                           'target_people',
+                'sort': '-review_count,summary',
+            })
+        self.assertEqual(response.status_code, 200)
+
+        datagrid = self.getContextVar(response, 'datagrid')
+        self.assertEqual(len(datagrid.rows), 2)
+        self.assertEqual(datagrid.rows[0]['object'].summary, 'Test 1')
+        self.assertEqual(datagrid.rows[0]['object'].public_review_count, 1)
+        self.assertEqual(datagrid.rows[1]['object'].summary, 'Test 2')
+        self.assertEqual(datagrid.rows[1]['object'].public_review_count, 0)
+
+        self.assertEqual(datagrid.to_me.all_to_me, set([review_request.pk]))
+        self.assertEqual(datagrid.my_comments.my_reviews, {
+            review_request.pk: {
+                'private': True,
+                'ship_it': False,
+            },
+        })
+        self.assertContains(response, 'Comments drafted')
+
     def testReviewListSitewideLogin(self):
         """Testing all_review_requests view with site-wide login enabled"""
         self.siteconfig.set("auth_require_sitewide_login", True)
@@ -1451,6 +1527,203 @@ class ViewTests(TestCase):
         # Make sure they're not equal
         self.assertNotEqual(etag1, etag2)
 
+    def test_review_request_etag_not_modified(self):
+        """Testing review request ETags with unchanged review requests"""
+        self.client.login(username='doc', password='doc')
+
+        review_request = self.create_review_request(publish=True)
+
+        response = self.client.get(review_request.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        response = self.client.get(review_request.get_absolute_url(),
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Any new activity should cause the page to be reloaded.
+        self.create_review(review_request, publish=True)
+
+        response = self.client.get(review_request.get_absolute_url(),
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_review_request_etag_with_star(self):
+        """Testing review request ETags after starring the review request"""
+        self.client.login(username='doc', password='doc')
+
+        review_request = self.create_review_request(publish=True)
+
+        response = self.client.get(review_request.get_absolute_url())
+        etag = response['ETag']
+
+        profile = User.objects.get(username='doc').get_profile()
+        profile.star_review_request(review_request)
+
+        response = self.client.get(review_request.get_absolute_url(),
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_review_detail_entry_cache(self):
+        """Testing review_detail view with cached entries"""
+        self.client.login(username='doc', password='doc')
+
+        review_request = self.create_review_request(create_repository=True,
+                                                    publish=True)
+        diffset = self.create_diffset(review_request)
+        filediff = self.create_filediff(diffset)
+
+        review = self.create_review(review_request)
+        comment = self.create_diff_comment(review, filediff,
+                                           issue_opened=True)
+        review.publish()
+
+        response = self.client.get(review_request.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['issues']['open'], 1)
+
+        entries = response.context['entries']
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(len(entries[0]['comments']['diff_comments']), 1)
+        self.assertEqual(entries[0]['diff_fragments'],
+                         [(comment.pk, '%s' % filediff.pk)])
+
+        # The second load should use the cached entry, without losing any
+        # of its data.
+        response = self.client.get(review_request.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['issues']['open'], 1)
+
+        entries = response.context['entries']
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(len(entries[0]['comments']['diff_comments']), 0)
+        self.assertEqual(entries[0]['diff_fragments'],
+                         [(comment.pk, '%s' % filediff.pk)])
+        self.assertIn('data-issue-status="open"', response.content)
+
+        # Changing the issue status should cause the entry to be rendered
+        # again.
+        comment.issue_status = Comment.RESOLVED
+        comment.save()
+
+        response = self.client.get(review_request.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['issues']['open'], 0)
+        self.assertEqual(response.context['issues']['resolved'], 1)
+        self.assertIn('data-issue-status="resolved"', response.content)
+
+    def test_review_detail_entry_cache_with_reply(self):
+        """Testing review_detail view with cached entries and new replies"""
+        self.client.login(username='doc', password='doc')
+
+        review_request = self.create_review_request(publish=True)
+        review = self.create_review(review_request, publish=True)
+
+        response = self.client.get(review_request.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('My reply text', response.content)
+
+        reply = self.create_reply(review, body_top='My reply text')
+        reply.body_top_reply_to = review
+        reply.publish()
+
+        response = self.client.get(review_request.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('My reply text', response.content)
+
+    def test_review_detail_entry_cache_with_deleted_comment(self):
+        """Testing review_detail view with cached entries and deleted
+        comments
+        """
+        self.client.login(username='grumpy', password='grumpy')
+
+        review_request = self.create_review_request(create_repository=True,
+                                                    publish=True)
+        diffset = self.create_diffset(review_request)
+        filediff = self.create_filediff(diffset)
+        review = self.create_review(review_request, publish=True)
+        comment = self.create_diff_comment(review, filediff)
+
+        reply = self.create_reply(review)
+        self.create_diff_comment(reply, filediff, text='My reply text',
+                                 reply_to=comment)
+
+        response = self.client.get(review_request.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('My reply text', response.content)
+
+        reply.comments.get().delete()
+
+        response = self.client.get(review_request.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('My reply text', response.content)
+
+    def test_review_request_fingerprint_with_dependencies(self):
+        """Testing review request activity fingerprints with dependency
+        changes
+        """
+        review_request1 = self.create_review_request(publish=True)
+        review_request2 = self.create_review_request(publish=True)
+
+        fingerprint1 = get_review_request_fingerprint(review_request1.pk)
+        fingerprint2 = get_review_request_fingerprint(review_request2.pk)
+        self.assertEqual(get_review_request_fingerprint(review_request1.pk),
+                         fingerprint1)
+
+        review_request1.depends_on.add(review_request2)
+
+        self.assertNotEqual(
+            get_review_request_fingerprint(review_request1.pk),
+            fingerprint1)
+        self.assertNotEqual(
+            get_review_request_fingerprint(review_request2.pk),
+            fingerprint2)
+
+
+class DiffCommentFragmentsTests(SpyAgency, TestCase):
+    """Unit tests for build_diff_comment_fragments."""
+    fixtures = ['test_users', 'test_scmtools']
+
+    def test_build_diff_comment_fragments(self):
+        """Testing build_diff_comment_fragments loads chunks once per file"""
+        review_request = self.create_review_request(create_repository=True,
+                                                    publish=True)
+        diffset = self.create_diffset(review_request)
+        filediff1 = self.create_filediff(diffset, source_file='/foo',
+                                         dest_file='/foo')
+        filediff2 = self.create_filediff(diffset, source_file='/bar',
+                                         dest_file='/bar')
+
+        review = self.create_review(review_request)
+        comment1 = self.create_diff_comment(review, filediff1, first_line=1)
+        comment2 = self.create_diff_comment(review, filediff2, first_line=1)
+        comment3 = self.create_diff_comment(review, filediff1, first_line=10)
+
+        def get_file_chunks_in_ranges(context, filediff, interfilediff,
+                                      ranges):
+            return [[] for i in range(len(ranges))]
+
+        self.spy_on(views.get_file_chunks_in_ranges,
+                    call_fake=get_file_chunks_in_ranges)
+
+        user = User.objects.get(username='doc')
+        had_error, entries = views.build_diff_comment_fragments(
+            [comment1, comment2, comment3], {'user': user})
+
+        self.assertFalse(had_error)
+        self.assertEqual([entry['comment'] for entry in entries],
+                         [comment1, comment2, comment3])
+
+        calls = views.get_file_chunks_in_ranges.spy.calls
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(
+            sorted((call.args[1].pk, call.args[3]) for call in calls),
+            sorted([
+                (filediff1.pk, [(1, 5), (10, 5)]),
+                (filediff2.pk, [(1, 5)]),
+            ]))
+
 
 class DraftTests(TestCase):
     fixtures = ['test_users', 'test_scmtools']
@@ -1568,12 +1841,14 @@ class PostCommitTests(SpyAgency, TestCase):
 
             return commit
 
-        def get_file_exists(repository, path, revision, base_commit_id=None,
-                            request=None):
-            return (path, revision) in [('/readme', 'd6613f5')]
+        def get_files_exist(repository, files, request=None):
+            return [
+                (path, revision) in [('/readme', 'd6613f5')]
+                for path, revision, base_commit_id in files
+            ]
 
         self.spy_on(self.repository.get_change, call_fake=get_change)
-        self.spy_on(self.repository.get_file_exists, call_fake=get_file_exists)
+        self.spy_on(self.repository.get_files_exist, call_fake=get_files_exist)
 
         review_request = ReviewRequest.objects.create(self.user,
                                                       self.repository)
@@ -1603,12 +1878,14 @@ class PostCommitTests(SpyAgency, TestCase):
 
             return commit
 
-        def get_file_exists(repository, path, revision, base_commit_id=None,
-                            request=None):
-            return (path, revision) in [('/readme', 'd6613f5')]
+        def get_files_exist(repository, files, request=None):
+            return [
+                (path, revision) in [('/readme', 'd6613f5')]
+                for path, revision, base_commit_id in files
+            ]
 
         self.spy_on(self.repository.get_change, call_fake=get_change)
-        self.spy_on(self.repository.get_file_exists, call_fake=get_file_exists)
+        self.spy_on(self.repository.get_files_exist, call_fake=get_files_exist)
 
         review_request = ReviewRequest.objects.create(self.user,
                                                       self.repository)
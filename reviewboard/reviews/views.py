@@ -8,6 +8,7 @@ from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
+from django.core.cache import cache
 from django.core.exceptions import MultipleObjectsReturned, ObjectDoesNotExist
 from django.core.urlresolvers import reverse
 from django.db.models import Q
@@ -19,11 +20,12 @@ from django.template.context import RequestContext
 from django.template.loader import render_to_string
 from django.utils import six, timezone
 from django.utils.decorators import method_decorator
-from django.utils.http import http_date
+from django.utils.http import http_date, urlquote_plus
 from django.utils.safestring import mark_safe
 from django.utils.timezone import utc
-from django.utils.translation import ugettext_lazy as _
+from django.utils.translation import get_language, ugettext_lazy as _
 from django.views.generic.list import ListView
+from djblets.cache.backend import make_cache_key
 from djblets.db.query import get_object_or_none
 from djblets.siteconfig.models import SiteConfiguration
 from djblets.util.dates import get_latest_timestamp
@@ -33,16 +35,18 @@ from djblets.util.http import (set_last_modified, get_modified_since,
 
 from reviewboard.accounts.decorators import (check_login_required,
                                              valid_prefs_required)
-from reviewboard.accounts.models import ReviewRequestVisit, Profile
+from reviewboard.accounts.models import ReviewRequestVisit
 from reviewboard.attachments.models import FileAttachment
 from reviewboard.changedescs.models import ChangeDescription
-from reviewboard.diffviewer.diffutils import get_file_chunks_in_range
+from reviewboard.diffviewer.diffutils import get_file_chunks_in_ranges
 from reviewboard.diffviewer.models import DiffSet
 from reviewboard.diffviewer.views import (DiffFragmentView, DiffViewerView,
                                           exception_traceback_string)
 from reviewboard.extensions.hooks import (DashboardHook,
                                           ReviewRequestDetailHook,
                                           UserPageSidebarHook)
+from reviewboard.reviews.activity import (get_review_fingerprints,
+                                          get_review_request_fingerprint)
 from reviewboard.reviews.ui.screenshot import LegacyScreenshotReviewUI
 from reviewboard.reviews.context import (comment_counts,
                                          diffsets_with_comments,
@@ -61,6 +65,7 @@ from reviewboard.reviews.models import (Comment,
                                         Screenshot, ScreenshotComment)
 from reviewboard.scmtools.core import PRE_CREATION
 from reviewboard.scmtools.models import Repository
+from reviewboard.search.indexing import search_review_requests
 from reviewboard.site.models import LocalSite
 from reviewboard.webapi.encoder import status_to_string
 
@@ -128,6 +133,35 @@ def _build_id_map(objects):
     return id_map
 
 
+def _make_entry_cache_key(request, entry, review_request, draft,
+                          review_fingerprints):
+    """Returns the cache key for an entry on the review request page.
+
+    The key covers everything that affects how the entry is rendered for
+    the user viewing the page.
+    """
+    if 'review' in entry:
+        # Reviews show the user's own draft replies, whether the user can
+        # change issue statuses, and the current captions for file
+        # attachments and screenshots.
+        review = entry['review']
+
+        if draft:
+            draft_timestamp = draft.last_updated.isoformat()
+        else:
+            draft_timestamp = ''
+
+        key = 'review:%s:%s:%s:%s:%s' % (
+            review.pk, review_fingerprints[review.pk], request.user.pk,
+            review_request.last_updated.isoformat(), draft_timestamp)
+    else:
+        key = 'changedesc:%s' % entry['changedesc'].pk
+
+    return make_cache_key('review-detail-entry:%s:%d:%s:%s:%s' % (
+        key, entry['collapsed'], get_language(),
+        timezone.get_current_timezone_name(), settings.AJAX_SERIAL))
+
+
 def _query_for_diff(review_request, user, revision, draft):
     """
     Queries for a diff based on several parameters.
@@ -165,36 +199,68 @@ def build_diff_comment_fragments(
     comment_entries = []
     had_error = False
     siteconfig = SiteConfiguration.objects.get_current()
+    domain = Site.objects.get_current().domain
+    domain_method = siteconfig.get("site_domain_method")
+
+    def render_error(comment, e):
+        return exception_traceback_string(None, e, error_template_name, {
+            'comment': comment,
+            'file': {
+                'depot_filename': comment.filediff.source_file,
+                'index': None,
+                'filediff': comment.filediff,
+            },
+            'domain': domain,
+            'domain_method': domain_method,
+        })
+
+    # Comments on the same file share one list of chunks, so group them
+    # up and find the lines for all of them in a single pass.
+    comments = list(comments)
+    comment_groups = {}
 
     for comment in comments:
+        comment_groups.setdefault(
+            (comment.filediff_id, comment.interfilediff_id),
+            []).append(comment)
+
+    comment_chunks = {}
+    error_content = {}
+
+    for group_comments in six.itervalues(comment_groups):
         try:
-            content = render_to_string(comment_template_name, {
-                'comment': comment,
-                'chunks': list(get_file_chunks_in_range(context,
-                                                        comment.filediff,
-                                                        comment.interfilediff,
-                                                        comment.first_line,
-                                                        comment.num_lines)),
-                'domain': Site.objects.get_current().domain,
-                'domain_method': siteconfig.get("site_domain_method"),
-            })
+            chunks_list = get_file_chunks_in_ranges(
+                context,
+                group_comments[0].filediff,
+                group_comments[0].interfilediff,
+                [
+                    (comment.first_line, comment.num_lines)
+                    for comment in group_comments
+                ])
+
+            for comment, chunks in zip(group_comments, chunks_list):
+                comment_chunks[comment.pk] = chunks
         except Exception as e:
-            content = exception_traceback_string(None, e,
-                                                 error_template_name, {
-                'comment': comment,
-                'file': {
-                    'depot_filename': comment.filediff.source_file,
-                    'index': None,
-                    'filediff': comment.filediff,
-                },
-                'domain': Site.objects.get_current().domain,
-                'domain_method': siteconfig.get("site_domain_method"),
-            })
+            for comment in group_comments:
+                error_content[comment.pk] = render_error(comment, e)
 
-            # It's bad that we failed, and we'll return a 500, but we'll
-            # still return content for anything we have. This will prevent any
-            # caching.
+    # If anything failed, we'll return a 500, but we'll still return
+    # content for anything we have. This will prevent any caching.
+    for comment in comments:
+        if comment.pk in error_content:
+            content = error_content[comment.pk]
             had_error = True
+        else:
+            try:
+                content = render_to_string(comment_template_name, {
+                    'comment': comment,
+                    'chunks': comment_chunks[comment.pk],
+                    'domain': domain,
+                    'domain_method': domain_method,
+                })
+            except Exception as e:
+                content = render_error(comment, e)
+                had_error = True
 
         comment_entries.append({
             'comment': comment,
@@ -295,6 +361,29 @@ def review_detail(request,
     if not review_request:
         return response
 
+    last_visited = 0
+
+    if request.user.is_authenticated():
+        # If the review request is public and pending review and if the user
+        # is logged in, mark that they've visited this review request.
+        if review_request.public and review_request.status == "P":
+            visited, visited_is_new = ReviewRequestVisit.objects.get_or_create(
+                user=request.user, review_request=review_request)
+            last_visited = visited.timestamp.replace(tzinfo=utc)
+            visited.timestamp = timezone.now()
+            visited.save()
+
+    # Find out if we can bail early, before loading anything else. The
+    # review request's activity fingerprint changes whenever anything shown
+    # on this page changes, so it's all we need for the ETag.
+    etag = "%s:%s:%s" % (
+        request.user,
+        get_review_request_fingerprint(review_request.pk),
+        settings.AJAX_SERIAL)
+
+    if etag_if_none_match(request, etag):
+        return HttpResponseNotModified()
+
     # The review request detail page needs a lot of data from the database,
     # and going through standard model relations will result in far too many
     # queries. So we'll be optimizing quite a bit by prefetching and
@@ -310,16 +399,10 @@ def review_detail(request,
     reply_timestamps = {}
     reviews_entry_map = {}
     reviews_id_map = {}
-    review_timestamp = 0
 
     # Start by going through all reviews that point to this review request.
     # This includes draft reviews. We'll be separating these into a list of
     # public reviews and a mapping of replies.
-    #
-    # We'll also compute the latest review timestamp early, for the ETag
-    # generation below.
-    #
-    # The second pass will come after the ETag calculation.
     all_reviews = list(review_request.reviews.select_related('user'))
 
     for review in all_reviews:
@@ -347,12 +430,6 @@ def review_detail(request,
                     reply_timestamps[parent_id] = max(
                         reply_timestamps[parent_id],
                         review.timestamp)
-        elif (request.user.is_authenticated() and
-              review.user_id == request.user.pk and
-              (review_timestamp == 0 or review.timestamp > review_timestamp)):
-            # This is the latest draft so far from the current user, so
-            # we'll use this timestamp in the ETag.
-            review_timestamp = review.timestamp
 
         if review.public or (request.user.is_authenticated() and
                              review.user_id == request.user.pk):
@@ -371,26 +448,6 @@ def review_detail(request,
 
     pending_review = review_request.get_pending_review(request.user)
     review_ids = list(reviews_id_map.keys())
-    last_visited = 0
-    starred = False
-
-    if request.user.is_authenticated():
-        # If the review request is public and pending review and if the user
-        # is logged in, mark that they've visited this review request.
-        if review_request.public and review_request.status == "P":
-            visited, visited_is_new = ReviewRequestVisit.objects.get_or_create(
-                user=request.user, review_request=review_request)
-            last_visited = visited.timestamp.replace(tzinfo=utc)
-            visited.timestamp = timezone.now()
-            visited.save()
-
-        try:
-            profile = request.user.get_profile()
-            starred_review_requests = \
-                profile.starred_review_requests.filter(pk=review_request.pk)
-            starred = (starred_review_requests.count() > 0)
-        except Profile.DoesNotExist:
-            pass
 
     draft = review_request.get_draft(request.user)
     review_request_details = draft or review_request
@@ -401,27 +458,11 @@ def review_detail(request,
     for diffset in diffsets:
         diffset_versions[diffset.pk] = diffset.revision
 
-    # Find out if we can bail early. Generate an ETag for this.
     last_activity_time, updated_object = \
         review_request.get_last_activity(diffsets, public_reviews)
 
-    if draft:
-        draft_timestamp = draft.last_updated
-    else:
-        draft_timestamp = ""
-
     blocks = list(review_request.blocks.all())
 
-    etag = "%s:%s:%s:%s:%s:%s:%s:%s" % (
-        request.user, last_activity_time, draft_timestamp,
-        review_timestamp, review_request.last_review_activity_timestamp,
-        ','.join([six.text_type(r.pk) for r in blocks]),
-        int(starred), settings.AJAX_SERIAL
-    )
-
-    if etag_if_none_match(request, etag):
-        return HttpResponseNotModified()
-
     # Get the list of public ChangeDescriptions.
     #
     # We want to get the latest ChangeDescription along with this. This is
@@ -438,9 +479,6 @@ def review_detail(request,
 
     # Now that we have the list of public reviews and all that metadata,
     # being processing them and adding entries for display in the page.
-    #
-    # We do this here and not above because we don't want to build *too* much
-    # before the ETag check.
     for review in public_reviews:
         if not review.is_reply():
             state = ''
@@ -463,6 +501,12 @@ def review_detail(request,
                     'screenshot_comments': [],
                     'file_attachment_comments': []
                 },
+                'issues': {
+                    'total': 0,
+                    'open': 0,
+                    'resolved': 0,
+                    'dropped': 0
+                },
                 'timestamp': review.timestamp,
                 'class': state,
                 'collapsed': state == 'collapsed',
@@ -470,6 +514,51 @@ def review_detail(request,
             reviews_entry_map[review.pk] = entry
             entries.append(entry)
 
+    # Add the entries for the ChangeDescriptions. The details on what
+    # changed will be filled in later, if they're needed.
+    for changedesc in changedescs:
+        # Expand the latest review change
+        state = ''
+
+        # Mark as collapsed if the change is older than a newer change
+        if latest_timestamp and changedesc.timestamp < latest_timestamp:
+            state = 'collapsed'
+
+        entries.append({
+            'changedesc': changedesc,
+            'timestamp': changedesc.timestamp,
+            'class': state,
+            'collapsed': state == 'collapsed',
+        })
+
+    # Sort all the reviews and ChangeDescriptions into a single list, for
+    # display.
+    entries.sort(key=lambda item: item['timestamp'])
+
+    # Public reviews and ChangeDescriptions rarely change once they're
+    # posted, so each entry is cached once it's rendered. Only the entries
+    # that aren't in the cache need to have their comments loaded and be
+    # rendered.
+    review_fingerprints = get_review_fingerprints(
+        list(reviews_entry_map.keys()))
+
+    for entry in entries:
+        entry['cache_key'] = _make_entry_cache_key(
+            request, entry, review_request, draft, review_fingerprints)
+
+    cached_entries = cache.get_many([entry['cache_key'] for entry in entries])
+    uncached_entries = []
+    uncached_review_ids = set()
+
+    for entry in entries:
+        if entry['cache_key'] in cached_entries:
+            entry.update(cached_entries[entry['cache_key']])
+        else:
+            uncached_entries.append(entry)
+
+            if 'review' in entry:
+                uncached_review_ids.add(entry['review'].pk)
+
     # Link up all the review body replies.
     for key, reply_list in (('_body_top_replies', body_top_replies),
                             ('_body_bottom_replies', body_bottom_replies)):
@@ -499,12 +588,14 @@ def review_detail(request,
     has_inactive_file_attachments = False
     has_inactive_screenshots = False
 
-    issues = {
-        'total': 0,
-        'open': 0,
-        'resolved': 0,
-        'dropped': 0
-    }
+    # Only the entries being rendered need their comments. Replies are
+    # shown in the entry for the review they're replying to.
+    rendered_review_ids = [
+        review_id
+        for review_id in review_ids
+        if (review_id in uncached_review_ids or
+            reviews_id_map[review_id].base_reply_to_id in uncached_review_ids)
+    ]
 
     # Get all the comments and attach them to the reviews.
     for model, key, ordering in (
@@ -523,7 +614,15 @@ def review_detail(request,
         related_field = model.review.related.field
         comment_field_name = related_field.m2m_reverse_field_name()
         through = related_field.rel.through
-        q = through.objects.filter(review__in=review_ids).select_related()
+
+        if model is FileAttachmentComment:
+            # The page needs all the file attachment comments, not just
+            # the ones shown in the entries being rendered.
+            q = through.objects.filter(review__in=review_ids)
+        else:
+            q = through.objects.filter(review__in=rendered_review_ids)
+
+        q = q.select_related()
 
         if ordering:
             q = q.order_by(*ordering)
@@ -597,8 +696,9 @@ def review_detail(request,
                 if comment.is_reply():
                     replied_comment = comment_map[comment.reply_to_id]
                     replied_comment._replies.append(comment)
-            elif parent_review.public:
-                # This is a comment on a public review we're going to show.
+            elif (parent_review.public and
+                  obj.review_id in uncached_review_ids):
+                # This is a comment on a public review we're going to render.
                 # Add it to the list.
                 assert obj.review_id in reviews_entry_map
                 entry = reviews_entry_map[obj.review_id]
@@ -607,12 +707,15 @@ def review_detail(request,
                 if comment.issue_opened:
                     status_key = \
                         comment.issue_status_to_string(comment.issue_status)
-                    issues[status_key] += 1
-                    issues['total'] += 1
+                    entry['issues'][status_key] += 1
+                    entry['issues']['total'] += 1
 
-    # Sort all the reviews and ChangeDescriptions into a single list, for
-    # display.
-    for changedesc in changedescs:
+    # Figure out what changed in each ChangeDescription we're rendering.
+    for entry in uncached_entries:
+        if 'changedesc' not in entry:
+            continue
+
+        changedesc = entry['changedesc']
         fields_changed = []
 
         for name, info in six.iteritems(changedesc.fields_changed):
@@ -677,22 +780,7 @@ def review_detail(request,
                 'diff_revision': diff_revision,
             })
 
-        # Expand the latest review change
-        state = ''
-
-        # Mark as collapsed if the change is older than a newer change
-        if latest_timestamp and changedesc.timestamp < latest_timestamp:
-            state = 'collapsed'
-
-        entries.append({
-            'changeinfo': fields_changed,
-            'changedesc': changedesc,
-            'timestamp': changedesc.timestamp,
-            'class': state,
-            'collapsed': state == 'collapsed',
-        })
-
-    entries.sort(key=lambda item: item['timestamp'])
+        entry['changeinfo'] = fields_changed
 
     close_description = ''
     close_description_rich_text = False
@@ -717,7 +805,6 @@ def review_detail(request,
         'close_description': close_description,
         'close_description_rich_text': close_description_rich_text,
         'PRE_CREATION': PRE_CREATION,
-        'issues': issues,
         'has_diffs': (draft and draft.diffset) or len(diffsets) > 0,
         'file_attachments': [file_attachment
                              for file_attachment in file_attachments
@@ -726,8 +813,59 @@ def review_detail(request,
         'screenshots': screenshots,
     })
 
-    response = render_to_response(template_name,
-                                  RequestContext(request, context_data))
+    context = RequestContext(request, context_data)
+
+    # Render the entries that weren't in the cache, and cache them.
+    new_cached_entries = {}
+
+    for entry in uncached_entries:
+        if 'review' in entry:
+            diff_fragments = []
+
+            for comment in entry['comments']['diff_comments']:
+                if comment.interfilediff_id:
+                    filediff_id = '%s-%s' % (comment.filediff_id,
+                                             comment.interfilediff_id)
+                else:
+                    filediff_id = six.text_type(comment.filediff_id)
+
+                diff_fragments.append((comment.pk, filediff_id))
+
+            cached_entry = {
+                'html': render_to_string('reviews/review_entry.html',
+                                         {'entry': entry}, context),
+                'issue_summary_html': render_to_string(
+                    'reviews/review_issue_summary_entry.html',
+                    {'entry': entry}, context),
+                'issues': entry['issues'],
+                'diff_fragments': diff_fragments,
+            }
+        else:
+            cached_entry = {
+                'html': render_to_string('reviews/changedesc_entry.html',
+                                         {'entry': entry}, context),
+            }
+
+        entry.update(cached_entry)
+        new_cached_entries[entry['cache_key']] = cached_entry
+
+    if new_cached_entries:
+        cache.set_many(new_cached_entries, settings.CACHE_EXPIRATION_TIME)
+
+    issues = {
+        'total': 0,
+        'open': 0,
+        'resolved': 0,
+        'dropped': 0
+    }
+
+    for entry in entries:
+        for status_key, count in six.iteritems(entry.get('issues', {})):
+            issues[status_key] += count
+
+    context['issues'] = issues
+
+    response = render_to_response(template_name, context_instance=context)
     set_etag(response, etag)
 
     return response
@@ -749,8 +887,7 @@ def all_review_requests(request,
         request,
         ReviewRequest.objects.public(user=request.user,
                                      status=None,
-                                     local_site=local_site,
-                                     with_counts=True),
+                                     local_site=local_site),
         _("All Review Requests"),
         local_site=local_site)
     return datagrid.render_to_response(template_name)
@@ -857,8 +994,7 @@ def group(request,
         ReviewRequest.objects.to_group(name,
                                        local_site,
                                        user=request.user,
-                                       status=None,
-                                       with_counts=True),
+                                       status=None),
         _("Review requests for %s") % name,
         local_site=local_site)
 
@@ -925,7 +1061,6 @@ def submitter(request,
         ReviewRequest.objects.from_user(username,
                                         user=request.user,
                                         status=None,
-                                        with_counts=True,
                                         local_site=local_site,
                                         filter_private=True),
         _("%s's review requests") % username,
@@ -1209,7 +1344,10 @@ def comment_diff_fragments(
     if not review_request:
         return response
 
-    comments = get_list_or_404(Comment, pk__in=comment_ids.split(","))
+    comments = get_list_or_404(
+        Comment.objects.select_related('filediff__diffset',
+                                       'interfilediff__diffset'),
+        pk__in=comment_ids.split(","))
     latest_timestamp = get_latest_timestamp([comment.timestamp
                                              for comment in comments])
 
@@ -1234,7 +1372,7 @@ def comment_diff_fragments(
         return HttpResponseServerError(page_content)
 
     response = HttpResponse(page_content)
-    set_last_modified(response, comment.timestamp)
+    set_last_modified(response, latest_timestamp)
     response['Expires'] = http_date(time.time() + 60 * 60 * 24 * 365)  # 1 year
     return response
 
@@ -1623,27 +1761,60 @@ def view_screenshot(request,
     return review_ui.render_to_response(request)
 
 
-class ReviewsSearchView(ListView):
-    template_name = 'reviews/search.html'
+class SearchResults(object):
+    """The review requests matching a search.
 
-    def get_context_data(self, **kwargs):
-        query = self.request.GET.get('q', '')
-        context_data = super(ReviewsSearchView, self).get_context_data(**kwargs)
-        context_data.update({
-            'query': query,
-            'extra_query': 'q=%s' % query,
-        })
+    This acts as a sequence of review requests, in the order returned by
+    the search index. Only the review requests in a requested slice are
+    loaded from the database, so this can be paginated cheaply.
+    """
+    def __init__(self, review_request_ids):
+        self.review_request_ids = review_request_ids
 
-        return context_data
+    def __len__(self):
+        return len(self.review_request_ids)
 
-    def get_queryset(self):
-        query = self.request.GET.get('q', '')
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            ids = self.review_request_ids[index]
+        else:
+            ids = [self.review_request_ids[index]]
+
+        review_requests = ReviewRequest.objects.filter(pk__in=ids) \
+            .select_related('submitter')
+        review_requests_by_id = dict(
+            (review_request.pk, review_request)
+            for review_request in review_requests
+        )
+
+        # Anything that has gone away since it was indexed is left out.
+        results = [
+            review_requests_by_id[review_request_id]
+            for review_request_id in ids
+            if review_request_id in review_requests_by_id
+        ]
+
+        if isinstance(index, slice):
+            return results
+        elif results:
+            return results[0]
+        else:
+            raise IndexError(index)
+
+
+class ReviewsSearchView(ListView):
+    template_name = 'reviews/search.html'
+    paginate_by = 25
+
+    def get(self, request, *args, **kwargs):
         siteconfig = SiteConfiguration.objects.get_current()
 
         if not siteconfig.get("search_enable"):
             # FIXME: show something useful
             raise Http404
 
+        query = request.GET.get('q', '')
+
         if not query:
             # FIXME: I'm not super thrilled with this
             return HttpResponseRedirect(reverse("root"))
@@ -1654,50 +1825,40 @@ class ReviewsSearchView(ListView):
                 return HttpResponseRedirect(
                     query_review_request.get_absolute_url())
 
-        import lucene
-        lv = [int(x) for x in lucene.VERSION.split('.')]
-        lucene_is_2x = lv[0] == 2 and lv[1] < 9
-        lucene_is_3x = lv[0] == 3 or (lv[0] == 2 and lv[1] == 9)
+        return super(ReviewsSearchView, self).get(request, *args, **kwargs)
 
-        # We may have already initialized lucene
-        try:
-            lucene.initVM(lucene.CLASSPATH)
-        except ValueError:
-            pass
-
-        index_file = siteconfig.get("search_index_file")
-        if lucene_is_2x:
-            store = lucene.FSDirectory.getDirectory(index_file, False)
-        elif lucene_is_3x:
-            store = lucene.FSDirectory.open(lucene.File(index_file))
+    def get_context_data(self, **kwargs):
+        query = self.request.GET.get('q', '')
+        context_data = super(ReviewsSearchView, self).get_context_data(**kwargs)
+        paginator = context_data['paginator']
+        page = context_data['page_obj']
+        context_data.update({
+            'query': query,
+            'extra_query': 'q=%s' % urlquote_plus(query),
+            'hits': paginator.count,
+            'results_per_page': paginator.per_page,
+            'page': page.number,
+            'pages': paginator.num_pages,
+            'first_on_page': page.start_index(),
+            'last_on_page': page.end_index(),
+            'has_next': page.has_next(),
+            'has_previous': page.has_previous(),
+            'next': page.number + 1,
+            'previous': page.number - 1,
+        })
+
+        return context_data
+
+    def get_queryset(self):
+        local_site_name = self.kwargs.get('local_site_name')
+
+        if local_site_name:
+            local_site = get_object_or_404(LocalSite, name=local_site_name)
         else:
-            assert False
+            local_site = None
 
-        try:
-            searcher = lucene.IndexSearcher(store)
-        except lucene.JavaError as e:
-            # FIXME: show a useful error
-            raise e
-
-        if lucene_is_2x:
-            parser = lucene.QueryParser('text', lucene.StandardAnalyzer())
-            result_ids = [int(lucene.Hit.cast_(hit).getDocument().get('id'))
-                          for hit in searcher.search(parser.parse(query))]
-        elif lucene_is_3x:
-            parser = lucene.QueryParser(
-                lucene.Version.LUCENE_CURRENT, 'text',
-                lucene.StandardAnalyzer(lucene.Version.LUCENE_CURRENT))
-
-            result_ids = [
-                searcher.doc(hit.doc).get('id')
-                for hit in searcher.search(parser.parse(query), 100).scoreDocs
-            ]
-
-        searcher.close()
-
-        return ReviewRequest.objects.filter(
-            id__in=result_ids,
-            local_site__name=self.kwargs['local_site_name'])
+        return SearchResults(search_review_requests(
+            self.request.GET.get('q', ''), local_site))
 
 
 @check_login_required
@@ -139,6 +139,28 @@ class SCMTool(object):
     def get_file(self, path, revision=None):
         raise NotImplementedError
 
+    def get_files(self, files):
+        """Returns the contents of several files at once.
+
+        ``files`` is a list of (path, revision) tuples. This returns a
+        dictionary mapping each (path, revision) tuple that could be fetched
+        to the file's contents. Files that couldn't be fetched are left out,
+        and callers are expected to fall back on get_file for those, so that
+        the proper error is raised.
+
+        By default, this just calls get_file for each file. SCMTools that
+        can fetch several files in one round trip should override this.
+        """
+        results = {}
+
+        for path, revision in files:
+            try:
+                results[(path, revision)] = self.get_file(path, revision)
+            except SCMError:
+                pass
+
+        return results
+
     def file_exists(self, path, revision=HEAD):
         try:
             self.get_file(path, revision)
@@ -146,6 +168,27 @@ class SCMTool(object):
         except FileNotFoundError:
             return False
 
+    def get_files_exist(self, files):
+        """Returns whether several files exist at once.
+
+        ``files`` is a list of (path, revision) tuples. This returns a
+        dictionary mapping each (path, revision) tuple that could be checked
+        to whether the file exists. Files that couldn't be checked are left
+        out, and callers are expected to fall back on file_exists for those.
+
+        By default, this just calls file_exists for each file. SCMTools that
+        can check several files in one round trip should override this.
+        """
+        results = {}
+
+        for path, revision in files:
+            try:
+                results[(path, revision)] = self.file_exists(path, revision)
+            except SCMError:
+                pass
+
+        return results
+
     def parse_diff_revision(self, file_str, revision_str, moved=False):
         raise NotImplementedError
 
@@ -214,12 +257,21 @@ class SCMTool(object):
         return patch
 
     @classmethod
-    def popen(cls, command, local_site_name=None):
+    def popen(cls, command, local_site_name=None, stdin=None,
+              stderr=subprocess.PIPE):
         """Launches an application, capturing output.
 
         This wraps subprocess.Popen to provide some common parameters and
         to pass environment variables that may be needed by rbssh, if
         indirectly invoked.
+
+        If ``stdin`` is provided (usually ``subprocess.PIPE``), it will be
+        used for the process's standard input, allowing callers to keep
+        talking to long-lived processes.
+
+        The process's standard error is captured by default. Callers that
+        won't read it can pass another file for ``stderr`` instead, so that
+        the process can't block on a full pipe.
         """
         env = os.environ.copy()
 
@@ -230,7 +282,8 @@ class SCMTool(object):
 
         return subprocess.Popen(command,
                                 env=env,
-                                stderr=subprocess.PIPE,
+                                stdin=stdin,
+                                stderr=stderr,
                                 stdout=subprocess.PIPE,
                                 close_fds=(os.name != 'nt'))
 
@@ -313,14 +366,7 @@ class SCMClient(object):
         logging.info('Fetching file from %s' % url)
 
         try:
-            request = URLRequest(url)
-
-            if self.username:
-                auth_string = base64.b64encode('%s:%s' % (self.username,
-                                                          self.password))
-                request.add_header('Authorization', 'Basic %s' % auth_string)
-
-            return urlopen(request).read()
+            return urlopen(self._build_http_request(url)).read()
         except HTTPError as e:
             if e.code == 404:
                 logging.error('404')
@@ -334,3 +380,49 @@ class SCMClient(object):
             msg = "Unexpected error fetching file from %s: %s" % (url, e)
             logging.error(msg)
             raise SCMError(msg)
+
+    def get_file_exists_http(self, url, path, revision):
+        """Returns whether a file exists in an HTTP-backed repository.
+
+        This sends a HEAD request for the file, so the contents don't need
+        to be downloaded. If the server doesn't support HEAD requests, the
+        file will be fetched with get_file_http instead.
+        """
+        logging.info('Checking for file at %s' % url)
+
+        try:
+            urlopen(self._build_http_request(url, method='HEAD'))
+
+            return True
+        except HTTPError as e:
+            if e.code == 404:
+                return False
+            elif e.code not in (405, 501):
+                msg = "HTTP error code %d when checking for file at %s: %s" % \
+                      (e.code, url, e)
+                logging.error(msg)
+                raise SCMError(msg)
+        except Exception as e:
+            msg = "Unexpected error checking for file at %s: %s" % (url, e)
+            logging.error(msg)
+            raise SCMError(msg)
+
+        try:
+            self.get_file_http(url, path, revision)
+
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _build_http_request(self, url, method=None):
+        request = URLRequest(url)
+
+        if method:
+            request.get_method = lambda: method
+
+        if self.username:
+            auth_string = base64.b64encode('%s:%s' % (self.username,
+                                                      self.password))
+            request.add_header('Authorization', 'Basic %s' % auth_string)
+
+        return request
@@ -1,8 +1,12 @@
 from __future__ import unicode_literals
 
+import atexit
 import logging
 import os
 import re
+import subprocess
+import threading
+import time
 
 from django.utils.translation import ugettext_lazy as _
 from djblets.util.compat import six
@@ -90,6 +94,21 @@ class GitTool(SCMTool):
 
         return self.client.get_file(path, revision)
 
+    def get_files(self, files):
+        results = {}
+        to_fetch = []
+
+        for path, revision in files:
+            if revision == PRE_CREATION:
+                results[(path, revision)] = ""
+            else:
+                to_fetch.append((path, revision))
+
+        if to_fetch:
+            results.update(self.client.get_files(to_fetch))
+
+        return results
+
     def file_exists(self, path, revision=HEAD):
         if revision == PRE_CREATION:
             return False
@@ -99,6 +118,21 @@ class GitTool(SCMTool):
         except (FileNotFoundError, InvalidRevisionFormatError):
             return False
 
+    def get_files_exist(self, files):
+        results = {}
+        to_check = []
+
+        for path, revision in files:
+            if revision == PRE_CREATION:
+                results[(path, revision)] = False
+            else:
+                to_check.append((path, revision))
+
+        if to_check:
+            results.update(self.client.get_files_exist(to_check))
+
+        return results
+
     def parse_diff_revision(self, file_str, revision_str, moved=False,
                             *args, **kwargs):
         revision = revision_str
@@ -152,14 +186,14 @@ class GitDiffParser(DiffParser):
     """
     pre_creation_regexp = re.compile("^0+$")
 
-    def parse(self):
+    def iter_files(self):
         """
-        Parses the diff, returning a list of File objects representing each
-        file in the diff.
+        Parses the diff, yielding File objects representing each file in
+        the diff as they're found.
         """
-        self.files = []
         i = 0
-        preamble = ''
+        preamble = []
+        found_files = False
 
         while i < len(self.lines):
             next_i, file_info, new_diff = self._parse_diff(i)
@@ -168,25 +202,25 @@ class GitDiffParser(DiffParser):
                 self._ensure_file_has_required_fields(file_info)
 
                 if preamble:
-                    file_info.data = preamble + file_info.data
-                    preamble = ''
+                    file_info.prepend_data(self.join_data(preamble))
+                    preamble = []
 
-                self.files.append(file_info)
+                found_files = True
+
+                yield file_info
             elif new_diff:
                 # We found a diff, but it was empty and has no file entry.
                 # Reset the preamble.
-                preamble = ''
+                preamble = []
             else:
-                preamble += self.lines[i] + '\n'
+                preamble += [self.lines[i], self.newline]
 
             i = next_i
 
-        if not self.files and preamble.strip() != '':
+        if not found_files and self.join_data(preamble).strip():
             # This is probably not an actual git diff file.
             raise DiffParserError('This does not appear to be a git diff', 0)
 
-        return self.files
-
     def _parse_diff(self, linenum):
         """Parses out one file from a Git diff
 
@@ -209,7 +243,7 @@ class GitDiffParser(DiffParser):
 
         # Now we have a diff we are going to use so get the filenames + commits
         file_info = File()
-        file_info.data = self.lines[linenum] + "\n"
+        self.append_lines(file_info, linenum)
         file_info.binary = False
         diff_line = self.lines[linenum].split()
 
@@ -226,20 +260,17 @@ class GitDiffParser(DiffParser):
         # Parse the extended header to save the new file, deleted file,
         # mode change, file move, and index.
         if self._is_new_file(linenum):
-            file_info.data += self.lines[linenum] + "\n"
+            self.append_lines(file_info, linenum)
             linenum += 1
         elif self._is_deleted_file(linenum):
-            file_info.data += self.lines[linenum] + "\n"
+            self.append_lines(file_info, linenum)
             linenum += 1
             file_info.deleted = True
         elif self._is_mode_change(linenum):
-            file_info.data += self.lines[linenum] + "\n"
-            file_info.data += self.lines[linenum + 1] + "\n"
+            self.append_lines(file_info, linenum, 2)
             linenum += 2
         elif self._is_moved_file(linenum):
-            file_info.data += self.lines[linenum] + "\n"
-            file_info.data += self.lines[linenum + 1] + "\n"
-            file_info.data += self.lines[linenum + 2] + "\n"
+            self.append_lines(file_info, linenum, 3)
             linenum += 3
             file_info.moved = True
 
@@ -260,7 +291,7 @@ class GitDiffParser(DiffParser):
             if self.pre_creation_regexp.match(file_info.origInfo):
                 file_info.origInfo = PRE_CREATION
 
-            file_info.data += self.lines[linenum] + "\n"
+            self.append_lines(file_info, linenum)
             linenum += 1
 
         # Get the changes
@@ -269,7 +300,7 @@ class GitDiffParser(DiffParser):
                 break
             elif self._is_binary_patch(linenum):
                 file_info.binary = True
-                file_info.data += self.lines[linenum] + "\n"
+                self.append_lines(file_info, linenum)
                 empty_change = False
                 linenum += 1
                 break
@@ -277,8 +308,7 @@ class GitDiffParser(DiffParser):
                 if self.lines[linenum].split()[1] == "/dev/null":
                     file_info.origInfo = PRE_CREATION
 
-                file_info.data += self.lines[linenum] + '\n'
-                file_info.data += self.lines[linenum + 1] + '\n'
+                self.append_lines(file_info, linenum, 2)
                 linenum += 2
             else:
                 empty_change = False
@@ -339,6 +369,253 @@ class GitDiffParser(DiffParser):
                 setattr(file_info, attr, '')
 
 
+class GitCatFileProcess(object):
+    """A long-lived git-cat-file(1) process for a local repository.
+
+    This wraps a ``git cat-file --batch`` or ``git cat-file --batch-check``
+    process, sending object names over stdin and reading the results back
+    from stdout. This avoids forking a new process for every file or
+    existence check.
+
+    Requests are serialized through a lock, so only one request is ever
+    in flight on the pipes at a time. If the process dies, it will be
+    restarted on the next request.
+    """
+    def __init__(self, git_dir, batch_option, local_site_name=None):
+        assert batch_option in ('--batch', '--batch-check')
+
+        self.git_dir = git_dir
+        self.batch_option = batch_option
+        self.local_site_name = local_site_name
+        self.lock = threading.Lock()
+        self.last_used = time.time()
+        self._process = None
+        self._stderr = None
+
+    def query(self, object_name):
+        """Looks up an object in the repository.
+
+        This returns a tuple of (type, size, contents). The contents will
+        be None for ``--batch-check`` processes. If the object doesn't
+        exist, this returns None.
+        """
+        if '\n' in object_name:
+            return None
+
+        with self.lock:
+            self.last_used = time.time()
+
+            try:
+                return self._query(object_name)
+            except (IOError, OSError, ValueError) as e:
+                # The process likely crashed or was killed. Start a new one
+                # and try once more.
+                logging.warning('git cat-file process for %s failed (%s). '
+                                'Restarting it.', self.git_dir, e)
+                self._close()
+
+                return self._query(object_name)
+
+    def query_many(self, object_names):
+        """Looks up several objects in the repository at once.
+
+        This returns a list of results in the same order as object_names,
+        each in the form returned by query().
+
+        All the requests are written to the process up-front by a separate
+        thread while the results are read back, so that neither side can
+        block on a full pipe.
+        """
+        results = [None] * len(object_names)
+        requests = [
+            (i, object_name)
+            for i, object_name in enumerate(object_names)
+            if '\n' not in object_name
+        ]
+
+        if not requests:
+            return results
+
+        with self.lock:
+            self.last_used = time.time()
+
+            try:
+                self._query_many(requests, results)
+            except (IOError, OSError, ValueError) as e:
+                logging.warning('git cat-file process for %s failed (%s). '
+                                'Restarting it.', self.git_dir, e)
+                self._close()
+
+                self._query_many(requests, results)
+
+        return results
+
+    def is_running(self):
+        """Returns whether the underlying process is currently running."""
+        return self._process is not None and self._process.poll() is None
+
+    def close(self):
+        """Shuts down the process."""
+        with self.lock:
+            self._close()
+
+    def _query(self, object_name):
+        p = self._get_process()
+        p.stdin.write(object_name.encode('utf-8') + b'\n')
+        p.stdin.flush()
+
+        return self._read_result(p)
+
+    def _query_many(self, requests, results):
+        p = self._get_process()
+        data = b''.join(
+            object_name.encode('utf-8') + b'\n'
+            for i, object_name in requests
+        )
+
+        def write_requests():
+            try:
+                p.stdin.write(data)
+                p.stdin.flush()
+            except (IOError, OSError, ValueError):
+                # The reader will notice that the process went away.
+                pass
+
+        writer = threading.Thread(target=write_requests)
+        writer.daemon = True
+        writer.start()
+
+        try:
+            for i, object_name in requests:
+                results[i] = self._read_result(p)
+        except:
+            # Make sure the writer isn't left blocked on a full pipe.
+            self._close()
+            raise
+        finally:
+            writer.join()
+
+    def _read_result(self, p):
+        header = p.stdout.readline()
+
+        if not header:
+            raise IOError('git cat-file exited unexpectedly')
+
+        header = header.rstrip(b'\n')
+
+        if header.endswith(b' missing') or header.endswith(b' ambiguous'):
+            return None
+
+        sha1, obj_type, size = header.split(b' ')
+        size = int(size)
+        contents = None
+
+        if self.batch_option == '--batch':
+            contents = p.stdout.read(size)
+
+            # Each object's contents is followed by a newline.
+            if len(contents) != size or p.stdout.read(1) != b'\n':
+                raise IOError('Unexpected end of output from git cat-file')
+
+        return obj_type.decode('ascii'), size, contents
+
+    def _get_process(self):
+        if not self.is_running():
+            self._close()
+
+            # Nothing reads from stderr while the process is running, so
+            # it's thrown away rather than left to fill up a pipe.
+            self._stderr = open(os.devnull, 'wb')
+            self._process = SCMTool.popen(
+                ['git', '--git-dir=%s' % self.git_dir, 'cat-file',
+                 self.batch_option],
+                local_site_name=self.local_site_name,
+                stdin=subprocess.PIPE,
+                stderr=self._stderr)
+
+        return self._process
+
+    def _close(self):
+        p = self._process
+        self._process = None
+
+        if self._stderr is not None:
+            self._stderr.close()
+            self._stderr = None
+
+        if p is None:
+            return
+
+        try:
+            p.stdin.close()
+        except (IOError, OSError):
+            pass
+
+        if p.poll() is None:
+            try:
+                p.kill()
+            except OSError:
+                pass
+
+        p.wait()
+        p.stdout.close()
+
+
+class GitCatFileProcessPool(object):
+    """A pool of git-cat-file(1) processes, shared by all GitClients.
+
+    There's at most one process per repository, batch mode and Local Site.
+    Processes that haven't been used in ``idle_timeout`` seconds are shut
+    down the next time the pool is accessed.
+    """
+    idle_timeout = 300
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._processes = {}
+
+    def get_process(self, git_dir, batch_option, local_site_name=None):
+        """Returns a process for the given repository and batch mode."""
+        key = (git_dir, batch_option, local_site_name)
+
+        with self._lock:
+            self._close_idle()
+
+            try:
+                process = self._processes[key]
+            except KeyError:
+                process = GitCatFileProcess(git_dir, batch_option,
+                                            local_site_name)
+                self._processes[key] = process
+
+        return process
+
+    def close_all(self):
+        """Shuts down all processes in the pool."""
+        with self._lock:
+            processes = list(six.itervalues(self._processes))
+            self._processes = {}
+
+        for process in processes:
+            process.close()
+
+    def _close_idle(self):
+        cutoff = time.time() - self.idle_timeout
+
+        for key, process in list(six.iteritems(self._processes)):
+            # A process that's currently handling a request isn't idle.
+            if process.last_used < cutoff and process.lock.acquire(False):
+                try:
+                    del self._processes[key]
+                    process._close()
+                finally:
+                    process.lock.release()
+
+
+cat_file_pool = GitCatFileProcessPool()
+atexit.register(cat_file_pool.close_all)
+
+
 class GitClient(SCMClient):
     FULL_SHA1_LENGTH = 40
 
@@ -402,22 +679,100 @@ class GitClient(SCMClient):
         else:
             return self._cat_file(path, revision, "blob")
 
+    def get_files(self, files):
+        """Returns the contents of several files at once.
+
+        For local repositories, all the blobs are fetched through a single
+        round trip to ``git cat-file --batch``. Files that couldn't be found
+        are left out of the results.
+        """
+        results = {}
+
+        if self.raw_file_url:
+            for path, revision in files:
+                try:
+                    results[(path, revision)] = self.get_file(path, revision)
+                except SCMError:
+                    pass
+
+            return results
+
+        commits = []
+        keys = []
+
+        for path, revision in files:
+            try:
+                commits.append(self._resolve_head(revision, path))
+                keys.append((path, revision))
+            except SCMError:
+                pass
+
+        process = cat_file_pool.get_process(self.git_dir, '--batch',
+                                            self.local_site_name)
+
+        try:
+            query_results = process.query_many(commits)
+        except (IOError, OSError, ValueError) as e:
+            raise SCMError(six.text_type(e))
+
+        for key, result in zip(keys, query_results):
+            if result is not None and result[0] == 'blob':
+                results[key] = result[2]
+
+        return results
+
     def get_file_exists(self, path, revision):
         if self.raw_file_url:
             try:
-                # We want to make sure we can access the file successfully,
-                # without any HTTP errors. A successful access means the file
-                # exists. The contents themselves are meaningless, so ignore
-                # them. If we do successfully get the file without triggering
-                # any sort of exception, then the file exists.
-                self.get_file(path, revision)
-                return True
+                self.validate_sha1_format(path, revision)
+
+                return self.get_file_exists_http(
+                    self._build_raw_url(path, revision), path, revision)
             except Exception:
                 return False
         else:
             contents = self._cat_file(path, revision, "-t")
             return contents and contents.strip() == "blob"
 
+    def get_files_exist(self, files):
+        """Returns whether several files exist at once.
+
+        For local repositories, all the files are checked through a single
+        round trip to ``git cat-file --batch-check``. Files that couldn't be
+        checked are left out of the results.
+        """
+        results = {}
+
+        if self.raw_file_url:
+            for path, revision in files:
+                results[(path, revision)] = \
+                    self.get_file_exists(path, revision)
+
+            return results
+
+        commits = []
+        keys = []
+
+        for path, revision in files:
+            try:
+                commits.append(self._resolve_head(revision, path))
+                keys.append((path, revision))
+            except SCMError:
+                pass
+
+        process = cat_file_pool.get_process(self.git_dir, '--batch-check',
+                                            self.local_site_name)
+
+        try:
+            query_results = process.query_many(commits)
+        except (IOError, OSError, ValueError) as e:
+            raise SCMError(six.text_type(e))
+
+        for key, result in zip(keys, query_results):
+            results[key] = (result is not None and result[0] == 'blob')
+
+        return results
+
     def validate_sha1_format(self, path, sha1):
         """Validates that a SHA1 is of the right length for this repository."""
         if self.raw_file_url and len(sha1) != self.FULL_SHA1_LENGTH:
@@ -436,28 +791,45 @@ class GitClient(SCMClient):
 
     def _cat_file(self, path, revision, option):
         """
-        Call git-cat-file(1) to get content or type information for a
+        Query git-cat-file(1) to get content or type information for a
         repository object.
 
-        If called with just "commit", gets the content of a blob (or
-        raises an exception if the commit is not a blob).
+        If called with "blob", gets the content of a blob (or raises an
+        exception if the commit is not a blob).
 
-        Otherwise, "option" can be used to pass a switch to git-cat-file,
-        e.g. to test or existence or get the type of "commit".
+        If called with "-t", gets the type of the object, which can be used
+        to test for existence.
+
+        The lookups are sent to long-lived ``git cat-file --batch`` and
+        ``git cat-file --batch-check`` processes shared through
+        ``cat_file_pool``, rather than forking a new process each time.
         """
+        assert option in ('blob', '-t')
+
         commit = self._resolve_head(revision, path)
 
-        p = self._run_git(['--git-dir=%s' % self.git_dir, 'cat-file',
-                           option, commit])
-        contents = p.stdout.read()
-        errmsg = six.text_type(p.stderr.read())
-        failure = p.wait()
+        if option == 'blob':
+            batch_option = '--batch'
+        else:
+            batch_option = '--batch-check'
 
-        if failure:
-            if errmsg.startswith("fatal: Not a valid object name"):
-                raise FileNotFoundError(commit)
-            else:
-                raise SCMError(errmsg)
+        process = cat_file_pool.get_process(self.git_dir, batch_option,
+                                            self.local_site_name)
+
+        try:
+            result = process.query(commit)
+        except (IOError, OSError, ValueError) as e:
+            raise SCMError(six.text_type(e))
+
+        if result is None:
+            raise FileNotFoundError(commit)
+
+        obj_type, size, contents = result
+
+        if option == '-t':
+            return obj_type
+        elif obj_type != 'blob':
+            raise SCMError('%s is a %s, not a blob' % (commit, obj_type))
 
         return contents
 
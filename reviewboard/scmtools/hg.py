@@ -1,7 +1,10 @@
 from __future__ import unicode_literals
 
 import logging
+import os
 import re
+import shutil
+import tempfile
 
 from djblets.util.compat import six
 from djblets.util.compat.six.moves.urllib.parse import quote as urllib_quote
@@ -37,6 +40,21 @@ class HgTool(SCMTool):
     def get_file(self, path, revision=HEAD):
         return self.client.cat_file(path, six.text_type(revision))
 
+    def get_files(self, files):
+        if not isinstance(self.client, HgClient):
+            return super(HgTool, self).get_files(files)
+
+        keys = dict(
+            ((path, six.text_type(revision)), (path, revision))
+            for path, revision in files
+        )
+        results = self.client.cat_files(list(keys))
+
+        return dict(
+            (keys[key], data)
+            for key, data in six.iteritems(results)
+        )
+
     def parse_diff_revision(self, file_str, revision_str, *args, **kwargs):
         revision = revision_str
         if file_str == "/dev/null":
@@ -250,6 +268,51 @@ class HgClient(SCMClient):
 
         raise FileNotFoundError(path, rev)
 
+    def cat_files(self, files):
+        """Returns the contents of several files at once.
+
+        ``files`` is a list of (path, rev) tuples. The files are fetched
+        with one ``hg cat`` per revision, writing each file out to a
+        temporary directory. This returns a dictionary mapping each
+        (path, rev) tuple that could be fetched to the file's contents.
+        """
+        paths_by_rev = {}
+
+        for path, rev in files:
+            if path and not path.startswith('/') and rev != PRE_CREATION:
+                paths_by_rev.setdefault(rev, []).append(path)
+
+        results = {}
+
+        for rev, paths in six.iteritems(paths_by_rev):
+            if rev == HEAD:
+                hg_rev = 'tip'
+            else:
+                hg_rev = rev
+
+            tempdir = tempfile.mkdtemp(prefix='reviewboard-hg.')
+
+            try:
+                p = self._run_hg(['cat', '--rev', hg_rev,
+                                  '--output', os.path.join(tempdir, '%p')] +
+                                 paths)
+                p.stdout.read()
+
+                # Mercurial exits with an error if any of the files were
+                # missing, but will still have written out the rest.
+                p.wait()
+
+                for path in paths:
+                    filename = os.path.join(tempdir, path)
+
+                    if os.path.isfile(filename):
+                        with open(filename, 'rb') as f:
+                            results[(path, rev)] = f.read()
+            finally:
+                shutil.rmtree(tempdir, ignore_errors=True)
+
+        return results
+
     def _calculate_default_args(self):
         self.default_args = [
             '--noninteractive',
@@ -3,6 +3,8 @@ from __future__ import unicode_literals
 from django.db.models import Manager, Q
 from django.db.models.query import QuerySet
 
+from reviewboard.accounts.access import get_user_access
+
 
 _TOOL_CACHE = {}
 
@@ -62,10 +64,9 @@ class RepositoryManager(Manager):
                 q = q & Q(visible=True)
 
             if user.is_authenticated():
-                q = q | (Q(users__pk=user.pk) |
-                         Q(review_groups__users=user.pk))
+                q = q | Q(pk__in=get_user_access(user).repository_ids)
 
-            qs = self.filter(q).distinct()
+            qs = self.filter(q)
 
         return qs.filter(local_site=local_site)
 
@@ -1,5 +1,9 @@
 from __future__ import unicode_literals
 
+import logging
+import zlib
+
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
@@ -10,8 +14,12 @@ from django.utils.translation import ugettext_lazy as _
 from djblets.cache.backend import cache_memoize, make_cache_key
 from djblets.db.fields import JSONField
 from djblets.log import log_timed
+from djblets.util.compat import six
+from djblets.util.compat.six.moves import cPickle as pickle
 
+from reviewboard.accounts.access import get_user_access
 from reviewboard.hostingsvcs.models import HostingServiceAccount
+from reviewboard.scmtools.errors import SCMError
 from reviewboard.scmtools.managers import RepositoryManager, ToolManager
 from reviewboard.scmtools.signals import (checked_file_exists,
                                           checking_file_exists,
@@ -216,6 +224,29 @@ class Repository(models.Model):
                                              request)],
             large_data=True)[0]
 
+    def get_files(self, files, request=None):
+        """Returns several files from the repository at once.
+
+        ``files`` is a list of (path, revision, base_commit_id) tuples. This
+        returns a list of the files' contents, in the same order.
+
+        Any files already in the cache are fetched from it in one go. The
+        rest are fetched from the repository together, if the SCMTool
+        supports it, and then cached. Any file that can't be fetched will
+        raise the same error that get_file would.
+        """
+        files = [tuple(f) for f in files]
+        results = self._get_cached_files(files)
+        missing = [f for f in files if f not in results]
+
+        if missing:
+            results.update(self._get_files_uncached(missing, request))
+
+        return [
+            results[f] if f in results else self.get_file(*f, request=request)
+            for f in files
+        ]
+
     def get_file_exists(self, path, revision, base_commit_id=None,
                         request=None):
         """Returns whether or not a file exists in the repository.
@@ -240,6 +271,31 @@ class Repository(models.Model):
 
         return exists
 
+    def get_files_exist(self, files, request=None):
+        """Returns whether several files exist in the repository.
+
+        ``files`` is a list of (path, revision, base_commit_id) tuples. This
+        returns a list of booleans, in the same order.
+
+        Any results already in the cache are fetched from it in one go. The
+        rest are checked together, if the hosting service or SCMTool
+        supports it, and files that exist are cached in the same way as
+        get_file_exists does. Files that can't be checked together fall back
+        on get_file_exists.
+        """
+        files = [tuple(f) for f in files]
+        results = self._get_cached_files_exist(files)
+        missing = [f for f in files if f not in results]
+
+        if missing:
+            results.update(self._get_files_exist_uncached(missing, request))
+
+        return [
+            (results[f] if f in results
+             else self.get_file_exists(*f, request=request))
+            for f in files
+        ]
+
     def get_branches(self):
         """Returns a list of branches."""
         hosting_service = self.hosting_service
@@ -307,8 +363,7 @@ class Repository(models.Model):
 
         return (self.public or
                 (user.is_authenticated() and
-                 (self.review_groups.filter(users__pk=user.pk).count() > 0 or
-                  self.users.filter(pk=user.pk).count() > 0)))
+                 self.pk in get_user_access(user).repository_ids))
 
     def is_mutable_by(self, user):
         """Returns whether or not the user can modify or delete the repository.
@@ -376,6 +431,205 @@ class Repository(models.Model):
 
         return data
 
+    def _get_cached_files(self, files):
+        """Internal function for fetching several files from the cache.
+
+        This reads the entries that get_file stores with
+        cache_memoize(large_data=True), but with one cache request for all
+        the chunk counts and one for all the chunks, rather than at least
+        two per file. djblets has no public way to fetch several large
+        entries at once, so this has to follow the way cache_memoize
+        stores them. Any entry that can't be read this way is left out,
+        and get_files will fetch and store the file again.
+
+        This returns a dictionary mapping each (path, revision,
+        base_commit_id) tuple found in the cache to the file's contents.
+        """
+        keys = dict(
+            (f, self._make_file_cache_key(*f))
+            for f in files
+        )
+        chunk_counts = cache.get_many([
+            make_cache_key(key)
+            for key in six.itervalues(keys)
+        ])
+        chunk_keys = {}
+
+        for f, key in six.iteritems(keys):
+            try:
+                chunk_count = int(chunk_counts[make_cache_key(key)])
+            except (KeyError, TypeError, ValueError):
+                continue
+
+            chunk_keys[f] = [
+                make_cache_key('%s-%d' % (key, i))
+                for i in range(chunk_count)
+            ]
+
+        if not chunk_keys:
+            return {}
+
+        chunks = cache.get_many([
+            chunk_key
+            for f_chunk_keys in six.itervalues(chunk_keys)
+            for chunk_key in f_chunk_keys
+        ])
+        results = {}
+
+        for f, f_chunk_keys in six.iteritems(chunk_keys):
+            try:
+                data = b''.join(
+                    chunks[chunk_key][0]
+                    for chunk_key in f_chunk_keys
+                )
+                results[f] = pickle.loads(zlib.decompress(data))[0]
+            except Exception as e:
+                # Leave this to get_file, which will fetch and store it again.
+                logging.debug('Unable to load cached file %s: %s',
+                              keys[f], e)
+
+        return results
+
+    def _get_files_uncached(self, files, request):
+        """Internal function for fetching several uncached files.
+
+        This is called by get_files for any files that weren't already in
+        the cache. If the repository isn't backed by a hosting service, the
+        files are fetched through a single call to the SCMTool's get_files.
+        Each fetched file is stored in the cache in the same way as get_file
+        does.
+
+        Files that couldn't be fetched are left out of the results.
+        """
+        if self.hosting_service:
+            return {}
+
+        for path, revision, base_commit_id in files:
+            fetching_file.send(sender=self,
+                               path=path,
+                               revision=revision,
+                               base_commit_id=base_commit_id,
+                               request=request)
+
+        log_timer = log_timed("Fetching %d files from %s"
+                              % (len(files), self),
+                              request=request)
+
+        try:
+            tool_results = self.get_scmtool().get_files([
+                (path, revision)
+                for path, revision, base_commit_id in files
+            ])
+        except SCMError as e:
+            logging.warning('Unable to fetch files from %s in a batch: %s',
+                            self, e)
+            tool_results = {}
+
+        log_timer.done()
+
+        results = {}
+
+        for f in files:
+            path, revision, base_commit_id = f
+
+            try:
+                data = tool_results[(path, revision)]
+            except KeyError:
+                continue
+
+            fetched_file.send(sender=self,
+                              path=path,
+                              revision=revision,
+                              base_commit_id=base_commit_id,
+                              request=request,
+                              data=data)
+
+            cache_memoize(self._make_file_cache_key(*f),
+                          lambda: [data],
+                          large_data=True,
+                          force_overwrite=True)
+            results[f] = data
+
+        return results
+
+    def _get_cached_files_exist(self, files):
+        """Internal function for checking several files in the cache.
+
+        A file is known to exist if its file-exists entry is cached, or if
+        get_file has cached its contents. This returns a dictionary mapping
+        each (path, revision, base_commit_id) tuple known to exist to True.
+        """
+        keys = {}
+
+        for f in files:
+            keys[make_cache_key(self._make_file_exists_cache_key(*f))] = f
+            keys[make_cache_key(self._make_file_cache_key(*f))] = f
+
+        return dict(
+            (keys[key], True)
+            for key in cache.get_many(list(keys.keys()))
+        )
+
+    def _get_files_exist_uncached(self, files, request):
+        """Internal function for checking several uncached files.
+
+        This is called by get_files_exist for any files that weren't already
+        known to exist. The files are handed to the hosting service or
+        SCMTool in one call, and the files found to exist are cached.
+
+        Files that couldn't be checked are left out of the results.
+        """
+        for path, revision, base_commit_id in files:
+            checking_file_exists.send(sender=self,
+                                      path=path,
+                                      revision=revision,
+                                      base_commit_id=base_commit_id,
+                                      request=request)
+
+        log_timer = log_timed("Checking %d files in %s" % (len(files), self),
+                              request=request)
+
+        hosting_service = self.hosting_service
+
+        try:
+            if hosting_service:
+                results = hosting_service.get_files_exist(self, files)
+            else:
+                tool_results = self.get_scmtool().get_files_exist([
+                    (path, revision)
+                    for path, revision, base_commit_id in files
+                ])
+                results = dict(
+                    (f, tool_results[f[:2]])
+                    for f in files
+                    if f[:2] in tool_results
+                )
+        except SCMError as e:
+            logging.warning('Unable to check files in %s in a batch: %s',
+                            self, e)
+            results = {}
+
+        log_timer.done()
+
+        for f, exists in six.iteritems(results):
+            path, revision, base_commit_id = f
+            checked_file_exists.send(sender=self,
+                                     path=path,
+                                     revision=revision,
+                                     base_commit_id=base_commit_id,
+                                     request=request,
+                                     exists=exists)
+
+        cache.set_many(
+            dict(
+                (make_cache_key(self._make_file_exists_cache_key(*f)), '1')
+                for f, exists in six.iteritems(results)
+                if exists
+            ),
+            settings.CACHE_EXPIRATION_TIME)
+
+        return results
+
     def _get_file_exists_uncached(self, path, revision, base_commit_id,
                                   request):
         """Internal function for checking that a file exists.
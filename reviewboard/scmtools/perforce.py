@@ -233,6 +233,90 @@ class PerforceClient(object):
         """
         return self._run_worker(lambda: self._get_file(path, revision))
 
+    def _get_files(self, files):
+        results = {}
+        depot_paths = []
+        pending = {}
+
+        for path, revision in files:
+            if revision == PRE_CREATION:
+                results[(path, revision)] = ''
+                continue
+            elif revision == HEAD:
+                depot_paths.append(path)
+            else:
+                depot_paths.append('%s#%s' % (path, revision))
+
+            pending.setdefault(path, []).append((path, revision))
+
+        if not depot_paths:
+            return results
+
+        # Without -q, each file's contents are preceded by a dictionary
+        # describing which file and revision they belong to. Files that
+        # don't exist only produce warnings, and are left out.
+        res = self.p4.run_print(*depot_paths)
+
+        for i in range(0, len(res) - 1, 2):
+            info = res[i]
+            keys = pending.get(info.get('depotFile'), [])
+
+            for key in keys:
+                if key[1] == HEAD or key[1] == info.get('rev'):
+                    results[key] = res[i + 1]
+                    keys.remove(key)
+                    break
+
+        return results
+
+    def get_files(self, files):
+        """
+        Get the contents of several files, using a single connection and
+        a single 'p4 print'.
+        """
+        return self._run_worker(lambda: self._get_files(files))
+
+    def _get_files_exist(self, files):
+        results = {}
+        depot_paths = []
+        pending = {}
+
+        for path, revision in files:
+            if revision == PRE_CREATION:
+                results[(path, revision)] = False
+                continue
+            elif revision == HEAD:
+                depot_paths.append(path)
+            else:
+                depot_paths.append('%s#%s' % (path, revision))
+
+            pending.setdefault(path, []).append((path, revision))
+
+        if not depot_paths:
+            return results
+
+        # Files that don't exist at all only produce warnings, and are left
+        # out of the results. The head fields describe the file as of the
+        # requested revision, so a deleted file will have a delete action.
+        for info in self.p4.run_fstat(*depot_paths):
+            keys = pending.get(info.get('depotFile'), [])
+
+            for key in keys:
+                if key[1] == HEAD or key[1] == info.get('headRev'):
+                    results[key] = (info.get('headAction') not in
+                                    ('delete', 'move/delete'))
+                    keys.remove(key)
+                    break
+
+        return results
+
+    def get_files_exist(self, files):
+        """
+        Check whether several files exist, using a single connection and
+        a single 'p4 fstat'.
+        """
+        return self._run_worker(lambda: self._get_files_exist(files))
+
     def _get_files_at_revision(self, revision_str):
         return self.p4.run_files(revision_str)
 
@@ -335,6 +419,12 @@ class PerforceTool(SCMTool):
     def get_file(self, path, revision=HEAD):
         return self.client.get_file(path, revision)
 
+    def get_files(self, files):
+        return self.client.get_files(files)
+
+    def get_files_exist(self, files):
+        return self.client.get_files_exist(files)
+
     def parse_diff_revision(self, file_str, revision_str, *args, **kwargs):
         # Perforce has this lovely idiosyncracy that diffs show revision #1 both
         # for pre-creation and when there's an actual revision.
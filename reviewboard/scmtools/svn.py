@@ -4,14 +4,15 @@ from __future__ import unicode_literals
 import datetime
 import logging
 import os
+import posixpath
 import re
 import weakref
 from shutil import rmtree
 from tempfile import mkdtemp
 
 try:
-    from pysvn import (ClientError, Revision, opt_revision_kind,
-                       SVN_DIRENT_CREATED_REV)
+    from pysvn import (ClientError, Revision, node_kind, opt_revision_kind,
+                       SVN_DIRENT_CREATED_REV, SVN_DIRENT_KIND)
 except ImportError:
     pass
 from django.core.cache import cache
@@ -201,6 +202,59 @@ class SVNTool(SCMTool):
 
         return self._do_on_path(get_file_data, path, revision)
 
+    def get_files_exist(self, files):
+        """Returns whether several files exist at once.
+
+        Rather than checking each file separately, this lists each
+        directory containing the files once per revision. A diff touching
+        many files in a few directories only needs a few requests.
+
+        Files that aren't found in the listings are left out of the
+        results, so that file_exists can make the final call on them.
+        """
+        def list_dir(normpath, normrev):
+            return self.client.list(normpath,
+                                    peg_revision=normrev,
+                                    revision=normrev,
+                                    dirent_fields=SVN_DIRENT_KIND,
+                                    recurse=False)
+
+        results = {}
+        dirs = {}
+
+        for path, revision in files:
+            if not path or revision == PRE_CREATION:
+                results[(path, revision)] = False
+                continue
+
+            dirname, basename = posixpath.split(path)
+
+            if not dirname.strip('/'):
+                dirname = self.repopath
+
+            dirs.setdefault((dirname, revision), []).append(
+                (basename, (path, revision)))
+
+        for (dirname, revision), dir_files in six.iteritems(dirs):
+            try:
+                entries = self._do_on_path(list_dir, dirname, revision)
+            except SCMError:
+                # Leave these to file_exists, which will raise any errors
+                # properly.
+                continue
+
+            filenames = set(
+                entry['path'].split('/')[-1]
+                for entry, unused in entries
+                if entry['kind'] == node_kind.file
+            )
+
+            for basename, key in dir_files:
+                if basename in filenames:
+                    results[key] = True
+
+        return results
+
     def get_keywords(self, path, revision=HEAD):
         def get_file_keywords(normpath, normrev):
             keywords = self.client.propget("svn:keywords", normpath, normrev,
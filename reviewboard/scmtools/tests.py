@@ -12,8 +12,12 @@ from django.contrib.auth.models import AnonymousUser, User
 from django.core.cache import cache
 from django.test import TestCase as DjangoTestCase
 from djblets.util.compat import six
+from djblets.util.compat.six.moves import cStringIO as StringIO
 from djblets.util.compat.six.moves import zip_longest
+from djblets.util.compat.six.moves.urllib.error import HTTPError
+from djblets.util.compat.six.moves.urllib.request import urlopen
 from djblets.util.filesystem import is_exe_in_path
+from kgb import SpyAgency
 import nose
 
 from reviewboard.diffviewer.diffutils import patch
@@ -25,12 +29,12 @@ from reviewboard.hostingsvcs.service import (HostingService,
                                              unregister_hosting_service)
 from reviewboard.reviews.models import Group
 from reviewboard.scmtools.core import (Branch, ChangeSet, Commit, Revision,
-                                       HEAD, PRE_CREATION)
+                                       SCMClient, HEAD, PRE_CREATION)
 from reviewboard.scmtools.errors import (SCMError, FileNotFoundError,
                                          RepositoryNotFoundError,
                                          AuthenticationError)
 from reviewboard.scmtools.forms import RepositoryForm
-from reviewboard.scmtools.git import ShortSHA1Error
+from reviewboard.scmtools.git import ShortSHA1Error, cat_file_pool
 from reviewboard.scmtools.models import Repository, Tool
 from reviewboard.scmtools.perforce import STunnelProxy, STUNNEL_SERVER
 from reviewboard.scmtools.signals import (checked_file_exists,
@@ -137,7 +141,7 @@ class SCMTestCase(SSHTestCase):
                 self.assertNotEqual(tool.get_file(filename, HEAD), None)
 
 
-class CoreTests(DjangoTestCase):
+class CoreTests(SpyAgency, DjangoTestCase):
     """Tests for the scmtools.core module"""
 
     def test_interface(self):
@@ -152,8 +156,51 @@ class CoreTests(DjangoTestCase):
         self.assertTrue(len(cs.bugs_closed) == 0)
         self.assertTrue(len(cs.files) == 0)
 
+    def test_get_file_exists_http(self):
+        """Testing SCMClient.get_file_exists_http uses a HEAD request"""
+        def _urlopen(request, *args, **kwargs):
+            self.assertEqual(request.get_method(), 'HEAD')
+            return StringIO(b'')
 
-class RepositoryTests(DjangoTestCase):
+        self.spy_on(urlopen, call_fake=_urlopen)
+
+        client = SCMClient('http://example.com/')
+        self.assertTrue(client.get_file_exists_http(
+            'http://example.com/raw/abc123', 'path', 'abc123'))
+        self.assertEqual(len(urlopen.spy.calls), 1)
+
+    def test_get_file_exists_http_not_found(self):
+        """Testing SCMClient.get_file_exists_http with a missing file"""
+        def _urlopen(request, *args, **kwargs):
+            raise HTTPError(request.get_full_url(), 404, 'Not Found', {},
+                            None)
+
+        self.spy_on(urlopen, call_fake=_urlopen)
+
+        client = SCMClient('http://example.com/')
+        self.assertFalse(client.get_file_exists_http(
+            'http://example.com/raw/abc123', 'path', 'abc123'))
+
+    def test_get_file_exists_http_without_head_support(self):
+        """Testing SCMClient.get_file_exists_http falls back on GET if
+        HEAD isn't supported
+        """
+        def _urlopen(request, *args, **kwargs):
+            if request.get_method() == 'HEAD':
+                raise HTTPError(request.get_full_url(), 405,
+                                'Method Not Allowed', {}, None)
+
+            return StringIO(b'data')
+
+        self.spy_on(urlopen, call_fake=_urlopen)
+
+        client = SCMClient('http://example.com/')
+        self.assertTrue(client.get_file_exists_http(
+            'http://example.com/raw/abc123', 'path', 'abc123'))
+        self.assertEqual(len(urlopen.spy.calls), 2)
+
+
+class RepositoryTests(SpyAgency, DjangoTestCase):
     fixtures = ['test_scmtools']
 
     def setUp(self):
@@ -165,13 +212,19 @@ class RepositoryTests(DjangoTestCase):
 
         self.scmtool_cls = self.repository.get_scmtool().__class__
         self.old_get_file = self.scmtool_cls.get_file
+        self.old_get_files = self.scmtool_cls.get_files
         self.old_file_exists = self.scmtool_cls.file_exists
+        self.old_get_files_exist = self.scmtool_cls.get_files_exist
 
     def tearDown(self):
+        super(RepositoryTests, self).tearDown()
+
         cache.clear()
 
         self.scmtool_cls.get_file = self.old_get_file
+        self.scmtool_cls.get_files = self.old_get_files
         self.scmtool_cls.file_exists = self.old_file_exists
+        self.scmtool_cls.get_files_exist = self.old_get_files_exist
 
     def test_get_file_caching(self):
         """Testing Repository.get_file caches result"""
@@ -221,6 +274,79 @@ class RepositoryTests(DjangoTestCase):
         self.assertEqual(found_signals[1],
                          ('fetched_file', path, revision, request))
 
+    def test_get_files_caching(self):
+        """Testing Repository.get_files caches results"""
+        def get_file(self, path, revision):
+            num_calls['get_file'] += 1
+            return b'file data'
+
+        def get_files(self, files):
+            num_calls['get_files'] += 1
+            return dict(
+                ((path, revision), b'%s data' % path.encode('utf-8'))
+                for path, revision in files
+                if path != 'missing'
+            )
+
+        num_calls = {
+            'get_file': 0,
+            'get_files': 0,
+        }
+
+        files = [
+            ('readme', 'e965047', None),
+            ('missing', 'e965047', None),
+            ('other', 'd6613f5', None),
+        ]
+
+        self.scmtool_cls.get_file = get_file
+        self.scmtool_cls.get_files = get_files
+
+        data1 = self.repository.get_files(files)
+
+        self.assertEqual(data1, [b'readme data', b'file data', b'other data'])
+        self.assertEqual(num_calls['get_files'], 1)
+        self.assertEqual(num_calls['get_file'], 1)
+
+        data2 = self.repository.get_files(files)
+
+        self.assertEqual(data1, data2)
+        self.assertEqual(num_calls['get_files'], 1)
+        self.assertEqual(num_calls['get_file'], 1)
+
+        self.assertEqual(self.repository.get_file('other', 'd6613f5'),
+                         b'other data')
+        self.assertEqual(num_calls['get_file'], 1)
+
+    def test_get_files_cache_requests(self):
+        """Testing Repository.get_files fetches cached files in one go"""
+        def get_files(self, files):
+            return dict(
+                ((path, revision), b'%s data' % path.encode('utf-8'))
+                for path, revision in files
+            )
+
+        files = [
+            ('readme', 'e965047', None),
+            ('other', 'd6613f5', None),
+            ('third', 'd6613f5', 'abc123'),
+        ]
+
+        self.scmtool_cls.get_files = get_files
+        data = self.repository.get_files(files)
+
+        self.spy_on(cache.get_many)
+        self.spy_on(self.repository.get_file)
+
+        self.assertEqual(self.repository.get_files(files), data)
+        self.assertEqual(data,
+                         [b'readme data', b'other data', b'third data'])
+
+        # One request for the chunk counts, and one for the chunks. None of
+        # the files should be looked up on their own.
+        self.assertEqual(len(cache.get_many.spy.calls), 2)
+        self.assertFalse(self.repository.get_file.spy.called)
+
     def test_get_file_exists_caching_when_exists(self):
         """Testing Repository.get_file_exists caches result when exists"""
         def file_exists(self, path, revision):
@@ -271,6 +397,58 @@ class RepositoryTests(DjangoTestCase):
         self.assertFalse(exists2)
         self.assertEqual(num_calls['get_file_exists'], 2)
 
+    def test_get_files_exist_caching(self):
+        """Testing Repository.get_files_exist caches results"""
+        def file_exists(self, path, revision):
+            num_calls['file_exists'] += 1
+            return False
+
+        def get_files_exist(self, files):
+            num_calls['get_files_exist'] += 1
+            return dict(
+                ((path, revision), path != 'missing')
+                for path, revision in files
+                if path != 'unknown'
+            )
+
+        num_calls = {
+            'file_exists': 0,
+            'get_files_exist': 0,
+        }
+
+        files = [
+            ('readme', 'e965047', None),
+            ('missing', 'e965047', None),
+            ('unknown', 'e965047', None),
+            ('other', 'd6613f5', None),
+        ]
+
+        self.scmtool_cls.file_exists = file_exists
+        self.scmtool_cls.get_files_exist = get_files_exist
+
+        exists1 = self.repository.get_files_exist(files)
+
+        self.assertEqual(exists1, [True, False, False, True])
+        self.assertEqual(num_calls['get_files_exist'], 1)
+        self.assertEqual(num_calls['file_exists'], 1)
+
+        exists2 = self.repository.get_files_exist(files)
+
+        self.assertEqual(exists1, exists2)
+        self.assertEqual(num_calls['get_files_exist'], 2)
+        self.assertEqual(num_calls['file_exists'], 2)
+
+        # Only the files that weren't known to exist should be checked again.
+        files_exist_calls = []
+        self.scmtool_cls.get_files_exist = \
+            lambda self, files: files_exist_calls.append(files) or {}
+
+        self.repository.get_files_exist(files)
+        self.assertEqual(files_exist_calls,
+                         [[('missing', 'e965047'), ('unknown', 'e965047')]])
+        self.assertTrue(self.repository.get_file_exists('other', 'd6613f5'))
+        self.assertEqual(num_calls['file_exists'], 4)
+
     def test_get_file_exists_caching_with_fetched_file(self):
         """Testing Repository.get_file_exists uses get_file's cached result"""
         def get_file(self, path, revision):
@@ -655,6 +833,54 @@ class SubversionTests(SCMTestCase):
         self.assertRaises(FileNotFoundError,
                           lambda: self.tool.get_file('hello', PRE_CREATION))
 
+    def test_get_files_exist(self):
+        """Testing SVNTool.get_files_exist with existing files"""
+        files = [
+            ('trunk/doc/misc-docs/Makefile', '2'),
+            ('/trunk/doc/misc-docs/Makefile', '5'),
+            ('trunk/doc/misc-docs/Makefile', HEAD),
+            ('trunk/doc/misc-docs/Makefile', PRE_CREATION),
+        ]
+
+        self.assertEqual(self.tool.get_files_exist(files), {
+            files[0]: True,
+            files[1]: True,
+            files[2]: True,
+            files[3]: False,
+        })
+
+    def test_get_files_exist_with_missing_files(self):
+        """Testing SVNTool.get_files_exist with missing files"""
+        files = [
+            ('trunk/doc/misc-docs/Makefile', '2'),
+            ('trunk/doc/misc-docs/Makefile2', '2'),
+            ('trunk/missing-dir/Makefile', '2'),
+        ]
+
+        # Files that aren't found are left for file_exists to check.
+        self.assertEqual(self.tool.get_files_exist(files), {
+            files[0]: True,
+        })
+        self.assertFalse(self.tool.file_exists(*files[1]))
+        self.assertFalse(self.tool.file_exists(*files[2]))
+
+    def test_get_files_exist_with_mixed_revisions(self):
+        """Testing SVNTool.get_files_exist with files at several revisions"""
+        # branch1 is created from trunk in revision 7.
+        files = [
+            ('branches/branch1/doc/misc-docs/Makefile', '7'),
+            ('branches/branch1/doc/misc-docs/Makefile', '5'),
+            ('trunk/doc/misc-docs/Makefile', '1'),
+            ('trunk/doc/misc-docs/Makefile', '7'),
+        ]
+
+        self.assertEqual(self.tool.get_files_exist(files), {
+            files[0]: True,
+            files[2]: True,
+            files[3]: True,
+        })
+        self.assertFalse(self.tool.file_exists(*files[1]))
+
     def test_revision_parsing(self):
         """Testing revision number parsing"""
         self.assertEqual(self.tool.parse_diff_revision('', '(working copy)')[1],
@@ -863,6 +1089,29 @@ class SubversionTests(SCMTestCase):
                          '56e50374056931c03a333f234fa63375')
 
 
+class FakeP4(object):
+    """A stand-in for P4.P4, returning canned results for commands."""
+    def __init__(self, results):
+        self.results = results
+        self.commands = []
+
+    def connect(self):
+        pass
+
+    def connected(self):
+        return False
+
+    def run_fstat(self, *args):
+        self.commands.append(('fstat',) + args)
+
+        return self.results['fstat']
+
+    def run_print(self, *args):
+        self.commands.append(('print',) + args)
+
+        return self.results['print']
+
+
 class PerforceTests(SCMTestCase):
     """Unit tests for perforce.
 
@@ -960,6 +1209,75 @@ class PerforceTests(SCMTestCase):
         self.assertEqual(md5(file).hexdigest(),
                          '227bdd87b052fcad9369e65c7bf23fd0')
 
+    def test_get_files(self):
+        """Testing PerforceTool.get_files"""
+        self.tool.client.p4 = FakeP4({
+            'print': [
+                {'depotFile': '//depot/foo.c', 'rev': '3'},
+                b'foo.c#3',
+                {'depotFile': '//depot/foo.c', 'rev': '4'},
+                b'foo.c#4',
+                {'depotFile': '//depot/bar.c', 'rev': '7'},
+                b'bar.c#7',
+            ],
+        })
+
+        files = [
+            ('//depot/foo.c', '3'),
+            ('//depot/foo.c', '4'),
+            ('//depot/bar.c', HEAD),
+            ('//depot/missing.c', '1'),
+            ('//depot/new.c', PRE_CREATION),
+        ]
+
+        self.assertEqual(self.tool.get_files(files), {
+            files[0]: b'foo.c#3',
+            files[1]: b'foo.c#4',
+            files[2]: b'bar.c#7',
+            files[4]: '',
+        })
+        self.assertEqual(self.tool.client.p4.commands, [
+            ('print', '//depot/foo.c#3', '//depot/foo.c#4', '//depot/bar.c',
+             '//depot/missing.c#1'),
+        ])
+
+    def test_get_files_exist(self):
+        """Testing PerforceTool.get_files_exist"""
+        self.tool.client.p4 = FakeP4({
+            'fstat': [
+                {'depotFile': '//depot/foo.c', 'headRev': '3',
+                 'headAction': 'edit'},
+                {'depotFile': '//depot/foo.c', 'headRev': '4',
+                 'headAction': 'edit'},
+                {'depotFile': '//depot/bar.c', 'headRev': '7',
+                 'headAction': 'add'},
+                {'depotFile': '//depot/deleted.c', 'headRev': '2',
+                 'headAction': 'delete'},
+            ],
+        })
+
+        files = [
+            ('//depot/foo.c', '3'),
+            ('//depot/foo.c', '4'),
+            ('//depot/bar.c', HEAD),
+            ('//depot/deleted.c', '2'),
+            ('//depot/missing.c', '1'),
+            ('//depot/new.c', PRE_CREATION),
+        ]
+
+        # Files that fstat doesn't report on are left for file_exists.
+        self.assertEqual(self.tool.get_files_exist(files), {
+            files[0]: True,
+            files[1]: True,
+            files[2]: True,
+            files[3]: False,
+            files[5]: False,
+        })
+        self.assertEqual(self.tool.client.p4.commands, [
+            ('fstat', '//depot/foo.c#3', '//depot/foo.c#4', '//depot/bar.c',
+             '//depot/deleted.c#2', '//depot/missing.c#1'),
+        ])
+
     def test_empty_diff(self):
         """Testing Perforce empty diff parsing"""
         diff = b"==== //depot/foo/proj/README#2 ==M== /src/proj/README ====\n"
@@ -1386,6 +1704,18 @@ class MercurialTests(SCMTestCase):
         self.assertRaises(FileNotFoundError,
                           lambda: self.tool.get_file('hello', PRE_CREATION))
 
+    def test_get_files(self):
+        """Testing HgTool.get_files"""
+        rev = Revision('661e5dd3c493')
+
+        self.assertEqual(
+            self.tool.get_files([('doc/readme', rev),
+                                 ('doc/readme2', rev),
+                                 ('doc/readme', PRE_CREATION)]),
+            {
+                ('doc/readme', rev): b'Hello\n\ngoodbye\n',
+            })
+
     def test_interface(self):
         """Testing basic HgTool API"""
         self.assertTrue(self.tool.get_diffs_use_absolute_paths())
@@ -1846,6 +2176,85 @@ class GitTests(SCMTestCase):
         self.assertRaises(FileNotFoundError,
                           lambda: self.tool.get_file("readme", "0000000"))
 
+    def test_get_files(self):
+        """Testing GitTool.get_files"""
+        files = [
+            ("readme", "e965047"),
+            ("readme", "d6613f5"),
+            ("readme", PRE_CREATION),
+            ("readme", "0000000"),
+            ("readme", "a62df6c"),
+            ("", HEAD),
+        ]
+
+        self.assertEqual(self.tool.get_files(files), {
+            ("readme", "e965047"): b'Hello\n',
+            ("readme", "d6613f5"): b'Hello there\n',
+            ("readme", PRE_CREATION): b'',
+        })
+
+    def test_get_file_reuses_cat_file_process(self):
+        """Testing GitTool.get_file reuses git cat-file processes"""
+        self.assertEqual(self.tool.get_file("readme", "e965047"), b'Hello\n')
+
+        process = cat_file_pool.get_process(self.tool.client.git_dir,
+                                            '--batch')
+        pid = process._process.pid
+
+        self.assertEqual(self.tool.get_file("readme", "d6613f5"),
+                         b'Hello there\n')
+        self.assertTrue(self.tool.file_exists("readme", "e965047"))
+        self.assertEqual(process._process.pid, pid)
+
+    def test_get_file_restarts_cat_file_process(self):
+        """Testing GitTool.get_file restarts crashed git cat-file processes"""
+        self.assertEqual(self.tool.get_file("readme", "e965047"), b'Hello\n')
+
+        process = cat_file_pool.get_process(self.tool.client.git_dir,
+                                            '--batch')
+        process._process.kill()
+        process._process.wait()
+
+        self.assertEqual(self.tool.get_file("readme", "d6613f5"),
+                         b'Hello there\n')
+        self.assertTrue(process.is_running())
+
+    def test_cat_file_process_close(self):
+        """Testing GitCatFileProcess.close closes the process's files"""
+        self.assertEqual(self.tool.get_file("readme", "e965047"), b'Hello\n')
+
+        process = cat_file_pool.get_process(self.tool.client.git_dir,
+                                            '--batch')
+        p = process._process
+        stderr = process._stderr
+
+        # stderr isn't read, so it mustn't be a pipe that can fill up.
+        self.assertEqual(p.stderr, None)
+
+        process.close()
+
+        self.assertFalse(process.is_running())
+        self.assertTrue(p.stdin.closed)
+        self.assertTrue(p.stdout.closed)
+        self.assertTrue(stderr.closed)
+
+    def test_get_files_exist(self):
+        """Testing GitTool.get_files_exist"""
+        self.assertEqual(
+            self.tool.get_files_exist([
+                ('readme', 'e965047'),
+                ('readme', 'd6613f5'),
+                ('missing', '0000000000000000000000000000000000000000'),
+                ('new', PRE_CREATION),
+            ]),
+            {
+                ('readme', 'e965047'): True,
+                ('readme', 'd6613f5'): True,
+                ('missing', '0000000000000000000000000000000000000000'):
+                    False,
+                ('new', PRE_CREATION): False,
+            })
+
     def test_parse_diff_revision_with_remote_and_short_SHA1_error(self):
         """Testing GitTool.parse_diff_revision with remote files and short SHA1 error"""
         self.assertRaises(
@@ -0,0 +1,17 @@
+from __future__ import unicode_literals
+
+from reviewboard.signals import initializing
+
+
+def connect_signals(**kwargs):
+    """
+    Listens to the ``initializing`` signal and tells the search indexer to
+    connect its signals, so that the search index is kept up to date as
+    review requests change.
+    """
+    from reviewboard.search import indexing
+
+    indexing.connect_signals()
+
+
+initializing.connect(connect_signals)
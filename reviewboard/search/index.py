@@ -0,0 +1,591 @@
+from __future__ import unicode_literals
+
+import errno
+import json
+import logging
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+
+from djblets.util.compat import six
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from reviewboard.search.query import parse_query
+from reviewboard.search.segments import (SegmentReader, SegmentWriter,
+                                         make_term, merge_segments,
+                                         write_docnums)
+
+
+# The field used to look up documents by ID when they're replaced or
+# deleted.
+ID_FIELD = '_id'
+
+
+class SearchIndex(object):
+    """A search index stored in a directory on disk.
+
+    The index is made up of immutable segments (see
+    reviewboard.search.segments). Updating documents writes them to a new
+    segment and marks any older copies as deleted, so updates are cheap
+    and can be done as things change. The list of segments making up the
+    index is stored in a manifest file, which is replaced atomically,
+    so searches always see a consistent index.
+
+    Small segments are merged together as they build up, keeping the
+    number of segments that each search has to look at down. Larger
+    merges are left to merge(), which is called by the index management
+    command.
+
+    Changes are serialized between processes through a lock file. Searches
+    don't take the lock. Each process keeps its segments open between
+    searches, and only opens new ones when the manifest changes.
+    """
+    MANIFEST_FILENAME = 'segments.json'
+    LOCK_FILENAME = 'write.lock'
+    FORMAT_VERSION = 1
+
+    # Segments are merged once there are this many of roughly the same
+    # size (within a power of MERGE_FACTOR).
+    MERGE_FACTOR = 10
+
+    # Updates will only merge segments up to this many documents. Larger
+    # segments are merged by merge().
+    MAX_AUTO_MERGE_DOCS = 10000
+
+    # The number of documents written to each segment during a rebuild,
+    # before they're all merged together.
+    REBUILD_SEGMENT_DOCS = 5000
+
+    def __init__(self, path, schema):
+        self.path = path
+        self.schema = schema
+        self._lock = threading.Lock()
+        self._generation = None
+        self._readers = {}
+        self._segment_readers = []
+
+    def search(self, query, local_site_id=None):
+        """Searches the index.
+
+        This returns the IDs of the documents matching the query that were
+        added with the given local_site_id, best matches first.
+        """
+        readers = self._get_readers()
+        scores = parse_query(query, self.schema).execute(readers,
+                                                         self.schema.boosts)
+        local_site_id = local_site_id or 0
+        results = {}
+
+        for (i, docnum), score in six.iteritems(scores):
+            doc_id, doc_local_site_id = readers[i].get_doc(docnum)
+
+            if doc_local_site_id == local_site_id:
+                results[doc_id] = max(score, results.get(doc_id, 0))
+
+        return [
+            result_id
+            for result_id, result_score in sorted(
+                six.iteritems(results),
+                key=lambda item: (-item[1], -item[0]))
+        ]
+
+    def update_documents(self, docs):
+        """Adds documents to the index, replacing any with the same IDs.
+
+        ``docs`` is a list of (doc_id, local_site_id, fields) tuples, where
+        fields maps field names to their text.
+        """
+        docs = list(docs)
+        writer = SegmentWriter()
+
+        # If a document is listed more than once, only the last copy is
+        # kept. Otherwise, the earlier copies would be left in the index.
+        last_indexes = dict(
+            (doc[0], i)
+            for i, doc in enumerate(docs)
+        )
+
+        for i, (doc_id, local_site_id, fields) in enumerate(docs):
+            if last_indexes[doc_id] == i:
+                writer.add_document(doc_id, local_site_id,
+                                    self._analyze(doc_id, fields))
+
+        if not writer.docs:
+            return
+
+        doc_ids = [pk for pk, _ in writer.docs]
+
+        with self._write_lock():
+            manifest = self._read_manifest()
+            name = self._make_segment_name()
+            writer.write(self.path, name)
+
+            removed_files = self._delete_ids(manifest, doc_ids)
+            manifest['segments'].append({
+                'name': name,
+                'num_docs': len(writer.docs),
+                'num_deleted': 0,
+                'deletions': None,
+            })
+
+            self._commit(manifest, removed_files)
+            self._merge_segments(manifest, self.MAX_AUTO_MERGE_DOCS)
+
+    def delete_documents(self, doc_ids):
+        """Removes the documents with the given IDs from the index."""
+        doc_ids = list(doc_ids)
+
+        with self._write_lock():
+            manifest = self._read_manifest()
+            old_deletions = [
+                entry['deletions']
+                for entry in manifest['segments']
+            ]
+            removed_files = self._delete_ids(manifest, doc_ids)
+
+            # Any rebuilds in progress may have already written these
+            # documents. They're recorded so that each rebuild can delete
+            # them once it's done.
+            rebuilds = manifest.get('rebuilds', {})
+
+            for deleted_ids in six.itervalues(rebuilds):
+                deleted_ids.extend(doc_ids)
+
+            if (rebuilds or
+                old_deletions != [entry['deletions']
+                                  for entry in manifest['segments']]):
+                self._commit(manifest, removed_files)
+
+    def rebuild(self, docs):
+        """Replaces the contents of the index with a new set of documents.
+
+        ``docs`` is an iterable in the form passed to update_documents.
+        The documents are written to new segments in batches, without
+        holding the lock, so other changes can still be made while the
+        index is being rebuilt. The old index is then replaced all at
+        once. Any documents updated in the meantime are kept, and any
+        deleted in the meantime stay deleted.
+        """
+        rebuild_id = uuid.uuid4().hex
+
+        with self._write_lock():
+            manifest = self._read_manifest()
+            old_names = set(
+                entry['name']
+                for entry in manifest['segments']
+            )
+
+            # Deletions made while rebuilding are recorded here by
+            # delete_documents.
+            manifest.setdefault('rebuilds', {})[rebuild_id] = []
+            self._commit(manifest, [])
+
+        names = []
+
+        try:
+            writer = SegmentWriter()
+
+            for doc_id, local_site_id, fields in docs:
+                writer.add_document(doc_id, local_site_id,
+                                    self._analyze(doc_id, fields))
+
+                if len(writer.docs) >= self.REBUILD_SEGMENT_DOCS:
+                    names.append(self._make_segment_name())
+                    writer.write(self.path, names[-1])
+                    writer = SegmentWriter()
+
+            if writer.docs or not names:
+                names.append(self._make_segment_name())
+                writer.write(self.path, names[-1])
+
+            if len(names) > 1:
+                readers = [
+                    SegmentReader(self.path, name)
+                    for name in names
+                ]
+                name = self._make_segment_name()
+                names.append(name)
+                num_docs = merge_segments(readers, self.path, name)
+
+                for reader in readers:
+                    reader.close()
+
+                self._remove_files(names[:-1], [])
+                names = [name]
+            else:
+                name = names[0]
+                num_docs = len(writer.docs)
+
+            with self._write_lock():
+                manifest = self._read_manifest()
+                removed_names = []
+                removed_files = []
+                new_segments = []
+
+                for entry in manifest['segments']:
+                    if entry['name'] in old_names:
+                        removed_names.append(entry['name'])
+
+                        if entry['deletions']:
+                            removed_files.append(entry['deletions'])
+                    else:
+                        new_segments.append(entry)
+
+                new_entry = {
+                    'name': name,
+                    'num_docs': num_docs,
+                    'num_deleted': 0,
+                    'deletions': None,
+                }
+
+                # Anything updated while rebuilding is newer than the copy
+                # we just wrote.
+                updated_ids = set()
+
+                for entry in new_segments:
+                    reader = SegmentReader(self.path, entry['name'],
+                                           entry['deletions'])
+                    updated_ids.update(
+                        doc_id
+                        for docnum, doc_id, local_site_id in reader.iter_docs()
+                    )
+                    reader.close()
+
+                # Anything deleted while rebuilding must be deleted from
+                # the copy we just wrote as well.
+                rebuilds = manifest.get('rebuilds', {})
+                deleted_ids = rebuilds.pop(rebuild_id, [])
+
+                manifest['segments'] = [new_entry]
+                self._delete_ids(manifest, updated_ids.union(deleted_ids))
+                manifest['segments'] += new_segments
+
+                self._commit(manifest, removed_files)
+                self._remove_files(removed_names, [])
+        except:
+            self._remove_files(names, [])
+            self._forget_rebuild(rebuild_id)
+            raise
+
+    def merge(self, optimize=False):
+        """Merges segments together.
+
+        Unlike the merging done when updating documents, this will merge
+        segments of any size. If optimize is True, all segments will be
+        merged into one.
+        """
+        with self._write_lock():
+            manifest = self._read_manifest()
+            self._merge_segments(manifest, None, optimize)
+
+    def _forget_rebuild(self, rebuild_id):
+        """Stops recording deletions for a rebuild that failed."""
+        with self._write_lock():
+            manifest = self._read_manifest()
+
+            if rebuild_id in manifest.get('rebuilds', {}):
+                del manifest['rebuilds'][rebuild_id]
+                self._commit(manifest, [])
+
+    def _analyze(self, doc_id, fields):
+        """Splits the fields of a document into tokens."""
+        analyzed = {
+            ID_FIELD: [(0, six.text_type(doc_id))],
+        }
+
+        for field, text in six.iteritems(fields):
+            if text:
+                analyzed[field] = self.schema.tokenize_field(field, text)
+
+        return analyzed
+
+    def _get_readers(self):
+        """Returns readers for the segments currently in the index.
+
+        If the manifest has changed since the last call, any new segments
+        are opened, and deletions are reloaded.
+        """
+        for attempt in range(3):
+            manifest = self._read_manifest()
+
+            with self._lock:
+                if manifest['generation'] == self._generation:
+                    return self._segment_readers
+
+                try:
+                    self._open_segments(manifest)
+                    return self._segment_readers
+                except (IOError, OSError) as e:
+                    # The segments may have been merged and removed since
+                    # we read the manifest. Read it again and retry.
+                    if e.errno != errno.ENOENT:
+                        raise
+
+        raise IOError('Unable to open the search index at %s' % self.path)
+
+    def _open_segments(self, manifest):
+        """Opens the segments listed in a manifest.
+
+        This must be called with self._lock held.
+        """
+        readers = {}
+        segment_readers = []
+
+        for entry in manifest['segments']:
+            reader = self._readers.get(entry['name'])
+
+            if reader is None:
+                reader = SegmentReader(self.path, entry['name'],
+                                       entry['deletions'])
+            elif reader.deletions_file != entry['deletions']:
+                reader.load_deletions(entry['deletions'])
+
+            readers[entry['name']] = reader
+            segment_readers.append(reader)
+
+        # Readers for segments that are no longer in the index may still be
+        # in use by searches in other threads, so they're left to close when
+        # they're no longer referenced.
+        self._readers = readers
+        self._segment_readers = segment_readers
+        self._generation = manifest['generation']
+
+    def _delete_ids(self, manifest, doc_ids):
+        """Marks documents as deleted in the segments in a manifest.
+
+        New deletion files are written for each segment that has any of the
+        documents, and the manifest is updated to point to them. This
+        returns the list of deletion files that were replaced.
+
+        This must be called with the write lock held.
+        """
+        id_terms = [
+            make_term(ID_FIELD, six.text_type(doc_id))
+            for doc_id in doc_ids
+        ]
+        removed_files = []
+
+        for entry in manifest['segments']:
+            reader = SegmentReader(self.path, entry['name'],
+                                   entry['deletions'])
+
+            try:
+                deleted = set(reader.deleted)
+
+                for term in id_terms:
+                    deleted.update(docnum
+                                   for docnum, positions
+                                   in reader.get_postings(term, False))
+
+                if len(deleted) == len(reader.deleted):
+                    continue
+
+                deletions_file = '%s_%s.del' % (entry['name'],
+                                                uuid.uuid4().hex[:8])
+                write_docnums(self.path, deletions_file, deleted)
+
+                if entry['deletions']:
+                    removed_files.append(entry['deletions'])
+
+                entry['deletions'] = deletions_file
+                entry['num_deleted'] = len(deleted)
+            finally:
+                reader.close()
+
+        return removed_files
+
+    def _merge_segments(self, manifest, max_docs, optimize=False):
+        """Merges any segments that have built up in the manifest.
+
+        Segments are grouped into tiers, by the number of live documents
+        they contain. Once a tier has MERGE_FACTOR segments, they're merged
+        together into a segment in a higher tier. Segments with no live
+        documents are dropped. If max_docs is provided, segments that would
+        end up with more documents than that aren't merged. If optimize is
+        True, all segments are merged together.
+
+        This must be called with the write lock held.
+        """
+        while True:
+            tiers = {}
+            empty = []
+
+            for entry in manifest['segments']:
+                num_live_docs = entry['num_docs'] - entry['num_deleted']
+
+                if num_live_docs == 0:
+                    empty.append(entry)
+                else:
+                    tier = 0
+
+                    while num_live_docs >= self.MERGE_FACTOR:
+                        num_live_docs //= self.MERGE_FACTOR
+                        tier += 1
+
+                    tiers.setdefault(tier, []).append(entry)
+
+            to_merge = None
+
+            if optimize:
+                to_merge = sum(six.itervalues(tiers), [])
+                optimize = False
+
+                if len(to_merge) < 2:
+                    to_merge = None
+            else:
+                for tier in sorted(tiers):
+                    entries = tiers[tier]
+
+                    if (len(entries) >= self.MERGE_FACTOR and
+                        (max_docs is None or
+                         self.MERGE_FACTOR ** (tier + 1) <= max_docs)):
+                        to_merge = entries
+                        break
+
+            if not to_merge and not empty:
+                return
+
+            removed_names = [entry['name'] for entry in empty]
+            removed_files = [
+                entry['deletions']
+                for entry in empty
+                if entry['deletions']
+            ]
+
+            if to_merge:
+                readers = [
+                    SegmentReader(self.path, entry['name'],
+                                  entry['deletions'])
+                    for entry in to_merge
+                ]
+                name = self._make_segment_name()
+
+                try:
+                    num_docs = merge_segments(readers, self.path, name)
+                finally:
+                    for reader in readers:
+                        reader.close()
+
+                merged_names = set(entry['name'] for entry in to_merge)
+                manifest['segments'] = [
+                    entry
+                    for entry in manifest['segments']
+                    if entry['name'] not in merged_names
+                ] + [{
+                    'name': name,
+                    'num_docs': num_docs,
+                    'num_deleted': 0,
+                    'deletions': None,
+                }]
+                removed_names += merged_names
+                removed_files += [
+                    entry['deletions']
+                    for entry in to_merge
+                    if entry['deletions']
+                ]
+
+            empty_names = set(entry['name'] for entry in empty)
+            manifest['segments'] = [
+                entry
+                for entry in manifest['segments']
+                if entry['name'] not in empty_names
+            ]
+
+            self._commit(manifest, removed_files)
+            self._remove_files(removed_names, [])
+
+    def _read_manifest(self):
+        """Reads the manifest listing the segments in the index."""
+        try:
+            with open(os.path.join(self.path, self.MANIFEST_FILENAME),
+                      'r') as f:
+                manifest = json.load(f)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+            manifest = {
+                'version': self.FORMAT_VERSION,
+                'generation': 0,
+                'segments': [],
+            }
+
+        if manifest['version'] != self.FORMAT_VERSION:
+            raise IOError('Unsupported search index version %s in %s. The '
+                          'index must be rebuilt.'
+                          % (manifest['version'], self.path))
+
+        return manifest
+
+    def _commit(self, manifest, removed_files):
+        """Writes out a new manifest.
+
+        The old deletion files in removed_files are removed once the new
+        manifest is in place.
+
+        This must be called with the write lock held.
+        """
+        manifest['generation'] += 1
+
+        filename = os.path.join(self.path, self.MANIFEST_FILENAME)
+        tmp_filename = '%s.tmp' % filename
+
+        with open(tmp_filename, 'w') as f:
+            json.dump(manifest, f)
+
+        try:
+            os.rename(tmp_filename, filename)
+        except OSError:
+            # Windows won't rename over an existing file.
+            os.unlink(filename)
+            os.rename(tmp_filename, filename)
+
+        self._remove_files([], removed_files)
+
+    def _remove_files(self, names, filenames):
+        """Removes the files for segments and any other listed files."""
+        filenames = list(filenames)
+
+        for name in names:
+            filenames += [
+                '%s.%s' % (name, ext)
+                for ext in SegmentReader.EXTENSIONS
+            ]
+
+        for filename in filenames:
+            try:
+                os.unlink(os.path.join(self.path, filename))
+            except OSError as e:
+                # The file may still be open by a search on Windows. It
+                # won't be referenced anymore, so it's safe to leave.
+                logging.debug('Unable to remove search index file %s: %s',
+                              filename, e)
+
+    def _make_segment_name(self):
+        """Returns a unique name for a new segment."""
+        return 'seg_%s' % uuid.uuid4().hex[:16]
+
+    def _ensure_path(self):
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+    @contextmanager
+    def _write_lock(self):
+        """Holds the index's write lock for the duration of a block."""
+        self._ensure_path()
+        fd = os.open(os.path.join(self.path, self.LOCK_FILENAME),
+                     os.O_RDWR | os.O_CREAT)
+
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+
+            yield
+        finally:
+            # Closing the file releases the lock.
+            os.close(fd)
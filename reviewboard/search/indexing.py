@@ -0,0 +1,195 @@
+from __future__ import unicode_literals
+
+import logging
+import threading
+
+from django.db.models.signals import post_delete
+from djblets.siteconfig.models import SiteConfiguration
+from djblets.util.compat import six
+
+from reviewboard.reviews.models import ReviewRequest, Review
+from reviewboard.reviews.signals import (review_request_closed,
+                                         review_request_published,
+                                         review_request_reopened,
+                                         review_published,
+                                         reply_published)
+from reviewboard.search.index import SearchIndex
+from reviewboard.search.query import Schema
+
+
+schema = Schema(
+    fields=['summary', 'description', 'testing_done', 'bug', 'changenum',
+            'author', 'file', 'review'],
+    keyword_fields=['username'],
+    boosts={
+        'summary': 2.0,
+    })
+
+_search_index = None
+_search_index_lock = threading.Lock()
+
+
+def get_search_index():
+    """Returns the search index for the configured index directory.
+
+    The index is kept open for the lifetime of the process, so that
+    searches can reuse the segments that are already open.
+    """
+    global _search_index
+
+    siteconfig = SiteConfiguration.objects.get_current()
+    path = siteconfig.get('search_index_file')
+
+    with _search_index_lock:
+        if _search_index is None or _search_index.path != path:
+            _search_index = SearchIndex(path, schema)
+
+        return _search_index
+
+
+def get_indexable_review_requests():
+    """Returns a queryset of all review requests that should be indexed."""
+    return ReviewRequest.objects.filter(
+        public=True,
+        status__in=(ReviewRequest.PENDING_REVIEW, ReviewRequest.SUBMITTED))
+
+
+def is_indexable(review_request):
+    """Returns whether a review request should be in the search index."""
+    return (review_request.public and
+            review_request.status in (ReviewRequest.PENDING_REVIEW,
+                                      ReviewRequest.SUBMITTED))
+
+
+def build_document(review_request):
+    """Builds the search index document for a review request.
+
+    This returns a tuple in the form accepted by
+    SearchIndex.update_documents.
+    """
+    files = set()
+
+    if review_request.diffset_history_id:
+        for diffset in review_request.diffset_history.diffsets.all():
+            for filediff in diffset.files.all():
+                if filediff.source_file:
+                    files.add(filediff.source_file)
+
+                if filediff.dest_file:
+                    files.add(filediff.dest_file)
+
+    reviews = Review.objects.filter(review_request=review_request,
+                                    public=True)
+    review_text = []
+
+    for review in reviews:
+        review_text += [review.body_top, review.body_bottom]
+
+    if review_request.changenum:
+        changenum = six.text_type(review_request.changenum)
+    else:
+        changenum = ''
+
+    submitter = review_request.submitter
+
+    return (review_request.pk, review_request.local_site_id, {
+        'summary': review_request.summary,
+        'description': review_request.description,
+        'testing_done': review_request.testing_done,
+        'bug': ' '.join(review_request.bugs_closed.split(',')),
+        'changenum': changenum,
+        'author': ' '.join([submitter.username, submitter.get_full_name()]),
+        'username': submitter.username,
+        'file': '\n'.join(sorted(files)),
+        'review': '\n'.join(review_text),
+    })
+
+
+def update_review_requests(review_requests):
+    """Updates the search index for a list of review requests.
+
+    Review requests that should be indexed are added (or replaced) in the
+    index. The rest are removed from it.
+    """
+    index = get_search_index()
+    docs = []
+    deleted_ids = []
+
+    for review_request in review_requests:
+        if is_indexable(review_request):
+            docs.append(build_document(review_request))
+        else:
+            deleted_ids.append(review_request.pk)
+
+    if docs:
+        index.update_documents(docs)
+
+    if deleted_ids:
+        index.delete_documents(deleted_ids)
+
+
+def search_review_requests(query, local_site=None):
+    """Searches for review requests.
+
+    This returns the IDs of the matching review requests on the given
+    Local Site, best matches first.
+    """
+    if local_site:
+        local_site_id = local_site.pk
+    else:
+        local_site_id = None
+
+    return get_search_index().search(query, local_site_id)
+
+
+def _update_review_request(review_request):
+    """Updates the search index for a review request, if search is enabled.
+
+    Errors are logged, rather than being allowed to interrupt whatever
+    triggered the update.
+    """
+    siteconfig = SiteConfiguration.objects.get_current()
+
+    if not siteconfig.get('search_enable'):
+        return
+
+    try:
+        update_review_requests([review_request])
+    except Exception as e:
+        logging.error('Unable to update the search index for review '
+                      'request %s: %s',
+                      review_request.pk, e, exc_info=1)
+
+
+def _on_review_request_changed(sender, review_request, **kwargs):
+    _update_review_request(review_request)
+
+
+def _on_review_published(sender, review=None, reply=None, **kwargs):
+    _update_review_request((review or reply).review_request)
+
+
+def _on_review_request_deleted(sender, instance, **kwargs):
+    siteconfig = SiteConfiguration.objects.get_current()
+
+    if not siteconfig.get('search_enable'):
+        return
+
+    try:
+        get_search_index().delete_documents([instance.pk])
+    except Exception as e:
+        logging.error('Unable to remove review request %s from the search '
+                      'index: %s',
+                      instance.pk, e, exc_info=1)
+
+
+def connect_signals():
+    review_request_published.connect(_on_review_request_changed,
+                                     sender=ReviewRequest)
+    review_request_closed.connect(_on_review_request_changed,
+                                  sender=ReviewRequest)
+    review_request_reopened.connect(_on_review_request_changed,
+                                    sender=ReviewRequest)
+    review_published.connect(_on_review_published, sender=Review)
+    reply_published.connect(_on_review_published, sender=Review)
+    post_delete.connect(_on_review_request_deleted, sender=ReviewRequest)
@@ -0,0 +1,339 @@
+"""Text analysis and query handling for the search index.
+
+Queries are made up of whitespace-separated clauses, each of which must
+match for a document to be returned. A clause can be:
+
+* A word, such as ``crash``.
+* A phrase in quotes, such as ``"null pointer"``.
+* A prefix followed by ``*``, such as ``deref*``.
+* Any of the above, restricted to one field, such as ``file:main.c``,
+  ``summary:"null pointer"`` or ``author:chri*``.
+
+Two clauses separated by ``OR`` match if either of them match. A clause
+prefixed with ``-`` or ``NOT`` excludes any documents it matches.
+"""
+
+from __future__ import unicode_literals
+
+import math
+import re
+
+from djblets.util.compat import six
+
+from reviewboard.search.segments import make_term
+
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+QUERY_CLAUSE_RE = re.compile(
+    r'(?P<prefix>[-+]?)'
+    r'(?:(?P<field>\w+):)?'
+    r'(?:"(?P<phrase>[^"]*)"?|(?P<word>[^\s"]+))',
+    re.UNICODE)
+
+# Common English words that aren't indexed. These still take up a position,
+# so phrases containing them will only match where some word was present.
+STOP_WORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'if',
+    'in', 'into', 'is', 'it', 'no', 'not', 'of', 'on', 'or', 'such', 'that',
+    'the', 'their', 'then', 'there', 'these', 'they', 'this', 'to', 'was',
+    'will', 'with',
+])
+
+# The maximum number of terms a prefix will be expanded to in each field
+# of each segment.
+MAX_PREFIX_TERMS = 1024
+
+
+def tokenize(text):
+    """Splits text into a list of (position, token) tuples.
+
+    Tokens are runs of letters, digits and underscores, converted to
+    lowercase. Stop words are left out.
+    """
+    return [
+        (position, token)
+        for position, token in enumerate(
+            match.group(0).lower()
+            for match in TOKEN_RE.finditer(text or '')
+        )
+        if token not in STOP_WORDS
+    ]
+
+
+def tokenize_keyword(text):
+    """Returns the tokens for a field that's indexed as a single value."""
+    text = (text or '').strip().lower()
+
+    if text:
+        return [(0, text)]
+    else:
+        return []
+
+
+class Schema(object):
+    """Describes the fields in a search index.
+
+    ``fields`` is a list of the names of fields that are split into words.
+    ``keyword_fields`` are indexed as a single value, and must be matched
+    exactly. ``default_fields`` are searched by clauses that don't name a
+    field. ``boosts`` maps field names to a multiplier for the scores of
+    matches in that field.
+    """
+    def __init__(self, fields, keyword_fields=(), default_fields=None,
+                 boosts=None):
+        self.fields = list(fields)
+        self.keyword_fields = list(keyword_fields)
+        self.default_fields = list(default_fields or fields)
+        self.boosts = boosts or {}
+
+    def has_field(self, field):
+        """Returns whether a field is part of the schema."""
+        return field in self.fields or field in self.keyword_fields
+
+    def tokenize_field(self, field, text):
+        """Splits text into tokens in the way used for a field."""
+        if field in self.keyword_fields:
+            return tokenize_keyword(text)
+        else:
+            return tokenize(text)
+
+
+class Clause(object):
+    """A single clause of a query.
+
+    This matches a phrase (which may be a single token) in any of a list of
+    fields. If ``prefix`` is True, the clause is a single token that
+    matches any term starting with it.
+    """
+    def __init__(self, fields, tokens, prefix=False):
+        self.fields = fields
+        self.tokens = tokens
+        self.prefix = prefix
+
+    def execute(self, readers, num_docs, boosts):
+        """Returns the scores for the documents matching the clause.
+
+        This is a dictionary mapping (segment index, local document number)
+        tuples to scores.
+        """
+        scores = {}
+
+        for i, reader in enumerate(readers):
+            for field in self.fields:
+                boost = boosts.get(field, 1.0)
+
+                if self.prefix:
+                    self._match_prefix(i, reader, field, num_docs, boost,
+                                       scores)
+                elif len(self.tokens) == 1:
+                    self._match_term(i, reader, field, num_docs, boost,
+                                     scores)
+                else:
+                    self._match_phrase(i, reader, field, num_docs, boost,
+                                       scores)
+
+        return scores
+
+    def _match_term(self, i, reader, field, num_docs, boost, scores):
+        info = reader.lookup_term(make_term(field, self.tokens[0][1]))
+
+        if info is not None:
+            self._add_term_scores(i, reader, info, num_docs, boost, scores)
+
+    def _match_prefix(self, i, reader, field, num_docs, boost, scores):
+        prefix = make_term(field, self.tokens[0][1])
+
+        for j, info in enumerate(reader.iter_prefix(prefix)):
+            if j == MAX_PREFIX_TERMS:
+                break
+
+            self._add_term_scores(i, reader, info, num_docs, boost, scores)
+
+    def _add_term_scores(self, i, reader, info, num_docs, boost, scores):
+        weight = boost * _idf(info[1], num_docs)
+
+        for docnum, freq in reader.read_postings(info, with_positions=False):
+            key = (i, docnum)
+            scores[key] = scores.get(key, 0) + weight * math.sqrt(freq)
+
+    def _match_phrase(self, i, reader, field, num_docs, boost, scores):
+        term_postings = []
+        weight = 0
+
+        for offset, token in self.tokens:
+            info = reader.lookup_term(make_term(field, token))
+
+            if info is None:
+                return
+
+            weight += _idf(info[1], num_docs)
+            term_postings.append((offset, dict(reader.read_postings(info))))
+
+        # Start with the rarest term, to keep the candidate list short.
+        term_postings.sort(key=lambda item: len(item[1]))
+        first_offset, first_postings = term_postings[0]
+        weight *= boost
+
+        for docnum, positions in six.iteritems(first_postings):
+            other_positions = []
+
+            for offset, postings in term_postings[1:]:
+                if docnum not in postings:
+                    break
+
+                other_positions.append((offset - first_offset,
+                                        set(postings[docnum])))
+            else:
+                freq = 0
+
+                for position in positions:
+                    for delta, candidates in other_positions:
+                        if position + delta not in candidates:
+                            break
+                    else:
+                        freq += 1
+
+                if freq:
+                    key = (i, docnum)
+                    scores[key] = (scores.get(key, 0) +
+                                   weight * math.sqrt(freq))
+
+
+class Query(object):
+    """A parsed search query.
+
+    ``groups`` is a list of lists of clauses. A document must match at
+    least one clause in every group. It must not match any of the clauses
+    in ``excluded``.
+    """
+    def __init__(self, groups, excluded):
+        self.groups = groups
+        self.excluded = excluded
+
+    def execute(self, readers, boosts=None):
+        """Returns the scores for the documents matching the query.
+
+        This is a dictionary mapping (segment index, local document number)
+        tuples to scores.
+        """
+        boosts = boosts or {}
+        num_docs = sum(reader.num_live_docs for reader in readers)
+        results = None
+
+        for group in self.groups:
+            group_scores = {}
+
+            for clause in group:
+                for key, score in six.iteritems(
+                        clause.execute(readers, num_docs, boosts)):
+                    group_scores[key] = group_scores.get(key, 0) + score
+
+            if results is None:
+                results = group_scores
+            else:
+                results = dict(
+                    (key, score + group_scores[key])
+                    for key, score in six.iteritems(results)
+                    if key in group_scores
+                )
+
+            if not results:
+                return {}
+
+        if results is None:
+            return {}
+
+        for clause in self.excluded:
+            for key in clause.execute(readers, num_docs, boosts):
+                results.pop(key, None)
+
+        return results
+
+
+def parse_query(query, schema):
+    """Parses a query string into a Query."""
+    groups = []
+    excluded = []
+    join_next = False
+    exclude_next = False
+
+    for m in QUERY_CLAUSE_RE.finditer(query):
+        prefix = m.group('prefix')
+        field = m.group('field')
+        phrase = m.group('phrase')
+        word = m.group('word')
+
+        if not prefix and not field and word in ('AND', 'OR', 'NOT'):
+            join_next = (word == 'OR' and bool(groups))
+            exclude_next = (word == 'NOT')
+            continue
+
+        if exclude_next:
+            prefix = '-'
+            exclude_next = False
+
+        if field and not schema.has_field(field):
+            # This isn't something we know how to search on, so treat it
+            # as part of the text.
+            if phrase is not None:
+                phrase = '%s %s' % (field, phrase)
+            else:
+                word = '%s:%s' % (field, word)
+
+            field = None
+
+        if field:
+            fields = [field]
+        else:
+            fields = schema.default_fields
+
+        is_prefix = False
+
+        if phrase is None:
+            if word.endswith('*') and len(word) > 1:
+                word = word[:-1]
+                is_prefix = True
+
+            text = word
+        else:
+            text = phrase
+
+        if field:
+            tokens = schema.tokenize_field(field, text)
+        else:
+            tokens = tokenize(text)
+
+        if is_prefix and len(tokens) != 1:
+            is_prefix = False
+
+        if not tokens:
+            # This was made up entirely of punctuation or stop words, which
+            # aren't indexed. Don't let it rule out every result.
+            join_next = False
+            continue
+
+        # Make the positions relative to the first token.
+        first_position = tokens[0][0]
+        tokens = [
+            (position - first_position, token)
+            for position, token in tokens
+        ]
+
+        clause = Clause(fields, tokens, is_prefix)
+
+        if prefix == '-':
+            excluded.append(clause)
+        elif join_next:
+            groups[-1].append(clause)
+        else:
+            groups.append([clause])
+
+        join_next = False
+
+    return Query(groups, excluded)
+
+
+def _idf(doc_freq, num_docs):
+    """Returns the inverse document frequency for a term."""
+    return 1.0 + math.log(float(num_docs + 1) / (doc_freq + 1))
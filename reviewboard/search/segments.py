@@ -0,0 +1,498 @@
+"""On-disk storage for the search index.
+
+An index is made up of one or more immutable segments, each holding a
+batch of documents. A segment named ``name`` is stored in these files:
+
+``name.doc``
+    A (doc_id, local_site_id) pair of unsigned 32-bit integers for each
+    document in the segment, in order of their local document numbers.
+
+``name.tis``
+    The term dictionary. This holds an entry for each term in the segment,
+    sorted by the term's UTF-8 encoding. Each entry is a varint-prefixed
+    term, followed by varints for the number of documents containing the
+    term and the offset and length of its postings in ``name.pst``.
+
+``name.tix``
+    The offset of each term dictionary entry in ``name.tis``, as unsigned
+    32-bit integers. This allows terms to be binary searched.
+
+``name.pst``
+    The postings for each term. For each document containing the term,
+    this holds varints for the difference between its local document
+    number and the previous one, the number of times the term occurs,
+    and the difference between each position and the previous one.
+
+Terms are stored as the name of the field, followed by a NUL byte and
+then the token.
+
+Documents deleted from a segment are listed in a separate deletions file,
+which holds the delta-encoded varint local document numbers.
+
+The files are memory-mapped when a segment is opened, so only the parts
+of the index that are actually used by a search are read from disk.
+"""
+
+from __future__ import unicode_literals
+
+import heapq
+import mmap
+import os
+import struct
+
+from djblets.util.compat import six
+
+
+DOC_STRUCT = struct.Struct(str('<II'))
+OFFSET_STRUCT = struct.Struct(str('<I'))
+
+# The largest number of bytes that a varint for a 64-bit value can take.
+MAX_VARINT_LEN = 10
+
+
+def encode_varint(value, buf):
+    """Appends a value to a bytearray as a varint.
+
+    Each byte holds 7 bits of the value, starting with the lowest bits.
+    The high bit is set on every byte except the last.
+    """
+    while value > 0x7F:
+        buf.append((value & 0x7F) | 0x80)
+        value >>= 7
+
+    buf.append(value)
+
+
+def decode_varint(buf, pos):
+    """Reads a varint from a bytearray.
+
+    This returns a tuple of the value and the position following it.
+    """
+    value = 0
+    shift = 0
+
+    while True:
+        b = buf[pos]
+        pos += 1
+        value |= (b & 0x7F) << shift
+
+        if b < 0x80:
+            return value, pos
+
+        shift += 7
+
+
+def make_term(field, token):
+    """Returns the encoded form of a term for the given field and token."""
+    return ('%s\0%s' % (field, token)).encode('utf-8')
+
+
+def split_term(term):
+    """Returns the field and token for an encoded term."""
+    field, token = term.decode('utf-8').split('\0', 1)
+
+    return field, token
+
+
+class SegmentWriter(object):
+    """Builds a new segment in memory and writes it out to disk.
+
+    Documents are added through add_document, along with the tokens for
+    each of their fields. Once all documents have been added, write will
+    store the segment in the index directory.
+    """
+    def __init__(self):
+        self.docs = []
+        self._postings = {}
+
+    def add_document(self, doc_id, local_site_id, fields):
+        """Adds a document to the segment.
+
+        ``fields`` maps field names to lists of (position, token) tuples.
+        Positions must be in increasing order.
+        """
+        docnum = len(self.docs)
+        self.docs.append((doc_id, local_site_id or 0))
+
+        for field, tokens in six.iteritems(fields):
+            positions_by_term = {}
+
+            for position, token in tokens:
+                positions_by_term.setdefault(make_term(field, token),
+                                             []).append(position)
+
+            for term, positions in six.iteritems(positions_by_term):
+                self._postings.setdefault(term, []).append(
+                    (docnum, positions))
+
+        return docnum
+
+    def write(self, path, name):
+        """Writes the segment to the index directory."""
+        with SegmentFileWriter(path, name) as file_writer:
+            for doc_id, local_site_id in self.docs:
+                file_writer.add_doc(doc_id, local_site_id)
+
+            for term in sorted(self._postings):
+                file_writer.add_term(term, self._postings[term])
+
+
+class SegmentFileWriter(object):
+    """Writes the files for a segment.
+
+    Documents and terms are written out as they're added, so segments can
+    be built without holding all of their postings in memory. Terms must
+    be added in sorted order.
+
+    This is meant to be used as a context manager. The files are closed
+    when the block exits.
+    """
+    def __init__(self, path, name):
+        self.num_docs = 0
+        self._files = {}
+        self._tis_len = 0
+        self._pst_len = 0
+
+        for ext in SegmentReader.EXTENSIONS:
+            self._files[ext] = open(
+                os.path.join(path, '%s.%s' % (name, ext)), 'wb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        for f in six.itervalues(self._files):
+            f.close()
+
+    def add_doc(self, doc_id, local_site_id):
+        """Adds a document, returning its local document number."""
+        self._files['doc'].write(DOC_STRUCT.pack(doc_id, local_site_id or 0))
+        self.num_docs += 1
+
+        return self.num_docs - 1
+
+    def add_term(self, term, postings):
+        """Adds a term and its postings.
+
+        ``postings`` is a list of (local document number, positions) tuples,
+        sorted by document number.
+        """
+        pst = bytearray()
+        last_docnum = 0
+
+        for docnum, positions in postings:
+            encode_varint(docnum - last_docnum, pst)
+            encode_varint(len(positions), pst)
+            last_docnum = docnum
+            last_position = 0
+
+            for position in positions:
+                encode_varint(position - last_position, pst)
+                last_position = position
+
+        tis = bytearray()
+        encode_varint(len(term), tis)
+        tis += term
+        encode_varint(len(postings), tis)
+        encode_varint(self._pst_len, tis)
+        encode_varint(len(pst), tis)
+
+        self._files['tix'].write(OFFSET_STRUCT.pack(self._tis_len))
+        self._files['tis'].write(tis)
+        self._files['pst'].write(pst)
+        self._tis_len += len(tis)
+        self._pst_len += len(pst)
+
+
+class SegmentReader(object):
+    """Provides access to a segment stored on disk."""
+    EXTENSIONS = ('doc', 'tis', 'tix', 'pst')
+
+    def __init__(self, path, name, deletions_file=None):
+        self.path = path
+        self.name = name
+        self._files = []
+        self._doc = self._map_file('doc')
+        self._tis = self._map_file('tis')
+        self._tix = self._map_file('tix')
+        self._pst = self._map_file('pst')
+        self.num_docs = len(self._doc) // DOC_STRUCT.size
+        self.num_terms = len(self._tix) // OFFSET_STRUCT.size
+        self.deleted = set()
+        self.deletions_file = None
+
+        self.load_deletions(deletions_file)
+
+    @property
+    def num_live_docs(self):
+        """The number of documents that haven't been deleted."""
+        return self.num_docs - len(self.deleted)
+
+    def close(self):
+        """Closes all files for the segment."""
+        for f, mapped in self._files:
+            if mapped is not None:
+                mapped.close()
+
+            f.close()
+
+        self._files = []
+
+    def load_deletions(self, deletions_file):
+        """Loads the set of deleted documents from a deletions file."""
+        deleted = set()
+
+        if deletions_file:
+            with open(os.path.join(self.path, deletions_file), 'rb') as f:
+                deleted.update(read_docnums(bytearray(f.read())))
+
+        self.deleted = deleted
+        self.deletions_file = deletions_file
+
+    def get_doc(self, docnum):
+        """Returns the (doc_id, local_site_id) pair for a document."""
+        return DOC_STRUCT.unpack_from(self._doc, docnum * DOC_STRUCT.size)
+
+    def iter_docs(self):
+        """Yields (local document number, doc_id, local_site_id) tuples.
+
+        Deleted documents are skipped.
+        """
+        deleted = self.deleted
+
+        for docnum in range(self.num_docs):
+            if docnum not in deleted:
+                doc_id, local_site_id = self.get_doc(docnum)
+                yield docnum, doc_id, local_site_id
+
+    def get_term_info(self, i):
+        """Returns the entry at an index in the term dictionary.
+
+        This is a tuple of (term, doc_freq, postings_offset, postings_len).
+        """
+        offset = OFFSET_STRUCT.unpack_from(self._tix,
+                                           i * OFFSET_STRUCT.size)[0]
+        tis = self._tis
+        buf = bytearray(tis[offset:offset + MAX_VARINT_LEN])
+        term_len, pos = decode_varint(buf, 0)
+        start = offset + pos
+        buf = bytearray(tis[start + term_len:
+                            start + term_len + 3 * MAX_VARINT_LEN])
+        doc_freq, pos = decode_varint(buf, 0)
+        postings_offset, pos = decode_varint(buf, pos)
+        postings_len, pos = decode_varint(buf, pos)
+
+        return tis[start:start + term_len], doc_freq, postings_offset, \
+            postings_len
+
+    def get_term(self, i):
+        """Returns the term at an index in the term dictionary."""
+        offset = OFFSET_STRUCT.unpack_from(self._tix,
+                                           i * OFFSET_STRUCT.size)[0]
+        tis = self._tis
+        term_len, pos = decode_varint(
+            bytearray(tis[offset:offset + MAX_VARINT_LEN]), 0)
+        start = offset + pos
+
+        return tis[start:start + term_len]
+
+    def find_term(self, term):
+        """Returns the index of the first term that's >= the given term."""
+        lo = 0
+        hi = self.num_terms
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+
+            if self.get_term(mid) < term:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        return lo
+
+    def lookup_term(self, term):
+        """Returns the term dictionary entry for a term, or None."""
+        i = self.find_term(term)
+
+        if i < self.num_terms:
+            info = self.get_term_info(i)
+
+            if info[0] == term:
+                return info
+
+        return None
+
+    def iter_prefix(self, prefix):
+        """Yields the term dictionary entries for terms with a prefix."""
+        for i in range(self.find_term(prefix), self.num_terms):
+            info = self.get_term_info(i)
+
+            if not info[0].startswith(prefix):
+                break
+
+            yield info
+
+    def iter_terms(self):
+        """Yields every entry in the term dictionary."""
+        for i in range(self.num_terms):
+            yield self.get_term_info(i)
+
+    def get_doc_freq(self, term):
+        """Returns the number of documents containing a term."""
+        info = self.lookup_term(term)
+
+        if info is None:
+            return 0
+
+        return info[1]
+
+    def get_postings(self, term, with_positions=True):
+        """Returns the postings for a term.
+
+        This is a list of (local document number, positions) tuples for
+        each document that contains the term and hasn't been deleted. If
+        with_positions is False, the number of occurrences is returned
+        instead of the positions.
+        """
+        info = self.lookup_term(term)
+
+        if info is None:
+            return []
+
+        return self.read_postings(info, with_positions)
+
+    def read_postings(self, info, with_positions=True):
+        """Returns the postings for a term dictionary entry.
+
+        See get_postings for details.
+        """
+        term, doc_freq, offset, length = info
+        buf = bytearray(self._pst[offset:offset + length])
+        deleted = self.deleted
+        postings = []
+        pos = 0
+        docnum = 0
+
+        for i in range(doc_freq):
+            delta, pos = decode_varint(buf, pos)
+            freq, pos = decode_varint(buf, pos)
+            docnum += delta
+
+            if with_positions:
+                positions = []
+                position = 0
+
+                for j in range(freq):
+                    delta, pos = decode_varint(buf, pos)
+                    position += delta
+                    positions.append(position)
+            else:
+                # Skip past the positions.
+                for j in range(freq):
+                    while buf[pos] & 0x80:
+                        pos += 1
+
+                    pos += 1
+
+                positions = freq
+
+            if docnum not in deleted:
+                postings.append((docnum, positions))
+
+        return postings
+
+    def _map_file(self, ext):
+        f = open(os.path.join(self.path, '%s.%s' % (self.name, ext)), 'rb')
+
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be mapped.
+            mapped = None
+
+        self._files.append((f, mapped))
+
+        if mapped is None:
+            return b''
+
+        return mapped
+
+
+def write_docnums(path, filename, docnums):
+    """Writes a sorted list of local document numbers to a file."""
+    buf = bytearray()
+    last_docnum = 0
+
+    for docnum in sorted(docnums):
+        encode_varint(docnum - last_docnum, buf)
+        last_docnum = docnum
+
+    with open(os.path.join(path, filename), 'wb') as f:
+        f.write(buf)
+
+
+def read_docnums(buf):
+    """Yields the local document numbers stored by write_docnums."""
+    pos = 0
+    docnum = 0
+
+    while pos < len(buf):
+        delta, pos = decode_varint(buf, pos)
+        docnum += delta
+        yield docnum
+
+
+def merge_segments(readers, path, name):
+    """Merges the live documents from several segments into a new one.
+
+    The terms from each segment are merged in sorted order, so only the
+    postings for one term are held in memory at a time.
+
+    This returns the number of documents in the new segment.
+    """
+    with SegmentFileWriter(path, name) as file_writer:
+        docnum_maps = []
+
+        for reader in readers:
+            docnum_map = {}
+
+            for docnum, doc_id, local_site_id in reader.iter_docs():
+                docnum_map[docnum] = file_writer.add_doc(doc_id,
+                                                         local_site_id)
+
+            docnum_maps.append(docnum_map)
+
+        term_iters = [
+            _iter_merge_terms(i, reader)
+            for i, reader in enumerate(readers)
+        ]
+        cur_term = None
+        postings = []
+
+        # Since each segment's documents come after the previous segment's,
+        # adding each segment's postings in order keeps them sorted.
+        for term, i, info in heapq.merge(*term_iters):
+            if term != cur_term:
+                if postings:
+                    file_writer.add_term(cur_term, postings)
+
+                cur_term = term
+                postings = []
+
+            docnum_map = docnum_maps[i]
+            postings += [
+                (docnum_map[docnum], positions)
+                for docnum, positions in readers[i].read_postings(info)
+            ]
+
+        if postings:
+            file_writer.add_term(cur_term, postings)
+
+        return file_writer.num_docs
+
+
+def _iter_merge_terms(i, reader):
+    """Yields (term, segment index, term info) tuples for merging."""
+    for info in reader.iter_terms():
+        yield info[0], i, info
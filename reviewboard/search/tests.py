@@ -0,0 +1,291 @@
+from __future__ import unicode_literals
+
+import json
+import os
+import shutil
+import tempfile
+
+from djblets.siteconfig.models import SiteConfiguration
+
+from reviewboard import initialize
+from reviewboard.reviews.models import ReviewRequest
+from reviewboard.search.index import SearchIndex
+from reviewboard.search.indexing import search_review_requests
+from reviewboard.search.query import Schema, parse_query, tokenize
+from reviewboard.testing import TestCase
+
+
+class SearchIndexTests(TestCase):
+    """Unit tests for SearchIndex."""
+    def setUp(self):
+        super(SearchIndexTests, self).setUp()
+
+        self.path = tempfile.mkdtemp(prefix='rb-tests-search-')
+        self.schema = Schema(fields=['summary', 'description', 'file'],
+                             keyword_fields=['username'],
+                             default_fields=['summary', 'description'])
+        self.index = SearchIndex(self.path, self.schema)
+        self.index.update_documents([
+            (1, None, {
+                'summary': 'Fix the null pointer crash',
+                'description': 'This crashed in main.cc on startup.',
+                'file': 'src/main.cc',
+                'username': 'doc',
+            }),
+            (2, None, {
+                'summary': 'Add a new feature',
+                'description': 'Null values were pointing nowhere.',
+                'file': 'src/feature.py',
+                'username': 'grumpy',
+            }),
+            (3, 1, {
+                'summary': 'Fix a crash',
+                'username': 'doc',
+            }),
+        ])
+
+    def tearDown(self):
+        super(SearchIndexTests, self).tearDown()
+
+        shutil.rmtree(self.path)
+
+    def test_tokenize(self):
+        """Testing search tokenize"""
+        self.assertEqual(tokenize('Fix the NULL-pointer crash'),
+                         [(0, 'fix'), (2, 'null'), (3, 'pointer'),
+                          (4, 'crash')])
+
+    def test_parse_query(self):
+        """Testing search parse_query"""
+        query = parse_query('crash OR summary:"null pointer" -file:foo* the',
+                            self.schema)
+
+        self.assertEqual(len(query.groups), 1)
+        self.assertEqual(len(query.groups[0]), 2)
+        self.assertEqual(query.groups[0][0].fields,
+                         ['summary', 'description'])
+        self.assertEqual(query.groups[0][1].fields, ['summary'])
+        self.assertEqual(query.groups[0][1].tokens,
+                         [(0, 'null'), (1, 'pointer')])
+        self.assertEqual(len(query.excluded), 1)
+        self.assertTrue(query.excluded[0].prefix)
+
+    def test_search(self):
+        """Testing SearchIndex.search"""
+        self.assertEqual(self.index.search('crash'), [1])
+        self.assertEqual(sorted(self.index.search('null')), [1, 2])
+        self.assertEqual(self.index.search('null crash'), [1])
+        self.assertEqual(self.index.search('nothing'), [])
+
+    def test_search_with_local_site(self):
+        """Testing SearchIndex.search with a Local Site"""
+        self.assertEqual(self.index.search('crash', 1), [3])
+
+    def test_search_with_phrase(self):
+        """Testing SearchIndex.search with phrases"""
+        self.assertEqual(self.index.search('"null pointer"'), [1])
+        self.assertEqual(self.index.search('"fix the null"'), [1])
+        self.assertEqual(self.index.search('"fix null"'), [])
+        self.assertEqual(self.index.search('"pointer null"'), [])
+
+    def test_search_with_fields(self):
+        """Testing SearchIndex.search with fields"""
+        self.assertEqual(self.index.search('summary:null'), [1])
+        self.assertEqual(self.index.search('file:main.cc'), [1])
+        self.assertEqual(self.index.search('main.cc'), [1])
+        self.assertEqual(self.index.search('username:grumpy'), [2])
+        self.assertEqual(sorted(self.index.search('file:src')), [1, 2])
+
+    def test_search_with_prefix(self):
+        """Testing SearchIndex.search with prefixes"""
+        self.assertEqual(self.index.search('crash*'), [1])
+        self.assertEqual(sorted(self.index.search('point*')), [1, 2])
+        self.assertEqual(self.index.search('file:feat*'), [2])
+
+    def test_search_with_operators(self):
+        """Testing SearchIndex.search with OR and exclusions"""
+        self.assertEqual(sorted(self.index.search('crash OR feature')), [1, 2])
+        self.assertEqual(self.index.search('null -crash'), [2])
+        self.assertEqual(self.index.search('null NOT crash'), [2])
+
+    def test_update_documents(self):
+        """Testing SearchIndex.update_documents replaces documents"""
+        self.index.update_documents([
+            (1, None, {
+                'summary': 'Something different',
+            }),
+        ])
+
+        self.assertEqual(self.index.search('crash'), [])
+        self.assertEqual(self.index.search('different'), [1])
+
+    def test_update_documents_with_duplicate_ids(self):
+        """Testing SearchIndex.update_documents with the same ID listed
+        twice
+        """
+        self.index.update_documents([
+            (1, None, {
+                'summary': 'First copy',
+            }),
+            (1, None, {
+                'summary': 'Second copy',
+            }),
+        ])
+
+        self.assertEqual(self.index.search('first'), [])
+        self.assertEqual(self.index.search('second'), [1])
+
+        self.index.delete_documents([1])
+
+        self.assertEqual(self.index.search('copy'), [])
+
+    def test_delete_documents(self):
+        """Testing SearchIndex.delete_documents"""
+        self.index.delete_documents([2])
+
+        self.assertEqual(self.index.search('null'), [1])
+
+    def test_merge_segments(self):
+        """Testing SearchIndex merges segments as they're added"""
+        self.index.MERGE_FACTOR = 3
+
+        for i in range(10):
+            self.index.update_documents([
+                (i + 10, None, {
+                    'summary': 'Document %d' % i,
+                }),
+            ])
+
+        self.assertTrue(len(self._get_segments()) < 10)
+        self.assertEqual(len(self.index.search('document')), 10)
+        self.assertEqual(sorted(self.index.search('null')), [1, 2])
+
+        self.index.merge(optimize=True)
+
+        self.assertEqual(len(self._get_segments()), 1)
+        self.assertEqual(len(self.index.search('document')), 10)
+        self.assertEqual(sorted(self.index.search('null')), [1, 2])
+        self.assertEqual(self.index.search('crash', 1), [3])
+
+    def test_rebuild(self):
+        """Testing SearchIndex.rebuild"""
+        self.index.REBUILD_SEGMENT_DOCS = 3
+
+        self.index.rebuild(
+            (i, None, {'summary': 'Document %d' % i})
+            for i in range(10)
+        )
+
+        self.assertEqual(len(self._get_segments()), 1)
+        self.assertEqual(self.index.search('document'), list(range(9, -1, -1)))
+        self.assertEqual(self.index.search('null'), [])
+
+        # Only the files for the new segment should be left.
+        self.assertEqual(
+            len([
+                filename
+                for filename in os.listdir(self.path)
+                if filename.startswith('seg_')
+            ]),
+            4)
+
+    def test_rebuild_with_changes(self):
+        """Testing SearchIndex.rebuild with documents changed while
+        rebuilding
+        """
+        def get_docs():
+            for i in range(1, 6):
+                if i == 3:
+                    self.index.update_documents([
+                        (1, None, {'summary': 'Updated document'}),
+                    ])
+                    self.index.delete_documents([2])
+
+                yield i, None, {'summary': 'Document %d' % i}
+
+        self.index.rebuild(get_docs())
+
+        self.assertEqual(sorted(self.index.search('document')),
+                         [1, 3, 4, 5])
+        self.assertEqual(self.index.search('updated'), [1])
+
+        with open(os.path.join(self.path, 'segments.json'), 'r') as f:
+            self.assertEqual(json.load(f)['rebuilds'], {})
+
+    def _get_segments(self):
+        with open(os.path.join(self.path, 'segments.json'), 'r') as f:
+            return json.load(f)['segments']
+
+
+class IndexingTests(TestCase):
+    """Unit tests for keeping the search index up to date."""
+    fixtures = ['test_users', 'test_scmtools']
+
+    def setUp(self):
+        super(IndexingTests, self).setUp()
+
+        initialize()
+
+        self.path = tempfile.mkdtemp(prefix='rb-tests-search-')
+
+        self.siteconfig = SiteConfiguration.objects.get_current()
+        self.siteconfig.set('search_enable', True)
+        self.siteconfig.set('search_index_file', self.path)
+        self.siteconfig.save()
+
+    def tearDown(self):
+        super(IndexingTests, self).tearDown()
+
+        self.siteconfig.set('search_enable', False)
+        self.siteconfig.save()
+
+        shutil.rmtree(self.path)
+
+    def test_publish_review_request(self):
+        """Testing publishing a review request updates the search index"""
+        review_request = self.create_review_request(
+            summary='Fix the flux capacitor')
+
+        self.assertEqual(search_review_requests('flux'), [])
+
+        review_request.publish(review_request.submitter)
+
+        self.assertEqual(search_review_requests('flux'), [review_request.pk])
+
+    def test_publish_review(self):
+        """Testing publishing a review updates the search index"""
+        review_request = self.create_review_request(publish=True)
+        review = self.create_review(review_request,
+                                    body_top='Needs more gigawatts')
+
+        self.assertEqual(search_review_requests('gigawatts'), [])
+
+        review.publish()
+
+        self.assertEqual(search_review_requests('gigawatts'),
+                         [review_request.pk])
+
+    def test_discard_review_request(self):
+        """Testing discarding a review request removes it from the search
+        index
+        """
+        review_request = self.create_review_request(
+            summary='Fix the flux capacitor',
+            publish=True)
+
+        review_request.close(ReviewRequest.DISCARDED)
+
+        self.assertEqual(search_review_requests('flux'), [])
+
+    def test_search_view(self):
+        """Testing the search view"""
+        review_request = self.create_review_request(
+            summary='Fix the flux capacitor',
+            publish=True)
+
+        response = self.client.get('/r/search/', {'q': 'flux'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['object_list']),
+                         [review_request])
+        self.assertEqual(response.context['hits'], 1)
@@ -171,6 +171,7 @@ RB_BUILTIN_APPS = [
     'reviewboard.reviews',
     'reviewboard.reviews.ui',
     'reviewboard.scmtools',
+    'reviewboard.search',
     'reviewboard.site',
     'reviewboard.ssh',
     'reviewboard.webapi',
@@ -413,7 +413,7 @@ class FileDiffResource(WebAPIResource):
         payload = {
             'diff_data': {
                 'binary': f['binary'],
-                'chunks': f['chunks'],
+                'chunks': list(f['chunks']),
                 'num_changes': f['num_changes'],
                 'changed_chunk_indexes': f['changed_chunk_indexes'],
                 'new_file': f['newfile'],